@@ -15,18 +15,30 @@ def normalize_customer_key(value):
     return re.sub(r'[^A-Z0-9]+', '', text)
 
 
-def resolve_customer(value):
+def build_customer_index():
+    """Índice clave normalizada → empresas activas, para resolver una planilla con una sola consulta."""
+    index = {}
+    for company in ClienteEmpresa.objects.filter(activo=True):
+        for key in {normalize_customer_key(company.nombre), normalize_customer_key(company.rut)}:
+            index.setdefault(key, []).append(company)
+    return index
+
+
+def resolve_customer(value, index=None):
     """Retorna la empresa activa por nombre o RUT canónico; exige coincidencia única."""
     key = normalize_customer_key(value)
     if not key:
         raise ValueError('Cliente vacío en la planilla de embarque.')
-    matches = [
-        company for company in ClienteEmpresa.objects.filter(activo=True)
-        if key in {
-            normalize_customer_key(company.nombre),
-            normalize_customer_key(company.rut),
-        }
-    ]
+    if index is None:
+        matches = [
+            company for company in ClienteEmpresa.objects.filter(activo=True)
+            if key in {
+                normalize_customer_key(company.nombre),
+                normalize_customer_key(company.rut),
+            }
+        ]
+    else:
+        matches = index.get(key, [])
     if not matches:
         raise ValueError(
             f"Cliente '{str(value).strip()}' no está registrado. "
@@ -1,47 +1,72 @@
 from datetime import datetime, timedelta
 from statistics import median
 
-from django.db.models import Count
 from django.utils import timezone
 
-from apps.programaciones.models import Programacion, TiempoOperacion
+from apps.core.services.slot_calendar import SlotCalendarService
 
 
 class ClientSlotRecommendationService:
     """Recomendaciones explicables; reglas seguras en cold start, histórico al madurar."""
 
     MIN_PREDICTIVE_SAMPLES = 3
-    HISTORY_DAYS = 120
+    MAX_RANGE_DAYS = 31
 
     @classmethod
     def recommend(cls, empresa, cd, target_date):
+        return cls.recommend_range(empresa, cd, target_date, target_date)['dias'][0]
+
+    @classmethod
+    def recommend_range(cls, empresa, cd, start_date, end_date):
+        """
+        Recomendaciones día a día entre dos fechas (inclusive).
+
+        La carga sale del calendario de cupos y las duraciones del histograma
+        día de la semana × hora del CD: dos consultas para todo el rango.
+        """
+        if end_date < start_date:
+            raise ValueError('La fecha final debe ser posterior a la inicial.')
+        if (end_date - start_date).days >= cls.MAX_RANGE_DAYS:
+            raise ValueError(f'El rango no puede superar {cls.MAX_RANGE_DAYS} días.')
+        tz = timezone.get_current_timezone()
+        range_start = timezone.make_aware(datetime.combine(start_date, empresa.hora_inicio_recepcion), tz)
+        range_end = timezone.make_aware(datetime.combine(end_date, empresa.hora_fin_recepcion), tz)
+        calendar = SlotCalendarService.calendario(cd, range_start, range_end, empresa.duracion_slot_min)
+
+        cells = SlotCalendarService.duraciones(cd)
+        history = [minutes for samples in cells.values() for _, minutes in samples]
+        baseline = float(median(history)) if history else float(cd.tiempo_promedio_descarga_min or 60)
+
+        days = []
+        day = start_date
+        while day <= end_date:
+            days.append(cls._recommend_day(empresa, cd, day, calendar, cells, baseline, len(history)))
+            day += timedelta(days=1)
+        return {
+            'desde': start_date.isoformat(),
+            'hasta': end_date.isoformat(),
+            'dias': days,
+        }
+
+    @classmethod
+    def _recommend_day(cls, empresa, cd, target_date, calendar, cells, baseline, history_size):
         tz = timezone.get_current_timezone()
         start = timezone.make_aware(datetime.combine(target_date, empresa.hora_inicio_recepcion), tz)
         end = timezone.make_aware(datetime.combine(target_date, empresa.hora_fin_recepcion), tz)
         now = timezone.now()
         duration = timedelta(minutes=empresa.duracion_slot_min)
 
-        cutoff = now - timedelta(days=cls.HISTORY_DAYS)
-        history = list(TiempoOperacion.objects.filter(
-            cd=cd, anomalia=False, hora_inicio__gte=cutoff,
-            tiempo_real_min__gt=0,
-        ).only('hora_inicio', 'tiempo_real_min'))
-        baseline = float(median([row.tiempo_real_min for row in history])) if history else float(cd.tiempo_promedio_descarga_min or 60)
-
         candidates = []
         cursor = start
         while cursor + duration <= end:
             if cursor > now:
                 slot_end = cursor + duration
-                load = Programacion.objects.filter(
-                    cd=cd,
-                    fecha_programada__lt=slot_end,
-                    fecha_programada__gte=cursor,
-                ).exclude(container__estado__in=['cancelado', 'devuelto']).count()
+                load = calendar.carga(cursor, slot_end)
+                local = timezone.localtime(cursor)
                 same_hour = [
-                    row.tiempo_real_min for row in history
-                    if row.hora_inicio.weekday() == cursor.weekday()
-                    and abs(row.hora_inicio.hour - cursor.hour) <= 1
+                    minutes
+                    for hour in (local.hour - 1, local.hour, local.hour + 1)
+                    for _, minutes in cells.get((local.weekday(), hour), ())
                 ]
                 samples = len(same_hour)
                 predicted_duration = float(median(same_hour)) if samples else baseline
@@ -75,8 +100,8 @@ class ClientSlotRecommendationService:
         candidates.sort(key=lambda item: (not item['disponible'], -item['score'], item['inicio']))
         return {
             'fecha': target_date.isoformat(),
-            'cold_start': len(history) < cls.MIN_PREDICTIVE_SAMPLES,
-            'muestras_totales': len(history),
+            'cold_start': history_size < cls.MIN_PREDICTIVE_SAMPLES,
+            'muestras_totales': history_size,
             'recomendados': candidates[:3],
             'todos': candidates,
         }
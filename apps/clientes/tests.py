@@ -1,13 +1,17 @@
 from datetime import time, timedelta
 
 from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework.test import APIClient
 
 from apps.cds.models import CD
 from apps.containers.models import Container
+from apps.core.services.slot_calendar import SlotCalendarService
+from apps.programaciones.models import CargaSlotCD, Programacion
 
 from .models import ClienteEmpresa, ClienteUsuario, SituacionCliente, SolicitudHorario
 from .services import ClientSlotRecommendationService
@@ -115,6 +119,95 @@ class ClientSlotRecommendationTests(TestCase):
         self.assertTrue(all(item['cupos_disponibles'] == 1 for item in result['recomendados']))
 
 
+    def _slot_fixture(self):
+        company = ClienteEmpresa.objects.create(
+            nombre='Cliente Calendario', hora_inicio_recepcion=time(8),
+            hora_fin_recepcion=time(12), duracion_slot_min=60, capacidad_por_slot=2,
+        )
+        cd = CD.objects.create(
+            nombre='CD Calendario', codigo='CALEN', direccion='A', comuna='Santiago',
+            tipo='cliente', lat=-33.45, lng=-70.65, cliente_empresa=company,
+        )
+        return company, cd
+
+    def _programar(self, cd, suffix, fecha):
+        container = Container.objects.create(
+            container_id=f'CALU{suffix:07d}', tipo='40', nave='Nave', estado='liberado',
+        )
+        return Programacion.objects.create(container=container, cd=cd, fecha_programada=fecha, cliente='Cliente')
+
+    def test_calendar_load_follows_create_move_and_cancel(self):
+        company, cd = self._slot_fixture()
+        day = timezone.localdate() + timedelta(days=1)
+        tz = timezone.get_current_timezone()
+        nine = timezone.make_aware(timezone.datetime.combine(day, time(9, 10)), tz)
+        first = self._programar(cd, 1, nine)
+        second = self._programar(cd, 2, nine + timedelta(minutes=20))
+
+        def load_at(hour):
+            slot = next(
+                item for item in ClientSlotRecommendationService.recommend(company, cd, day)['todos']
+                if timezone.localtime(timezone.datetime.fromisoformat(item['inicio'])).hour == hour
+            )
+            return slot['carga_programada']
+
+        self.assertEqual(load_at(9), 2)
+        self.assertEqual(load_at(10), 0)
+
+        second.fecha_programada = nine + timedelta(hours=1)
+        second.save()
+        self.assertEqual((load_at(9), load_at(10)), (1, 1))
+
+        first.container.estado = 'cancelado'
+        first.container.save()
+        self.assertEqual((load_at(9), load_at(10)), (0, 1))
+        first.container.estado = 'liberado'
+        first.container.save()
+        self.assertEqual(load_at(9), 1)
+        first.container.estado = 'cancelado'
+        first.container.save()
+        self.assertEqual(
+            sum(CargaSlotCD.objects.filter(cd=cd).values_list('carga', flat=True)),
+            Programacion.objects.filter(cd=cd).exclude(container__estado__in=['cancelado', 'devuelto']).count(),
+        )
+
+        second.delete()
+        self.assertFalse(CargaSlotCD.objects.filter(cd=cd).exists())
+        self._programar(cd, 3, nine)
+        SlotCalendarService.rebuild()
+        self.assertEqual(load_at(9), 1)
+
+    def test_slot_length_off_the_block_grid_counts_exactly(self):
+        company, cd = self._slot_fixture()
+        company.duracion_slot_min = 12
+        company.save()
+        day = timezone.localdate() + timedelta(days=1)
+        tz = timezone.get_current_timezone()
+        # 08:12 cae en el bloque de 08:10, que empieza dentro del slot de 08:00
+        self._programar(cd, 5, timezone.make_aware(timezone.datetime.combine(day, time(8, 12)), tz))
+
+        cargas = {
+            timezone.localtime(timezone.datetime.fromisoformat(item['inicio'])).strftime('%H:%M'): item['carga_programada']
+            for item in ClientSlotRecommendationService.recommend(company, cd, day)['todos']
+        }
+        self.assertEqual((cargas['08:00'], cargas['08:12']), (0, 1))
+
+    def test_range_uses_constant_queries(self):
+        company, cd = self._slot_fixture()
+        start = timezone.localdate() + timedelta(days=1)
+        self._programar(cd, 4, timezone.make_aware(timezone.datetime.combine(start, time(9)), timezone.get_current_timezone()))
+
+        with CaptureQueriesContext(connection) as one_day:
+            single = ClientSlotRecommendationService.recommend_range(company, cd, start, start)
+        with CaptureQueriesContext(connection) as week:
+            result = ClientSlotRecommendationService.recommend_range(company, cd, start, start + timedelta(days=6))
+        self.assertEqual(len(one_day), len(week))
+        self.assertLessEqual(len(week), 2)
+        self.assertEqual(len(result['dias']), 7)
+        self.assertEqual(result['dias'][0]['todos'], single['dias'][0]['todos'])
+        with self.assertRaises(ValueError):
+            ClientSlotRecommendationService.recommend_range(company, cd, start, start + timedelta(days=40))
+
 class OperationsReviewTests(TestCase):
     def test_staff_acceptance_creates_programacion_and_advances_container(self):
         company = ClienteEmpresa.objects.create(nombre='Cliente Review')
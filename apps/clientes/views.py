@@ -100,6 +100,22 @@ def api_recomendaciones(request):
     return Response(ClientSlotRecommendationService.recommend(empresa, cd, target_date))
 
 
+@api_view(['GET'])
+@permission_classes([IsClientUser])
+def api_recomendaciones_rango(request):
+    empresa = _profile(request.user).empresa
+    try:
+        cd = empresa.centros_distribucion.get(pk=request.query_params.get('cd'), activo=True, tipo='cliente')
+        desde = timezone.datetime.strptime(request.query_params.get('desde', ''), '%Y-%m-%d').date()
+        hasta = timezone.datetime.strptime(request.query_params.get('hasta', ''), '%Y-%m-%d').date()
+    except (empresa.centros_distribucion.model.DoesNotExist, TypeError, ValueError):
+        return Response({'error': 'CD o fechas inválidos.'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        return Response(ClientSlotRecommendationService.recommend_range(empresa, cd, desde, hasta))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
 @api_view(['GET', 'POST'])
 @permission_classes([IsClientUser])
 def api_solicitudes(request):
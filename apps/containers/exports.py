@@ -0,0 +1,105 @@
+"""
+Especificaciones de exportación de contenedores (apps.core.services.streaming_export).
+
+El `now` de la exportación se fija una vez y los días/urgencia de demurrage se
+calculan una sola vez por fila en `_demurrage`.
+"""
+from django.db.models import Q
+
+from apps.core.services.streaming_export import Column, ExportSpec, register_export
+
+from .models import Container
+
+
+def _stock_queryset():
+    return Container.objects.filter(Q(estado='liberado') | Q(estado='por_arribar'))
+
+
+def _demurrage(container, now):
+    dias = (container.fecha_demurrage - now).days if container.fecha_demurrage else None
+    return {'dias_demurrage': dias, 'urgencia': Container.urgencia_para_dias(dias)}
+
+
+def _fecha(campo, formato):
+    def valor(container, fila):
+        fecha = getattr(container, campo)
+        return fecha.strftime(formato) if fecha else None
+    return valor
+
+
+def _estilo_urgencia(valor, container, fila):
+    return f"urgencia_{fila['urgencia']}"
+
+
+LIBERACION_EXPORT = register_export(ExportSpec(
+    name='liberacion',
+    sheet_title='Liberados y Por Liberar',
+    filename='liberados_por_liberar',
+    queryset=lambda: _stock_queryset().select_related('cd_entrega').order_by('-fecha_demurrage', 'estado'),
+    only=(
+        'container_id', 'estado', 'nave', 'tipo', 'tipo_carga', 'peso_carga', 'tara', 'contenido',
+        'posicion_fisica', 'puerto', 'fecha_demurrage', 'cd_entrega__nombre', 'comuna', 'vendor',
+        'sello', 'fecha_liberacion', 'fecha_eta', 'secuenciado',
+    ),
+    preparar=_demurrage,
+    styles={
+        'urgencia_vencido': {'bold': True, 'color': 'FFFFFF', 'fill': 'FF0000'},
+        'urgencia_critico': {'bold': True, 'color': 'FFFFFF', 'fill': 'FF6B6B'},
+        'urgencia_alto': {'fill': 'FFA500'},
+        'urgencia_medio': {'fill': 'FFD700'},
+        'urgencia_bajo': {},
+        'urgencia_sin_fecha': {},
+    },
+    columns=[
+        Column('CONTAINER ID', lambda c, f: c.container_id, 18),
+        Column('ESTADO', lambda c, f: c.get_estado_display(), 15),
+        Column('NAVE', lambda c, f: c.nave, 25),
+        Column('TIPO', lambda c, f: c.get_tipo_display(), 10),
+        Column('TIPO CARGA', lambda c, f: c.get_tipo_carga_display(), 15),
+        Column('PESO CARGA (KG)', lambda c, f: float(c.peso_carga or 0), 15, tipo='decimal'),
+        Column('TARA (KG)', lambda c, f: float(c.tara or 0), 12, tipo='decimal'),
+        Column('PESO TOTAL (KG)', lambda c, f: c.peso_total, 15, tipo='decimal'),
+        Column('PESO TOTAL (TON)', lambda c, f: round(c.peso_total / 1000, 2), 15, tipo='decimal'),
+        Column('CONTENIDO', lambda c, f: c.contenido or '', 40),
+        Column('POSICIÓN FÍSICA', lambda c, f: c.posicion_fisica or '', 18),
+        Column('PUERTO', lambda c, f: c.puerto, 15),
+        Column('FECHA DEMURRAGE', _fecha('fecha_demurrage', '%d/%m/%Y'), 18),
+        Column('DÍAS DEMURRAGE', lambda c, f: f['dias_demurrage'], 15, tipo='entero'),
+        Column('URGENCIA', lambda c, f: f['urgencia'].upper() if c.fecha_demurrage else 'SIN FECHA', 12,
+               style=_estilo_urgencia),
+        Column('CD ENTREGA', lambda c, f: c.cd_entrega.nombre if c.cd_entrega else '', 30),
+        Column('COMUNA', lambda c, f: c.comuna or '', 15),
+        Column('VENDOR', lambda c, f: c.vendor or '', 30),
+        Column('SELLO', lambda c, f: c.sello or '', 15),
+        Column('FECHA LIBERACIÓN', _fecha('fecha_liberacion', '%d/%m/%Y %H:%M'), 18),
+        Column('FECHA ETA', _fecha('fecha_eta', '%d/%m/%Y'), 15),
+        Column('SECUENCIADO', lambda c, f: 'SÍ' if c.secuenciado else 'NO', 12),
+    ],
+))
+
+
+STOCK_EXPORT = register_export(ExportSpec(
+    name='stock',
+    sheet_title='Stock',
+    filename='stock_contenedores',
+    queryset=lambda: _stock_queryset().order_by('secuenciado', '-fecha_liberacion'),
+    only=(
+        'container_id', 'tipo', 'nave', 'vendor', 'posicion_fisica', 'comuna', 'secuenciado',
+        'fecha_liberacion', 'fecha_eta', 'fecha_demurrage', 'deposito_devolucion',
+    ),
+    preparar=_demurrage,
+    columns=[
+        Column('CONTAINER ID', lambda c, f: c.container_id, 18),
+        Column('TIPO', lambda c, f: c.get_tipo_display(), 10),
+        Column('NAVE', lambda c, f: c.nave, 25),
+        Column('VENDOR', lambda c, f: c.vendor or '', 30),
+        Column('POSICIÓN FÍSICA', lambda c, f: c.posicion_fisica or '', 18),
+        Column('COMUNA', lambda c, f: c.comuna or '', 15),
+        Column('SECUENCIADO', lambda c, f: c.secuenciado, 12, tipo='booleano'),
+        Column('FECHA LIBERACIÓN', _fecha('fecha_liberacion', '%d/%m/%Y %H:%M'), 18),
+        Column('FECHA ETA', _fecha('fecha_eta', '%d/%m/%Y'), 15),
+        Column('FECHA DEMURRAGE', _fecha('fecha_demurrage', '%d/%m/%Y'), 18),
+        Column('DÍAS HASTA DEMURRAGE', lambda c, f: f['dias_demurrage'], 15, tipo='entero'),
+        Column('DEPÓSITO DEVOLUCIÓN', lambda c, f: c.deposito_devolucion or '', 30),
+    ],
+))
@@ -0,0 +1,158 @@
+"""
+Procesamiento en lote de los importadores Excel.
+
+La planilla se normaliza por columnas con pandas, los contenedores existentes
+se leen con una sola consulta IN y las escrituras se acumulan en un
+ImportBatch que las persiste con bulk_create/bulk_update dentro de una
+transacción. Como bulk_update no emite post_save, al final se aplican en
+conjunto los efectos de apps.containers.signals.
+
+Los errores por fila (validación, cliente, transición de estado) se detectan
+antes de escribir: una fila con error no modifica nada y se informa en el
+reporte con su número de fila.
+"""
+import pandas as pd
+from django.db import transaction
+from django.utils import timezone
+
+from apps.containers.models import Container
+from apps.events.models import Event
+
+
+def normalizar_ids(series):
+    """Container.normalize_container_id por columna; vacíos y 'NAN' quedan como ''."""
+    ids = (
+        series.astype(str).str.strip().str.upper()
+        .str.replace(' ', '', regex=False).str.replace('-', '', regex=False)
+    )
+    return ids.where(series.notna() & (ids != 'NAN'), '')
+
+
+def texto(df, columna, default=None):
+    """Columna como texto sin espacios extremos; nulos (o columna ausente) → default."""
+    if columna not in df.columns:
+        return pd.Series([default] * len(df), index=df.index, dtype=object)
+    valores = df[columna]
+    return valores.astype(str).str.strip().astype(object).where(valores.notna(), default)
+
+
+def numeros(df, columna):
+    """(valores float con NaN, máscara de celdas no vacías que no son número)."""
+    if columna not in df.columns:
+        vacia = pd.Series(float('nan'), index=df.index)
+        return vacia, vacia.notna()
+    valores = pd.to_numeric(df[columna], errors='coerce')
+    return valores, df[columna].notna() & valores.isna()
+
+
+def _a_fecha(valor):
+    try:
+        return pd.to_datetime(valor)
+    except (TypeError, ValueError):
+        return pd.NaT
+
+
+def fechas(df, columna):
+    """(Timestamps con NaT, máscara de celdas no vacías que no son fecha)."""
+    if columna not in df.columns:
+        vacia = pd.Series(pd.NaT, index=df.index)
+        return vacia, pd.Series(False, index=df.index)
+    valores = df[columna]
+    try:
+        parsed = pd.to_datetime(valores, errors='coerce', format='mixed')
+    except (TypeError, ValueError):
+        # Zonas horarias mezcladas: se interpreta celda a celda.
+        parsed = valores.map(_a_fecha)
+    return parsed, valores.notna() & parsed.isna()
+
+
+def aware(valor):
+    """Timestamp/datetime → datetime aware (None si es nulo)."""
+    if valor is None or pd.isna(valor):
+        return None
+    if isinstance(valor, pd.Timestamp):
+        valor = valor.to_pydatetime()
+    return timezone.make_aware(valor) if timezone.is_naive(valor) else valor
+
+
+class ImportBatch:
+    """Acumula contenedores, cambios de estado y eventos de una importación."""
+
+    BATCH_SIZE = 500
+
+    def __init__(self, usuario=None):
+        self.usuario = usuario
+        self.nuevos = []
+        self.modificados = {}
+        self.campos = set()
+        self.eventos = []
+
+    @staticmethod
+    def contenedores(ids):
+        """Contenedores existentes por container_id, en una consulta IN."""
+        ids = sorted({container_id for container_id in ids if container_id})
+        return Container.objects.in_bulk(ids, field_name='container_id')
+
+    def crear(self, container):
+        self.nuevos.append(container)
+
+    def actualizar(self, container, *campos):
+        # Los creados en esta misma planilla se insertan con su estado final.
+        if container.pk is None:
+            return
+        self.modificados[container.pk] = container
+        self.campos.update(campos)
+
+    def evento(self, container, event_type, detalles):
+        self.eventos.append(Event(
+            container=container, event_type=event_type, detalles=detalles, usuario=self.usuario
+        ))
+
+    def cambiar_estado(self, container, nuevo_estado, *, permitir_reversion=False, now=None):
+        """Container.cambiar_estado en memoria: valida, marca el timestamp y encola el evento."""
+        if container.estado == nuevo_estado:
+            return
+        estado_anterior = container.aplicar_transicion(
+            nuevo_estado, permitir_reversion=permitir_reversion, now=now
+        )
+        campos = ['estado']
+        if nuevo_estado in Container.TIMESTAMPS_ESTADO:
+            campos.append(Container.TIMESTAMPS_ESTADO[nuevo_estado])
+        self.actualizar(container, *campos)
+        self.evento(container, 'cambio_estado', {
+            'estado_anterior': estado_anterior,
+            'estado_nuevo': nuevo_estado,
+        })
+
+    def guardar(self, escrituras_adicionales=None):
+        """
+        Persiste el lote en una transacción.
+
+        `escrituras_adicionales` se ejecuta después de escribir los contenedores
+        y antes de los eventos y efectos de signals (p. ej. programaciones).
+        """
+        from apps.containers.signals import aplicar_efectos_post_save
+        from apps.core.services.dashboard_stats import DashboardStatsService
+
+        modificados = list(self.modificados.values())
+        now = timezone.now()
+        for container in self.nuevos + modificados:
+            if not container.tara:
+                container.tara = container.get_tara_default()
+            container.updated_at = now
+
+        with transaction.atomic():
+            if self.nuevos:
+                Container.objects.bulk_create(self.nuevos, batch_size=self.BATCH_SIZE)
+            if modificados:
+                Container.objects.bulk_update(
+                    modificados, sorted(self.campos | {'tara', 'updated_at'}), batch_size=self.BATCH_SIZE
+                )
+            if escrituras_adicionales:
+                escrituras_adicionales()
+            if self.eventos:
+                Event.objects.bulk_create(self.eventos, batch_size=self.BATCH_SIZE)
+            aplicar_efectos_post_save(modificados)
+
+        if self.nuevos or modificados:
+            DashboardStatsService.invalidate()
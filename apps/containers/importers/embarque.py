@@ -3,13 +3,13 @@ Importador de Excel de Embarque
 Crea contenedores con estado 'por_arribar'
 """
 import pandas as pd
-from django.utils import timezone
-from django.db import transaction
 import logging
 from apps.containers.models import Container
-from apps.events.models import Event
 from apps.core.services.excel import normalize_columns, read_excel_with_header_detection
-from apps.clientes.matching import resolve_customer
+from apps.clientes.matching import build_customer_index, resolve_customer
+from apps.containers.importers.bulk import (
+    ImportBatch, aware, fechas, normalizar_ids, numeros, texto,
+)
 
 
 logger = logging.getLogger(__name__)
@@ -29,6 +29,8 @@ class EmbarqueImporter:
     - Container Seal / Sello (opcional)
     - Cliente / Customer / Consignee / Importador (requerido para Portal Cliente)
     - Puerto (opcional, default: Valparaíso)
+
+    La planilla se procesa en lote: ver apps.containers.importers.bulk.
     """
     
     COLUMNAS_REQUERIDAS = ['container_id', 'tipo', 'nave', 'cliente']
@@ -36,6 +38,7 @@ class EmbarqueImporter:
     def __init__(self, archivo_path, usuario=None):
         self.archivo_path = archivo_path
         self.usuario = usuario
+        self.on_progress = None  # callable(filas_procesadas, filas_totales)
         self.resultados = {
             'creados': 0,
             'actualizados': 0,
@@ -110,6 +113,10 @@ class EmbarqueImporter:
             raise ValueError('Peso inválido: debe ser mayor a 0')
 
         return peso_val
+
+    def validar_tipos(self, tipos):
+        """validar_tipo aplicado a una columna completa"""
+        return tipos.map(self.validar_tipo)
     
     def procesar(self):
         """Procesa el archivo Excel y crea/actualiza contenedores"""
@@ -136,111 +143,8 @@ class EmbarqueImporter:
                 extra={'archivo': self.archivo_path, 'filas': len(df), 'usuario': self.usuario}
             )
 
-            # Procesar cada fila
-            for idx, row in df.iterrows():
-                try:
-                    with transaction.atomic():
-                        # Normalizar container_id (eliminar espacios y guiones)
-                        container_id_raw = str(row['container_id']).strip().upper()
-                        container_id = Container.normalize_container_id(container_id_raw)
-
-                        if not container_id or container_id == 'NAN':
-                            self.resultados['errores'] += 1
-                            self.resultados['detalles'].append({
-                                'fila': idx + 2,
-                                'error': 'Container ID vacío'
-                            })
-                            continue
-
-                        nave = str(row['nave']).strip() if pd.notna(row['nave']) else ''
-                        if not nave:
-                            raise ValueError('Nave vacía o inválida')
-
-                        # Datos del contenedor
-                        datos = {
-                            'tipo': self.validar_tipo(row.get('tipo')),
-                            'nave': nave,
-                            'viaje': str(row.get('viaje')).strip() if pd.notna(row.get('viaje')) else None,
-                            'booking': str(row.get('booking')).strip() if pd.notna(row.get('booking')) else None,
-                            'peso_carga': self.validar_peso(row.get('peso')),
-                            'vendor': str(row.get('vendor')).strip() if pd.notna(row.get('vendor')) else None,
-                            'sello': str(row.get('sello')).strip() if pd.notna(row.get('sello')) else None,
-                            'puerto': str(row.get('puerto')).strip() if pd.notna(row.get('puerto')) else 'San Antonio',
-                            'estado': 'por_arribar',
-                        }
-
-                        # La nave define la empresa propietaria del stock. El CD se
-                        # elige después desde Portal Cliente al solicitar horario.
-                        cliente_raw = str(row['cliente']).strip() if pd.notna(row['cliente']) else ''
-                        empresa = resolve_customer(cliente_raw)
-                        datos['cliente'] = cliente_raw
-                        datos['cliente_empresa'] = empresa
-                        datos['cd_entrega'] = None
-
-                        # Agregar fecha_eta si está disponible
-                        if 'fecha_eta' in row.index and pd.notna(row['fecha_eta']):
-                            try:
-                                # Convertir a datetime si no lo es ya
-                                if isinstance(row['fecha_eta'], str):
-                                    fecha_eta = pd.to_datetime(row['fecha_eta'])
-                                else:
-                                    fecha_eta = row['fecha_eta']
-                                datos['fecha_eta'] = fecha_eta
-                            except Exception as fecha_error:
-                                raise ValueError(
-                                    f"Fecha ETA inválida '{row['fecha_eta']}': {str(fecha_error)}"
-                                )
-
-                        # Crear o actualizar sin retroceder el ciclo de vida de
-                        # un contenedor que ya avanzó más allá de por_arribar.
-                        estado_inicial = datos.pop('estado')
-                        container, created = Container.objects.get_or_create(
-                            container_id=container_id,
-                            defaults={**datos, 'estado': estado_inicial},
-                        )
-                        if not created:
-                            for field, value in datos.items():
-                                if value is not None:
-                                    setattr(container, field, value)
-                            container.save()
-
-                        if created:
-                            self.resultados['creados'] += 1
-                            # Registrar evento
-                            Event.objects.create(
-                                container=container,
-                                event_type='import_embarque',
-                                detalles={
-                                    'nave': datos['nave'],
-                                    'tipo': datos['tipo'],
-                                    'cliente': datos['cliente'],
-                                    'cliente_empresa_id': datos['cliente_empresa'].pk,
-                                },
-                                usuario=self.usuario
-                            )
-                        else:
-                            self.resultados['actualizados'] += 1
+            self._procesar_en_lote(df)
 
-                        self.resultados['detalles'].append({
-                            'fila': idx + 2,
-                            'container_id': container_id,
-                            'accion': 'creado' if created else 'actualizado',
-                            'nave': datos['nave'],
-                            'cliente': datos['cliente'],
-                            'cliente_empresa_id': datos['cliente_empresa'].pk,
-                            'cd_entrega': None,
-                        })
-                
-                except Exception as e:
-                    logger.warning(
-                        'import_embarque_row_error',
-                        extra={'fila': idx + 2, 'error': str(e), 'usuario': self.usuario}
-                    )
-                    self.resultados['errores'] += 1
-                    self.resultados['detalles'].append({
-                        'fila': idx + 2,
-                        'error': str(e)
-                    })
             logger.info(
                 'import_embarque_finished',
                 extra={
@@ -256,3 +160,99 @@ class EmbarqueImporter:
         except Exception as e:
             logger.exception('import_embarque_failed', extra={'usuario': self.usuario})
             raise Exception(f"Error al procesar archivo de embarque: {str(e)}")
+
+    def _error_fila(self, idx, error):
+        logger.warning(
+            'import_embarque_row_error',
+            extra={'fila': idx + 2, 'error': str(error), 'usuario': self.usuario}
+        )
+        self.resultados['errores'] += 1
+        self.resultados['detalles'].append({
+            'fila': idx + 2,
+            'error': str(error)
+        })
+
+    def _procesar_en_lote(self, df):
+        """Valida por columnas, lee los contenedores con una consulta y escribe en lote"""
+        ids = normalizar_ids(df['container_id'])
+        naves = texto(df, 'nave', '')
+        tipos = self.validar_tipos(df['tipo'])
+        pesos, pesos_invalidos = numeros(df, 'peso')
+        opcionales = {campo: texto(df, campo) for campo in ('viaje', 'booking', 'vendor', 'sello')}
+        puertos = texto(df, 'puerto', 'San Antonio')
+        clientes = texto(df, 'cliente', '')
+        fechas_eta, fechas_eta_invalidas = fechas(df, 'fecha_eta')
+
+        lote = ImportBatch(self.usuario)
+        contenedores = lote.contenedores(ids)
+        indice_clientes = build_customer_index()
+
+        for posicion, idx in enumerate(df.index, 1):
+            if self.on_progress:
+                self.on_progress(posicion, len(df))
+            container_id = ids[idx]
+            if not container_id:
+                self.resultados['errores'] += 1
+                self.resultados['detalles'].append({
+                    'fila': idx + 2,
+                    'error': 'Container ID vacío'
+                })
+                continue
+            try:
+                if not naves[idx]:
+                    raise ValueError('Nave vacía o inválida')
+                if pesos_invalidos[idx]:
+                    raise ValueError(f"Peso inválido: {df.at[idx, 'peso']}")
+                peso = self.validar_peso(pesos[idx])
+                empresa = resolve_customer(clientes[idx], indice_clientes)
+                if fechas_eta_invalidas[idx]:
+                    raise ValueError(f"Fecha ETA inválida '{df.at[idx, 'fecha_eta']}'")
+            except Exception as e:
+                self._error_fila(idx, e)
+                continue
+
+            datos = {
+                'tipo': tipos[idx],
+                'nave': naves[idx],
+                **{campo: valores[idx] for campo, valores in opcionales.items()},
+                'peso_carga': peso,
+                'puerto': puertos[idx],
+                'cliente': clientes[idx],
+                'cliente_empresa': empresa,
+                'cd_entrega': None,
+            }
+            fecha_eta = aware(fechas_eta[idx])
+            if fecha_eta:
+                datos['fecha_eta'] = fecha_eta
+
+            container = contenedores.get(container_id)
+            created = container is None
+            if created:
+                container = Container(container_id=container_id, estado='por_arribar', **datos)
+                contenedores[container_id] = container
+                lote.crear(container)
+                lote.evento(container, 'import_embarque', {
+                    'nave': datos['nave'],
+                    'tipo': datos['tipo'],
+                    'cliente': datos['cliente'],
+                    'cliente_empresa_id': empresa.pk,
+                })
+                self.resultados['creados'] += 1
+            else:
+                campos = [field for field, value in datos.items() if value is not None]
+                for field in campos:
+                    setattr(container, field, datos[field])
+                lote.actualizar(container, *campos)
+                self.resultados['actualizados'] += 1
+
+            self.resultados['detalles'].append({
+                'fila': idx + 2,
+                'container_id': container_id,
+                'accion': 'creado' if created else 'actualizado',
+                'nave': datos['nave'],
+                'cliente': datos['cliente'],
+                'cliente_empresa_id': empresa.pk,
+                'cd_entrega': None,
+            })
+
+        lote.guardar()
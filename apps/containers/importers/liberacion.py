@@ -7,12 +7,12 @@ Asigna posición física según reglas:
 """
 import pandas as pd
 from django.utils import timezone
-from django.db import transaction
 from datetime import datetime
 import logging
-from apps.containers.models import Container
-from apps.events.models import Event
 from apps.core.services.excel import normalize_columns, read_excel_with_header_detection
+from apps.containers.importers.bulk import (
+    ImportBatch, aware, fechas, normalizar_ids, numeros, texto,
+)
 
 
 logger = logging.getLogger(__name__)
@@ -33,6 +33,8 @@ class LiberacionImporter:
     Mapeo automático de posiciones:
     - TPS → ZEAL
     - STI / PCE → CLEP
+
+    La planilla se procesa en lote: ver apps.containers.importers.bulk.
     """
     
     COLUMNAS_REQUERIDAS = ['container_id', 'posicion_fisica']
@@ -46,6 +48,7 @@ class LiberacionImporter:
     def __init__(self, archivo_path, usuario=None):
         self.archivo_path = archivo_path
         self.usuario = usuario
+        self.on_progress = None  # callable(filas_procesadas, filas_totales)
         self.resultados = {
             'liberados': 0,
             'por_liberar': 0,  # Contenedores con fecha futura
@@ -100,6 +103,20 @@ class LiberacionImporter:
         
         # Si no está en el mapeo, retornar la original
         return posicion
+
+    def mapear_posiciones(self, posiciones):
+        """mapear_posicion aplicado a una columna completa"""
+        return posiciones.map(self.mapear_posicion)
+
+    @staticmethod
+    def parsear_hora(valor):
+        """Hora de liberación (string HH:MM:SS o datetime); None si no se puede leer"""
+        try:
+            if isinstance(valor, str):
+                return pd.to_datetime(valor, format='%H:%M:%S').time()
+            return pd.to_datetime(valor).time()
+        except Exception:
+            return None
     
     def procesar(self):
         """Procesa el archivo Excel y actualiza contenedores a liberado"""
@@ -126,169 +143,8 @@ class LiberacionImporter:
                 extra={'archivo': self.archivo_path, 'filas': len(df), 'usuario': self.usuario}
             )
             
-            # Procesar cada fila
-            for idx, row in df.iterrows():
-                try:
-                    with transaction.atomic():
-                        # Normalizar container_id (eliminar espacios y guiones)
-                        container_id_raw = str(row['container_id']).strip().upper()
-                        container_id = Container.normalize_container_id(container_id_raw)
-
-                        if not container_id or container_id == 'NAN':
-                            self.resultados['errores'] += 1
-                            self.resultados['detalles'].append({
-                                'fila': idx + 2,
-                                'error': 'Container ID vacío'
-                            })
-                            continue
-
-                        # Buscar contenedor
-                        try:
-                            container = Container.objects.get(container_id=container_id)
-                        except Container.DoesNotExist:
-                            self.resultados['no_encontrados'] += 1
-                            self.resultados['detalles'].append({
-                                'fila': idx + 2,
-                                'container_id': container_id,
-                                'error': 'Contenedor no encontrado en el sistema'
-                            })
-                            continue
-
-                        # Mapear posición física
-                        posicion_original = row.get('posicion_fisica')
-                        posicion_mapeada = self.mapear_posicion(posicion_original)
-                        if not posicion_mapeada:
-                            raise ValueError('Posición física vacía o inválida')
-
-                        # Parsear fecha y hora de liberación desde el Excel
-                        fecha_liberacion = None
-                        if 'fecha_liberacion' in df.columns and pd.notna(row.get('fecha_liberacion')):
-                            try:
-                                fecha_lib = pd.to_datetime(row['fecha_liberacion'])
-                                # Combinar con hora si está disponible
-                                if 'hora_liberacion' in df.columns and pd.notna(row.get('hora_liberacion')):
-                                    try:
-                                        # Intentar parsear hora (puede venir como datetime o string)
-                                        if isinstance(row['hora_liberacion'], str):
-                                            hora_lib = pd.to_datetime(row['hora_liberacion'], format='%H:%M:%S').time()
-                                        else:
-                                            hora_lib = pd.to_datetime(row['hora_liberacion']).time()
-                                        fecha_liberacion = timezone.make_aware(datetime.combine(fecha_lib.date(), hora_lib))
-                                    except Exception:
-                                        # Si falla el parseo de hora, usar solo fecha
-                                        fecha_liberacion = timezone.make_aware(fecha_lib) if timezone.is_naive(fecha_lib) else fecha_lib
-                                else:
-                                    fecha_liberacion = timezone.make_aware(fecha_lib) if timezone.is_naive(fecha_lib) else fecha_lib
-                            except Exception as fecha_error:
-                                raise ValueError(
-                                    f"Fecha de liberación inválida '{row.get('fecha_liberacion')}': {str(fecha_error)}"
-                                )
-
-                        # Si no hay fecha de liberación en el Excel, usar la fecha actual
-                        if not fecha_liberacion:
-                            fecha_liberacion = timezone.now()
-
-                        # Determinar el estado basado en la fecha de liberación
-                        now = timezone.now()
-                        if fecha_liberacion <= now:
-                            nuevo_estado = 'liberado'
-                        else:
-                            nuevo_estado = 'por_arribar'
-
-                        if container.estado != nuevo_estado:
-                            container.cambiar_estado(
-                                nuevo_estado,
-                                self.usuario,
-                                permitir_reversion=(nuevo_estado == 'por_arribar'),
-                            )
-
-                        container.posicion_fisica = posicion_mapeada
-                        # Respetar fecha de Excel por trazabilidad operativa
-                        container.fecha_liberacion = fecha_liberacion
-
-                        # Comuna si viene en el Excel
-                        if 'comuna' in df.columns and pd.notna(row.get('comuna')):
-                            container.comuna = str(row['comuna']).strip()
-
-                        # Depósito de devolución si viene en el Excel
-                        if 'deposito_devolucion' in df.columns and pd.notna(row.get('deposito_devolucion')):
-                            container.deposito_devolucion = str(row['deposito_devolucion']).strip()
-
-                        # Actualizar peso_carga si viene en el Excel (puede ser más preciso que el inicial)
-                        if 'peso' in df.columns and pd.notna(row.get('peso')):
-                            peso = float(row['peso'])
-                            if peso <= 0:
-                                raise ValueError('Peso inválido: debe ser mayor a 0')
-                            container.peso_carga = peso
-
-                        # Cliente y referencia
-                        if 'cliente' in df.columns and pd.notna(row.get('cliente')):
-                            container.cliente = str(row['cliente']).strip()
-
-                        if 'referencia' in df.columns and pd.notna(row.get('referencia')):
-                            container.referencia = str(row['referencia']).strip()
+            self._procesar_en_lote(df)
 
-                        # Fecha salida puede usarse para calcular fecha_demurrage
-                        # Nota: La fecha_demurrage real vendrá del Excel de programación
-                        if 'fecha_salida' in df.columns and pd.notna(row.get('fecha_salida')):
-                            try:
-                                if isinstance(row['fecha_salida'], str):
-                                    pd.to_datetime(row['fecha_salida'])
-                                else:
-                                    pd.to_datetime(row['fecha_salida'])
-                            except Exception as salida_error:
-                                raise ValueError(
-                                    f"Fecha salida inválida '{row.get('fecha_salida')}': {str(salida_error)}"
-                                )
-
-                        container.save()
-                    
-                    # Registrar evento
-                    Event.objects.create(
-                        container=container,
-                        event_type='import_liberacion',
-                        detalles={
-                            'posicion_original': str(posicion_original) if pd.notna(posicion_original) else None,
-                            'posicion_mapeada': posicion_mapeada,
-                            'comuna': container.comuna,
-                            'fecha_liberacion': fecha_liberacion.isoformat(),
-                            'estado_resultante': nuevo_estado,
-                        },
-                        usuario=self.usuario
-                    )
-                    
-                    # Actualizar contador según el estado resultante
-                    if nuevo_estado == 'liberado':
-                        self.resultados['liberados'] += 1
-                    else:
-                        self.resultados['por_liberar'] += 1
-                    
-                    self.resultados['detalles'].append({
-                        'fila': idx + 2,
-                        'container_id': container_id,
-                        'posicion': posicion_mapeada,
-                        'fecha_liberacion': fecha_liberacion.strftime('%Y-%m-%d %H:%M') if fecha_liberacion else 'N/A',
-                        'estado': nuevo_estado,
-                        'accion': 'liberado' if nuevo_estado == 'liberado' else 'programado para liberación'
-                    })
-                
-                except Exception as e:
-                    logger.warning(
-                        'import_liberacion_row_error',
-                        extra={
-                            'fila': idx + 2,
-                            'container_id': container_id if 'container_id' in locals() else None,
-                            'error': str(e),
-                            'usuario': self.usuario,
-                        }
-                    )
-                    self.resultados['errores'] += 1
-                    self.resultados['detalles'].append({
-                        'fila': idx + 2,
-                        'container_id': container_id if 'container_id' in locals() else 'N/A',
-                        'error': str(e)
-                    })
-            
             logger.info(
                 'import_liberacion_finished',
                 extra={
@@ -305,3 +161,132 @@ class LiberacionImporter:
         except Exception as e:
             logger.exception('import_liberacion_failed', extra={'usuario': self.usuario})
             raise Exception(f"Error al procesar archivo de liberación: {str(e)}")
+
+    def _error_fila(self, idx, container_id, error):
+        logger.warning(
+            'import_liberacion_row_error',
+            extra={'fila': idx + 2, 'container_id': container_id, 'error': str(error), 'usuario': self.usuario}
+        )
+        self.resultados['errores'] += 1
+        self.resultados['detalles'].append({
+            'fila': idx + 2,
+            'container_id': container_id,
+            'error': str(error)
+        })
+
+    def _procesar_en_lote(self, df):
+        """Valida por columnas, lee los contenedores con una consulta y escribe en lote"""
+        ids = normalizar_ids(df['container_id'])
+        posiciones = self.mapear_posiciones(df['posicion_fisica'])
+        fechas_lib, fechas_lib_invalidas = fechas(df, 'fecha_liberacion')
+        horas = (
+            df['hora_liberacion'].map(self.parsear_hora, na_action='ignore')
+            if 'hora_liberacion' in df.columns else pd.Series(None, index=df.index, dtype=object)
+        )
+        _, fechas_salida_invalidas = fechas(df, 'fecha_salida')
+        pesos, pesos_invalidos = numeros(df, 'peso')
+        opcionales = {
+            'comuna': texto(df, 'comuna'),
+            'deposito_devolucion': texto(df, 'deposito_devolucion'),
+            'cliente': texto(df, 'cliente'),
+            'referencia': texto(df, 'referencia'),
+        }
+
+        lote = ImportBatch(self.usuario)
+        contenedores = lote.contenedores(ids)
+        now = timezone.now()
+
+        for posicion, idx in enumerate(df.index, 1):
+            if self.on_progress:
+                self.on_progress(posicion, len(df))
+            container_id = ids[idx]
+            if not container_id:
+                self.resultados['errores'] += 1
+                self.resultados['detalles'].append({
+                    'fila': idx + 2,
+                    'error': 'Container ID vacío'
+                })
+                continue
+
+            container = contenedores.get(container_id)
+            if container is None:
+                self.resultados['no_encontrados'] += 1
+                self.resultados['detalles'].append({
+                    'fila': idx + 2,
+                    'container_id': container_id,
+                    'error': 'Contenedor no encontrado en el sistema'
+                })
+                continue
+
+            posicion_original = df.at[idx, 'posicion_fisica']
+            posicion_mapeada = posiciones[idx]
+            try:
+                if not posicion_mapeada:
+                    raise ValueError('Posición física vacía o inválida')
+                if fechas_lib_invalidas[idx]:
+                    raise ValueError(f"Fecha de liberación inválida '{df.at[idx, 'fecha_liberacion']}'")
+                if pesos_invalidos[idx]:
+                    raise ValueError(f"Peso inválido: {df.at[idx, 'peso']}")
+                peso = None if pd.isna(pesos[idx]) else float(pesos[idx])
+                if peso is not None and peso <= 0:
+                    raise ValueError('Peso inválido: debe ser mayor a 0')
+                if fechas_salida_invalidas[idx]:
+                    raise ValueError(f"Fecha salida inválida '{df.at[idx, 'fecha_salida']}'")
+
+                fecha_liberacion = None
+                if pd.notna(fechas_lib[idx]):
+                    hora = horas[idx]
+                    if hora is not None and not pd.isna(hora):
+                        fecha_liberacion = timezone.make_aware(
+                            datetime.combine(fechas_lib[idx].date(), hora)
+                        )
+                    else:
+                        fecha_liberacion = aware(fechas_lib[idx])
+                fecha_liberacion = fecha_liberacion or now
+                nuevo_estado = 'liberado' if fecha_liberacion <= now else 'por_arribar'
+
+                # Última validación: si la transición es inválida la fila no modifica nada.
+                lote.cambiar_estado(
+                    container, nuevo_estado,
+                    permitir_reversion=(nuevo_estado == 'por_arribar'),
+                    now=now,
+                )
+            except Exception as e:
+                self._error_fila(idx, container_id, e)
+                continue
+
+            container.posicion_fisica = posicion_mapeada
+            container.fecha_liberacion = fecha_liberacion
+            campos = ['posicion_fisica', 'fecha_liberacion']
+            for campo, valores in opcionales.items():
+                if valores[idx] is not None:
+                    setattr(container, campo, valores[idx])
+                    campos.append(campo)
+            if peso is not None:
+                container.peso_carga = peso
+                campos.append('peso_carga')
+            lote.actualizar(container, *campos)
+
+            lote.evento(container, 'import_liberacion', {
+                'posicion_original': str(posicion_original) if pd.notna(posicion_original) else None,
+                'posicion_mapeada': posicion_mapeada,
+                'comuna': container.comuna,
+                'fecha_liberacion': fecha_liberacion.isoformat(),
+                'estado_resultante': nuevo_estado,
+            })
+
+            if nuevo_estado == 'liberado':
+                self.resultados['liberados'] += 1
+            else:
+                self.resultados['por_liberar'] += 1
+
+            self.resultados['detalles'].append({
+                'fila': idx + 2,
+                'container_id': container_id,
+                'posicion': posicion_mapeada,
+                'fecha_liberacion': fecha_liberacion.strftime('%Y-%m-%d %H:%M'),
+                'estado': nuevo_estado,
+                'accion': 'liberado' if nuevo_estado == 'liberado' else 'programado para liberación'
+            })
+
+        lote.guardar()
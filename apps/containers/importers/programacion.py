@@ -11,8 +11,9 @@ import logging
 from apps.containers.models import Container
 from apps.programaciones.models import Programacion
 from apps.cds.models import CD
-from apps.events.models import Event
+from apps.core.services.slot_calendar import SlotCalendarService
 from apps.core.services.excel import normalize_columns, read_excel_with_header_detection
+from apps.containers.importers.bulk import ImportBatch, normalizar_ids, texto
 
 
 logger = logging.getLogger(__name__)
@@ -34,6 +35,8 @@ class ProgramacionImporter:
     
     Nota: Si existe Fecha Demurrage, se usa directamente. 
     Si existe WK Demurrage, se calcula desde fecha_liberacion.
+
+    La planilla se procesa en lote: ver apps.containers.importers.bulk.
     """
     
     COLUMNAS_REQUERIDAS = ['container_id', 'fecha_programada', 'cd']
@@ -41,6 +44,7 @@ class ProgramacionImporter:
     def __init__(self, archivo_path, usuario=None):
         self.archivo_path = archivo_path
         self.usuario = usuario
+        self.on_progress = None  # callable(filas_procesadas, filas_totales)
         self.resultados = {
             'programados': 0,
             'no_encontrados': 0,
@@ -110,47 +114,59 @@ class ProgramacionImporter:
                 continue
         
         raise ValueError(f"Formato de fecha no reconocido: {fecha_str}")
+
+    def combinar_hora(self, fecha_programada, hora_prog):
+        """Combina la fecha programada con la hora de la planilla (datetime, time o string)"""
+        try:
+            if isinstance(hora_prog, str):
+                # Si es string, intentar parsear
+                hora_time = pd.to_datetime(hora_prog, format='%H:%M:%S').time()
+            elif hasattr(hora_prog, 'time'):
+                # Si es datetime, extraer time
+                hora_time = hora_prog.time()
+            else:
+                # Si es time object, usar directamente
+                hora_time = hora_prog
+
+            return timezone.make_aware(datetime.combine(fecha_programada.date(), hora_time))
+        except Exception as hora_error:
+            raise ValueError(
+                f"Hora programada inválida '{hora_prog}': {str(hora_error)}"
+            )
     
     def buscar_cd(self, cd_str):
-        """Busca un CD por nombre o código, extrayendo nombre de formato 'codigo - nombre'"""
+        """Busca un CD activo por nombre o código, extrayendo nombre de formato 'codigo - nombre'"""
+        return self.buscar_cd_en(cd_str, list(CD.objects.filter(activo=True)))
+    
+    def buscar_cd_en(self, cd_str, cds):
+        """buscar_cd sobre una lista de CDs activos ya cargada: código, luego nombre (contiene)"""
         if pd.isna(cd_str):
             return None
-        
+
         cd_str = str(cd_str).strip()
-        
-        # Si viene en formato "6020 - PEÑÓN", extraer la parte del nombre
+
+        def por_codigo(codigo):
+            return [cd for cd in cds if (cd.codigo or '').lower() == codigo.lower()]
+
+        def por_nombre(nombre):
+            return [cd for cd in cds if nombre.lower() in (cd.nombre or '').lower()]
+
         if ' - ' in cd_str:
             partes = cd_str.split(' - ')
-            codigo_parte = partes[0].strip()
-            nombre_parte = partes[1].strip()
-            
-            # Buscar primero por código
-            cd = CD.objects.filter(codigo__iexact=codigo_parte, activo=True).first()
-            if cd:
-                return cd
-            
-            # Si no, buscar por nombre
-            cd = CD.objects.filter(nombre__icontains=nombre_parte, activo=True).first()
-            if cd:
-                return cd
-        
-        # Buscar por código exacto
-        cds_codigo = CD.objects.filter(codigo__iexact=cd_str, activo=True)
-        if cds_codigo.count() > 1:
+            coincidencias = por_codigo(partes[0].strip()) or por_nombre(partes[1].strip())
+            if coincidencias:
+                return coincidencias[0]
+
+        coincidencias = por_codigo(cd_str)
+        if len(coincidencias) > 1:
             raise ValueError(f"CD ambiguo por código: {cd_str}")
-        cd = cds_codigo.first()
-        if cd:
-            return cd
-        
-        # Buscar por nombre (contiene)
-        cds_nombre = CD.objects.filter(nombre__icontains=cd_str, activo=True)
-        if cds_nombre.count() > 1:
+        if coincidencias:
+            return coincidencias[0]
+
+        coincidencias = por_nombre(cd_str)
+        if len(coincidencias) > 1:
             raise ValueError(f"CD ambiguo por nombre: {cd_str}")
-        cd = cds_nombre.first()
-        if cd:
-            return cd
-        
-        return None
+        return coincidencias[0] if coincidencias else None
     
     def procesar(self):
         """Procesa el archivo Excel y crea programaciones"""
@@ -177,201 +193,8 @@ class ProgramacionImporter:
                 extra={'archivo': self.archivo_path, 'filas': len(df), 'usuario': self.usuario}
             )
             
-            # Procesar cada fila
-            for idx, row in df.iterrows():
-                try:
-                    with transaction.atomic():
-                        # Normalizar container_id (eliminar espacios y guiones)
-                        container_id_raw = str(row['container_id']).strip().upper()
-                        container_id = Container.normalize_container_id(container_id_raw)
-
-                        if not container_id or container_id == 'NAN':
-                            self.resultados['errores'] += 1
-                            self.resultados['detalles'].append({
-                                'fila': idx + 2,
-                                'error': 'Container ID vacío'
-                            })
-                            continue
-
-                        # Buscar contenedor
-                        try:
-                            container = Container.objects.get(container_id=container_id)
-                        except Container.DoesNotExist:
-                            self.resultados['no_encontrados'] += 1
-                            self.resultados['detalles'].append({
-                                'fila': idx + 2,
-                                'container_id': container_id,
-                                'error': 'Contenedor no encontrado en el sistema'
-                            })
-                            continue
-
-                        # Parsear fecha y combinar con hora si está disponible
-                        fecha_programada = self.parsear_fecha(row['fecha_programada'])
-                        if not fecha_programada:
-                            self.resultados['errores'] += 1
-                            self.resultados['detalles'].append({
-                                'fila': idx + 2,
-                                'container_id': container_id,
-                                'error': 'Fecha programada inválida'
-                            })
-                            continue
-
-                        # Combinar con hora si está disponible
-                        if 'hora_programada' in df.columns and pd.notna(row.get('hora_programada')):
-                            try:
-                                # Intentar parsear hora (puede venir como datetime, time, o string)
-                                hora_prog = row['hora_programada']
-                                if isinstance(hora_prog, str):
-                                    # Si es string, intentar parsear
-                                    hora_time = pd.to_datetime(hora_prog, format='%H:%M:%S').time()
-                                elif hasattr(hora_prog, 'time'):
-                                    # Si es datetime, extraer time
-                                    hora_time = hora_prog.time()
-                                else:
-                                    # Si es time object, usar directamente
-                                    hora_time = hora_prog
-
-                                # Combinar fecha con hora
-                                fecha_programada = timezone.make_aware(
-                                    datetime.combine(fecha_programada.date(), hora_time)
-                                )
-                            except Exception as hora_error:
-                                raise ValueError(
-                                    f"Hora programada inválida '{row.get('hora_programada')}': {str(hora_error)}"
-                                )
-
-                        # Buscar CD
-                        cd = self.buscar_cd(row['cd'])
-                        if not cd:
-                            self.resultados['cd_no_encontrado'] += 1
-                            self.resultados['detalles'].append({
-                                'fila': idx + 2,
-                                'container_id': container_id,
-                                'error': f"CD no encontrado: {row['cd']}"
-                            })
-                            continue
-
-                        # Cliente (puede venir de Programacion pero actualizar Container)
-                        cliente = str(row.get('cliente', 'N/A')).strip() if pd.notna(row.get('cliente')) else 'N/A'
-
-                        # Actualizar datos del contenedor desde programación
-                        if 'contenido' in df.columns and pd.notna(row.get('contenido')):
-                            container.contenido = str(row['contenido']).strip()
-
-                        if 'referencia' in df.columns and pd.notna(row.get('referencia')):
-                            container.referencia = str(row['referencia']).strip()
-
-                        # Actualizar nave si viene en el Excel de programación
-                        if 'nave' in df.columns and pd.notna(row.get('nave')):
-                            nave_prog = str(row['nave']).strip()
-                            if nave_prog:
-                                container.nave = nave_prog
-
-                        # Combinar MED y TIPO para obtener tipo completo (ej: 40H = 40HC)
-                        if 'medida' in df.columns and 'tipo_contenedor' in df.columns:
-                            medida = str(row.get('medida', '')).strip()
-                            tipo = str(row.get('tipo_contenedor', '')).strip().upper()
-                            if medida and tipo:
-                                if 'H' in tipo and medida == '40':
-                                    container.tipo = '40HC'
-                                elif medida == '20':
-                                    container.tipo = '20'
-                                elif medida == '45':
-                                    container.tipo = '45'
-
-                        container.save()
-
-                        # La naviera libera primero; una planilla de programación no
-                        # puede adelantar un contenedor que sigue por arribar.
-                        if container.estado not in ['liberado', 'secuenciado', 'programado']:
-                            raise ValueError(
-                                f"El contenedor debe estar liberado antes de programarse. "
-                                f"Estado actual: {container.estado}"
-                            )
-
-                        # Crear o actualizar programación
-                        programacion, created = Programacion.objects.update_or_create(
-                            container=container,
-                            defaults={
-                                'cd': cd,
-                                'fecha_programada': fecha_programada,
-                                'cliente': cliente,
-                                'direccion_entrega': str(row.get('direccion_entrega', '')).strip() if pd.notna(row.get('direccion_entrega')) else '',
-                                'observaciones': str(row.get('observaciones', '')).strip() if pd.notna(row.get('observaciones')) else '',
-                            }
-                        )
-
-                        # Actualizar estado del contenedor
-                        if container.estado in ['liberado', 'secuenciado']:
-                            container.cambiar_estado('programado', self.usuario)
-
-                        # Actualizar fecha_demurrage si está disponible en el Excel
-                        if 'fecha_demurrage' in df.columns and pd.notna(row.get('fecha_demurrage')):
-                            fecha_demurrage = self.parsear_fecha(row['fecha_demurrage'])
-                            if fecha_demurrage:
-                                container.fecha_demurrage = fecha_demurrage
-                                container.save(update_fields=['fecha_demurrage', 'updated_at'])
-
-                        # Alternativamente, calcular desde WK DEMURRAGE (días)
-                        elif 'dias_demurrage' in df.columns and pd.notna(row.get('dias_demurrage')):
-                            dias = int(str(row['dias_demurrage']).replace(' días', '').replace('días', '').strip())
-                            if container.fecha_liberacion:
-                                container.fecha_demurrage = container.fecha_liberacion + timedelta(days=dias)
-                                container.save(update_fields=['fecha_demurrage', 'updated_at'])
-
-                        # Verificar si requiere alerta 48h
-                        if programacion.verificar_alerta():
-                            self.resultados['alertas_generadas'] += 1
-                            Event.objects.create(
-                                container=container,
-                                event_type='alerta_48h',
-                                detalles={
-                                    'fecha_programada': fecha_programada.isoformat(),
-                                    'horas_restantes': programacion.horas_hasta_programacion,
-                                },
-                                usuario=self.usuario
-                            )
-
-                        # Registrar evento de importación
-                        if created:
-                            Event.objects.create(
-                                container=container,
-                                event_type='import_programacion',
-                                detalles={
-                                    'fecha_programada': fecha_programada.isoformat(),
-                                    'cliente': cliente,
-                                    'cd': cd.nombre,
-                                },
-                                usuario=self.usuario
-                            )
-
-                        self.resultados['programados'] += 1
-                        self.resultados['detalles'].append({
-                            'fila': idx + 2,
-                            'container_id': container_id,
-                            'fecha': fecha_programada.strftime('%Y-%m-%d %H:%M'),
-                            'cd': cd.nombre,
-                            'alerta': programacion.requiere_alerta,
-                            'accion': 'creado' if created else 'actualizado'
-                        })
-                
-                except Exception as e:
-                    logger.warning(
-                        'import_programacion_row_error',
-                        extra={
-                            'fila': idx + 2,
-                            'container_id': container_id if 'container_id' in locals() else None,
-                            'error': str(e),
-                            'usuario': self.usuario,
-                        }
-                    )
-                    self.resultados['errores'] += 1
-                    self.resultados['detalles'].append({
-                        'fila': idx + 2,
-                        'container_id': container_id if 'container_id' in locals() else 'N/A',
-                        'error': str(e)
-                    })
-            
+            self._procesar_en_lote(df)
+
             logger.info(
                 'import_programacion_finished',
                 extra={
@@ -389,3 +212,220 @@ class ProgramacionImporter:
         except Exception as e:
             logger.exception('import_programacion_failed', extra={'usuario': self.usuario})
             raise Exception(f"Error al procesar archivo de programación: {str(e)}")
+
+    def _error_fila(self, idx, container_id, error):
+        logger.warning(
+            'import_programacion_row_error',
+            extra={'fila': idx + 2, 'container_id': container_id, 'error': str(error), 'usuario': self.usuario}
+        )
+        self.resultados['errores'] += 1
+        self.resultados['detalles'].append({
+            'fila': idx + 2,
+            'container_id': container_id,
+            'error': str(error)
+        })
+
+    def _cambios_contenedor(self, df, idx):
+        """Campos del contenedor que la fila actualiza (contenido, referencia, nave, tipo)"""
+        cambios = {}
+        for columna in ('contenido', 'referencia'):
+            if columna in df.columns and pd.notna(df.at[idx, columna]):
+                cambios[columna] = str(df.at[idx, columna]).strip()
+        if 'nave' in df.columns and pd.notna(df.at[idx, 'nave']):
+            nave_prog = str(df.at[idx, 'nave']).strip()
+            if nave_prog:
+                cambios['nave'] = nave_prog
+        if 'medida' in df.columns and 'tipo_contenedor' in df.columns:
+            medida = str(df.at[idx, 'medida']).strip()
+            tipo = str(df.at[idx, 'tipo_contenedor']).strip().upper()
+            if medida and tipo:
+                if 'H' in tipo and medida == '40':
+                    cambios['tipo'] = '40HC'
+                elif medida == '20':
+                    cambios['tipo'] = '20'
+                elif medida == '45':
+                    cambios['tipo'] = '45'
+        return cambios
+
+    def _fecha_demurrage(self, df, idx, container):
+        if 'fecha_demurrage' in df.columns and pd.notna(df.at[idx, 'fecha_demurrage']):
+            return self.parsear_fecha(df.at[idx, 'fecha_demurrage'])
+        if 'dias_demurrage' in df.columns and pd.notna(df.at[idx, 'dias_demurrage']):
+            dias = int(str(df.at[idx, 'dias_demurrage']).replace(' días', '').replace('días', '').strip())
+            if container.fecha_liberacion:
+                return container.fecha_liberacion + timedelta(days=dias)
+        return None
+
+    def _procesar_en_lote(self, df):
+        """
+        Valida por columnas, lee contenedores y CDs con una consulta y escribe en lote.
+
+        Las programaciones nuevas se insertan con bulk_create, que no dispara la
+        asignación automática por post_save; se asignan juntas al confirmar la
+        transacción con AssignmentService.asignar_multiples.
+        """
+        ids = normalizar_ids(df['container_id'])
+        clientes = texto(df, 'cliente', 'N/A')
+        direcciones = texto(df, 'direccion_entrega', '')
+        observaciones = texto(df, 'observaciones', '')
+
+        lote = ImportBatch(self.usuario)
+        contenedores = lote.contenedores(ids)
+        cds = list(CD.objects.filter(activo=True))
+        cds_por_texto = {}
+        programaciones = {
+            p.container_id: p
+            for p in Programacion.objects.filter(container__in=list(contenedores.values()))
+        }
+        nuevas, actualizadas = [], {}
+        now = timezone.now()
+
+        for posicion, idx in enumerate(df.index, 1):
+            if self.on_progress:
+                self.on_progress(posicion, len(df))
+            container_id = ids[idx]
+            if not container_id:
+                self.resultados['errores'] += 1
+                self.resultados['detalles'].append({
+                    'fila': idx + 2,
+                    'error': 'Container ID vacío'
+                })
+                continue
+
+            container = contenedores.get(container_id)
+            if container is None:
+                self.resultados['no_encontrados'] += 1
+                self.resultados['detalles'].append({
+                    'fila': idx + 2,
+                    'container_id': container_id,
+                    'error': 'Contenedor no encontrado en el sistema'
+                })
+                continue
+
+            try:
+                fecha_programada = self.parsear_fecha(df.at[idx, 'fecha_programada'])
+                if not fecha_programada:
+                    self._error_fila(idx, container_id, 'Fecha programada inválida')
+                    continue
+                if 'hora_programada' in df.columns and pd.notna(df.at[idx, 'hora_programada']):
+                    fecha_programada = self.combinar_hora(fecha_programada, df.at[idx, 'hora_programada'])
+
+                cd_raw = df.at[idx, 'cd']
+                clave_cd = None if pd.isna(cd_raw) else str(cd_raw).strip()
+                if clave_cd not in cds_por_texto:
+                    cds_por_texto[clave_cd] = self.buscar_cd_en(cd_raw, cds)
+                cd = cds_por_texto[clave_cd]
+                if not cd:
+                    self.resultados['cd_no_encontrado'] += 1
+                    self.resultados['detalles'].append({
+                        'fila': idx + 2,
+                        'container_id': container_id,
+                        'error': f"CD no encontrado: {cd_raw}"
+                    })
+                    continue
+
+                # La naviera libera primero; una planilla de programación no
+                # puede adelantar un contenedor que sigue por arribar.
+                if container.estado not in ['liberado', 'secuenciado', 'programado']:
+                    raise ValueError(
+                        f"El contenedor debe estar liberado antes de programarse. "
+                        f"Estado actual: {container.estado}"
+                    )
+                fecha_demurrage = self._fecha_demurrage(df, idx, container)
+            except Exception as e:
+                self._error_fila(idx, container_id, e)
+                continue
+
+            cambios = self._cambios_contenedor(df, idx)
+            for campo, valor in cambios.items():
+                setattr(container, campo, valor)
+            lote.actualizar(container, *cambios)
+
+            datos = {
+                'cd': cd,
+                'fecha_programada': fecha_programada,
+                'cliente': clientes[idx],
+                'direccion_entrega': direcciones[idx],
+                'observaciones': observaciones[idx],
+            }
+            programacion = programaciones.get(container.pk)
+            created = programacion is None
+            if created:
+                programacion = Programacion(container=container, **datos)
+                programaciones[container.pk] = programacion
+                nuevas.append(programacion)
+            else:
+                for campo, valor in datos.items():
+                    setattr(programacion, campo, valor)
+                if programacion.pk:
+                    actualizadas[programacion.pk] = programacion
+
+            if container.estado in ['liberado', 'secuenciado']:
+                lote.cambiar_estado(container, 'programado', now=now)
+
+            if fecha_demurrage:
+                container.fecha_demurrage = fecha_demurrage
+                lote.actualizar(container, 'fecha_demurrage')
+
+            # Programacion.verificar_alerta sin guardar: se persiste en lote
+            horas = programacion.horas_hasta_programacion
+            requiere = not programacion.driver_id and 0 < horas < 48
+            programacion.requiere_alerta = requiere
+            if requiere:
+                self.resultados['alertas_generadas'] += 1
+                lote.evento(container, 'alerta_48h', {
+                    'fecha_programada': fecha_programada.isoformat(),
+                    'horas_restantes': horas,
+                })
+
+            if created:
+                lote.evento(container, 'import_programacion', {
+                    'fecha_programada': fecha_programada.isoformat(),
+                    'cliente': datos['cliente'],
+                    'cd': cd.nombre,
+                })
+
+            self.resultados['programados'] += 1
+            self.resultados['detalles'].append({
+                'fila': idx + 2,
+                'container_id': container_id,
+                'fecha': fecha_programada.strftime('%Y-%m-%d %H:%M'),
+                'cd': cd.nombre,
+                'alerta': programacion.requiere_alerta,
+                'accion': 'creado' if created else 'actualizado'
+            })
+
+        def escribir_programaciones():
+            if nuevas:
+                Programacion.objects.bulk_create(nuevas, batch_size=ImportBatch.BATCH_SIZE)
+            if actualizadas:
+                for programacion in actualizadas.values():
+                    programacion.updated_at = now
+                Programacion.objects.bulk_update(
+                    list(actualizadas.values()),
+                    ['cd', 'fecha_programada', 'cliente', 'direccion_entrega', 'observaciones',
+                     'requiere_alerta', 'updated_at'],
+                    batch_size=ImportBatch.BATCH_SIZE,
+                )
+            # bulk_create/bulk_update no emiten post_save: calendario de cupos en lote
+            SlotCalendarService.actualizar_programaciones(nuevas + list(actualizadas.values()))
+            pendientes = [p for p in nuevas if not p.driver_id]
+            if pendientes:
+                transaction.on_commit(lambda: self._asignar_nuevas([p.pk for p in pendientes]))
+
+        lote.guardar(escribir_programaciones)
+
+    def _asignar_nuevas(self, programacion_ids):
+        """Asignación automática conjunta de las programaciones creadas en lote"""
+        from apps.core.services.assignment import AssignmentService
+
+        try:
+            programaciones = list(
+                Programacion.objects.filter(pk__in=programacion_ids).select_related('container', 'cd')
+            )
+            AssignmentService.asignar_multiples(programaciones, usuario='system_auto_assign')
+        except Exception as e:
+            logger.error(
+                f"Falló la asignación automática del lote importado ({len(programacion_ids)} programaciones): {e}",
+                exc_info=True
+            )
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cds', '0004_cd_cliente_empresa'),
+        ('clientes', '0002_situacioncliente'),
+        ('containers', '0011_container_cliente_empresa'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='container',
+            index=models.Index(fields=['updated_at'], name='containers__updated_01d869_idx'),
+        ),
+    ]
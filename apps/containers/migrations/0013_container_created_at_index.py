@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cds', '0004_cd_cliente_empresa'),
+        ('clientes', '0002_situacioncliente'),
+        ('containers', '0012_container_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='container',
+            index=models.Index(fields=['created_at'], name='containers__created_b1fbbc_idx'),
+        ),
+    ]
@@ -145,6 +145,8 @@ class Container(models.Model):
             models.Index(fields=['estado']),
             models.Index(fields=['fecha_programacion']),
             models.Index(fields=['secuenciado']),
+            models.Index(fields=['updated_at']),
+            models.Index(fields=['created_at']),
         ]
     
     def __str__(self):
@@ -232,7 +234,11 @@ class Container(models.Model):
     @property
     def urgencia_demurrage(self):
         """Retorna nivel de urgencia basado en días para demurrage"""
-        dias = self.dias_para_demurrage
+        return self.urgencia_para_dias(self.dias_para_demurrage)
+
+    @staticmethod
+    def urgencia_para_dias(dias):
+        """Nivel de urgencia para `dias` restantes hasta demurrage (None = sin fecha)"""
         if dias is None:
             return 'sin_fecha'
         if dias < 0:
@@ -250,16 +256,78 @@ class Container(models.Model):
         if not self.tara:
             self.tara = self.get_tara_default()
         super().save(*args, **kwargs)
+
+    # Campos cuyos cambios disparan los efectos post_save (apps.containers.signals)
+    CAMPOS_SEGUIDOS = ('estado', 'fecha_demurrage', 'cd_entrega_id', 'fecha_descarga')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.marcar_sincronizado()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        # Los campos recargados (también los diferidos al accederlos) vuelven a ser la referencia
+        originales = getattr(self, '_valores_originales', None)
+        if originales is None:
+            return
+        recargados = None if fields is None else {getattr(self._meta.get_field(campo), 'attname', campo) for campo in fields}
+        for campo in self.CAMPOS_SEGUIDOS:
+            if (recargados is None or campo in recargados) and campo in self.__dict__:
+                originales[campo] = self.__dict__[campo]
+
+    def marcar_sincronizado(self):
+        """Toma los valores actuales de CAMPOS_SEGUIDOS como los persistidos."""
+        self._valores_originales = {
+            campo: self.__dict__[campo] for campo in self.CAMPOS_SEGUIDOS if campo in self.__dict__
+        }
+
+    def valor_original(self, campo):
+        """Valor persistido de un campo de CAMPOS_SEGUIDOS (el actual si no hay referencia)."""
+        return (getattr(self, '_valores_originales', None) or {}).get(campo, self.__dict__.get(campo))
+
+    def campos_cambiados(self):
+        """
+        CAMPOS_SEGUIDOS modificados desde que se leyó o guardó la instancia.
+        Sin valores de referencia (instancia nueva) se consideran todos cambiados.
+        """
+        originales = getattr(self, '_valores_originales', None)
+        if originales is None:
+            return set(self.CAMPOS_SEGUIDOS)
+        return {
+            campo for campo in self.CAMPOS_SEGUIDOS
+            # Un campo diferido que no se cargó tampoco se modificó
+            if campo in self.__dict__ and (campo not in originales or originales[campo] != self.__dict__[campo])
+        }
     
-    def cambiar_estado(self, nuevo_estado, usuario=None, *, permitir_reversion=False):
-        """Cambia el estado y registra el timestamp correspondiente"""
+    TIMESTAMPS_ESTADO = {
+        'liberado': 'fecha_liberacion',
+        'programado': 'fecha_programacion',
+        'asignado': 'fecha_asignacion',
+        'en_ruta': 'fecha_inicio_ruta',
+        'entregado': 'fecha_entrega',
+        'soltado': 'fecha_soltado',
+        'descargado': 'fecha_descarga',
+        'vacio': 'fecha_vacio',
+        'vacio_en_ruta': 'fecha_vacio_ruta',
+        'devuelto': 'fecha_devolucion',
+    }
+
+    def aplicar_transicion(self, nuevo_estado, *, permitir_reversion=False, now=None):
+        """
+        Valida y aplica en memoria un cambio de estado, sin guardar.
+
+        Retorna el estado anterior. Lo usan cambiar_estado y los importadores
+        en lote, que persisten con bulk_update.
+        """
         estados = {value for value, _ in self.ESTADOS}
         if nuevo_estado not in estados:
             raise ValidationError(f"Estado desconocido: {nuevo_estado}")
 
         estado_anterior = self.estado
         if nuevo_estado == estado_anterior:
-            return self
+            return estado_anterior
         permitidos = self.TRANSICIONES_VALIDAS.get(estado_anterior, set())
         if nuevo_estado not in permitidos and not permitir_reversion:
             raise ValidationError(
@@ -268,28 +336,24 @@ class Container(models.Model):
         self.estado = nuevo_estado
         
         # Actualizar timestamp según el nuevo estado
-        now = timezone.now()
-        timestamp_map = {
-            'liberado': 'fecha_liberacion',
-            'programado': 'fecha_programacion',
-            'asignado': 'fecha_asignacion',
-            'en_ruta': 'fecha_inicio_ruta',
-            'entregado': 'fecha_entrega',
-            'soltado': 'fecha_soltado',
-            'descargado': 'fecha_descarga',
-            'vacio': 'fecha_vacio',
-            'vacio_en_ruta': 'fecha_vacio_ruta',
-            'devuelto': 'fecha_devolucion',
-        }
-        
-        if nuevo_estado in timestamp_map:
-            setattr(self, timestamp_map[nuevo_estado], now)
+        if nuevo_estado in self.TIMESTAMPS_ESTADO:
+            setattr(self, self.TIMESTAMPS_ESTADO[nuevo_estado], now or timezone.now())
+        return estado_anterior
+
+    def cambiar_estado(self, nuevo_estado, usuario=None, *, permitir_reversion=False):
+        """Cambia el estado y registra el timestamp correspondiente"""
+        if nuevo_estado == self.estado:
+            return self
+        estado_anterior = self.aplicar_transicion(nuevo_estado, permitir_reversion=permitir_reversion)
         
         self.save()
         
+        from apps.core.services.dashboard_stats import DashboardStatsService
+        DashboardStatsService.invalidate()
+        
         # Registrar evento
-        from apps.events.models import Event
-        Event.objects.create(
+        from apps.events.services import EventLog
+        EventLog.registrar(
             container=self,
             event_type='cambio_estado',
             detalles={
@@ -1,4 +1,6 @@
 from rest_framework import serializers
+
+from apps.core.fieldsets import SparseFieldsetSerializerMixin
 from .models import Container
 
 
@@ -29,8 +31,8 @@ class ContainerSerializer(serializers.ModelSerializer):
         return attrs
 
 
-class ContainerListSerializer(serializers.ModelSerializer):
-    """Serializer simplificado para listas"""
+class ContainerListSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
+    """Serializer simplificado para listas (admite `?fields=`)"""
     estado_display = serializers.CharField(source='get_estado_display', read_only=True)
     tipo_movimiento_display = serializers.CharField(source='get_tipo_movimiento_display', read_only=True)
     tipo_carga_display = serializers.CharField(source='get_tipo_carga_display', read_only=True)
@@ -57,6 +59,17 @@ class ContainerListSerializer(serializers.ModelSerializer):
             'fecha_soltado', 'vacio_contabilizado',
             'tiene_programacion'
         ]
+        # Columnas que usan las propiedades y métodos (proyección de `?fields=`)
+        dependencias_campos = {
+            'estado_display': ['estado'],
+            'tipo_movimiento_display': ['tipo_movimiento'],
+            'tipo_carga_display': ['tipo_carga'],
+            'container_id_formatted': ['container_id'],
+            'peso_total': ['peso_carga', 'tara', 'tipo', 'tipo_carga'],
+            'dias_para_demurrage': ['fecha_demurrage'],
+            'urgencia_demurrage': ['fecha_demurrage'],
+            'tiene_programacion': [],
+        }
     
     def get_tiene_programacion(self, obj):
         """Indica si el contenedor tiene una programación asociada"""
@@ -81,5 +94,6 @@ class ContainerStockExportSerializer(serializers.ModelSerializer):
         if not obj.fecha_demurrage:
             return None
         from django.utils import timezone
-        delta = obj.fecha_demurrage - timezone.now()
+        # Las exportaciones fijan `now` en el contexto para no consultarlo por fila
+        delta = obj.fecha_demurrage - (self.context.get('now') or timezone.now())
         return delta.days
@@ -1,66 +1,91 @@
 """
 Django signals para Container
 Maneja automáticamente el inventario de vacíos en CDs
+
+Un solo receiver post_save (`despachar_efectos_post_save`) compara los
+CAMPOS_SEGUIDOS del contenedor con los valores leídos de la base de datos
+(Container.campos_cambiados) y ejecuta sólo los efectos cuyos campos
+disparadores cambiaron. La programación del contenedor se lee a lo más una
+vez por save y la comparten todos los efectos; un save que no toca estado,
+CD de entrega, demurrage ni fecha de descarga no hace ninguna consulta
+adicional.
 """
+import logging
+from datetime import timedelta
+
 from django.db import transaction
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from .models import Container
 
+logger = logging.getLogger(__name__)
 
-@receiver(post_save, sender=Container)
-def sincronizar_estado_con_programacion(sender, instance, created, **kwargs):
+# Anticipación de la alerta de demurrage (alerta_48h)
+VENTANA_DEMURRAGE = timedelta(days=2)
+
+
+class ProgramacionDelContenedor:
+    """Programación del contenedor, consultada a lo más una vez y compartida entre efectos."""
+
+    _SIN_LEER = object()
+
+    def __init__(self, container, programacion=_SIN_LEER):
+        self.container = container
+        self._programacion = programacion
+
+    def get(self):
+        if self._programacion is self._SIN_LEER:
+            from apps.programaciones.models import Programacion
+            self._programacion = Programacion.objects.filter(container=self.container).first()
+        return self._programacion
+
+    def set(self, programacion):
+        self._programacion = programacion
+
+
+def sincronizar_estado_con_programacion(instance, created, programacion):
     """
-    Signal que mantiene sincronizado el estado del contenedor con su programación.
+    Mantiene sincronizado el estado del contenedor con su programación.
     
     Casos:
     1. Si el container vuelve a 'programado' desde 'asignado', limpiar el driver de la programación
     2. Si el container vuelve a 'liberado', eliminar la programación (opcional)
     """
     # Solo procesar si no es creación nueva
-    if created:
+    if created or instance.estado != 'programado':
         return
     
     # Evitar loops infinitos
     if hasattr(instance, '_sincronizacion_en_proceso'):
         return
     
-    from apps.programaciones.models import Programacion
-    
-    try:
-        programacion = Programacion.objects.get(container=instance)
-    except Programacion.DoesNotExist:
-        return  # No hay programación, nada que sincronizar
-    except Programacion.MultipleObjectsReturned:
-        return  # Caso anómalo, no intervenir
-    
+    programacion = programacion.get()
     # Si el contenedor vuelve a 'programado' pero tiene conductor asignado
-    if instance.estado == 'programado' and programacion.driver:
-        # Limpiar asignación del conductor
-        programacion.driver = None
-        programacion.fecha_asignacion = None
-        instance._sincronizacion_en_proceso = True
-        programacion.save(update_fields=['driver', 'fecha_asignacion'])
-        
-        # Crear evento de auditoría
-        from apps.events.models import Event
-        Event.objects.create(
-            container=instance,
-            event_type='cambio_estado',
-            detalles={
-                'estado_nuevo': 'programado',
-                'accion': 'asignacion_removida',
-                'descripcion': 'Asignación de conductor removida al volver a estado programado',
-                'automatico': True
-            }
-        )
+    if programacion is None or not programacion.driver_id:
+        return
 
+    # Limpiar asignación del conductor
+    programacion.driver = None
+    programacion.fecha_asignacion = None
+    instance._sincronizacion_en_proceso = True
+    programacion.save(update_fields=['driver', 'fecha_asignacion'])
+    
+    # Crear evento de auditoría
+    from apps.events.services import EventLog
+    EventLog.registrar(
+        container=instance,
+        event_type='cambio_estado',
+        detalles={
+            'estado_nuevo': 'programado',
+            'accion': 'asignacion_removida',
+            'descripcion': 'Asignación de conductor removida al volver a estado programado',
+            'automatico': True
+        }
+    )
 
-@receiver(post_save, sender=Container)
-def manejar_vacios_automaticamente(sender, instance, created, **kwargs):
+
+def manejar_vacios_automaticamente(instance, created, programacion=None):
     """
-    Signal que se ejecuta después de guardar un Container
-    
     Lógica:
     1. Si el contenedor cambia a estado 'vacio'
     2. Y tiene un CD de entrega asignado
@@ -99,8 +124,8 @@ def manejar_vacios_automaticamente(sender, instance, created, **kwargs):
             Container.objects.filter(pk=container.pk).update(vacio_contabilizado=True)
         
         # Crear evento de auditoría
-        from apps.events.models import Event
-        Event.objects.create(
+        from apps.events.services import EventLog
+        EventLog.registrar(
             container=instance,
             event_type='contenedor_vacio',
             detalles={
@@ -114,18 +139,15 @@ def manejar_vacios_automaticamente(sender, instance, created, **kwargs):
         
     except Exception as e:
         # CD lleno, registrar en logs
-        import logging
-        logger = logging.getLogger(__name__)
         logger.warning(
             f"No se pudo recibir vacío {instance.container_id} en {instance.cd_entrega.nombre}: {str(e)}"
         )
 
 
-@receiver(post_save, sender=Container)
-def crear_programacion_automatica(sender, instance, created, **kwargs):
+def crear_programacion_automatica(instance, created, programacion):
     """
-    Signal que crea automáticamente una Programacion cuando un contenedor
-    cambia a estado 'programado' y no tiene una programación asociada.
+    Crea automáticamente una Programacion cuando un contenedor cambia a
+    estado 'programado' y no tiene una programación asociada.
     
     Esto resuelve el problema cuando se usa el botón "Programar" manual
     que solo cambia el estado pero no crea la Programacion.
@@ -143,19 +165,12 @@ def crear_programacion_automatica(sender, instance, created, **kwargs):
     from django.utils import timezone
     
     # Verificar si ya existe una programación
-    try:
-        Programacion.objects.get(container=instance)
-        return  # Ya existe, no hacer nada
-    except Programacion.DoesNotExist:
-        pass  # No existe, crear una nueva
-    except Programacion.MultipleObjectsReturned:
-        return  # Ya hay programaciones, no crear más
+    if programacion.get() is not None:
+        return
     
     # Nunca inventar un destino: una programación sin CD requiere intervención.
     cd = instance.cd_entrega
     if not cd:
-        import logging
-        logger = logging.getLogger(__name__)
         logger.warning(
             f"No se creó programación para {instance.container_id}: falta CD de entrega explícito"
         )
@@ -170,7 +185,7 @@ def crear_programacion_automatica(sender, instance, created, **kwargs):
     
     # Crear la programación
     try:
-        programacion = Programacion.objects.create(
+        creada = Programacion.objects.create(
             container=instance,
             cd=cd,
             fecha_programada=fecha_programada,
@@ -178,10 +193,11 @@ def crear_programacion_automatica(sender, instance, created, **kwargs):
             direccion_entrega=cd.direccion,
             observaciones='Programación creada automáticamente desde operaciones'
         )
+        programacion.set(creada)
         
         # Crear evento de auditoría
-        from apps.events.models import Event
-        Event.objects.create(
+        from apps.events.services import EventLog
+        EventLog.registrar(
             container=instance,
             event_type='import_programacion',
             detalles={
@@ -198,53 +214,309 @@ def crear_programacion_automatica(sender, instance, created, **kwargs):
         
     except Exception as e:
         # Log error pero no fallar
-        import logging
-        logger = logging.getLogger(__name__)
         logger.error(f"Error creando programación automática para {instance.container_id}: {str(e)}")
 
 
-@receiver(post_save, sender=Container)
-def alertar_demurrage_cercano(sender, instance, created, **kwargs):
+def _evento_alerta_demurrage(container, ahora):
+    from apps.events.models import Event
+
+    dias = round((container.fecha_demurrage - ahora).total_seconds() / 86400, 1)
+    return Event(
+        container=container,
+        event_type='alerta_48h',
+        detalles={
+            'fecha_demurrage': container.fecha_demurrage.isoformat(),
+            'dias_restantes': dias,
+            'tiene_conductor': False,
+            'descripcion': f'Alerta: Demurrage vence en {dias} días'
+        }
+    )
+
+
+def _con_alerta_vigente(container_ids):
+    """Contenedores que ya tienen un evento alerta_48h dentro de la ventana de su demurrage actual."""
+    from django.db.models import F
+    from apps.events.models import Event
+
+    return set(
+        Event.objects.filter(
+            container_id__in=container_ids, event_type='alerta_48h',
+            created_at__gte=F('container__fecha_demurrage') - VENTANA_DEMURRAGE,
+        ).values_list('container_id', flat=True)
+    )
+
+
+def alertar_demurrage_cercano(instance, created, programacion):
     """
-    Signal que verifica si el demurrage está cerca de vencer
-    y actualiza la alerta en la programación relacionada
+    Verifica si el demurrage está cerca de vencer y actualiza la alerta en la
+    programación relacionada
+
+    Sólo corre cuando cambia estado o fecha_demurrage; los contenedores que
+    entran en la ventana por el paso del tiempo los marca el barrido
+    alertar_demurrages_por_vencer (comando alert_demurrage_due).
     """
     # Solo si tiene fecha_demurrage
     if not instance.fecha_demurrage:
         return
     
     from django.utils import timezone
-    from datetime import timedelta
     
     ahora = timezone.now()
-    dias_hasta_demurrage = (instance.fecha_demurrage - ahora).total_seconds() / 86400
     
     # Si faltan menos de 2 días para demurrage
-    if dias_hasta_demurrage < 2 and dias_hasta_demurrage > 0:
-        # Buscar programación asociada
-        from apps.programaciones.models import Programacion
-        
-        try:
-            programacion = Programacion.objects.get(container=instance)
-            
-            # Actualizar flag de alerta si no tiene conductor
-            if not programacion.driver:
-                programacion.requiere_alerta = True
-                programacion.save(update_fields=['requiere_alerta'])
-                
-                # Crear evento de alerta
-                from apps.events.models import Event
-                Event.objects.create(
-                    container=instance,
-                    event_type='alerta_48h',
+    if not ahora < instance.fecha_demurrage < ahora + VENTANA_DEMURRAGE:
+        return
+
+    # Actualizar flag de alerta si no tiene conductor
+    programacion = programacion.get()
+    if programacion is None or programacion.driver_id:
+        return
+    if not programacion.requiere_alerta:
+        programacion.requiere_alerta = True
+        programacion.save(update_fields=['requiere_alerta'])
+    
+    # Crear evento de alerta (uno por ventana de demurrage)
+    if _con_alerta_vigente([instance.pk]):
+        return
+    from apps.events.services import EventLog
+    EventLog.registrar_eventos([_evento_alerta_demurrage(instance, ahora)])
+
+
+def alertar_demurrages_por_vencer(ahora=None):
+    """
+    Barrido periódico de alertar_demurrage_cercano: marca las programaciones
+    sin conductor cuyo demurrage vence en menos de 2 días aunque el contenedor
+    no se haya guardado desde que entró en la ventana. Idempotente: el flag se
+    fija sin condición y el evento alerta_48h se emite una vez por ventana.
+
+    Returns:
+        int: alertas nuevas emitidas
+    """
+    from django.utils import timezone
+    from apps.events.services import EventLog
+    from apps.programaciones.models import Programacion
+
+    ahora = ahora or timezone.now()
+    por_vencer = {
+        programacion.container_id: programacion.container
+        for programacion in Programacion.objects.filter(
+            driver__isnull=True,
+            container__fecha_demurrage__gt=ahora,
+            container__fecha_demurrage__lt=ahora + VENTANA_DEMURRAGE,
+        ).select_related('container')
+    }
+    if not por_vencer:
+        return 0
+    Programacion.objects.filter(container_id__in=por_vencer, requiere_alerta=False).update(requiere_alerta=True)
+    alertados = _con_alerta_vigente(por_vencer)
+    eventos = [
+        _evento_alerta_demurrage(container, ahora)
+        for pk, container in por_vencer.items() if pk not in alertados
+    ]
+    EventLog.registrar_eventos(eventos)
+    return len(eventos)
+
+
+def actualizar_indice_casos_similares(instance, created, programacion):
+    """
+    Mantiene CasoSimilarIndice cuando el contenedor entra o sale de un estado final.
+    """
+    from apps.core.services.similar_case_index import POST_DELIVERY_STATES, SimilarCaseIndex
+
+    if created or instance.estado not in POST_DELIVERY_STATES:
+        return
+    programacion = programacion.get()
+    if programacion:
+        programacion.container = instance
+        SimilarCaseIndex.refresh_for(programacion)
+
+
+def liberar_cupo_calendario(instance, created, programacion):
+    """
+    Un contenedor cancelado o devuelto deja de ocupar cupo, y vuelve a ocuparlo
+    si sale de esos estados: recalcula el bloque de CargaSlotCD de su programación.
+    """
+    from apps.core.services.slot_calendar import ESTADOS_SIN_CARGA, SlotCalendarService
+
+    if created:
+        return
+    if instance.estado not in ESTADOS_SIN_CARGA and instance.valor_original('estado') not in ESTADOS_SIN_CARGA:
+        return
+    programacion = programacion.get()
+    if programacion:
+        SlotCalendarService.actualizar_programaciones([programacion])
+
+
+def invalidar_resumen_diario(instance, created, programacion=None):
+    """
+    Si la fecha de descarga cambió de día, el resumen del día anterior queda
+    desactualizado (el del día nuevo lo detecta Container.updated_at).
+    """
+    if created:
+        return
+    from apps.core.services.analytics import AnalyticsAggregationService
+
+    AnalyticsAggregationService.invalidar_dias(instance.valor_original('fecha_descarga'))
+
+
+# (campos disparadores, efecto), en el orden en que se aplican
+EFECTOS_POST_SAVE = (
+    ({'estado'}, sincronizar_estado_con_programacion),
+    ({'estado', 'cd_entrega_id'}, manejar_vacios_automaticamente),
+    ({'estado', 'cd_entrega_id'}, crear_programacion_automatica),
+    ({'estado', 'fecha_demurrage'}, alertar_demurrage_cercano),
+    ({'estado'}, actualizar_indice_casos_similares),
+    ({'estado'}, liberar_cupo_calendario),
+    ({'fecha_descarga'}, invalidar_resumen_diario),
+)
+
+
+@receiver(post_save, sender=Container)
+def despachar_efectos_post_save(sender, instance, created, **kwargs):
+    """Ejecuta los efectos cuyos campos disparadores cambiaron en este save."""
+    cambiados = instance.campos_cambiados()
+    try:
+        if not cambiados:
+            return
+        programacion = ProgramacionDelContenedor(instance)
+        for campos, efecto in EFECTOS_POST_SAVE:
+            if campos & cambiados:
+                efecto(instance, created, programacion)
+    finally:
+        instance.marcar_sincronizado()
+
+
+@receiver(post_delete, sender=Container)
+def descontar_resumen_diario(sender, instance, **kwargs):
+    """Un contenedor borrado deja de contar en el resumen de su día de descarga."""
+    from apps.core.services.analytics import AnalyticsAggregationService
+
+    AnalyticsAggregationService.invalidar_dias(instance.valor_original('fecha_descarga'), instance.fecha_descarga)
+
+
+def aplicar_efectos_post_save(containers):
+    """
+    Equivalente en lote de los receivers post_save de Container.
+
+    bulk_update no emite post_save; los importadores en lote llaman a esta
+    función con los contenedores actualizados (no los recién creados, para los
+    que ningún receiver actúa). Igual que en despachar_efectos_post_save, cada
+    regla considera sólo los contenedores cuyos campos disparadores cambiaron.
+    Los casos frecuentes se resuelven con una consulta por regla; los raros que
+    necesitan bloqueo o crean objetos (vacíos en CD, programación automática)
+    delegan en el efecto individual.
+    """
+    from apps.events.models import Event
+    from apps.events.services import EventLog
+    from apps.programaciones.models import Programacion
+    from django.utils import timezone
+
+    cambiados = {c.pk: c.campos_cambiados() for c in containers if c.pk}
+    containers = [c for c in containers if cambiados.get(c.pk)]
+    descargas_anteriores = [
+        c.valor_original('fecha_descarga') for c in containers if 'fecha_descarga' in cambiados[c.pk]
+    ]
+    estados_anteriores = {c.pk: c.valor_original('estado') for c in containers}
+    for container in containers:
+        container.marcar_sincronizado()
+    if not containers:
+        return
+    eventos = []
+
+    def con_cambios(*campos):
+        return [c for c in containers if cambiados[c.pk] & set(campos)]
+
+    # sincronizar_estado_con_programacion
+    programados = {
+        c.pk: c for c in con_cambios('estado')
+        if c.estado == 'programado' and not hasattr(c, '_sincronizacion_en_proceso')
+    }
+    if programados:
+        con_driver = list(
+            Programacion.objects.filter(container_id__in=programados, driver__isnull=False)
+            .values_list('pk', 'container_id')
+        )
+        if con_driver:
+            Programacion.objects.filter(pk__in=[pk for pk, _ in con_driver]).update(
+                driver=None, fecha_asignacion=None
+            )
+            for _, container_id in con_driver:
+                programados[container_id]._sincronizacion_en_proceso = True
+                eventos.append(Event(
+                    container=programados[container_id],
+                    event_type='cambio_estado',
                     detalles={
-                        'fecha_demurrage': instance.fecha_demurrage.isoformat(),
-                        'dias_restantes': round(dias_hasta_demurrage, 1),
-                        'tiene_conductor': False,
-                        'descripcion': f'Alerta: Demurrage vence en {round(dias_hasta_demurrage, 1)} días'
+                        'estado_nuevo': 'programado',
+                        'accion': 'asignacion_removida',
+                        'descripcion': 'Asignación de conductor removida al volver a estado programado',
+                        'automatico': True
                     }
-                )
-        except Programacion.DoesNotExist:
-            pass
-        except Programacion.MultipleObjectsReturned:
-            pass
+                ))
+
+    # manejar_vacios_automaticamente
+    for container in con_cambios('estado', 'cd_entrega_id'):
+        if container.estado == 'vacio' and container.cd_entrega_id and not container.vacio_contabilizado:
+            manejar_vacios_automaticamente(container, False)
+
+    # crear_programacion_automatica
+    sin_programacion = {
+        c.pk: c for c in con_cambios('estado', 'cd_entrega_id')
+        if c.estado == 'programado' and c.cd_entrega_id and not hasattr(c, '_programacion_auto_creada')
+    }
+    if sin_programacion:
+        existentes = set(
+            Programacion.objects.filter(container_id__in=sin_programacion)
+            .values_list('container_id', flat=True)
+        )
+        for pk, container in sin_programacion.items():
+            if pk not in existentes:
+                crear_programacion_automatica(container, False, ProgramacionDelContenedor(container, None))
+
+    # alertar_demurrage_cercano
+    ahora = timezone.now()
+    por_vencer = {
+        c.pk: c for c in con_cambios('estado', 'fecha_demurrage')
+        if c.fecha_demurrage and ahora < c.fecha_demurrage < ahora + VENTANA_DEMURRAGE
+    }
+    if por_vencer:
+        sin_conductor = list(
+            Programacion.objects.filter(container_id__in=por_vencer, driver__isnull=True)
+            .values_list('pk', 'container_id')
+        )
+        if sin_conductor:
+            Programacion.objects.filter(pk__in=[pk for pk, _ in sin_conductor]).update(requiere_alerta=True)
+            alertados = _con_alerta_vigente([container_id for _, container_id in sin_conductor])
+            eventos.extend(
+                _evento_alerta_demurrage(por_vencer[container_id], ahora)
+                for _, container_id in sin_conductor if container_id not in alertados
+            )
+
+    # actualizar_indice_casos_similares: un recálculo por grupo afectado
+    from apps.core.services.similar_case_index import POST_DELIVERY_STATES, SimilarCaseIndex
+    cerrados = {c.pk: c for c in con_cambios('estado') if c.estado in POST_DELIVERY_STATES}
+    if cerrados:
+        grupos = {}
+        for programacion in Programacion.objects.filter(container_id__in=cerrados):
+            programacion.container = cerrados[programacion.container_id]
+            grupos.setdefault(SimilarCaseIndex.group_key(programacion), programacion)
+        for programacion in grupos.values():
+            SimilarCaseIndex.refresh_for(programacion)
+
+    # liberar_cupo_calendario
+    from apps.core.services.slot_calendar import ESTADOS_SIN_CARGA, SlotCalendarService
+    cambio_carga = [
+        c.pk for c in con_cambios('estado')
+        if c.estado in ESTADOS_SIN_CARGA or estados_anteriores[c.pk] in ESTADOS_SIN_CARGA
+    ]
+    if cambio_carga:
+        SlotCalendarService.actualizar_programaciones(
+            list(Programacion.objects.filter(container_id__in=cambio_carga).only('cd_id', 'fecha_programada'))
+        )
+
+    # invalidar_resumen_diario
+    if descargas_anteriores:
+        from apps.core.services.analytics import AnalyticsAggregationService
+        AnalyticsAggregationService.invalidar_dias(*descargas_anteriores)
+
+    if eventos:
+        EventLog.registrar_eventos(eventos)
@@ -2,23 +2,29 @@ from unittest.mock import patch
 
 import pandas as pd
 from django.contrib import admin
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth.models import User
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from django.utils import timezone
 from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from datetime import timedelta
 
 from apps.cds.models import CD
 from apps.containers.importers.embarque import EmbarqueImporter
+from apps.containers.importers.liberacion import LiberacionImporter
 from apps.containers.importers.programacion import ProgramacionImporter
 from apps.containers.admin import ContainerAdmin
 from apps.containers.models import Container
+from apps.containers.signals import aplicar_efectos_post_save
+from apps.drivers.models import Driver
 from apps.programaciones.models import Programacion
 from apps.core.services.returns import EmptyReturnService
 from apps.containers.serializers import ContainerListSerializer
 from apps.clientes.models import ClienteEmpresa
+from apps.events.models import Event
 
 
 class ContainerAdminClientCompanyTests(TestCase):
@@ -145,6 +151,132 @@ class ProgramacionImporterBusinessFlowTests(TestCase):
         self.assertTrue(Programacion.objects.filter(container=container).exists())
 
 
+class BulkImportModeTests(TestCase):
+    def setUp(self):
+        self.empresa = ClienteEmpresa.objects.create(nombre='Importadora Lote', rut='76.555.444-3')
+        self.cd = CD.objects.create(
+            nombre='CD Lote', codigo='LOTE-01', direccion='Destino',
+            comuna='Santiago', lat=-33.45, lng=-70.65,
+        )
+
+    def _run(self, importer_cls, module, rows, on_progress=None):
+        with patch(
+            f'apps.containers.importers.{module}.read_excel_with_header_detection',
+            return_value=pd.DataFrame(rows),
+        ):
+            importer = importer_cls(f'{module}.xlsx', 'test')
+            importer.on_progress = on_progress
+            return importer.procesar()
+
+    def _embarque_rows(self, n, start=0):
+        return [{
+            'Container Numbers': f'BULK {start + i:06d}-1',
+            'Container Size': "40' HC",
+            'Nave Confirmado': 'Nave Lote',
+            'Cliente': 'Importadora Lote',
+            'Weight Kgs': 1000 + i,
+        } for i in range(n)]
+
+    def test_embarque_bulk_reports_row_errors_without_writing_them(self):
+        Container.objects.create(container_id='BULK0000001', tipo='20', nave='Vieja', estado='liberado')
+        rows = self._embarque_rows(3) + [
+            {'Container Numbers': 'BADU 000001-1', 'Container Size': '40', 'Nave Confirmado': '',
+             'Cliente': 'Importadora Lote'},
+            {'Container Numbers': 'BADU 000002-1', 'Container Size': '40', 'Nave Confirmado': 'Nave',
+             'Cliente': 'Desconocido'},
+        ]
+
+        result = self._run(EmbarqueImporter, 'embarque', rows)
+
+        self.assertEqual((result['creados'], result['actualizados'], result['errores']), (2, 1, 2))
+        errores = {d['fila']: d['error'] for d in result['detalles'] if 'error' in d}
+        self.assertEqual(errores[5], 'Nave vacía o inválida')
+        self.assertIn('no está registrado', errores[6])
+        existente = Container.objects.get(container_id='BULK0000001')
+        self.assertEqual((existente.tipo, existente.nave, existente.estado), ('40HC', 'Nave Lote', 'liberado'))
+        nuevo = Container.objects.get(container_id='BULK0000011')
+        self.assertEqual((nuevo.estado, nuevo.cliente_empresa), ('por_arribar', self.empresa))
+        self.assertTrue(nuevo.tara)
+        self.assertEqual(Event.objects.filter(event_type='import_embarque').count(), 2)
+
+    def test_embarque_bulk_query_count_does_not_grow_per_row(self):
+        with CaptureQueriesContext(connection) as queries:
+            self._run(EmbarqueImporter, 'embarque', self._embarque_rows(60))
+        self.assertEqual(Container.objects.count(), 60)
+        # SQLite parte bulk_create en lotes por su límite de parámetros; aun así
+        # son unas pocas consultas, no varias por fila.
+        self.assertLessEqual(len(queries), 12)
+
+    def test_progress_reports_row_positions(self):
+        rows = self._embarque_rows(3)
+        rows.insert(1, {'Container Numbers': '', 'Container Size': '40'})
+        avance = []
+
+        self._run(EmbarqueImporter, 'embarque', rows, on_progress=lambda hechas, total: avance.append((hechas, total)))
+
+        self.assertEqual(avance, [(1, 3), (2, 3), (3, 3)])
+
+    def test_liberacion_bulk_releases_and_records_state_events(self):
+        Container.objects.create(container_id='RELU1234567', tipo='40', nave='Nave', estado='por_arribar')
+        Container.objects.create(container_id='DONE1234567', tipo='40', nave='Nave', estado='devuelto')
+        rows = [
+            {'Contenedor': 'RELU 123456-7', 'Almacen': 'TPS Valparaíso', 'Peso Unidades': 900},
+            {'Contenedor': 'DONE 123456-7', 'Almacen': 'STI'},
+            {'Contenedor': 'MISS 123456-7', 'Almacen': 'PCE'},
+        ]
+
+        result = self._run(LiberacionImporter, 'liberacion', rows)
+
+        self.assertEqual((result['liberados'], result['no_encontrados'], result['errores']), (1, 1, 1))
+        liberado = Container.objects.get(container_id='RELU1234567')
+        self.assertEqual((liberado.estado, liberado.posicion_fisica), ('liberado', 'ZEAL'))
+        self.assertEqual(float(liberado.peso_carga), 900.0)
+        self.assertEqual(Container.objects.get(container_id='DONE1234567').estado, 'devuelto')
+        self.assertTrue(Event.objects.filter(container=liberado, event_type='cambio_estado').exists())
+        self.assertTrue(Event.objects.filter(container=liberado, event_type='import_liberacion').exists())
+
+    def test_programacion_bulk_creates_programaciones_and_applies_demurrage_alert(self):
+        container = Container.objects.create(
+            container_id='PROG1234567', tipo='40', nave='Nave', estado='liberado',
+            fecha_liberacion=timezone.now(),
+        )
+        Container.objects.create(container_id='WAIT7654321', tipo='40', nave='Nave', estado='por_arribar')
+        fecha = timezone.localtime() + timedelta(days=5)
+        demurrage = timezone.localtime() + timedelta(days=1)
+        rows = [
+            {'Contenedor': container.container_id, 'Fecha de Programacion': fecha.strftime('%d/%m/%Y %H:%M'),
+             'Centro Distribucion': '6020 - CD Lote', 'Fecha Demurrage': demurrage.strftime('%d/%m/%Y %H:%M')},
+            {'Contenedor': 'WAIT7654321', 'Fecha de Programacion': fecha.strftime('%d/%m/%Y %H:%M'),
+             'Centro Distribucion': 'LOTE-01'},
+        ]
+
+        # Los eventos se insertan al confirmar la transacción del lote
+        with self.captureOnCommitCallbacks(execute=True):
+            result = self._run(ProgramacionImporter, 'programacion', rows)
+
+        self.assertEqual((result['programados'], result['errores']), (1, 1))
+        container.refresh_from_db()
+        self.assertEqual(container.estado, 'programado')
+        programacion = Programacion.objects.get(container=container)
+        self.assertEqual(programacion.cd, self.cd)
+        # El efecto de alertar_demurrage_cercano se aplica en lote tras el bulk_update.
+        self.assertTrue(programacion.requiere_alerta)
+        self.assertTrue(Event.objects.filter(container=container, event_type='alerta_48h').exists())
+        self.assertFalse(Programacion.objects.filter(container__container_id='WAIT7654321').exists())
+
+    def test_buscar_cd_uses_the_same_lookup_as_the_batch(self):
+        CD.objects.create(
+            nombre='CD Lote Norte', codigo='LOTE-02', direccion='Destino',
+            comuna='Santiago', lat=-33.4, lng=-70.6,
+        )
+        importer = ProgramacionImporter('programacion.xlsx', 'test')
+
+        self.assertEqual(importer.buscar_cd('lote-01'), self.cd)
+        self.assertEqual(importer.buscar_cd('9999 - CD Lote Norte').codigo, 'LOTE-02')
+        with self.assertRaisesMessage(ValueError, 'CD ambiguo por nombre'):
+            importer.buscar_cd('CD Lote')
+
+
 class ContainerCrudTests(APITestCase):
     def setUp(self):
         self.staff = User.objects.create_user('containerstaff', password='***', is_staff=True)
@@ -174,6 +306,125 @@ class ContainerCrudTests(APITestCase):
         self.assertEqual(container.estado, 'cancelado')
 
 
+class StreamingExportTests(APITestCase):
+    def setUp(self):
+        cd = CD.objects.create(
+            nombre='CD Export', codigo='CD-EXP', direccion='Destino', comuna='Santiago', lat=-33.45, lng=-70.65,
+        )
+        ahora = timezone.now()
+        Container.objects.create(
+            container_id='EXPU0000001', tipo='40HC', nave='Nave A', estado='liberado', peso_carga=20000,
+            cd_entrega=cd, fecha_demurrage=ahora - timedelta(days=2), fecha_liberacion=ahora,
+        )
+        Container.objects.create(
+            container_id='EXPU0000002', tipo='20', nave='Nave B', estado='por_arribar', secuenciado=True,
+            fecha_demurrage=ahora + timedelta(days=10, hours=1),
+        )
+        Container.objects.create(container_id='EXPU0000003', tipo='40', nave='Nave C', estado='entregado')
+
+    def test_liberacion_excel_is_write_only_with_named_styles(self):
+        import io
+        import openpyxl
+
+        response = self.client.get(reverse('container-export-liberacion-excel'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        wb = openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content)))
+        ws = wb['Liberados y Por Liberar']
+        filas = list(ws.iter_rows(values_only=True))
+
+        self.assertEqual(filas[0][0], 'CONTAINER ID')
+        self.assertEqual([f[0] for f in filas[1:]], ['EXPU0000002', 'EXPU0000001'])
+        vencido = ws.cell(row=3, column=15)
+        self.assertEqual((vencido.value, vencido.style), ('VENCIDO', 'urgencia_vencido'))
+        self.assertEqual(ws.cell(row=3, column=16).value, 'CD Export')
+        self.assertEqual(ws.cell(row=2, column=14).value, 10)
+        self.assertEqual(ws.cell(row=1, column=1).style, 'encabezado')
+
+    def test_csv_streams_rows(self):
+        response = self.client.get(reverse('container-export-liberacion-excel'), {'formato': 'csv'})
+        self.assertTrue(response.streaming)
+        lineas = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertTrue(lineas[0].startswith('CONTAINER ID,ESTADO'))
+        self.assertEqual(len(lineas), 3)
+
+    def test_stock_json_matches_serializer(self):
+        import json
+        from apps.containers.serializers import ContainerStockExportSerializer
+
+        response = self.client.get(reverse('container-export-stock'))
+        data = json.loads(b''.join(response.streaming_content))
+        esperado = ContainerStockExportSerializer(
+            Container.objects.filter(estado__in=['liberado', 'por_arribar']).order_by('secuenciado', '-fecha_liberacion'),
+            many=True,
+        ).data
+        self.assertEqual(data['total'], 2)
+        self.assertEqual(data['containers'], json.loads(json.dumps(esperado, default=str)))
+
+    def test_stock_json_stays_valid_across_chunks(self):
+        import json
+
+        Container.objects.bulk_create([
+            Container(container_id=f'CHNK{i:07d}', tipo='40', nave='Nave "Lote"', estado='liberado')
+            for i in range(1001)
+        ])
+
+        response = self.client.get(reverse('container-export-stock'))
+        data = json.loads(b''.join(response.streaming_content))
+
+        self.assertEqual(data['total'], 1003)
+        self.assertEqual(len(data['containers']), 1003)
+        self.assertEqual(len({c['container_id'] for c in data['containers']}), 1003)
+
+    def test_unknown_format_is_rejected(self):
+        response = self.client.get(reverse('container-export-stock'), {'formato': 'pdf'})
+        self.assertEqual(response.status_code, 400)
+
+
+
+class ContainerListPaginationTests(APITestCase):
+    def setUp(self):
+        self.cd = CD.objects.create(
+            nombre='CD Cursor', codigo='CURSOR', direccion='A', comuna='Santiago', lat=-33.45, lng=-70.65,
+        )
+        for i in range(7):
+            Container.objects.create(
+                container_id=f'CURS{i:07d}', tipo='40', nave='Nave', estado='liberado', cd_entrega=self.cd,
+            )
+
+    def test_cursor_mode_walks_every_row_without_count(self):
+        from apps.core.pagination import IndexedCursorPagination
+
+        vistos, paginas = [], 0
+        url = reverse('container-list') + '?paginacion=cursor'
+        with patch.object(IndexedCursorPagination, 'page_size', 3), CaptureQueriesContext(connection) as queries:
+            while url:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn('count', response.data)
+                vistos += [row['container_id'] for row in response.data['results']]
+                url = response.data['next']
+                paginas += 1
+        self.assertEqual(paginas, 3)
+        self.assertEqual(vistos, [f'CURS{i:07d}' for i in reversed(range(7))])
+        self.assertEqual(len(set(vistos)), 7)
+        self.assertFalse(any('COUNT(' in q['sql'] for q in queries.captured_queries))
+        # El modo por defecto conserva PageNumberPagination
+        self.assertIn('count', self.client.get(reverse('container-list')).data)
+
+    def test_sparse_fields_narrow_payload_and_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('container-list'), {'fields': 'container_id,estado_display,cd_entrega_nombre'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'container_id', 'estado_display', 'cd_entrega_nombre'})
+        listado = next(q['sql'] for q in queries.captured_queries if 'containers_container' in q['sql'] and 'LIMIT' in q['sql'])
+        self.assertNotIn('"contenido"', listado)
+        self.assertIn('"cds_cd"."nombre"', listado)
+        # Una consulta de conteo y una de página: sin cargas diferidas por fila
+        self.assertEqual(len(queries), 2)
+
+        self.assertEqual(self.client.get(reverse('container-list'), {'fields': 'container_id,inexistente'}).status_code, 400)
+
 class ScheduledReleaseTests(TestCase):
     def test_only_due_releases_are_advanced(self):
         due = Container.objects.create(
@@ -190,6 +441,49 @@ class ScheduledReleaseTests(TestCase):
         self.assertEqual(future.estado, 'por_arribar')
 
 
+# Eventos insertados de inmediato: la deduplicación consulta la tabla
+@override_settings(EVENTS_BUFFERED=False)
+class DemurrageAlertTests(TestCase):
+    def setUp(self):
+        self.cd = CD.objects.create(
+            nombre='CD Demurrage', codigo='DEMU', direccion='Destino', comuna='Santiago', lat=-33.4, lng=-70.6,
+        )
+        self.container = Container.objects.create(
+            container_id='DEMU1234567', tipo='40', nave='Nave', estado='liberado',
+            fecha_demurrage=timezone.now() + timedelta(days=3),
+        )
+        self.programacion = Programacion.objects.create(
+            container=self.container, cd=self.cd, cliente='Cliente',
+            fecha_programada=timezone.now() + timedelta(days=5),
+        )
+
+    def alertas(self):
+        return Event.objects.filter(container=self.container, event_type='alerta_48h').count()
+
+    def test_sweep_flags_containers_that_entered_the_window_without_a_save(self):
+        call_command('alert_demurrage_due')
+        self.programacion.refresh_from_db()
+        self.assertFalse(self.programacion.requiere_alerta)
+
+        # Pasa el tiempo: faltan menos de 48 horas sin que el contenedor se guarde
+        Container.objects.filter(pk=self.container.pk).update(fecha_demurrage=timezone.now() + timedelta(days=1))
+        call_command('alert_demurrage_due')
+        call_command('alert_demurrage_due')
+        self.programacion.refresh_from_db()
+        self.assertTrue(self.programacion.requiere_alerta)
+        self.assertEqual(self.alertas(), 1)
+
+    def test_save_restores_flag_but_does_not_repeat_the_event(self):
+        self.container.fecha_demurrage = timezone.now() + timedelta(days=1)
+        self.container.save()
+        Programacion.objects.filter(pk=self.programacion.pk).update(requiere_alerta=False)
+        self.container.fecha_demurrage += timedelta(hours=1)
+        self.container.save()
+        self.programacion.refresh_from_db()
+        self.assertTrue(self.programacion.requiere_alerta)
+        self.assertEqual(self.alertas(), 1)
+
+
 class EmptyReturnFlowTests(TestCase):
     def setUp(self):
         self.origin = CD.objects.create(
@@ -238,3 +532,48 @@ class EmptyReturnFlowTests(TestCase):
         self.container.refresh_from_db(); self.origin.refresh_from_db()
         self.assertEqual(self.container.estado, 'vacio')
         self.assertEqual(self.origin.vacios_actuales, 1)
+
+
+class ContainerSignalDispatchTests(TestCase):
+    def setUp(self):
+        self.cd = CD.objects.create(
+            nombre='CD Señales', codigo='SIGNAL', direccion='Destino', comuna='Santiago', lat=-33.4, lng=-70.6,
+        )
+        self.container = Container.objects.create(
+            container_id='SIGN1234567', tipo='40', nave='Nave', estado='asignado', cd_entrega=self.cd,
+        )
+        self.programacion = Programacion.objects.create(
+            container=self.container, cd=self.cd, cliente='Cliente',
+            fecha_programada=timezone.now() + timedelta(days=3),
+        )
+        self.driver = Driver.objects.create(nombre='Conductor Señales')
+        Programacion.objects.filter(pk=self.programacion.pk).update(driver=self.driver)
+        self.container = Container.objects.get(pk=self.container.pk)
+
+    def test_save_without_tracked_changes_runs_no_effects(self):
+        self.container.nave = 'Otra nave'
+        with CaptureQueriesContext(connection) as ctx:
+            self.container.save()
+        self.assertEqual([q['sql'].split()[0] for q in ctx.captured_queries], ['UPDATE'])
+
+    def test_state_change_reads_programacion_once(self):
+        self.container.estado = 'programado'
+        with CaptureQueriesContext(connection) as ctx:
+            self.container.save()
+        lecturas = [q for q in ctx.captured_queries
+                    if q['sql'].startswith('SELECT') and 'FROM "programaciones_programacion"' in q['sql']]
+        self.assertEqual(len(lecturas), 1)
+        self.programacion.refresh_from_db()
+        self.assertIsNone(self.programacion.driver_id)
+        self.assertEqual(self.container.campos_cambiados(), set())
+
+    def test_refresh_from_db_resets_reference_values(self):
+        Container.objects.filter(pk=self.container.pk).update(estado='programado')
+        self.container.refresh_from_db()
+        self.container.estado = 'asignado'
+        self.assertEqual(self.container.campos_cambiados(), {'estado'})
+
+    def test_bulk_effects_skip_unchanged_containers(self):
+        with CaptureQueriesContext(connection) as ctx:
+            aplicar_efectos_post_save([self.container])
+        self.assertEqual(len(ctx.captured_queries), 0)
@@ -3,8 +3,10 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.permissions import AllowAny, IsAdminUser
+from rest_framework.utils.encoders import JSONEncoder
+from django.http import StreamingHttpResponse
 from django.utils import timezone
-from django.db.models import Q
+import json
 import tempfile
 import os
 import logging
@@ -15,18 +17,26 @@ from .serializers import (
     ContainerListSerializer,
     ContainerStockExportSerializer
 )
+from .exports import LIBERACION_EXPORT, STOCK_EXPORT
 from .filters import ContainerFilter
 from .importers.embarque import EmbarqueImporter
 from .importers.liberacion import LiberacionImporter
 from .importers.programacion import ProgramacionImporter
+from apps.core.fieldsets import SparseFieldsetViewMixin
+from apps.core.pagination import CursorOrPagePagination
+from apps.core.services.import_jobs import ImportJobService
+from apps.core.services.streaming_export import StreamingExport
 
 
 logger = logging.getLogger(__name__)
 
 
-class ContainerViewSet(viewsets.ModelViewSet):
+class ContainerViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     """
     ViewSet para gestión de contenedores
+
+    El listado admite `?paginacion=cursor` (orden -created_at, sin COUNT ni
+    OFFSET) y `?fields=` para acotar campos y columnas.
     """
     queryset = Container.objects.all()
 
@@ -41,6 +51,8 @@ class ContainerViewSet(viewsets.ModelViewSet):
     search_fields = ['container_id', 'nave', 'vendor', 'comuna']
     ordering_fields = ['created_at', 'fecha_programacion', 'fecha_liberacion']
     ordering = ['-created_at']
+    cursor_ordering = ('-created_at', '-id')
+    pagination_class = CursorOrPagePagination
     permission_classes = [AllowAny]
 
     def get_permissions(self):
@@ -90,6 +102,11 @@ class ContainerViewSet(viewsets.ModelViewSet):
             )
         
         usuario = request.user.username if request.user.is_authenticated else None
+
+        if ImportJobService.async_enabled(request):
+            # El worker (manage.py run_import_worker) procesa el archivo; el cliente sondea status_url.
+            job = ImportJobService.encolar('embarque', archivo, usuario)
+            return Response(ImportJobService.as_dict(job), status=status.HTTP_202_ACCEPTED)
         
         # Guardar temporalmente
         with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as tmp:
@@ -154,6 +171,11 @@ class ContainerViewSet(viewsets.ModelViewSet):
             )
         
         usuario = request.user.username if request.user.is_authenticated else None
+
+        if ImportJobService.async_enabled(request):
+            # El worker (manage.py run_import_worker) procesa el archivo; el cliente sondea status_url.
+            job = ImportJobService.encolar('liberacion', archivo, usuario)
+            return Response(ImportJobService.as_dict(job), status=status.HTTP_202_ACCEPTED)
         
         with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as tmp:
             for chunk in archivo.chunks():
@@ -219,6 +241,11 @@ class ContainerViewSet(viewsets.ModelViewSet):
             )
         
         usuario = request.user.username if request.user.is_authenticated else None
+
+        if ImportJobService.async_enabled(request):
+            # El worker (manage.py run_import_worker) procesa el archivo; el cliente sondea status_url.
+            job = ImportJobService.encolar('programacion', archivo, usuario)
+            return Response(ImportJobService.as_dict(job), status=status.HTTP_202_ACCEPTED)
         
         with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as tmp:
             for chunk in archivo.chunks():
@@ -258,151 +285,58 @@ class ContainerViewSet(viewsets.ModelViewSet):
         """
         Exporta stock de contenedores liberados y por arribar (formato JSON)
         Incluye flag de 'secuenciado' para próximas liberaciones
+
+        `?formato=csv|xlsx|parquet` entrega la misma información como archivo.
         """
+        formato = request.query_params.get('formato', 'json')
+        if formato != 'json':
+            return self._exportar(STOCK_EXPORT, formato)
+
         # Filtrar solo liberados y por_arribar
-        containers = Container.objects.filter(
-            Q(estado='liberado') | Q(estado='por_arribar')
-        ).order_by('secuenciado', '-fecha_liberacion')
-        
-        serializer = ContainerStockExportSerializer(containers, many=True)
-        
-        return Response({
-            'success': True,
-            'total': containers.count(),
-            'containers': serializer.data
-        })
-    
+        containers = STOCK_EXPORT.queryset().only(*STOCK_EXPORT.only)
+        total = containers.count()
+        contexto = {'request': request, 'now': timezone.now()}
+
+        def generar():
+            # JSON emitido por bloques: no se materializa la lista completa
+            yield f'{{"success": true, "total": {total}, "containers": ['
+            bloque = []
+            primero = True
+            for container in containers.iterator(chunk_size=1000):
+                bloque.append(container)
+                if len(bloque) == 1000:
+                    yield ('' if primero else ',') + self._stock_json(bloque, contexto)
+                    primero = False
+                    bloque = []
+            if bloque:
+                yield ('' if primero else ',') + self._stock_json(bloque, contexto)
+            yield ']}'
+
+        return StreamingHttpResponse(generar(), content_type='application/json')
+
+    @staticmethod
+    def _stock_json(containers, contexto):
+        """Elementos del bloque serializados uno a uno y separados por comas"""
+        data = ContainerStockExportSerializer(containers, many=True, context=contexto).data
+        return ','.join(json.dumps(item, cls=JSONEncoder, ensure_ascii=False) for item in data)
+
+    @staticmethod
+    def _exportar(spec, formato):
+        try:
+            return StreamingExport.response(spec, formato)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
     @action(detail=False, methods=['get'], url_path='export-liberacion-excel')
     def export_liberacion_excel(self, request):
         """
         Exporta contenedores liberados y por liberar a Excel
         Incluye: ID, Nave, Estado, Peso Total, Contenido, Demurrage, etc.
+
+        Columnas en apps.containers.exports; `?formato=csv|parquet` cambia el formato.
         """
-        from django.http import HttpResponse
-        import openpyxl
-        from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-        from datetime import datetime
-        
-        # Filtrar contenedores liberados y por arribar
-        containers = Container.objects.filter(
-            Q(estado='liberado') | Q(estado='por_arribar')
-        ).select_related('cd_entrega').order_by('-fecha_demurrage', 'estado')
-        
-        # Crear workbook
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Liberados y Por Liberar"
-        
-        # Estilos
-        header_fill = PatternFill(start_color="E95420", end_color="E95420", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF", size=12)
-        border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
-        
-        # Headers
-        headers = [
-            'CONTAINER ID', 'ESTADO', 'NAVE', 'TIPO', 'TIPO CARGA',
-            'PESO CARGA (KG)', 'TARA (KG)', 'PESO TOTAL (KG)', 'PESO TOTAL (TON)',
-            'CONTENIDO', 'POSICIÓN FÍSICA', 'PUERTO',
-            'FECHA DEMURRAGE', 'DÍAS DEMURRAGE', 'URGENCIA',
-            'CD ENTREGA', 'COMUNA', 'VENDOR', 'SELLO',
-            'FECHA LIBERACIÓN', 'FECHA ETA', 'SECUENCIADO'
-        ]
-        
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-            cell.border = border
-        
-        # Datos
-        row = 2
-        for container in containers:
-            ws.cell(row=row, column=1, value=container.container_id).border = border
-            ws.cell(row=row, column=2, value=container.get_estado_display()).border = border
-            ws.cell(row=row, column=3, value=container.nave).border = border
-            ws.cell(row=row, column=4, value=container.get_tipo_display()).border = border
-            ws.cell(row=row, column=5, value=container.get_tipo_carga_display()).border = border
-            
-            ws.cell(row=row, column=6, value=float(container.peso_carga or 0)).border = border
-            ws.cell(row=row, column=7, value=float(container.tara or 0)).border = border
-            ws.cell(row=row, column=8, value=container.peso_total).border = border
-            ws.cell(row=row, column=9, value=round(container.peso_total / 1000, 2)).border = border
-            
-            ws.cell(row=row, column=10, value=container.contenido or '').border = border
-            ws.cell(row=row, column=11, value=container.posicion_fisica or '').border = border
-            ws.cell(row=row, column=12, value=container.puerto).border = border
-            
-            # Demurrage
-            if container.fecha_demurrage:
-                ws.cell(row=row, column=13, value=container.fecha_demurrage.strftime('%d/%m/%Y')).border = border
-                dias = container.dias_para_demurrage
-                ws.cell(row=row, column=14, value=dias if dias is not None else '').border = border
-                ws.cell(row=row, column=15, value=container.urgencia_demurrage.upper()).border = border
-                
-                # Colorear según urgencia
-                urgencia_cell = ws.cell(row=row, column=15)
-                if container.urgencia_demurrage == 'vencido':
-                    urgencia_cell.fill = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
-                    urgencia_cell.font = Font(bold=True, color="FFFFFF")
-                elif container.urgencia_demurrage == 'critico':
-                    urgencia_cell.fill = PatternFill(start_color="FF6B6B", end_color="FF6B6B", fill_type="solid")
-                    urgencia_cell.font = Font(bold=True, color="FFFFFF")
-                elif container.urgencia_demurrage == 'alto':
-                    urgencia_cell.fill = PatternFill(start_color="FFA500", end_color="FFA500", fill_type="solid")
-                elif container.urgencia_demurrage == 'medio':
-                    urgencia_cell.fill = PatternFill(start_color="FFD700", end_color="FFD700", fill_type="solid")
-            else:
-                ws.cell(row=row, column=13, value='').border = border
-                ws.cell(row=row, column=14, value='').border = border
-                ws.cell(row=row, column=15, value='SIN FECHA').border = border
-            
-            ws.cell(row=row, column=16, value=container.cd_entrega.nombre if container.cd_entrega else '').border = border
-            ws.cell(row=row, column=17, value=container.comuna or '').border = border
-            ws.cell(row=row, column=18, value=container.vendor or '').border = border
-            ws.cell(row=row, column=19, value=container.sello or '').border = border
-            
-            # Fechas
-            if container.fecha_liberacion:
-                ws.cell(row=row, column=20, value=container.fecha_liberacion.strftime('%d/%m/%Y %H:%M')).border = border
-            else:
-                ws.cell(row=row, column=20, value='').border = border
-            
-            if container.fecha_eta:
-                ws.cell(row=row, column=21, value=container.fecha_eta.strftime('%d/%m/%Y')).border = border
-            else:
-                ws.cell(row=row, column=21, value='').border = border
-            
-            ws.cell(row=row, column=22, value='SÍ' if container.secuenciado else 'NO').border = border
-            
-            row += 1
-        
-        # Ajustar anchos de columna
-        column_widths = {
-            1: 18, 2: 15, 3: 25, 4: 10, 5: 15,
-            6: 15, 7: 12, 8: 15, 9: 15, 10: 40,
-            11: 18, 12: 15, 13: 18, 14: 15, 15: 12,
-            16: 30, 17: 15, 18: 30, 19: 15, 20: 18,
-            21: 15, 22: 12
-        }
-        for col, width in column_widths.items():
-            ws.column_dimensions[openpyxl.utils.get_column_letter(col)].width = width
-        
-        # Preparar respuesta
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        filename = f'liberados_por_liberar_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        
-        wb.save(response)
-        return response
-    
+        return self._exportar(LIBERACION_EXPORT, request.query_params.get('formato', 'xlsx'))
+
     @action(detail=True, methods=['post'])
     def cambiar_estado(self, request, pk=None):
         """
@@ -466,7 +400,7 @@ class ContainerViewSet(viewsets.ModelViewSet):
         """
         from apps.programaciones.models import Programacion
         from apps.cds.models import CD
-        from apps.events.models import Event
+        from apps.events.services import EventLog
         from django.db import transaction, IntegrityError
         
         container = self.get_object()
@@ -571,7 +505,7 @@ class ContainerViewSet(viewsets.ModelViewSet):
                     raise ValueError(f"Estado del contenedor inválido para programar: {container.estado}")
                 
                 # Crear evento de auditoría
-                Event.objects.create(
+                EventLog.registrar(
                     container=container,
                     event_type='programacion_manual',
                     detalles={
@@ -0,0 +1,66 @@
+from django.contrib import admin
+from .models import ImportJob, MensajeOpenClaw, PerfilEndpoint
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'tipo', 'nombre_archivo', 'estado', 'progreso', 'usuario', 'intentos']
+    list_filter = ['tipo', 'estado', 'created_at']
+    search_fields = ['nombre_archivo', 'usuario']
+    readonly_fields = [
+        'tipo', 'estado', 'nombre_archivo', 'usuario', 'filas_total', 'filas_procesadas',
+        'progreso', 'resultado', 'error', 'intentos', 'worker', 'created_at', 'iniciado_en',
+        'finalizado_en', 'heartbeat',
+    ]
+
+    def has_add_permission(self, request):
+        # Las importaciones se encolan desde los endpoints de carga
+        return False
+
+
+@admin.register(PerfilEndpoint)
+class PerfilEndpointAdmin(admin.ModelAdmin):
+    list_display = [
+        'url_name', 'solicitudes', 'consultas_p50', 'consultas_p95', 'max_consultas',
+        'ms_bd_p95', 'ms_python_p95', 'con_n_mas_1', 'sobre_presupuesto', 'actualizado',
+    ]
+    search_fields = ['url_name']
+    readonly_fields = [
+        'url_name', 'solicitudes', 'con_n_mas_1', 'sobre_presupuesto', 'max_consultas',
+        'muestras', 'duplicadas', 'actualizado',
+    ]
+
+    @admin.display(description='Consultas p50')
+    def consultas_p50(self, obj):
+        return obj.percentiles(0)['p50']
+
+    @admin.display(description='Consultas p95')
+    def consultas_p95(self, obj):
+        return obj.percentiles(0)['p95']
+
+    @admin.display(description='BD p95 (ms)')
+    def ms_bd_p95(self, obj):
+        return obj.percentiles(1)['p95']
+
+    @admin.display(description='Python p95 (ms)')
+    def ms_python_p95(self, obj):
+        return obj.percentiles(2)['p95']
+
+    def has_add_permission(self, request):
+        # Los perfiles los registra QueryBudgetMiddleware
+        return False
+
+
+@admin.register(MensajeOpenClaw)
+class MensajeOpenClawAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'endpoint', 'programacion_id', 'estado', 'intentos', 'proximo_intento', 'enviado_en']
+    list_filter = ['estado', 'endpoint', 'created_at']
+    search_fields = ['clave_dedupe', 'error']
+    readonly_fields = [
+        'endpoint', 'payload', 'clave_dedupe', 'programacion_id', 'estado', 'intentos', 'proximo_intento',
+        'error', 'worker', 'reclamado_en', 'created_at', 'enviado_en',
+    ]
+
+    def has_add_permission(self, request):
+        # Los mensajes los encola OpenClawService
+        return False
@@ -4,16 +4,20 @@ Endpoints de dashboard y estadísticas
 """
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
 from rest_framework.response import Response
 from django.utils import timezone
 from datetime import timedelta
-from django.db.models import Avg, Count, Q, F
+from django.db.models import Avg, Count, Q
 
 from apps.containers.models import Container
 from apps.drivers.models import Driver
 from apps.programaciones.models import Programacion, TiempoOperacion, TiempoViaje
-from apps.notifications.models import Notification
+from apps.core.services.analytics import AnalyticsAggregationService
+from apps.core.services.dashboard_stats import DashboardStatsService
+from apps.core.services.route_cache import RouteCache
+from apps.core.services.import_jobs import ImportJobService
+from apps.core.models import ImportJob
 
 
 @api_view(['GET'])
@@ -21,54 +25,42 @@ from apps.notifications.models import Notification
 def dashboard_stats(request):
     """
     Estadísticas generales para el dashboard
+    
+    Los conteos vienen de DashboardStatsService (un aggregate por modelo,
+    cacheado con TTL corto e invalidado en cada cambio de estado).
     """
-    today = timezone.now().date()
+    snapshot = DashboardStatsService.snapshot()
+    containers = snapshot['contenedores']
+    conductores = snapshot['conductores']
     
     stats = {
         # Métricas principales
-        'contenedores_total': Container.objects.count(),
-        'conductores': Driver.objects.count(),
-        'conductores_disponibles': Driver.objects.filter(
-            activo=True,
-            presente=True,
-            num_entregas_dia__lt=F('max_entregas_dia')
-        ).count(),
+        'contenedores_total': containers['total'],
+        'conductores': conductores['total'],
+        'conductores_disponibles': conductores['disponibles'],
         
         # Métricas específicas requeridas
-        'programados_hoy': Container.objects.filter(
-            estado='programado',
-            fecha_programacion__date=today
-        ).count(),
-        
-        'con_demurrage': Container.objects.filter(
-            fecha_demurrage__isnull=False,
-            estado__in=['liberado', 'programado', 'asignado']
-        ).exclude(estado='devuelto').count(),
-        
-        'liberados': Container.objects.filter(estado='liberado').count(),
-        'en_ruta': Container.objects.filter(estado='en_ruta').count(),
+        'programados_hoy': containers['programados_hoy'],
+        'con_demurrage': containers['con_demurrage'],
+        'liberados': containers['estado_liberado'],
+        'en_ruta': containers['estado_en_ruta'],
         
-        # Alertas de no asignados
-        'sin_asignar': Container.objects.filter(
-            estado='programado',
-            fecha_programacion__lte=timezone.now() + timedelta(hours=48)
-        ).count(),
+        # Alertas de no asignados (programados dentro de 48h)
+        'sin_asignar': containers['programados_48h'],
         
         # Totales por estado (excluyendo devueltos)
-        'por_arribar': Container.objects.filter(estado='por_arribar').count(),
-        'programados': Container.objects.filter(estado='programado').count(),
-        'asignados': Container.objects.filter(estado='asignado').count(),
-        'entregados': Container.objects.filter(estado='entregado').count(),
-        'descargados': Container.objects.filter(estado='descargado').count(),
-        'vacios': Container.objects.filter(estado__in=['vacio', 'vacio_en_ruta']).count(),
+        'por_arribar': containers['estado_por_arribar'],
+        'programados': containers['estado_programado'],
+        'asignados': containers['estado_asignado'],
+        'entregados': containers['estado_entregado'],
+        'descargados': containers['estado_descargado'],
+        'vacios': containers['estado_vacio'] + containers['estado_vacio_en_ruta'],
         
         # Total excluyendo devueltos
-        'total_activos': Container.objects.exclude(estado='devuelto').count(),
+        'total_activos': containers['total'] - containers['estado_devuelto'],
         
         # Notificaciones activas
-        'notificaciones_activas': Notification.objects.filter(
-            estado__in=['pendiente', 'enviada']
-        ).count(),
+        'notificaciones_activas': snapshot['notificaciones_activas'],
     }
     
     return Response({
@@ -145,18 +137,15 @@ def analytics_conductores(request):
     """
     Analíticas de rendimiento de conductores
     """
-    drivers = Driver.objects.all()
+    drivers = list(Driver.objects.all())
     
-    analytics = []
+    # Conteos y perfiles ML para todos los conductores en una consulta cada uno
     from apps.core.services.learning_engine import OperationalLearningEngine
+    completadas = AnalyticsAggregationService.completadas_por_conductor()
+    perfiles = OperationalLearningEngine.driver_profiles(drivers)
+    
+    analytics = []
     for driver in drivers:
-        # Calcular estadísticas
-        programaciones_completadas = Programacion.objects.filter(
-            driver=driver,
-            container__estado__in=['descargado', 'devuelto']
-        ).count()
-        
-        perfil_ml = OperationalLearningEngine.driver_profile(driver)
         analytics.append({
             'driver_id': driver.id,
             'nombre': driver.nombre,
@@ -167,8 +156,8 @@ def analytics_conductores(request):
             'entregas_a_tiempo': driver.entregas_a_tiempo,
             'cumplimiento_porcentaje': float(driver.cumplimiento_porcentaje),
             'ocupacion_porcentaje': float(driver.ocupacion_porcentaje),
-            'programaciones_completadas': programaciones_completadas,
-            'perfil_velocidad_ml': perfil_ml,
+            'programaciones_completadas': completadas.get(driver.id, 0),
+            'perfil_velocidad_ml': perfiles[driver.id],
         })
     
     # Ordenar por cumplimiento
@@ -237,39 +226,12 @@ def analytics_tendencias(request):
     Tendencias y patrones históricos
     """
     dias = int(request.query_params.get('dias', 30))
-    fecha_inicio = timezone.now() - timedelta(days=dias)
-    
-    # Entregas por día
-    entregas_por_dia = []
-    for i in range(dias):
-        fecha = (timezone.now() - timedelta(days=dias-i-1)).date()
-        count = Container.objects.filter(
-            estado__in=['descargado', 'devuelto'],
-            fecha_descarga__date=fecha
-        ).count()
-        
-        entregas_por_dia.append({
-            'fecha': fecha.isoformat(),
-            'entregas': count
-        })
     
-    # Promedio de entregas por día de la semana
-    from collections import defaultdict
-    entregas_por_dia_semana = defaultdict(int)
-    contenedores_completados = Container.objects.filter(
-        fecha_descarga__gte=fecha_inicio,
-        estado__in=['descargado', 'devuelto']
-    )
-    
-    for container in contenedores_completados:
-        dia_semana = container.fecha_descarga.weekday()  # 0=Monday, 6=Sunday
-        entregas_por_dia_semana[dia_semana] += 1
+    # Entregas por día: un GROUP BY (días cerrados desde el rollup ResumenDiario)
+    entregas_por_dia = AnalyticsAggregationService.entregas_por_dia(dias)
     
-    dias_semana = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
-    entregas_semana = [
-        {'dia': dias_semana[i], 'entregas': entregas_por_dia_semana.get(i, 0)}
-        for i in range(7)
-    ]
+    # Entregas por día de la semana sobre la misma ventana
+    entregas_semana = AnalyticsAggregationService.entregas_por_dia_semana(entregas_por_dia)
     
     return Response({
         'success': True,
@@ -402,80 +364,50 @@ def ml_learning_stats(request):
     - Estadísticas de asignación automática
     - Progreso del aprendizaje
     """
-    from apps.cds.models import CD
+    from apps.core.services.learning_stats import LearningStatsService
     
-    # Estadísticas de datos de entrenamiento
-    fecha_30_dias = timezone.now() - timedelta(days=30)
     fecha_7_dias = timezone.now() - timedelta(days=7)
     
-    # Tiempos de operación
-    total_tiempos_operacion = TiempoOperacion.objects.count()
-    tiempos_operacion_recientes = TiempoOperacion.objects.filter(
-        fecha__gte=fecha_30_dias
-    ).count()
-    tiempos_operacion_validos = TiempoOperacion.objects.filter(
-        anomalia=False
-    ).count()
-    
-    # Tiempos de viaje
-    total_tiempos_viaje = TiempoViaje.objects.count()
-    tiempos_viaje_recientes = TiempoViaje.objects.filter(
-        fecha__gte=fecha_30_dias
-    ).count()
-    tiempos_viaje_validos = TiempoViaje.objects.filter(
-        anomalia=False
-    ).count()
+    # Datos de entrenamiento desde los acumulados (EstadisticaAprendizaje)
+    fuentes, acumulados_cd = LearningStatsService.resumen()
+    total_tiempos_operacion = fuentes['operacion']['total']
+    tiempos_operacion_recientes = fuentes['operacion']['recientes_30d']
+    tiempos_operacion_validos = fuentes['operacion']['validos']
+    total_tiempos_viaje = fuentes['viaje']['total']
+    tiempos_viaje_recientes = fuentes['viaje']['recientes_30d']
+    tiempos_viaje_validos = fuentes['viaje']['validos']
     
     # Estadísticas por CD
     cds_con_datos = []
-    for cd in CD.objects.all():
-        tiempos_cd = TiempoOperacion.objects.filter(
-            cd=cd,
-            anomalia=False
-        ).count()
-        
+    for acumulado in acumulados_cd:
+        tiempos_cd = acumulado['validos']
         if tiempos_cd > 0:
-            # Calcular precisión promedio (diferencia entre estimado y real)
-            tiempos_cd_obj = TiempoOperacion.objects.filter(
-                cd=cd,
-                anomalia=False,
-                fecha__gte=fecha_30_dias
-            )
-            
-            if tiempos_cd_obj.exists():
-                total_diff = 0
-                count = 0
-                for tiempo in tiempos_cd_obj:
-                    diff_abs = abs(tiempo.tiempo_real_min - tiempo.tiempo_estimado_min)
-                    total_diff += diff_abs
-                    count += 1
-                
-                error_promedio_min = total_diff / count if count > 0 else 0
-                precision = max(0, 100 - (error_promedio_min / 60 * 100))  # Precisión basada en error
+            # Precisión basada en el error absoluto medio de los últimos 30 días
+            if acumulado['validos_recientes']:
+                error_promedio_min = acumulado['error_reciente'] / acumulado['validos_recientes']
+                precision = max(0, 100 - (error_promedio_min / 60 * 100))
             else:
                 precision = 0
             
             cds_con_datos.append({
-                'cd_nombre': cd.nombre,
+                'cd_nombre': acumulado['cd'].nombre,
                 'datos_recolectados': tiempos_cd,
                 'precision_porcentaje': round(precision, 1),
                 'estado_aprendizaje': 'Excelente' if tiempos_cd > 50 else 'Bueno' if tiempos_cd > 20 else 'Inicial'
             })
     
     # Estadísticas de asignación automática
-    total_programaciones = Programacion.objects.count()
-    programaciones_asignadas = Programacion.objects.filter(
-        driver__isnull=False
-    ).count()
-    
-    programaciones_recientes = Programacion.objects.filter(
-        created_at__gte=fecha_7_dias
+    asignacion = Programacion.objects.aggregate(
+        total=Count('id'),
+        asignadas=Count('id', filter=Q(driver__isnull=False)),
+        recientes=Count('id', filter=Q(created_at__gte=fecha_7_dias)),
+        asignadas_recientes=Count('id', filter=Q(created_at__gte=fecha_7_dias, driver__isnull=False)),
     )
-    asignaciones_recientes = programaciones_recientes.filter(
-        driver__isnull=False
-    ).count()
+    total_programaciones = asignacion['total']
+    programaciones_asignadas = asignacion['asignadas']
+    asignaciones_recientes = asignacion['asignadas_recientes']
     
-    tasa_asignacion = (asignaciones_recientes / programaciones_recientes.count() * 100) if programaciones_recientes.count() > 0 else 0
+    tasa_asignacion = (asignaciones_recientes / asignacion['recientes'] * 100) if asignacion['recientes'] > 0 else 0
     
     # Resumen del estado del ML
     datos_minimos_operacion = 20  # Mínimo de datos para considerar el ML "entrenado"
@@ -520,6 +452,7 @@ def ml_learning_stats(request):
             'tasa_asignacion_porcentaje': round(tasa_asignacion, 1)
         },
         'aprendizaje_por_cd': cds_con_datos,
+        'cache_rutas_mapbox': RouteCache.stats(),
         'recomendaciones': [
             'Sistema aprendiendo continuamente de operaciones reales',
             f'Se han recolectado {tiempos_operacion_recientes} datos de operación en los últimos 30 días',
@@ -527,3 +460,38 @@ def ml_learning_stats(request):
             'Continúa operando normalmente para mejorar la precisión del sistema'
         ]
     })
+
+
+def _import_jobs_visibles(request):
+    jobs = ImportJob.objects.defer('contenido')
+    if not request.user.is_staff:
+        jobs = jobs.filter(usuario=request.user.username)
+    return jobs
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def import_jobs(request):
+    """
+    Importaciones recientes (staff ve todas; el resto sólo las propias)
+
+    Filtros opcionales: ?estado=pendiente|procesando|completado|fallido, ?tipo=...
+    """
+    jobs = _import_jobs_visibles(request)
+    if request.query_params.get('estado'):
+        jobs = jobs.filter(estado=request.query_params['estado'])
+    if request.query_params.get('tipo'):
+        jobs = jobs.filter(tipo=request.query_params['tipo'])
+    return Response({
+        'results': [ImportJobService.as_dict(job, incluir_resultado=False) for job in jobs[:50]],
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def import_job_status(request, pk):
+    """Estado, progreso y (al completar) resultado de una importación"""
+    job = _import_jobs_visibles(request).filter(pk=pk).first()
+    if job is None:
+        return Response({'error': 'Importación no encontrada'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(ImportJobService.as_dict(job))
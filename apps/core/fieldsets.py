@@ -0,0 +1,109 @@
+"""
+Sparse fieldsets para los listados de la API (`?fields=id,estado,nave`).
+
+SparseFieldsetSerializerMixin deja en el serializer sólo los campos pedidos
+(más `id`). SparseFieldsetViewMixin acota además la consulta con `.only()` a
+las columnas que esos campos necesitan:
+
+- la fuente del campo, si es una columna o una columna de una FK
+  (`cd_entrega.nombre` → select_related('cd_entrega') + only('cd_entrega__nombre'));
+- las columnas declaradas en `Meta.dependencias_campos` del serializer para
+  propiedades y métodos (p. ej. `peso_total` → peso_carga, tara, tipo, tipo_carga).
+
+Si algún campo pedido no se puede resolver a columnas, la consulta no se
+proyecta (el serializer igual se acota): es preferible traer columnas de más
+que provocar una carga diferida por fila.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+FIELDS_QUERY_PARAM = 'fields'
+CAMPOS_SIEMPRE = ('id',)
+
+
+def campos_solicitados(request):
+    """Campos de `?fields=` en una solicitud GET, o None si no se pidió un subconjunto."""
+    if request is None or request.method != 'GET':
+        return None
+    valor = request.query_params.get(FIELDS_QUERY_PARAM)
+    if not valor:
+        return None
+    return [campo.strip() for campo in valor.split(',') if campo.strip()]
+
+
+def _columna(model, ruta):
+    """(columnas, relaciones) para una ruta `a.b.c` de FKs hacia una columna, o None."""
+    columnas, relaciones, prefijo = set(), set(), []
+    for i, parte in enumerate(ruta):
+        try:
+            field = model._meta.get_field(parte)
+        except FieldDoesNotExist:
+            return None
+        if not field.concrete or field.many_to_many:
+            return None
+        prefijo.append(parte)
+        columnas.add('__'.join(prefijo))
+        if i < len(ruta) - 1:
+            if not field.is_relation:
+                return None
+            relaciones.add('__'.join(prefijo))
+            model = field.related_model
+    return columnas, relaciones
+
+
+def proyeccion(serializer_class, campos, model):
+    """(columnas, relaciones) que necesitan `campos` del serializer, o None si no se puede acotar."""
+    dependencias = getattr(serializer_class.Meta, 'dependencias_campos', {})
+    declarados = serializer_class().fields
+    columnas, relaciones = {model._meta.pk.name}, set()
+    for nombre in campos:
+        if nombre in dependencias:
+            for ruta in dependencias[nombre]:
+                partes = ruta.split('__')
+                columnas.update('__'.join(partes[:i + 1]) for i in range(len(partes)))
+                relaciones.update('__'.join(partes[:i + 1]) for i in range(len(partes) - 1))
+            continue
+        campo = declarados[nombre]
+        if isinstance(campo, serializers.BaseSerializer) or campo.source == '*':
+            return None
+        resuelto = _columna(model, campo.source.split('.'))
+        if resuelto is None:
+            return None
+        columnas.update(resuelto[0])
+        relaciones.update(resuelto[1])
+    return columnas, relaciones
+
+
+class SparseFieldsetSerializerMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        campos = campos_solicitados(self.context.get('request'))
+        if campos:
+            for nombre in set(self.fields) - set(campos) - set(CAMPOS_SIEMPRE):
+                self.fields.pop(nombre)
+
+
+class SparseFieldsetViewMixin:
+    """En `list`, valida `?fields=` contra el serializer y proyecta la consulta."""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        campos = campos_solicitados(self.request) if self.action == 'list' else None
+        if not campos:
+            return queryset
+        serializer_class = self.get_serializer_class()
+        desconocidos = sorted(set(campos) - set(serializer_class().fields))
+        if desconocidos:
+            raise ValidationError({FIELDS_QUERY_PARAM: f"Campos desconocidos: {', '.join(desconocidos)}"})
+
+        resultado = proyeccion(serializer_class, [*CAMPOS_SIEMPRE, *campos], queryset.model)
+        if resultado is None:
+            return queryset
+        columnas, relaciones = resultado
+        # El cursor lee el campo de orden de cada página
+        columnas.update(campo.lstrip('-') for campo in getattr(self, 'cursor_ordering', ()))
+        queryset = queryset.select_related(None)
+        if relaciones:
+            queryset = queryset.select_related(*relaciones)
+        return queryset.only(*columnas)
@@ -0,0 +1,14 @@
+"""Marca las programaciones sin conductor cuyo demurrage entró en la ventana de 48 horas."""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.containers.signals import alertar_demurrages_por_vencer
+
+
+class Command(BaseCommand):
+    help = 'Flag unassigned programaciones whose demurrage falls due within 48 hours (idempotent).'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            alertas = alertar_demurrages_por_vencer()
+        self.stdout.write(self.style.SUCCESS(f'Alertas de demurrage emitidas: {alertas}'))
@@ -0,0 +1,89 @@
+"""Mide consultas y latencia de los tiempos aprendidos: sin caché vs. caché versionada."""
+import random
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from apps.cds.models import CD
+from apps.drivers.models import Driver
+from apps.programaciones.models import TiempoOperacion, TiempoViaje
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark learned operation/trip time lookups (queries and ms per lookup). All writes are rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drivers', type=int, default=8)
+        parser.add_argument('--rows', type=int, default=200, help='Filas por tabla (operaciones y viajes)')
+        parser.add_argument('--rounds', type=int, default=5, help='Veces que se repite cada búsqueda')
+
+    def _datos(self, drivers_n, rows):
+        cd = CD.objects.create(
+            nombre='bench-tiempos', codigo='BENCH-TIEMPOS', direccion='Bench', comuna='Santiago',
+            lat=-33.45, lng=-70.65, activo=False,
+        )
+        drivers = Driver.objects.bulk_create([
+            Driver(nombre=f'bench-tiempos-{i}', activo=False, presente=False) for i in range(drivers_n)
+        ])
+        ahora = timezone.now()
+        operaciones, viajes = [], []
+        for i in range(rows):
+            inicio = ahora - timedelta(hours=i)
+            real = random.randint(30, 90)
+            operaciones.append(TiempoOperacion(
+                cd=cd, conductor=drivers[i % drivers_n], tipo_operacion='descarga_cd',
+                tiempo_estimado_min=60, tiempo_real_min=real, hora_inicio=inicio, hora_fin=inicio + timedelta(minutes=real),
+            ))
+            viaje = TiempoViaje(
+                conductor=drivers[i % drivers_n],
+                origen_lat=round(-33.50 + random.uniform(-0.05, 0.05), 6), origen_lon=round(-70.70 + random.uniform(-0.05, 0.05), 6),
+                destino_lat=-33.45, destino_lon=-70.65, tiempo_mapbox_min=30, tiempo_real_min=random.randint(25, 60),
+                hora_salida=inicio, hora_llegada=inicio, hora_del_dia=inicio.hour, dia_semana=inicio.weekday(), distancia_km=18,
+            )
+            # bulk_create no pasa por save(): las celdas se calculan aquí
+            viaje.origen_celda = TiempoViaje.celda_para(viaje.origen_lat, viaje.origen_lon)
+            viaje.destino_celda = TiempoViaje.celda_para(viaje.destino_lat, viaje.destino_lon)
+            viajes.append(viaje)
+        TiempoOperacion.objects.bulk_create(operaciones, batch_size=1000)
+        TiempoViaje.objects.bulk_create(viajes, batch_size=1000)
+        return cd, drivers
+
+    def _medir(self, cd, drivers, rounds):
+        salida = timezone.now()
+        busquedas = 0
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for _ in range(rounds):
+                for driver in [None, *drivers]:
+                    TiempoOperacion.obtener_tiempo_aprendido(cd, 'descarga_cd', driver)
+                    TiempoViaje.obtener_tiempo_aprendido((-33.50, -70.70), (-33.45, -70.65), 30, salida, driver)
+                    busquedas += 2
+            elapsed = time.perf_counter() - start
+        return busquedas, len(queries), elapsed
+
+    def handle(self, *args, **options):
+        drivers_n, rows, rounds = options['drivers'], options['rows'], options['rounds']
+        try:
+            with transaction.atomic():
+                cd, drivers = self._datos(drivers_n, rows)
+                for modo, habilitada in (('sin_cache', False), ('cache', True)):
+                    cache.clear()
+                    with override_settings(LEARNED_TIMES_CACHE_ENABLED=habilitada):
+                        busquedas, consultas, elapsed = self._medir(cd, drivers, rounds)
+                    self.stdout.write(
+                        f'{modo:>10}: {busquedas} búsquedas, {consultas / busquedas:.2f} consultas/búsqueda, '
+                        f'{elapsed * 1000 / busquedas:.2f} ms/búsqueda'
+                    )
+                raise _Rollback()
+        except _Rollback:
+            pass
+        cache.clear()
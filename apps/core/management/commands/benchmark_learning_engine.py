@@ -0,0 +1,101 @@
+"""Mide el puntaje de OperationalLearningEngine: evaluación fila a fila vs. cálculo vectorizado."""
+import random
+import time
+from datetime import timedelta
+from math import exp
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.core.services.learning_engine import HistoryArrays, OperationalLearningEngine
+from apps.drivers.models import Driver
+from apps.programaciones.models import TiempoViaje
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark learning engine scoring (row loop vs. vectorized) on synthetic in-memory history. '
+        'Nothing is written to the database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000, help='Viajes del histórico sintético')
+        parser.add_argument('--routes', type=int, default=3, help='Rutas alternativas por recomendación')
+        parser.add_argument('--window-hours', type=int, default=8, help='Horarios evaluados: salida + N horas')
+        parser.add_argument('--rounds', type=int, default=3, help='Veces que se repite cada evaluación')
+
+    def _historia(self, rows, firmas, driver_ids):
+        """Viajes sin guardar: HistoryArrays sólo lee atributos de la fila."""
+        hoy = timezone.now().date()
+        historia = []
+        for i in range(rows):
+            mapbox = random.randint(25, 50)
+            historia.append(TiempoViaje(
+                conductor_id=random.choice(driver_ids), tiempo_mapbox_min=mapbox,
+                tiempo_real_min=max(1, round(mapbox * random.uniform(0.7, 1.6))),
+                fecha=hoy - timedelta(days=random.randint(0, OperationalLearningEngine.HISTORY_DAYS)),
+                hora_del_dia=random.randint(0, 23), dia_semana=random.randint(0, 6),
+                ruta_firma=random.choice([*firmas, '']),
+            ))
+        return historia
+
+    @staticmethod
+    def _prediccion_fila_a_fila(historia, salida, ruta, driver):
+        """Evaluación por fila previa a la vectorización (misma fórmula que _predict_candidates)."""
+        hoy = timezone.now().date()
+        firma = ruta.get('route_signature')
+        filas_ruta = [r for r in historia if firma and r.ruta_firma == firma]
+        relevantes = filas_ruta if len(filas_ruta) >= OperationalLearningEngine.MIN_ROUTE_SAMPLES else historia
+        ponderados = []
+        for row in relevantes:
+            factor = max(0.45, min(2.5, row.calcular_factor_correccion()))
+            peso = exp(-max(0, (hoy - row.fecha).days) / 75)
+            delta = abs(row.hora_del_dia - salida.hour)
+            peso *= exp(-min(delta, 24 - delta) / 3.0)
+            peso *= 1.35 if row.dia_semana == salida.weekday() else 0.82
+            if firma and row.ruta_firma == firma:
+                peso *= 1.8
+            if driver and row.conductor_id == driver.id:
+                peso *= 1.65
+            ponderados.append((factor, peso))
+        aprendido = sum(f * p for f, p in ponderados) / sum(p for _, p in ponderados) if ponderados else 1.0
+        peso_aprendido = min(0.78, len(relevantes) / 18)
+        return max(1, round(float(ruta['duration_minutes']) * ((1 - peso_aprendido) + peso_aprendido * aprendido)))
+
+    def handle(self, *args, **options):
+        rows, rounds = options['rows'], options['rounds']
+        firmas = [f'bench-ruta-{i}' for i in range(options['routes'])]
+        driver = Driver(id=1, nombre='bench-motor')
+        historia = self._historia(rows, firmas, [driver.id, 2, 3, 4, None])
+        rutas = [
+            {'route_index': i, 'duration_minutes': 30 + 4 * i, 'distance_km': 18 + i, 'route_signature': firma}
+            for i, firma in enumerate(firmas)
+        ]
+        inicio = timezone.now().replace(minute=0, second=0, microsecond=0)
+        salidas = [inicio + timedelta(hours=h) for h in range(max(0, options['window_hours']) + 1)]
+        candidatos = len(salidas) * len(rutas)
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            fila_a_fila = [
+                [self._prediccion_fila_a_fila(historia, salida, ruta, driver) for salida in salidas]
+                for ruta in rutas
+            ]
+        fila_ms = (time.perf_counter() - start) * 1000 / rounds
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            vectorizado = OperationalLearningEngine._predict_candidates(
+                HistoryArrays(historia), salidas, rutas, driver
+            )
+        vector_ms = (time.perf_counter() - start) * 1000 / rounds
+
+        diferencias = sum(
+            esperado != prediccion['predicted_minutes']
+            for fila_ruta, vector_ruta in zip(fila_a_fila, vectorizado)
+            for esperado, prediccion in zip(fila_ruta, vector_ruta)
+        )
+        self.stdout.write(f'{rows} viajes, {candidatos} candidatos (rutas × horarios), {rounds} rondas')
+        self.stdout.write(f'{"fila_a_fila":>12}: {fila_ms:.2f} ms/recomendación')
+        self.stdout.write(f'{"vectorizado":>12}: {vector_ms:.2f} ms/recomendación')
+        self.stdout.write(f'{"aceleración":>12}: {fila_ms / vector_ms:.1f}x, {diferencias} predicciones distintas')
@@ -0,0 +1,42 @@
+"""Reporte de consultas por endpoint registrado por QueryBudgetMiddleware."""
+from django.core.management.base import BaseCommand
+
+from apps.core.models import PerfilEndpoint
+from apps.core.services.query_budget import QueryBudgetService
+
+
+class Command(BaseCommand):
+    help = 'Show per-endpoint query count, DB time and Python time percentiles and N+1 flags.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orden', choices=['p50', 'p95', 'p99'], default='p95')
+        parser.add_argument('--limite', type=int, default=30)
+        parser.add_argument('--detalle', action='store_true', help='Incluye las consultas repetidas de cada endpoint')
+        parser.add_argument('--reset', action='store_true', help='Borra los perfiles acumulados')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            borrados, _ = PerfilEndpoint.objects.all().delete()
+            self.stdout.write(self.style.SUCCESS(f'Perfiles borrados: {borrados}'))
+            return
+
+        QueryBudgetService.volcar()
+        filas = QueryBudgetService.reporte(options['orden'])[:options['limite']]
+        if not filas:
+            self.stdout.write('Sin perfiles registrados (¿QUERY_BUDGET_ENABLED activo?).')
+            return
+
+        self.stdout.write(
+            f"{'endpoint':<45} {'req':>6} {'q p50':>6} {'q p95':>6} {'q max':>6} "
+            f"{'bd p95':>8} {'py p95':>8} {'N+1':>5} {'>pres':>6}"
+        )
+        for fila in filas:
+            linea = (
+                f"{fila['url_name'][:45]:<45} {fila['solicitudes']:>6} {fila['consultas']['p50']:>6} "
+                f"{fila['consultas']['p95']:>6} {fila['max_consultas']:>6} {fila['ms_bd']['p95']:>8} "
+                f"{fila['ms_python']['p95']:>8} {fila['con_n_mas_1']:>5} {fila['sobre_presupuesto']:>6}"
+            )
+            self.stdout.write(self.style.WARNING(linea) if fila['con_n_mas_1'] else linea)
+            if options['detalle']:
+                for repetida in fila['duplicadas'].values():
+                    self.stdout.write(f"    ×{repetida['max_repeticiones']}: {repetida['sql'][:160]}")
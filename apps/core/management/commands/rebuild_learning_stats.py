@@ -0,0 +1,12 @@
+"""Reconstruye EstadisticaAprendizaje desde los tiempos de operación y viaje registrados."""
+from django.core.management.base import BaseCommand
+
+from apps.core.services.learning_stats import LearningStatsService
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-CD learning statistics used by ml_learning_stats.'
+
+    def handle(self, *args, **options):
+        grupos = LearningStatsService.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Grupos de aprendizaje: {grupos}'))
@@ -0,0 +1,14 @@
+"""Reconstruye CasoSimilarIndice desde el historial de programaciones cerradas."""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.core.services.similar_case_index import SimilarCaseIndex
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the precomputed similar-case index used by contextual reasoning.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            grupos = SimilarCaseIndex.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Grupos de casos similares: {grupos}'))
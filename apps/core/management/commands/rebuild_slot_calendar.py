@@ -0,0 +1,12 @@
+"""Reconstruye el calendario de cupos (CargaSlotCD) y el histograma de duraciones por CD."""
+from django.core.management.base import BaseCommand
+
+from apps.core.services.slot_calendar import SlotCalendarService
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the slot load calendar and duration histograms used by client recommendations.'
+
+    def handle(self, *args, **options):
+        bloques, celdas = SlotCalendarService.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Bloques de carga: {bloques}; celdas de duración: {celdas}'))
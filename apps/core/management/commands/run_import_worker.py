@@ -0,0 +1,53 @@
+"""Procesa la cola de importaciones Excel (ImportJob) con un pool de hilos."""
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from apps.core.services.import_jobs import ImportJobService
+
+
+class Command(BaseCommand):
+    help = 'Process queued Excel imports. Runs until interrupted unless --once is given.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=2, help='Importaciones en paralelo')
+        parser.add_argument('--poll', type=float, default=2.0, help='Segundos de espera con la cola vacía')
+        parser.add_argument('--once', action='store_true', help='Vaciar la cola y terminar')
+
+    def handle(self, *args, **options):
+        ImportJobService.recuperar_huerfanos()
+        if options['once']:
+            procesados = ImportJobService.run_pending()
+            self.stdout.write(self.style.SUCCESS(f'Importaciones procesadas: {procesados}'))
+            return
+
+        detener = threading.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda *_: detener.set())
+
+        hilos = [
+            threading.Thread(target=self._loop, args=(detener, options['poll']), name=f'import-worker-{i}')
+            for i in range(max(1, options['concurrency']))
+        ]
+        for hilo in hilos:
+            hilo.start()
+        self.stdout.write(f'Worker de importaciones activo ({len(hilos)} hilos)')
+
+        # El hilo principal sólo recupera trabajos huérfanos de otros procesos.
+        while not detener.wait(60):
+            close_old_connections()
+            ImportJobService.recuperar_huerfanos()
+        for hilo in hilos:
+            hilo.join()
+        self.stdout.write('Worker de importaciones detenido')
+
+    @staticmethod
+    def _loop(detener, poll):
+        try:
+            while not detener.is_set():
+                if not ImportJobService.run_pending(max_jobs=1):
+                    detener.wait(poll)
+        finally:
+            connection.close()
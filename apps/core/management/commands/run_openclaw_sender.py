@@ -0,0 +1,41 @@
+"""Entrega los mensajes del outbox de OpenClaw (MensajeOpenClaw)."""
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from apps.core.services.openclaw import OpenClawService
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued OpenClaw notifications. Runs until interrupted unless --once is given.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll', type=float, default=2.0, help='Segundos de espera sin mensajes vencidos')
+        parser.add_argument('--once', action='store_true', help='Enviar lo vencido y terminar')
+
+    def handle(self, *args, **options):
+        OpenClawService.recuperar_huerfanos()
+        if options['once']:
+            enviados = OpenClawService.run_pending()
+            self.stdout.write(self.style.SUCCESS(f'Mensajes OpenClaw enviados: {enviados}'))
+            return
+
+        detener = threading.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda *_: detener.set())
+
+        self.stdout.write('Sender de OpenClaw activo')
+        ciclos = 0
+        try:
+            while not detener.is_set():
+                OpenClawService.run_pending()
+                ciclos += 1
+                if ciclos % 30 == 0:
+                    close_old_connections()
+                    OpenClawService.recuperar_huerfanos()
+                detener.wait(options['poll'])
+        finally:
+            connection.close()
+        self.stdout.write('Sender de OpenClaw detenido')
@@ -0,0 +1,32 @@
+"""Middleware de instrumentación de consultas (ver apps.core.services.query_budget)."""
+import time
+
+from django.core.exceptions import MiddlewareNotUsed
+
+from apps.core.services.query_budget import QueryBudgetService, RegistroConsultas
+
+
+class QueryBudgetMiddleware:
+    """
+    Mide consultas, tiempo en BD y tiempo en Python de cada solicitud y los
+    acumula por nombre de URL. Se desactiva por completo sin QUERY_BUDGET_ENABLED.
+    """
+
+    def __init__(self, get_response):
+        if not QueryBudgetService.enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        registro = RegistroConsultas()
+        inicio = time.perf_counter()
+        with registro.medir():
+            response = self.get_response(request)
+        segundos = time.perf_counter() - inicio
+
+        match = getattr(request, 'resolver_match', None)
+        if match is not None:
+            resumen = QueryBudgetService.analizar(match.view_name or match.route, registro, segundos)
+            response['X-Query-Count'] = str(resumen['consultas'])
+            QueryBudgetService.registrar(resumen)
+        return response
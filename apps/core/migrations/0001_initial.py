@@ -0,0 +1,42 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('embarque', 'Embarque'), ('liberacion', 'Liberación'), ('programacion', 'Programación'), ('conductores', 'Conductores')], max_length=20, verbose_name='Tipo')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('completado', 'Completado'), ('fallido', 'Fallido')], default='pendiente', max_length=20, verbose_name='Estado')),
+                ('nombre_archivo', models.CharField(max_length=255, verbose_name='Archivo')),
+                ('contenido', models.BinaryField(help_text='Archivo subido; se descarta al terminar el procesamiento.', null=True, verbose_name='Contenido')),
+                ('usuario', models.CharField(blank=True, max_length=200, null=True, verbose_name='Usuario')),
+                ('filas_total', models.PositiveIntegerField(blank=True, null=True, verbose_name='Filas totales')),
+                ('filas_procesadas', models.PositiveIntegerField(default=0, verbose_name='Filas procesadas')),
+                ('progreso', models.PositiveSmallIntegerField(default=0, verbose_name='Progreso (%)')),
+                ('resultado', models.JSONField(blank=True, null=True, verbose_name='Resultado')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+                ('intentos', models.PositiveSmallIntegerField(default=0, verbose_name='Intentos')),
+                ('worker', models.CharField(blank=True, max_length=100, verbose_name='Worker')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Creado')),
+                ('iniciado_en', models.DateTimeField(blank=True, null=True, verbose_name='Iniciado')),
+                ('finalizado_en', models.DateTimeField(blank=True, null=True, verbose_name='Finalizado')),
+                ('heartbeat', models.DateTimeField(blank=True, help_text='Lo renueva el worker mientras procesa; permite recuperar trabajos huérfanos.', null=True, verbose_name='Último latido')),
+            ],
+            options={
+                'verbose_name': 'Importación',
+                'verbose_name_plural': 'Importaciones',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['estado', 'created_at'], name='core_import_estado_9d9328_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(unique=True, verbose_name='Fecha')),
+                ('entregas', models.PositiveIntegerField(default=0, verbose_name='Entregas')),
+                ('actualizado', models.DateTimeField(help_text='Contenedores modificados después de esta marca obligan a recalcular el día.', verbose_name='Actualizado')),
+            ],
+            options={
+                'verbose_name': 'Resumen diario',
+                'verbose_name_plural': 'Resúmenes diarios',
+                'ordering': ['fecha'],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_resumen_diario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PerfilEndpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url_name', models.CharField(max_length=200, unique=True, verbose_name='Endpoint')),
+                ('solicitudes', models.PositiveIntegerField(default=0, verbose_name='Solicitudes')),
+                ('con_n_mas_1', models.PositiveIntegerField(default=0, verbose_name='Con N+1')),
+                ('sobre_presupuesto', models.PositiveIntegerField(default=0, verbose_name='Sobre presupuesto')),
+                ('max_consultas', models.PositiveIntegerField(default=0, verbose_name='Máx. consultas')),
+                ('muestras', models.JSONField(blank=True, default=list, verbose_name='Muestras')),
+                ('duplicadas', models.JSONField(blank=True, default=dict, help_text='{huella: {sql, max_repeticiones}} de las consultas repetidas en una misma solicitud.', verbose_name='Consultas repetidas')),
+                ('actualizado', models.DateTimeField(auto_now=True, verbose_name='Actualizado')),
+            ],
+            options={
+                'verbose_name': 'Perfil de endpoint',
+                'verbose_name_plural': 'Perfiles de endpoints',
+                'ordering': ['url_name'],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:56
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_perfil_endpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MensajeOpenClaw',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('endpoint', models.CharField(max_length=100, verbose_name='Endpoint')),
+                ('payload', models.JSONField(verbose_name='Payload')),
+                ('clave_dedupe', models.CharField(blank=True, db_index=True, help_text='Mensajes con la misma clave dentro de OPENCLAW_DEDUPE_SECONDS se envían una sola vez.', max_length=64, verbose_name='Clave de deduplicación')),
+                ('programacion_id', models.PositiveIntegerField(blank=True, null=True, verbose_name='Programación')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('enviando', 'Enviando'), ('enviado', 'Enviado'), ('fallido', 'Fallido')], default='pendiente', max_length=20, verbose_name='Estado')),
+                ('intentos', models.PositiveSmallIntegerField(default=0, verbose_name='Intentos')),
+                ('proximo_intento', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Próximo intento')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+                ('worker', models.CharField(blank=True, max_length=100, verbose_name='Worker')),
+                ('reclamado_en', models.DateTimeField(blank=True, null=True, verbose_name='Reclamado')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Creado')),
+                ('enviado_en', models.DateTimeField(blank=True, null=True, verbose_name='Enviado')),
+            ],
+            options={
+                'verbose_name': 'Mensaje OpenClaw',
+                'verbose_name_plural': 'Mensajes OpenClaw',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['estado', 'proximo_intento'], name='core_mensaj_estado_a4d2d1_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,174 @@
+from django.db import models
+from django.utils import timezone
+
+
+class ImportJob(models.Model):
+    """Importación Excel encolada; la procesa `manage.py run_import_worker`"""
+
+    TIPOS = [
+        ('embarque', 'Embarque'),
+        ('liberacion', 'Liberación'),
+        ('programacion', 'Programación'),
+        ('conductores', 'Conductores'),
+    ]
+
+    ESTADOS = [
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando'),
+        ('completado', 'Completado'),
+        ('fallido', 'Fallido'),
+    ]
+
+    tipo = models.CharField('Tipo', max_length=20, choices=TIPOS)
+    estado = models.CharField('Estado', max_length=20, choices=ESTADOS, default='pendiente')
+    nombre_archivo = models.CharField('Archivo', max_length=255)
+    contenido = models.BinaryField(
+        'Contenido', null=True, editable=False,
+        help_text='Archivo subido; se descarta al terminar el procesamiento.'
+    )
+    usuario = models.CharField('Usuario', max_length=200, null=True, blank=True)
+
+    # Avance
+    filas_total = models.PositiveIntegerField('Filas totales', null=True, blank=True)
+    filas_procesadas = models.PositiveIntegerField('Filas procesadas', default=0)
+    progreso = models.PositiveSmallIntegerField('Progreso (%)', default=0)
+
+    # Resultado: misma respuesta que entregaba el endpoint síncrono
+    resultado = models.JSONField('Resultado', null=True, blank=True)
+    error = models.TextField('Error', blank=True)
+    intentos = models.PositiveSmallIntegerField('Intentos', default=0)
+    worker = models.CharField('Worker', max_length=100, blank=True)
+
+    # Timestamps
+    created_at = models.DateTimeField('Creado', auto_now_add=True)
+    iniciado_en = models.DateTimeField('Iniciado', null=True, blank=True)
+    finalizado_en = models.DateTimeField('Finalizado', null=True, blank=True)
+    heartbeat = models.DateTimeField(
+        'Último latido', null=True, blank=True,
+        help_text='Lo renueva el worker mientras procesa; permite recuperar trabajos huérfanos.'
+    )
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Importación'
+        verbose_name_plural = 'Importaciones'
+        indexes = [
+            models.Index(fields=['estado', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} #{self.pk} - {self.get_estado_display()}"
+
+    @property
+    def terminado(self):
+        return self.estado in ('completado', 'fallido')
+
+
+class ResumenDiario(models.Model):
+    """
+    Rollup diario de entregas para las analíticas de tendencias.
+
+    Sólo guarda días cerrados (anteriores a hoy); el día en curso se calcula
+    en vivo. Lo mantiene AnalyticsAggregationService.
+    """
+
+    fecha = models.DateField('Fecha', unique=True)
+    entregas = models.PositiveIntegerField('Entregas', default=0)
+    actualizado = models.DateTimeField(
+        'Actualizado',
+        help_text='Contenedores modificados después de esta marca obligan a recalcular el día.'
+    )
+
+    class Meta:
+        ordering = ['fecha']
+        verbose_name = 'Resumen diario'
+        verbose_name_plural = 'Resúmenes diarios'
+
+    def __str__(self):
+        return f"{self.fecha}: {self.entregas} entregas"
+
+
+class PerfilEndpoint(models.Model):
+    """
+    Perfil de consultas por endpoint (nombre de URL) que registra
+    QueryBudgetMiddleware cuando QUERY_BUDGET_ENABLED está activo.
+
+    `muestras` conserva las últimas QUERY_BUDGET_SAMPLES solicitudes como
+    [consultas, ms en BD, ms en Python]; los percentiles se calculan al leer.
+    """
+
+    url_name = models.CharField('Endpoint', max_length=200, unique=True)
+    solicitudes = models.PositiveIntegerField('Solicitudes', default=0)
+    con_n_mas_1 = models.PositiveIntegerField('Con N+1', default=0)
+    sobre_presupuesto = models.PositiveIntegerField('Sobre presupuesto', default=0)
+    max_consultas = models.PositiveIntegerField('Máx. consultas', default=0)
+    muestras = models.JSONField('Muestras', default=list, blank=True)
+    duplicadas = models.JSONField(
+        'Consultas repetidas', default=dict, blank=True,
+        help_text='{huella: {sql, max_repeticiones}} de las consultas repetidas en una misma solicitud.'
+    )
+    actualizado = models.DateTimeField('Actualizado', auto_now=True)
+
+    class Meta:
+        ordering = ['url_name']
+        verbose_name = 'Perfil de endpoint'
+        verbose_name_plural = 'Perfiles de endpoints'
+
+    def __str__(self):
+        return f"{self.url_name} ({self.solicitudes} solicitudes)"
+
+    @staticmethod
+    def _percentil(valores, p):
+        if not valores:
+            return 0
+        ordenados = sorted(valores)
+        return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+    def percentiles(self, columna=0, ps=(50, 95, 99)):
+        """Percentiles de una columna de `muestras` (0 consultas, 1 ms BD, 2 ms Python)."""
+        valores = [muestra[columna] for muestra in self.muestras]
+        return {f'p{p}': self._percentil(valores, p) for p in ps}
+
+
+class MensajeOpenClaw(models.Model):
+    """
+    Outbox de notificaciones a OpenClaw.
+
+    OpenClawService escribe el mensaje en la misma transacción que la decisión
+    que lo origina; `manage.py run_openclaw_sender` lo entrega en segundo plano
+    con reintentos y backoff.
+    """
+
+    ESTADOS = [
+        ('pendiente', 'Pendiente'),
+        ('enviando', 'Enviando'),
+        ('enviado', 'Enviado'),
+        ('fallido', 'Fallido'),
+    ]
+
+    endpoint = models.CharField('Endpoint', max_length=100)
+    payload = models.JSONField('Payload')
+    clave_dedupe = models.CharField(
+        'Clave de deduplicación', max_length=64, blank=True, db_index=True,
+        help_text='Mensajes con la misma clave dentro de OPENCLAW_DEDUPE_SECONDS se envían una sola vez.'
+    )
+    programacion_id = models.PositiveIntegerField('Programación', null=True, blank=True)
+    estado = models.CharField('Estado', max_length=20, choices=ESTADOS, default='pendiente')
+    intentos = models.PositiveSmallIntegerField('Intentos', default=0)
+    proximo_intento = models.DateTimeField('Próximo intento', default=timezone.now)
+    error = models.TextField('Error', blank=True)
+    worker = models.CharField('Worker', max_length=100, blank=True)
+    reclamado_en = models.DateTimeField('Reclamado', null=True, blank=True)
+    created_at = models.DateTimeField('Creado', auto_now_add=True)
+    enviado_en = models.DateTimeField('Enviado', null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Mensaje OpenClaw'
+        verbose_name_plural = 'Mensajes OpenClaw'
+        indexes = [
+            models.Index(fields=['estado', 'proximo_intento']),
+        ]
+
+    def __str__(self):
+        return f"{self.endpoint} #{self.pk} - {self.get_estado_display()}"
@@ -0,0 +1,43 @@
+"""
+Paginación de los listados de contenedores y programaciones.
+
+Por defecto se mantiene PageNumberPagination (`?page=`, con `count`). Con
+`?paginacion=cursor` (o al seguir un enlace con `?cursor=`) se usa paginación
+por cursor sobre el orden indexado que declara la vista en `cursor_ordering`:
+sin COUNT(*) ni OFFSET, así que cualquier página cuesta lo mismo que la
+primera. En modo cursor se ignora `?ordering=`.
+"""
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class IndexedCursorPagination(CursorPagination):
+    cursor_query_param = 'cursor'
+
+    def get_ordering(self, request, queryset, view):
+        return tuple(view.cursor_ordering)
+
+
+class CursorOrPagePagination(PageNumberPagination):
+    """PageNumberPagination, o IndexedCursorPagination si el cliente la pide."""
+
+    mode_query_param = 'paginacion'
+
+    def __init__(self):
+        self.cursor = None
+
+    def _usa_cursor(self, request, view):
+        if not getattr(view, 'cursor_ordering', None):
+            return False
+        params = request.query_params
+        return params.get(self.mode_query_param) == 'cursor' or IndexedCursorPagination.cursor_query_param in params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self._usa_cursor(request, view):
+            self.cursor = IndexedCursorPagination()
+            return self.cursor.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor:
+            return self.cursor.get_paginated_response(data)
+        return super().get_paginated_response(data)
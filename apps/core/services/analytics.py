@@ -0,0 +1,122 @@
+"""
+Agregaciones de las analíticas (tendencias y conductores).
+
+Cada serie sale de un único GROUP BY (TruncDate / annotate) en vez de un
+COUNT por día o por conductor. Con ANALYTICS_ROLLUP_ENABLED los días cerrados
+se leen de ResumenDiario: sólo se recalculan los días que faltan o cuyos
+contenedores cambiaron después del último cálculo (Container.updated_at), y
+el día en curso siempre se cuenta en vivo. Un contenedor que se borra o cuya
+fecha_descarga se mueve a otro día no deja rastro en el día anterior: los
+receivers de Container descartan ese resumen (invalidar_dias). La cantidad de
+consultas no depende del rango pedido.
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from apps.containers.models import Container
+from apps.core.models import ResumenDiario
+from apps.programaciones.models import Programacion
+
+ESTADOS_ENTREGADOS = ['descargado', 'devuelto']
+DIAS_SEMANA = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
+
+
+class AnalyticsAggregationService:
+    @staticmethod
+    def rollup_enabled():
+        return bool(getattr(settings, 'ANALYTICS_ROLLUP_ENABLED', True))
+
+    @staticmethod
+    def _entregas_agrupadas(**filtros):
+        """{fecha local: entregas} con un GROUP BY sobre fecha_descarga."""
+        filas = (
+            Container.objects.filter(estado__in=ESTADOS_ENTREGADOS, **filtros)
+            .annotate(dia=TruncDate('fecha_descarga'))
+            .values('dia')
+            .annotate(entregas=Count('id'))
+            .values_list('dia', 'entregas')
+        )
+        return dict(filas)
+
+    @classmethod
+    def entregas_en_vivo(cls, desde, hasta):
+        return cls._entregas_agrupadas(fecha_descarga__date__gte=desde, fecha_descarga__date__lte=hasta)
+
+    @classmethod
+    def entregas_cerradas(cls, desde, hasta):
+        """Entregas por día para días cerrados (< hoy), leídas del rollup y refrescadas si hace falta."""
+        marca = timezone.now()
+        resumen = {
+            fila.fecha: fila
+            for fila in ResumenDiario.objects.filter(fecha__gte=desde, fecha__lte=hasta)
+        }
+        dias = [desde + timedelta(days=i) for i in range((hasta - desde).days + 1)]
+        pendientes = {dia for dia in dias if dia not in resumen}
+
+        if resumen:
+            # Días ya resumidos cuyos contenedores cambiaron desde el último cálculo
+            desde_marca = min(fila.actualizado for fila in resumen.values())
+            pendientes.update(
+                Container.objects.filter(
+                    updated_at__gt=desde_marca,
+                    fecha_descarga__date__gte=desde, fecha_descarga__date__lte=hasta,
+                ).annotate(dia=TruncDate('fecha_descarga')).order_by().values_list('dia', flat=True).distinct()
+            )
+
+        resultado = {dia: fila.entregas for dia, fila in resumen.items()}
+        if pendientes:
+            conteos = cls._entregas_agrupadas(fecha_descarga__date__in=sorted(pendientes))
+            resultado.update({dia: conteos.get(dia, 0) for dia in pendientes})
+            ResumenDiario.objects.bulk_create(
+                [ResumenDiario(fecha=dia, entregas=resultado[dia], actualizado=marca) for dia in sorted(pendientes)],
+                update_conflicts=True, unique_fields=['fecha'], update_fields=['entregas', 'actualizado'],
+            )
+        if resumen:
+            # Avanza la marca para que la próxima lectura sólo mire cambios nuevos
+            ResumenDiario.objects.filter(fecha__in=resumen.keys() - pendientes).update(actualizado=marca)
+        return resultado
+
+    @staticmethod
+    def invalidar_dias(*fechas):
+        """Descarta el resumen de los días de esas fechas de descarga; se recalculan al leerlos."""
+        dias = {timezone.localdate(fecha) for fecha in fechas if fecha}
+        if dias:
+            ResumenDiario.objects.filter(fecha__in=dias).delete()
+
+    @classmethod
+    def entregas_por_dia(cls, dias):
+        """[{fecha, entregas}] de los últimos `dias` días, incluyendo hoy."""
+        hoy = timezone.localdate()
+        desde = hoy - timedelta(days=dias - 1)
+        if cls.rollup_enabled() and desde < hoy:
+            conteos = cls.entregas_cerradas(desde, hoy - timedelta(days=1))
+            conteos.update(cls.entregas_en_vivo(hoy, hoy))
+        else:
+            conteos = cls.entregas_en_vivo(desde, hoy)
+        return [
+            {'fecha': (desde + timedelta(days=i)).isoformat(), 'entregas': conteos.get(desde + timedelta(days=i), 0)}
+            for i in range(dias)
+        ]
+
+    @staticmethod
+    def entregas_por_dia_semana(serie):
+        """Suma la serie diaria por día de la semana (lunes primero)."""
+        por_dia = defaultdict(int)
+        for punto in serie:
+            por_dia[date.fromisoformat(punto['fecha']).weekday()] += punto['entregas']
+        return [{'dia': DIAS_SEMANA[i], 'entregas': por_dia.get(i, 0)} for i in range(7)]
+
+    @staticmethod
+    def completadas_por_conductor():
+        """{driver_id: programaciones con contenedor descargado/devuelto} en un GROUP BY."""
+        return dict(
+            Programacion.objects.filter(driver__isnull=False, container__estado__in=ESTADOS_ENTREGADOS)
+            .values('driver_id')
+            .annotate(total=Count('id'))
+            .values_list('driver_id', 'total')
+        )
@@ -58,23 +58,34 @@ class CapacityChecker:
 
 
 class ETAEstimator:
+    # Fallback a coordenadas de puertos conocidos si no hay GPS del conductor
+    PUERTOS = {
+        'ZEAL': (-33.05, -71.63),
+        'TPS': (-33.03, -71.63),
+        'STI': (-33.58, -71.61),
+        'CLEP': (-33.60, -71.58),
+    }
+
+    @classmethod
+    def origin_coords(cls, programacion: Programacion, driver: Driver | None):
+        """(lat, lng) desde donde parte el viaje al CD, o None si no se conoce."""
+        if driver and driver.ultima_posicion_lat and driver.ultima_posicion_lng:
+            return (driver.ultima_posicion_lat, driver.ultima_posicion_lng)
+        if programacion.container.posicion_fisica:
+            return cls.PUERTOS.get(programacion.container.posicion_fisica)
+        return None
+
     @classmethod
-    def estimate_minutes(cls, programacion: Programacion, driver: Driver | None) -> int:
+    def estimate_minutes(cls, programacion: Programacion, driver: Driver | None,
+                         historial_viaje=None, historial_operacion=None, ruta_base=None) -> int:
+        """
+        `ruta_base` es el tiempo de viaje ya resuelto (p. ej. por MatrixETAService);
+        si se entrega, no se consulta Mapbox para este par.
+        """
         from apps.core.services.ml_predictor import MLTimePredictor
-        
+
         # 1. Tiempo de viaje (ML + Mapbox)
-        origen_coords = None
-        if driver and driver.ultima_posicion_lat and driver.ultima_posicion_lng:
-            origen_coords = (driver.ultima_posicion_lat, driver.ultima_posicion_lng)
-        elif programacion.container.posicion_fisica:
-            # Fallback a coordenadas de puertos conocidos si no hay GPS del conductor
-            puertos = {
-                'ZEAL': (-33.05, -71.63),
-                'TPS': (-33.03, -71.63),
-                'STI': (-33.58, -71.61),
-                'CLEP': (-33.60, -71.58),
-            }
-            origen_coords = puertos.get(programacion.container.posicion_fisica)
+        origen_coords = cls.origin_coords(programacion, driver)
 
         if origen_coords and programacion.cd:
             destino_coords = (programacion.cd.lat, programacion.cd.lng)
@@ -82,7 +93,9 @@ class ETAEstimator:
                 origen_coords=origen_coords,
                 destino_coords=destino_coords,
                 hora_salida=programacion.fecha_programada,
-                conductor=driver
+                conductor=driver,
+                historial=historial_viaje,
+                ruta_base=ruta_base,
             )
             tiempo_viaje = prediccion['tiempo_estimado_min']
         else:
@@ -91,7 +104,8 @@ class ETAEstimator:
         # 2. Tiempo de operación en CD
         tiempo_op = MLTimePredictor.predecir_tiempo_operacion(
             cd=programacion.cd,
-            conductor=driver
+            conductor=driver,
+            historial=historial_operacion,
         )
 
         return int(tiempo_viaje + tiempo_op)
@@ -107,6 +121,33 @@ class RouteFeasibilityValidator:
 
 
 class AnomalyDetector:
+    @staticmethod
+    def active_conflict_driver_ids(programacion: Programacion, driver_ids) -> set:
+        """Conductores (de driver_ids) que ya participan en otro servicio activo."""
+        return set(
+            Programacion.objects.filter(
+                driver_id__in=driver_ids,
+                container__estado__in=['asignado', 'en_ruta'],
+            ).exclude(pk=programacion.pk).values_list('driver_id', flat=True).distinct()
+        )
+
+    @staticmethod
+    def carrier_history_count(programacion: Programacion) -> int:
+        return Programacion.objects.filter(
+            cd=programacion.cd,
+            container__vendor=programacion.container.vendor,
+            container__estado__in=['entregado', 'descargado', 'devuelto'],
+        ).exclude(pk=programacion.pk).count()
+
+    @staticmethod
+    def carrier_incident_count(programacion: Programacion, now=None) -> int:
+        now = now or timezone.now()
+        return Programacion.objects.filter(
+            container__vendor=programacion.container.vendor,
+            created_at__gte=now - timedelta(days=14),
+            incidentes_registrados__isnull=False,
+        ).exclude(incidentes_registrados=[]).count()
+
     @staticmethod
     def _has_tracking_coverage(programacion: Programacion, driver: Optional[Driver]) -> bool:
         has_cd_coords = bool(programacion.cd and programacion.cd.lat and programacion.cd.lng)
@@ -114,7 +155,23 @@ class AnomalyDetector:
         return has_cd_coords and has_driver_coords
 
     @classmethod
-    def detect(cls, programacion: Programacion, driver: Optional[Driver]) -> list[dict]:
+    def detect(
+        cls,
+        programacion: Programacion,
+        driver: Optional[Driver],
+        *,
+        has_conflict: Optional[bool] = None,
+        eta_min: Optional[int] = None,
+        carrier_history_count: Optional[int] = None,
+        carrier_incidents: Optional[int] = None,
+        fleet_at_limit: Optional[bool] = None,
+    ) -> list[dict]:
+        """
+        Detecta anomalías operacionales para el par programación/conductor.
+
+        Los argumentos opcionales permiten reutilizar valores ya calculados
+        (p. ej. por ScoringContext); si se omiten se consultan como siempre.
+        """
         anomalies: list[OperationalAnomaly] = []
         now = timezone.now()
         delay_threshold = float(getattr(settings, "DELAY_RISK_THRESHOLD", 0.65))
@@ -122,11 +179,9 @@ class AnomalyDetector:
         incident_threshold = int(getattr(settings, "CARRIER_INCIDENT_THRESHOLD", 3))
 
         if driver:
-            conflicting = Programacion.objects.filter(
-                driver=driver,
-                container__estado__in=['asignado', 'en_ruta'],
-            ).exclude(pk=programacion.pk).exists()
-            if conflicting:
+            if has_conflict is None:
+                has_conflict = cls.active_conflict_driver_ids(programacion, [driver.pk]) != set()
+            if has_conflict:
                 anomalies.append(OperationalAnomaly(
                     "ANOM_OPS_001", "P0",
                     "Vehículo/conductor ya asignado a otro servicio activo.",
@@ -170,7 +225,8 @@ class AnomalyDetector:
                 "Asignar recurso de mayor capacidad."
             ))
 
-        eta_min = ETAEstimator.estimate_minutes(programacion, driver)
+        if eta_min is None:
+            eta_min = ETAEstimator.estimate_minutes(programacion, driver)
         if not RouteFeasibilityValidator.is_feasible(programacion, eta_min):
             anomalies.append(OperationalAnomaly(
                 "ANOM_OPS_005", "P0",
@@ -185,12 +241,9 @@ class AnomalyDetector:
                 "Completar datos de ubicación y tracking antes de salida."
             ))
 
-        history_count = Programacion.objects.filter(
-            cd=programacion.cd,
-            container__vendor=programacion.container.vendor,
-            container__estado__in=['entregado', 'descargado', 'devuelto'],
-        ).exclude(pk=programacion.pk).count()
-        if history_count == 0:
+        if carrier_history_count is None:
+            carrier_history_count = cls.carrier_history_count(programacion)
+        if carrier_history_count == 0:
             anomalies.append(OperationalAnomaly(
                 "ANOM_OPS_008", "P1",
                 "Zona sin historial operativo del carrier.",
@@ -205,11 +258,8 @@ class AnomalyDetector:
                 "Revisión manual obligatoria previa al despacho."
             ))
 
-        carrier_incidents = Programacion.objects.filter(
-            container__vendor=programacion.container.vendor,
-            created_at__gte=now - timedelta(days=14),
-            incidentes_registrados__isnull=False,
-        ).exclude(incidentes_registrados=[]).count()
+        if carrier_incidents is None:
+            carrier_incidents = cls.carrier_incident_count(programacion, now)
         if carrier_incidents > incident_threshold:
             anomalies.append(OperationalAnomaly(
                 "ANOM_OPS_010", "P1",
@@ -224,7 +274,9 @@ class AnomalyDetector:
                 "Escalar a supervisor y activar protocolo de contingencia."
             ))
 
-        if FleetStatusService.is_fleet_at_limit():
+        if fleet_at_limit is None:
+            fleet_at_limit = FleetStatusService.is_fleet_at_limit()
+        if fleet_at_limit:
             anomalies.append(OperationalAnomaly(
                 "ANOM_OPS_015", "P2",
                 "Flota al límite de capacidad operativa.",
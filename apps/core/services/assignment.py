@@ -9,11 +9,11 @@ from apps.core.services.mapbox import MapboxService
 from apps.core.services.ml_predictor import MLTimePredictor
 from apps.core.services.learning_engine import OperationalLearningEngine
 from apps.core.services.anomaly_detector import (
-    AnomalyDetector, DelayRiskScorer, CapacityChecker, ETAEstimator, RouteFeasibilityValidator
+    DelayRiskScorer, CapacityChecker, RouteFeasibilityValidator
 )
-from apps.core.services.contextual_reasoning import ContextualReasoningService
 from apps.core.services.openclaw import OpenClawService
-from apps.events.models import Event
+from apps.core.services.scoring_context import ScoringContext
+from apps.events.services import EventLog
 
 
 class AssignmentService:
@@ -59,9 +59,10 @@ class AssignmentService:
         return round(1.0 - (ratio * 0.35), 3)
 
     @classmethod
-    def _score_historial(cls, driver: Driver) -> float:
+    def _score_historial(cls, driver: Driver, profile: dict | None = None) -> float:
         cumplimiento = float(driver.cumplimiento_porcentaje) / 100.0
-        profile = OperationalLearningEngine.driver_profile(driver)
+        if profile is None:
+            profile = OperationalLearningEngine.driver_profile(driver)
         # Con pocas muestras no se altera el historial declarado del conductor.
         if profile['samples'] < OperationalLearningEngine.MIN_DRIVER_SAMPLES:
             return round(cumplimiento, 3)
@@ -102,32 +103,42 @@ class AssignmentService:
         return f"Intervención requerida por score bajo ({score:.2f})."
 
     @classmethod
-    def calcular_score_total(cls, driver: Driver, programacion: Programacion):
-        base_weights = cls._get_base_weights()
-        dyn_weights = ContextualReasoningService.dynamic_weights(base_weights, programacion)
+    def calcular_score_total(cls, driver: Driver, programacion: Programacion, context: ScoringContext | None = None,
+                             notificar: bool = True):
+        """
+        Score explicable de un conductor para una programación.
+
+        `context` reutiliza los datos ya cargados para la programación; si no se
+        entrega se construye uno para este conductor. Con notificar=False no se
+        avisa de anomalías (la asignación, individual o por lotes, avisa sólo por los
+        pares elegidos).
+        """
+        if context is None:
+            context = ScoringContext.load(programacion, [driver], cls._get_base_weights())
+        dyn_weights = context.weights
 
         dimensions = {
             'disponibilidad_confirmada': cls._score_disponibilidad(driver),
             'riesgo_de_atraso': cls._score_riesgo(programacion, driver),
             'adecuacion_vehiculo_carga': cls._score_adecuacion(programacion, driver),
-            'historial_operativo': cls._score_historial(driver),
+            'historial_operativo': cls._score_historial(driver, context.driver_profile(driver)),
             'urgencia_del_servicio': cls._score_urgencia(programacion),
         }
 
         deterministic = sum(dimensions[k] * dyn_weights[k] for k in dimensions)
-        similar_cases = ContextualReasoningService.similar_cases(programacion, top_n=5)
-        confidence = ContextualReasoningService.confidence(similar_cases)
-        similar_boost = (sum(c.similarity for c in similar_cases) / len(similar_cases)) if similar_cases else 0.0
-        final_score = round((deterministic * 0.8) + (similar_boost * 0.2), 3)
+        similar_cases = context.similar_cases
+        confidence = context.confidence
+        final_score = round((deterministic * 0.8) + (context.similar_boost * 0.2), 3)
 
-        anomalies = AnomalyDetector.detect(programacion, driver)
+        anomalies = context.anomalies(driver)
         
         # Notificar anomalías críticas vía OpenClaw
-        if anomalies:
+        if anomalies and notificar:
             OpenClawService.notify_anomaly(programacion, anomalies)
 
         classification = cls._classify(final_score, anomalies, confidence)
         reason = cls._build_reason(driver, final_score, classification, anomalies, confidence)
+        eta_min = context.eta_minutes(driver)
 
         return {
             'score_total': Decimal(str(final_score)),
@@ -137,20 +148,25 @@ class AssignmentService:
             'classification': classification,
             'confidence': confidence,
             'similar_cases': [
-                {'programacion_id': c.programacion_id, 'similarity': c.similarity, 'outcome': c.outcome}
+                {'programacion_id': c.id, 'similarity': c.similarity, 'outcome': c.outcome}
                 for c in similar_cases
             ],
             'reason': reason,
-            'eta_estimado_min': ETAEstimator.estimate_minutes(programacion, driver),
-            'factible': RouteFeasibilityValidator.is_feasible(programacion, ETAEstimator.estimate_minutes(programacion, driver)),
+            'eta_estimado_min': eta_min,
+            'factible': RouteFeasibilityValidator.is_feasible(programacion, eta_min),
         }
 
     @classmethod
     def obtener_conductores_disponibles_con_score(cls, programacion: Programacion):
-        drivers = Driver.objects.filter(activo=True, presente=True)
+        """
+        Candidatos ordenados por score. No notifica anomalías: listar no es
+        asignar; asignar_mejor_conductor avisa sólo por el candidato elegido.
+        """
+        drivers = list(Driver.objects.filter(activo=True, presente=True))
+        context = ScoringContext.load(programacion, drivers, cls._get_base_weights())
         resultados = []
         for driver in drivers:
-            score_data = cls.calcular_score_total(driver, programacion)
+            score_data = cls.calcular_score_total(driver, programacion, context=context, notificar=False)
             resultados.append({
                 'driver': driver,
                 'score': score_data['score_total'],
@@ -212,7 +228,7 @@ class AssignmentService:
         if not review_required:
             return
 
-        Event.objects.create(
+        EventLog.registrar(
             container=programacion.container,
             event_type='alerta_48h',
             detalles={
@@ -238,6 +254,8 @@ class AssignmentService:
 
         mejor = conductores[0]
         driver = mejor['driver']
+        if mejor['anomalies']:
+            OpenClawService.notify_anomaly(programacion, mejor['anomalies'])
 
         programacion.score_por_dimension = mejor['desglose']
         programacion.clasificacion_sistema = mejor['classification']
@@ -302,8 +320,19 @@ class AssignmentService:
         }
 
     @classmethod
-    def asignar_multiples(cls, programaciones, usuario=None):
-        resultados = {'asignadas': 0, 'fallidas': 0, 'detalles': []}
+    def asignar_multiples(cls, programaciones, usuario=None, modo='global'):
+        """
+        Asigna un lote de programaciones.
+
+        modo='global' resuelve el lote completo con BatchDispatchService (óptimo
+        conjunto, una transacción); modo='secuencial' conserva el recorrido
+        codicioso en el orden recibido.
+        """
+        if modo == 'global':
+            from apps.core.services.batch_dispatch import BatchDispatchService
+            return BatchDispatchService.dispatch(programaciones, usuario)
+
+        resultados = {'asignadas': 0, 'fallidas': 0, 'detalles': [], 'modo': 'secuencial'}
         for programacion in programaciones:
             resultado = cls.asignar_mejor_conductor(programacion, usuario)
             selected_driver = resultado.get('driver')
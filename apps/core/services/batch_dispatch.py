@@ -0,0 +1,245 @@
+"""
+Despacho global por lotes.
+
+En vez de asignar programación por programación (cada una tomando su mejor
+conductor), se construye una matriz de scores programaciones × conductores y
+se resuelve la asignación que maximiza el score total ponderado por urgencia.
+"""
+import logging
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from apps.core.services.openclaw import OpenClawService
+from apps.core.services.scoring_context import ScoringContext
+from apps.drivers.models import Driver
+
+logger = logging.getLogger(__name__)
+
+
+class BatchDispatchService:
+    # Ponderación en el objetivo global: un servicio crítico vale más que uno normal.
+    URGENCY_PRIORITY = {'CRITICO': 1.5, 'URGENTE': 1.2}
+    # Costo de un par no elegible; domina cualquier suma de scores reales.
+    INFEASIBLE_COST = 1e6
+
+    @staticmethod
+    def hungarian(cost):
+        """
+        Asignación de costo mínimo (algoritmo húngaro con potenciales, O(n²m)).
+
+        `cost` es una lista de filas con n <= m columnas. Devuelve, por fila,
+        el índice de columna asignado.
+        """
+        n = len(cost)
+        if n == 0:
+            return []
+        m = len(cost[0])
+        if n > m:
+            raise ValueError('La matriz debe tener al menos tantas columnas como filas.')
+        inf = float('inf')
+        u = [0.0] * (n + 1)
+        v = [0.0] * (m + 1)
+        owner = [0] * (m + 1)  # owner[j] = fila (1-indexada) asignada a la columna j
+        way = [0] * (m + 1)
+        for i in range(1, n + 1):
+            owner[0] = i
+            j0 = 0
+            minv = [inf] * (m + 1)
+            used = [False] * (m + 1)
+            while True:
+                used[j0] = True
+                i0 = owner[j0]
+                delta = inf
+                j1 = 0
+                row = cost[i0 - 1]
+                for j in range(1, m + 1):
+                    if used[j]:
+                        continue
+                    cur = row[j - 1] - u[i0] - v[j]
+                    if cur < minv[j]:
+                        minv[j] = cur
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta = minv[j]
+                        j1 = j
+                for j in range(m + 1):
+                    if used[j]:
+                        u[owner[j]] += delta
+                        v[j] -= delta
+                    else:
+                        minv[j] -= delta
+                j0 = j1
+                if owner[j0] == 0:
+                    break
+            while j0:
+                j1 = way[j0]
+                owner[j0] = owner[j1]
+                j0 = j1
+        assignment = [-1] * n
+        for j in range(1, m + 1):
+            if owner[j]:
+                assignment[owner[j] - 1] = j - 1
+        return assignment
+
+    @classmethod
+    def _driver_slots(cls, driver: Driver) -> int:
+        # asignar_conductor rechaza conductores con otro servicio activo, así que
+        # dentro de un lote cada conductor recibe a lo sumo una programación.
+        if not driver.esta_disponible:
+            return 0
+        return min(1, driver.max_entregas_dia - driver.num_entregas_dia)
+
+    @classmethod
+    def _is_eligible(cls, candidate: dict) -> bool:
+        return not any(a['severity'] == 'P0' for a in candidate['anomalies'])
+
+    @classmethod
+    def build_matrix(cls, programaciones, drivers):
+        """
+        Scores de cada par usando un ScoringContext por programación. No se
+        notifican anomalías aquí: dispatch avisa sólo por los pares elegidos.
+        """
+        from apps.core.services.assignment import AssignmentService
+
+        base_weights = AssignmentService._get_base_weights()
+        matrix = []
+        for programacion in programaciones:
+            context = ScoringContext.load(programacion, drivers, base_weights)
+            row = []
+            for driver in drivers:
+                data = AssignmentService.calcular_score_total(
+                    driver, programacion, context=context, notificar=False,
+                )
+                row.append({
+                    'driver': driver,
+                    'score': data['score_total'],
+                    'desglose': data['score_por_dimension'],
+                    'weights': data['weights'],
+                    'anomalies': data['anomalies'],
+                    'classification': data['classification'],
+                    'confidence': data['confidence'],
+                    'similar_cases': data['similar_cases'],
+                    'reason': data['reason'],
+                    'eta_estimado_min': data['eta_estimado_min'],
+                })
+            matrix.append(row)
+        return matrix
+
+    @classmethod
+    def solve(cls, programaciones, matrix, drivers):
+        """Devuelve {índice de programación: candidato} con el óptimo global."""
+        columns = [
+            index for index, driver in enumerate(drivers)
+            for _ in range(cls._driver_slots(driver))
+        ]
+        if not programaciones or not columns:
+            return {}
+        cost = []
+        for prog_index, programacion in enumerate(programaciones):
+            priority = cls.URGENCY_PRIORITY.get(programacion.urgencia_servicio, 1.0)
+            row = []
+            for driver_index in columns:
+                candidate = matrix[prog_index][driver_index]
+                if cls._is_eligible(candidate):
+                    row.append(-float(candidate['score']) * priority)
+                else:
+                    row.append(cls.INFEASIBLE_COST)
+            # Columnas ficticias: dejar una programación sin conductor cuesta lo mismo que un par no elegible.
+            row.extend([cls.INFEASIBLE_COST] * len(programaciones))
+            cost.append(row)
+        assignment = cls.hungarian(cost)
+        selected = {}
+        for prog_index, column in enumerate(assignment):
+            if column >= len(columns):
+                continue
+            candidate = matrix[prog_index][columns[column]]
+            if cls._is_eligible(candidate):
+                selected[prog_index] = candidate
+        return selected
+
+    @classmethod
+    def dispatch(cls, programaciones, usuario=None):
+        """Asigna el lote completo en una sola transacción."""
+        from apps.core.services.assignment import AssignmentService
+
+        programaciones = list(programaciones)
+        pendientes = [p for p in programaciones if not p.driver_id]
+        drivers = list(Driver.objects.filter(activo=True, presente=True))
+        matrix = cls.build_matrix(pendientes, drivers)
+        selected = {
+            pendientes[index].pk: candidate
+            for index, candidate in cls.solve(pendientes, matrix, drivers).items()
+        }
+
+        resultados = {'asignadas': 0, 'fallidas': 0, 'detalles': [], 'modo': 'global', 'score_total': 0.0}
+        with transaction.atomic():
+            for programacion in programaciones:
+                if programacion.driver_id:
+                    cls._record(resultados, programacion, None, False,
+                                f'La programación ya tiene conductor asignado: {programacion.driver.nombre}')
+                    continue
+                candidate = selected.get(programacion.pk)
+                if candidate is None:
+                    cls._record(resultados, programacion, None, False,
+                                'Sin conductor elegible en la asignación global')
+                    continue
+
+                if candidate['anomalies']:
+                    OpenClawService.notify_anomaly(programacion, candidate['anomalies'])
+                programacion.score_por_dimension = candidate['desglose']
+                programacion.clasificacion_sistema = candidate['classification']
+                programacion.nivel_confianza = Decimal(str(round(candidate['confidence'] * 100, 2)))
+                programacion.anomalias_detectadas = candidate['anomalies']
+                programacion.similitud_historica_usada = candidate['similar_cases']
+                programacion.eta_recalculado_min = candidate['eta_estimado_min']
+                programacion.timestamp_despacho = timezone.now()
+                programacion.save(update_fields=[
+                    'score_por_dimension', 'clasificacion_sistema', 'nivel_confianza',
+                    'anomalias_detectadas', 'similitud_historica_usada', 'eta_recalculado_min', 'timestamp_despacho'
+                ])
+
+                if candidate['classification'] != 'DESPACHO_DIRECTO':
+                    AssignmentService._persist_operation_log(programacion, candidate, decision_operador='PENDIENTE')
+                    transaction.on_commit(
+                        lambda p=programacion, c=candidate: OpenClawService.request_review(p, c)
+                    )
+                    cls._record(resultados, programacion, candidate, False, candidate['reason'],
+                                requires_operator=True)
+                    continue
+
+                try:
+                    with transaction.atomic():
+                        programacion.asignar_conductor(candidate['driver'], usuario)
+                except ValidationError as exc:
+                    cls._record(resultados, programacion, candidate, False, ' '.join(exc.messages))
+                    continue
+                AssignmentService._persist_operation_log(programacion, candidate, decision_operador='CONFIRMAR')
+                resultados['score_total'] += float(candidate['score'])
+                cls._record(resultados, programacion, candidate, True, candidate['reason'])
+
+        resultados['score_total'] = round(resultados['score_total'], 3)
+        logger.info(
+            f"Despacho global: {resultados['asignadas']} asignadas, {resultados['fallidas']} fallidas "
+            f"({len(pendientes)} programaciones × {len(drivers)} conductores)"
+        )
+        return resultados
+
+    @staticmethod
+    def _record(resultados, programacion, candidate, success, reason, requires_operator=False):
+        if success:
+            resultados['asignadas'] += 1
+        else:
+            resultados['fallidas'] += 1
+        resultados['detalles'].append({
+            'programacion_id': programacion.id,
+            'container_id': programacion.container.container_id,
+            'success': success,
+            'driver': candidate['driver'].nombre if candidate else None,
+            'score': float(candidate['score']) if candidate else None,
+            'classification': candidate['classification'] if candidate else None,
+            'reason': reason,
+            'requires_operator': requires_operator,
+        })
@@ -1,6 +1,7 @@
 import logging
 from dataclasses import dataclass
 from typing import List
+from django.conf import settings
 from django.db.models import Q
 
 from apps.programaciones.models import Programacion
@@ -77,7 +78,21 @@ class ContextualReasoningService:
     def similar_cases(cls, programacion: Programacion, top_n: int = 5) -> List[SimilarCase]:
         '''
         Encuentra los casos históricos más similares a la programación actual.
+
+        Con SIMILAR_CASE_INDEX_ENABLED (por defecto) se responde desde el índice
+        precalculado CasoSimilarIndice; si no, se recorre el historial reciente.
         '''
+        if getattr(settings, 'SIMILAR_CASE_INDEX_ENABLED', True):
+            from apps.core.services.similar_case_index import SimilarCaseIndex
+            try:
+                return [
+                    SimilarCase(pk, sim, outcome)
+                    for pk, sim, outcome in SimilarCaseIndex.top_cases(programacion, top_n)
+                ]
+            except Exception as e:
+                logger.error(f"Error al consultar el índice de casos similares ({programacion.id}): {e}", exc_info=True)
+                return []
+
         try:
             # Estados finales que indican que una operación ha concluido
             final_states = ['entregado', 'descargado', 'devuelto', 'incidente', 'cancelado']
@@ -0,0 +1,91 @@
+"""
+Contadores del dashboard en una sola pasada.
+
+Cada modelo se resume con un único aggregate de Count(filter=...) y el
+resultado completo se guarda en caché con un TTL corto
+(DASHBOARD_STATS_TTL). Container.cambiar_estado invalida la caché, así que
+el operador que cambia un estado ve el conteo nuevo de inmediato; el resto de
+los procesos converge al vencer el TTL.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from apps.containers.models import Container
+from apps.drivers.models import Driver
+from apps.notifications.models import Notification
+
+
+class DashboardStatsService:
+    CACHE_KEY = 'dashboard:snapshot'
+
+    @staticmethod
+    def ttl_seconds() -> int:
+        return int(getattr(settings, 'DASHBOARD_STATS_TTL', 30))
+
+    @classmethod
+    def _container_counts(cls, now):
+        today = timezone.localdate(now)
+        aggregates = {
+            f'estado_{estado}': Count('id', filter=Q(estado=estado))
+            for estado, _ in Container.ESTADOS
+        }
+        aggregates.update({
+            'total': Count('id'),
+            'programados_hoy': Count('id', filter=Q(estado='programado', fecha_programacion__date=today)),
+            'con_demurrage': Count('id', filter=Q(
+                fecha_demurrage__isnull=False, estado__in=['liberado', 'programado', 'asignado']
+            )),
+            'programados_48h': Count('id', filter=Q(
+                estado='programado', fecha_programacion__lte=now + timedelta(hours=48)
+            )),
+        })
+        return Container.objects.aggregate(**aggregates)
+
+    @classmethod
+    def _driver_counts(cls):
+        return Driver.objects.aggregate(
+            total=Count('id'),
+            activos=Count('id', filter=Q(activo=True)),
+            disponibles=Count('id', filter=Q(
+                activo=True, presente=True, num_entregas_dia__lt=F('max_entregas_dia')
+            )),
+        )
+
+    @classmethod
+    def snapshot(cls):
+        """Conteos de contenedores, conductores, notificaciones y programaciones urgentes."""
+        data = cache.get(cls.CACHE_KEY)
+        if data is not None:
+            return data
+        from apps.programaciones.models import Programacion
+
+        now = timezone.now()
+        data = {
+            'contenedores': cls._container_counts(now),
+            'conductores': cls._driver_counts(),
+            'notificaciones_activas': Notification.objects.filter(
+                estado__in=['pendiente', 'enviada']
+            ).count(),
+            'programaciones_sin_conductor_72h': Programacion.objects.filter(
+                fecha_programada__gt=now,
+                fecha_programada__lte=now + timedelta(hours=72),
+                driver__isnull=True,
+            ).count(),
+            'generado': now.isoformat(),
+        }
+        cache.set(cls.CACHE_KEY, data, timeout=cls.ttl_seconds())
+        return data
+
+    @classmethod
+    def por_estado(cls, estados=None):
+        containers = cls.snapshot()['contenedores']
+        estados = estados or [estado for estado, _ in Container.ESTADOS]
+        return {estado: containers.get(f'estado_{estado}', 0) for estado in estados}
+
+    @classmethod
+    def invalidate(cls):
+        cache.delete(cls.CACHE_KEY)
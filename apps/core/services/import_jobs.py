@@ -0,0 +1,238 @@
+"""
+Cola de importaciones Excel respaldada en la base de datos.
+
+Los endpoints de carga guardan el archivo en un ImportJob y responden 202 de
+inmediato; `manage.py run_import_worker` reclama trabajos pendientes con un
+UPDATE condicional (sin broker externo, válido en PostgreSQL y SQLite) y los
+procesa con un pool de hilos. El resultado guardado es la misma respuesta que
+entregaba el endpoint síncrono, así que el cliente sólo cambia el sondeo.
+"""
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import F
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from apps.core.models import ImportJob
+
+logger = logging.getLogger(__name__)
+
+
+# tipo → (importador, mensaje de éxito, contadores de `resultados` expuestos en la respuesta)
+IMPORTADORES = {
+    'embarque': (
+        'apps.containers.importers.embarque.EmbarqueImporter',
+        'Importación completada',
+        ['creados', 'actualizados', 'errores'],
+    ),
+    'liberacion': (
+        'apps.containers.importers.liberacion.LiberacionImporter',
+        'Importación de liberación completada',
+        ['liberados', 'por_liberar', 'no_encontrados', 'errores'],
+    ),
+    'programacion': (
+        'apps.containers.importers.programacion.ProgramacionImporter',
+        'Importación de programación completada',
+        ['programados', 'no_encontrados', 'cd_no_encontrado', 'errores', 'alertas_generadas'],
+    ),
+    'conductores': (
+        'apps.drivers.importers.ConductorImporter',
+        'Importación completada',
+        ['creados', 'actualizados', 'errores'],
+    ),
+}
+
+
+class ImportJobService:
+    PROGRESS_INTERVAL_SECONDS = 1.0
+
+    @staticmethod
+    def async_enabled(request):
+        """
+        Cola activa salvo IMPORT_JOBS_ASYNC=False o `sincrono=1` en la petición.
+
+        Las cargas anónimas se procesan en línea: el estado del trabajo sólo lo
+        puede consultar su dueño autenticado o staff.
+        """
+        if not request.user.is_authenticated:
+            return False
+        sincrono = request.query_params.get('sincrono') or request.data.get('sincrono')
+        if str(sincrono).lower() in ('1', 'true', 'si', 'sí'):
+            return False
+        return bool(getattr(settings, 'IMPORT_JOBS_ASYNC', True))
+
+    @staticmethod
+    def respuesta(tipo, resultados):
+        """Respuesta del endpoint a partir de `importer.procesar()`."""
+        _, mensaje, contadores = IMPORTADORES[tipo]
+        return {
+            'success': True,
+            'mensaje': mensaje,
+            **{clave: resultados.get(clave, 0) for clave in contadores},
+            'detalles': resultados['detalles'],
+        }
+
+    @staticmethod
+    def procesar_archivo(tipo, archivo_path, usuario=None, on_progress=None):
+        """Ejecuta el importador del tipo sobre un archivo en disco y retorna la respuesta."""
+        importer = import_string(IMPORTADORES[tipo][0])(archivo_path, usuario)
+        importer.on_progress = on_progress
+        return ImportJobService.respuesta(tipo, importer.procesar())
+
+    @classmethod
+    def encolar(cls, tipo, archivo, usuario=None):
+        """Guarda el archivo subido como trabajo pendiente."""
+        if tipo not in IMPORTADORES:
+            raise ValueError(f"Tipo de importación desconocido: {tipo}")
+        contenido = b''.join(archivo.chunks())
+        job = ImportJob.objects.create(
+            tipo=tipo, nombre_archivo=archivo.name, contenido=contenido, usuario=usuario
+        )
+        logger.info('import_job_enqueued', extra={'job_id': job.pk, 'tipo': tipo, 'usuario': usuario})
+        return job
+
+    @staticmethod
+    def as_dict(job, incluir_resultado=True):
+        data = {
+            'job_id': job.pk,
+            'tipo': job.tipo,
+            'estado': job.estado,
+            'archivo': job.nombre_archivo,
+            'usuario': job.usuario,
+            'progreso': job.progreso,
+            'filas_total': job.filas_total,
+            'filas_procesadas': job.filas_procesadas,
+            'intentos': job.intentos,
+            'creado': job.created_at.isoformat() if job.created_at else None,
+            'iniciado': job.iniciado_en.isoformat() if job.iniciado_en else None,
+            'finalizado': job.finalizado_en.isoformat() if job.finalizado_en else None,
+            'status_url': reverse('import_job_status', args=[job.pk]),
+        }
+        if job.estado == 'fallido':
+            data['error'] = job.error
+        if incluir_resultado and job.estado == 'completado':
+            data['resultado'] = job.resultado
+        return data
+
+    @staticmethod
+    def worker_id():
+        return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+    @classmethod
+    def reclamar(cls, worker=None):
+        """
+        Toma el trabajo pendiente más antiguo.
+
+        El UPDATE filtra por estado='pendiente', así que si dos workers
+        compiten por el mismo trabajo sólo uno obtiene filas afectadas.
+        """
+        worker = worker or cls.worker_id()
+        for job_id in ImportJob.objects.filter(estado='pendiente').order_by('created_at').values_list('pk', flat=True)[:5]:
+            now = timezone.now()
+            claimed = ImportJob.objects.filter(pk=job_id, estado='pendiente').update(
+                estado='procesando', worker=worker, iniciado_en=now, heartbeat=now,
+                intentos=F('intentos') + 1,
+            )
+            if claimed:
+                return ImportJob.objects.get(pk=job_id)
+        return None
+
+    @classmethod
+    def _progress_callback(cls, job):
+        ultimo = [0.0]
+
+        def on_progress(procesadas, total):
+            ahora = time.monotonic()
+            if procesadas < total and ahora - ultimo[0] < cls.PROGRESS_INTERVAL_SECONDS:
+                return
+            ultimo[0] = ahora
+            # 100 % se reserva para cuando el resultado ya está guardado.
+            progreso = min(99, int(procesadas * 100 / total)) if total else 0
+            ImportJob.objects.filter(pk=job.pk).update(
+                filas_total=total, filas_procesadas=procesadas, progreso=progreso,
+                heartbeat=timezone.now(),
+            )
+
+        return on_progress
+
+    @staticmethod
+    def _latir(job_id, detener):
+        """Renueva el heartbeat aunque el importador pase mucho rato sin reportar filas."""
+        intervalo = max(5, int(getattr(settings, 'IMPORT_JOB_STALE_SECONDS', 300)) // 3)
+        try:
+            while not detener.wait(intervalo):
+                ImportJob.objects.filter(pk=job_id, estado='procesando').update(heartbeat=timezone.now())
+        finally:
+            connection.close()
+
+    @classmethod
+    def ejecutar(cls, job):
+        """Procesa un trabajo ya reclamado y guarda su resultado o error."""
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as tmp:
+            tmp.write(bytes(job.contenido or b''))
+            tmp_path = tmp.name
+        detener = threading.Event()
+        threading.Thread(target=cls._latir, args=(job.pk, detener), daemon=True).start()
+        try:
+            resultado = cls.procesar_archivo(
+                job.tipo, tmp_path, job.usuario, on_progress=cls._progress_callback(job)
+            )
+        except Exception as e:
+            logger.exception('import_job_failed', extra={'job_id': job.pk, 'tipo': job.tipo})
+            ImportJob.objects.filter(pk=job.pk).update(
+                estado='fallido', error=str(e), contenido=None, finalizado_en=timezone.now(),
+            )
+        else:
+            ImportJob.objects.filter(pk=job.pk).update(
+                estado='completado', resultado=resultado, progreso=100, contenido=None,
+                finalizado_en=timezone.now(),
+            )
+            logger.info('import_job_completed', extra={'job_id': job.pk, 'tipo': job.tipo})
+        finally:
+            detener.set()
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        job.refresh_from_db()
+        return job
+
+    @classmethod
+    def recuperar_huerfanos(cls):
+        """
+        Reencola trabajos cuyo worker dejó de latir (proceso reiniciado a mitad).
+
+        Tras IMPORT_JOB_MAX_ATTEMPTS intentos se marcan como fallidos para no
+        reprocesar indefinidamente un archivo que tumba al worker.
+        """
+        limite = timezone.now() - timedelta(seconds=int(getattr(settings, 'IMPORT_JOB_STALE_SECONDS', 300)))
+        max_intentos = int(getattr(settings, 'IMPORT_JOB_MAX_ATTEMPTS', 3))
+        huerfanos = ImportJob.objects.filter(estado='procesando', heartbeat__lt=limite)
+        fallidos = huerfanos.filter(intentos__gte=max_intentos).update(
+            estado='fallido', error='El worker se detuvo durante el procesamiento', contenido=None,
+            finalizado_en=timezone.now(),
+        )
+        reencolados = huerfanos.filter(intentos__lt=max_intentos).update(estado='pendiente', worker='')
+        if fallidos or reencolados:
+            logger.warning(f"Importaciones huérfanas: {reencolados} reencoladas, {fallidos} fallidas")
+        return reencolados
+
+    @classmethod
+    def run_pending(cls, max_jobs=None, worker=None):
+        """Procesa trabajos pendientes hasta vaciar la cola (o `max_jobs`); retorna cuántos procesó."""
+        procesados = 0
+        while max_jobs is None or procesados < max_jobs:
+            close_old_connections()
+            job = cls.reclamar(worker)
+            if job is None:
+                break
+            cls.ejecutar(job)
+            procesados += 1
+        return procesados
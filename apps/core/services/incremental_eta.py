@@ -0,0 +1,223 @@
+"""
+ETA incremental sobre la ruta ya almacenada.
+
+Cada ping GPS se proyecta sobre `programacion.ruta_geojson`; la distancia y el
+tiempo restantes salen de la polilínea y del tiempo aprendido del viaje
+(`prediccion_ml.predicted_minutes`). Mapbox sólo se consulta cuando no hay
+ruta, cuando el conductor se desvía más de ETA_REROUTE_DEVIATION_M o cuando
+vence el presupuesto de tiempo ETA_REROUTE_BUDGET_MIN, con un máximo de
+ETA_MAX_REROUTES re-ruteos por viaje. Sin ruta almacenada rigen el mismo cupo
+y el mismo presupuesto entre intentos; mientras tanto el ETA sale de la
+distancia haversine al CD (MatrixETAService.estimacion_offline).
+"""
+import logging
+import math
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+from django.utils import timezone
+
+from apps.core.services.mapbox import MapboxService
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6371000.0
+
+
+def _haversine_m(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+class RoutePolyline:
+    """Polilínea con distancias acumuladas para proyectar puntos en O(n)."""
+
+    def __init__(self, coordinates):
+        # GeoJSON usa [lng, lat]
+        self.points = [(float(lat), float(lng)) for lng, lat, *_ in coordinates]
+        self.cumulative = [0.0]
+        for (lat1, lng1), (lat2, lng2) in zip(self.points, self.points[1:]):
+            self.cumulative.append(self.cumulative[-1] + _haversine_m(lat1, lng1, lat2, lng2))
+
+    @property
+    def length_m(self):
+        return self.cumulative[-1]
+
+    def project(self, lat, lng):
+        """Devuelve (metros recorridos sobre la ruta, distancia del punto a la ruta en metros)."""
+        if len(self.points) == 1:
+            only = self.points[0]
+            return 0.0, _haversine_m(lat, lng, only[0], only[1])
+        # Proyección equirectangular local: precisa a escala de ciudad.
+        kx = math.cos(math.radians(lat)) * EARTH_RADIUS_M * math.pi / 180
+        ky = EARTH_RADIUS_M * math.pi / 180
+        best = (float('inf'), 0.0)
+        for index, ((lat1, lng1), (lat2, lng2)) in enumerate(zip(self.points, self.points[1:])):
+            ax, ay = (lng1 - lng) * kx, (lat1 - lat) * ky
+            bx, by = (lng2 - lng) * kx, (lat2 - lat) * ky
+            dx, dy = bx - ax, by - ay
+            seg2 = dx * dx + dy * dy
+            t = 0.0 if seg2 == 0 else max(0.0, min(1.0, -(ax * dx + ay * dy) / seg2))
+            px, py = ax + t * dx, ay + t * dy
+            dist2 = px * px + py * py
+            if dist2 < best[0]:
+                seg_len = self.cumulative[index + 1] - self.cumulative[index]
+                best = (dist2, self.cumulative[index] + t * seg_len)
+        return best[1], math.sqrt(best[0])
+
+
+class IncrementalETAService:
+    _polylines = OrderedDict()
+    _lock = threading.Lock()
+    POLYLINE_CACHE_SIZE = 256
+
+    @classmethod
+    def _polyline(cls, programacion):
+        geometry = programacion.ruta_geojson or {}
+        coordinates = geometry.get('coordinates') if isinstance(geometry, dict) else None
+        if not coordinates:
+            return None
+        key = programacion.ruta_firma or MapboxService.firma_ruta(geometry)
+        with cls._lock:
+            polyline = cls._polylines.get(key)
+            if polyline is not None:
+                cls._polylines.move_to_end(key)
+                return polyline
+        polyline = RoutePolyline(coordinates)
+        with cls._lock:
+            cls._polylines[key] = polyline
+            while len(cls._polylines) > cls.POLYLINE_CACHE_SIZE:
+                cls._polylines.popitem(last=False)
+        return polyline
+
+    @staticmethod
+    def _route_minutes(programacion):
+        prediccion = programacion.prediccion_ml or {}
+        return prediccion.get('predicted_minutes') or prediccion.get('mapbox_minutes')
+
+    @staticmethod
+    def _blended_factor(prediccion):
+        """Factor aplicado a Mapbox en la predicción original (mezcla histórico/Mapbox)."""
+        if prediccion.get('blended_factor'):
+            return float(prediccion['blended_factor'])
+        mapbox_minutes = prediccion.get('mapbox_minutes')
+        predicted = prediccion.get('predicted_minutes')
+        if mapbox_minutes and predicted:
+            return float(predicted) / float(mapbox_minutes)
+        return 1.0
+
+    @classmethod
+    def _has_route(cls, programacion, polyline):
+        return polyline is not None and polyline.length_m > 0 and bool(cls._route_minutes(programacion))
+
+    @classmethod
+    def _needs_reroute(cls, programacion, polyline, deviation_m, state, now):
+        max_reroutes = int(getattr(settings, 'ETA_MAX_REROUTES', 12))
+        if state.get('reruteos', 0) >= max_reroutes:
+            return None
+        budget_min = float(getattr(settings, 'ETA_REROUTE_BUDGET_MIN', 20))
+        last = state.get('ultimo_reruteo')
+        if not cls._has_route(programacion, polyline):
+            # Sin ruta se reintenta a lo más una vez por presupuesto (Mapbox caído o sin API key)
+            if last and (now - datetime.fromisoformat(last)).total_seconds() <= budget_min * 60:
+                return None
+            return 'sin_ruta'
+        if deviation_m > float(getattr(settings, 'ETA_REROUTE_DEVIATION_M', 300)):
+            return 'desvio'
+        anchor = datetime.fromisoformat(last) if last else programacion.fecha_inicio_ruta
+        if anchor and (now - anchor).total_seconds() > budget_min * 60:
+            return 'presupuesto'
+        return None
+
+    @classmethod
+    def _reroute(cls, programacion, lat, lng, motivo, state, now):
+        cd = programacion.cd
+        resultado = MapboxService.calcular_ruta(float(lng), float(lat), float(cd.lng), float(cd.lat))
+        prediccion = dict(programacion.prediccion_ml or {})
+        # Un intento fallido también consume cupo y reinicia el presupuesto:
+        # si no, cada ping volvería a consultar Mapbox mientras siga caído.
+        state['reruteos'] = state.get('reruteos', 0) + 1
+        state['ultimo_reruteo'] = now.isoformat()
+        state['ultimo_motivo'] = motivo
+        prediccion['eta_incremental'] = state
+        programacion.prediccion_ml = prediccion
+        if not resultado.get('success'):
+            return {**resultado, 'update_fields': ['prediccion_ml']}
+        factor = cls._blended_factor(prediccion)
+        predicted = max(1, round(float(resultado['duration_minutes']) * factor))
+        prediccion.update({
+            'mapbox_minutes': float(resultado['duration_minutes']),
+            'predicted_minutes': predicted,
+            'blended_factor': round(factor, 3),
+        })
+        programacion.ruta_geojson = resultado.get('geometry')
+        programacion.ruta_firma = resultado.get('route_signature')
+        return {
+            'success': True,
+            'eta_minutos': predicted,
+            'distancia_km': round(float(resultado['distance_km']), 2),
+            'fuente': 'mapbox',
+            'motivo_reruteo': motivo,
+            'update_fields': ['prediccion_ml', 'ruta_geojson', 'ruta_firma'],
+        }
+
+    @staticmethod
+    def _estimate_without_route(programacion, lat, lng, update_fields):
+        """ETA por distancia haversine al CD mientras no haya ruta almacenada."""
+        from apps.core.services.matrix_eta import MatrixETAService
+
+        cd = programacion.cd
+        base = MatrixETAService.estimacion_offline(
+            (lat, lng), (cd.lat, cd.lng), MatrixETAService.default_speed_kmh(),
+        )
+        return {
+            'success': True,
+            'eta_minutos': max(0, round(base['duration_minutes'])),
+            'distancia_km': base['distance_km'],
+            'fuente': 'haversine',
+            'update_fields': update_fields,
+        }
+
+    @classmethod
+    def estimate(cls, programacion, lat, lng):
+        """
+        Calcula el ETA restante para una posición.
+
+        Devuelve {'success', 'eta_minutos', 'distancia_km', 'fuente',
+        'update_fields'}; `update_fields` lista los campos de la programación
+        modificados en memoria que el llamador debe persistir.
+        """
+        lat, lng = float(lat), float(lng)
+        now = timezone.now()
+        state = dict((programacion.prediccion_ml or {}).get('eta_incremental') or {})
+        polyline = cls._polyline(programacion)
+        traveled_m, deviation_m = polyline.project(lat, lng) if polyline else (0.0, float('inf'))
+
+        update_fields = []
+        motivo = cls._needs_reroute(programacion, polyline, deviation_m, state, now)
+        if motivo:
+            resultado = cls._reroute(programacion, lat, lng, motivo, state, now)
+            if resultado.get('success'):
+                return resultado
+            logger.warning(f"Re-ruteo fallido ({resultado.get('error')}); se mantiene la estimación sin Mapbox")
+            update_fields = resultado['update_fields']
+        if not cls._has_route(programacion, polyline):
+            return cls._estimate_without_route(programacion, lat, lng, update_fields)
+
+        remaining_m = max(0.0, polyline.length_m - traveled_m)
+        # Si se agotó el cupo de re-ruteos y el conductor está fuera de ruta, suma el tramo hasta la polilínea.
+        remaining_m += deviation_m if deviation_m > float(getattr(settings, 'ETA_REROUTE_DEVIATION_M', 300)) else 0.0
+        minutes = cls._route_minutes(programacion) * (remaining_m / polyline.length_m)
+        return {
+            'success': True,
+            'eta_minutos': max(0, round(minutes)),
+            'distancia_km': round(remaining_m / 1000, 2),
+            'fuente': 'incremental',
+            'desvio_m': round(deviation_m),
+            'update_fields': update_fields,
+        }
@@ -0,0 +1,196 @@
+"""
+Tiempos aprendidos (TiempoOperacion / TiempoViaje) con caché versionada.
+
+Cada consulta de TiempoOperacion.obtener_tiempo_aprendido y
+TiempoViaje.obtener_tiempo_aprendido sin historial precargado se resuelve con
+una sola consulta: ROW_NUMBER() sobre la ventana del grupo y sobre la del
+conductor, filtrando ambas a la vez, y los promedios se calculan sobre esas
+pocas filas. El resultado se guarda en la caché por defecto bajo una llave que
+incluye la versión del grupo:
+
+- operación: (CD, tipo de operación), llave (CD, tipo, conductor);
+- viaje: celda de destino, llave (coordenadas, franja horaria, conductor).
+
+"Sin datos suficientes" (None) también se cachea: es el resultado más común
+en rutas poco recorridas. Los viajes se filtran por las celdas vecinas de
+origen y destino (índice origen_celda, destino_celda, fecha) antes del radio.
+`manage.py benchmark_learned_times` mide consultas y latencia por búsqueda.
+
+Cada tiempo nuevo, editado o borrado incrementa la versión de su grupo (en
+viajes, de las celdas de destino vecinas), así que el proceso que registra la
+observación ve el valor nuevo de inmediato; el resto converge al vencer
+LEARNED_TIMES_CACHE_TTL.
+"""
+import logging
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
+from apps.programaciones.models import TiempoOperacion, TiempoViaje
+
+logger = logging.getLogger(__name__)
+
+# Ventanas de obtener_tiempo_aprendido: (últimos N, mínimo requerido)
+VENTANA_OPERACION_CONDUCTOR = (10, 3)
+VENTANA_OPERACION_CD = (20, 5)
+VENTANA_VIAJE_CONDUCTOR = (5, 2)
+VENTANA_VIAJE_GENERAL = (10, 3)
+
+
+def _promedio(valores):
+    return sum(valores) / len(valores) if valores else None
+
+
+class LearnedTimesService:
+    KEY_PREFIX = 'tiempos_aprendidos'
+
+    @staticmethod
+    def enabled() -> bool:
+        return bool(getattr(settings, 'LEARNED_TIMES_CACHE_ENABLED', True))
+
+    @staticmethod
+    def ttl_seconds() -> int:
+        return int(getattr(settings, 'LEARNED_TIMES_CACHE_TTL', 300))
+
+    # --- Versiones ---
+
+    @classmethod
+    def _version_operacion_key(cls, cd_id, tipo_operacion):
+        return f'{cls.KEY_PREFIX}:v:op:{cd_id}:{tipo_operacion}'
+
+    @classmethod
+    def _version_viaje_key(cls, celda):
+        return f'{cls.KEY_PREFIX}:v:viaje:{celda}'
+
+    @staticmethod
+    def _bump(key):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+    @classmethod
+    def invalidar(cls, registro):
+        """Descarta los valores cacheados que la observación `registro` puede cambiar."""
+        try:
+            if isinstance(registro, TiempoViaje):
+                for celda in TiempoViaje.celdas_vecinas(registro.destino_lat, registro.destino_lon):
+                    cls._bump(cls._version_viaje_key(celda))
+            else:
+                cls._bump(cls._version_operacion_key(registro.cd_id, registro.tipo_operacion))
+        except Exception as e:
+            logger.warning(f"No se pudo invalidar la caché de tiempos aprendidos: {e}")
+
+    @classmethod
+    def _memo(cls, version_key, key, calcular):
+        if not cls.enabled():
+            return calcular()
+        try:
+            version = cache.get(version_key, 0)
+            full_key = f'{key}:v{version}'
+            valor = cache.get(full_key)
+        except Exception as e:
+            logger.warning(f"Caché de tiempos aprendidos no disponible: {e}")
+            return calcular()
+        if valor is None:
+            # Envuelto en una tupla para distinguir un None calculado de una llave ausente
+            valor = (calcular(),)
+            cache.set(full_key, valor, timeout=cls.ttl_seconds())
+        return valor[0]
+
+    # --- Operación ---
+
+    @staticmethod
+    def _ventanas(qs, orden, conductor, limite_conductor, limite_general):
+        """
+        Filas de la ventana general y de la del conductor en una consulta:
+        ROW_NUMBER() global y por conductor, filtrados juntos.
+        """
+        qs = qs.annotate(
+            posicion=Window(RowNumber(), order_by=orden),
+            posicion_conductor=Window(RowNumber(), partition_by=[F('conductor')], order_by=orden),
+        )
+        filtro = Q(posicion__lte=limite_general)
+        if conductor:
+            filtro |= Q(conductor_id=conductor.pk, posicion_conductor__lte=limite_conductor)
+        return qs.filter(filtro)
+
+    @classmethod
+    def _calcular_operacion(cls, cd_id, tipo_operacion, conductor, fecha_limite):
+        (n_conductor, min_conductor), (n_cd, min_cd) = VENTANA_OPERACION_CONDUCTOR, VENTANA_OPERACION_CD
+        qs = TiempoOperacion.objects.filter(
+            cd_id=cd_id, tipo_operacion=tipo_operacion, anomalia=False, fecha__gte=fecha_limite,
+        )
+        filas = list(
+            cls._ventanas(qs, [F('fecha').desc(), F('hora_inicio').desc()], conductor, n_conductor, n_cd)
+            .values_list('conductor_id', 'tiempo_real_min', 'posicion', 'posicion_conductor')
+        )
+        if conductor:
+            propios = [real for cid, real, _, pos in filas if cid == conductor.pk and pos <= n_conductor]
+            if len(propios) >= min_conductor:
+                return _promedio(propios)
+        generales = [real for _, real, pos, _ in filas if pos <= n_cd]
+        if len(generales) >= min_cd:
+            return _promedio(generales)
+        return None
+
+    @classmethod
+    def promedio_operacion(cls, cd, tipo_operacion, fecha_limite, conductor=None):
+        """Promedio aprendido (min) para el CD/tipo/conductor, o None si faltan datos."""
+        key = f'{cls.KEY_PREFIX}:op:{cd.pk}:{tipo_operacion}:{conductor.pk if conductor else "-"}:{fecha_limite}'
+        return cls._memo(
+            cls._version_operacion_key(cd.pk, tipo_operacion), key,
+            lambda: cls._calcular_operacion(cd.pk, tipo_operacion, conductor, fecha_limite),
+        )
+
+    # --- Viaje ---
+
+    @classmethod
+    def _calcular_viaje(cls, origen, destino, franja, fecha_limite, radio, conductor):
+        (n_conductor, min_conductor), (n_general, min_general) = VENTANA_VIAJE_CONDUCTOR, VENTANA_VIAJE_GENERAL
+        (o_lat, o_lon), (d_lat, d_lon) = origen, destino
+        qs = TiempoViaje.objects.filter(
+            origen_celda__in=TiempoViaje.celdas_vecinas(o_lat, o_lon),
+            destino_celda__in=TiempoViaje.celdas_vecinas(d_lat, d_lon),
+            origen_lat__gte=o_lat - radio, origen_lat__lte=o_lat + radio,
+            origen_lon__gte=o_lon - radio, origen_lon__lte=o_lon + radio,
+            destino_lat__gte=d_lat - radio, destino_lat__lte=d_lat + radio,
+            destino_lon__gte=d_lon - radio, destino_lon__lte=d_lon + radio,
+            hora_del_dia__gte=franja[0], hora_del_dia__lte=franja[1],
+            anomalia=False, fecha__gte=fecha_limite,
+        )
+        filas = list(
+            cls._ventanas(qs, [F('fecha').desc(), F('hora_salida').desc()], conductor, n_conductor, n_general)
+            .values_list('conductor_id', 'tiempo_real_min', 'tiempo_mapbox_min', 'posicion', 'posicion_conductor')
+        )
+        propios = []
+        if conductor:
+            propios = [real for cid, real, _, _, pos in filas if cid == conductor.pk and pos <= n_conductor]
+        generales = [(real, mapbox) for _, real, mapbox, pos, _ in filas if pos <= n_general]
+        return {
+            'propio': _promedio(propios) if len(propios) >= min_conductor else None,
+            'real': _promedio([real for real, _ in generales]) if len(generales) >= min_general else None,
+            'mapbox': _promedio([mapbox for _, mapbox in generales]) if len(generales) >= min_general else None,
+        }
+
+    @classmethod
+    def tiempo_viaje(cls, origen_coords, destino_coords, tiempo_mapbox, franja, fecha_limite, radio, conductor=None):
+        """Misma selección que TiempoViaje._tiempo_en_memoria, resuelta en la base de datos."""
+        origen = (Decimal(str(origen_coords[0])), Decimal(str(origen_coords[1])))
+        destino = (Decimal(str(destino_coords[0])), Decimal(str(destino_coords[1])))
+        key = (
+            f'{cls.KEY_PREFIX}:viaje:{origen[0]},{origen[1]}:{destino[0]},{destino[1]}:'
+            f'{franja[0]}-{franja[1]}:{conductor.pk if conductor else "-"}:{fecha_limite}'
+        )
+        promedios = cls._memo(
+            cls._version_viaje_key(TiempoViaje.celda_para(*destino)), key,
+            lambda: cls._calcular_viaje(origen, destino, franja, fecha_limite, radio, conductor),
+        )
+        if promedios['propio']:
+            return int(promedios['propio'])
+        if promedios['real'] and promedios['mapbox'] and promedios['mapbox'] > 0:
+            return int(tiempo_mapbox * (promedios['real'] / promedios['mapbox']))
+        return tiempo_mapbox
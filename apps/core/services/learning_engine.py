@@ -1,17 +1,62 @@
-"""Motor híbrido de aprendizaje operacional, explicable y con fallback seguro."""
+"""
+Motor híbrido de aprendizaje operacional, explicable y con fallback seguro.
+
+El histórico de un tramo se convierte una vez en columnas NumPy
+(HistoryArrays) y recommend puntúa todas las combinaciones horario × ruta en
+un solo cálculo vectorizado, con el mismo resultado que evaluar cada
+candidato fila a fila.
+"""
 from __future__ import annotations
 
 from collections import defaultdict
 from datetime import timedelta
-from math import exp
 from statistics import median
 
+import numpy as np
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 from django.utils import timezone
 
 from apps.core.services.mapbox import MapboxService
 from apps.programaciones.models import TiempoViaje
 
 
+class HistoryArrays:
+    """Histórico de viajes en columnas: factor, antigüedad, hora, día, firma y conductor."""
+
+    def __init__(self, rows, today=None):
+        today = today or timezone.now().date()
+        self.size = len(rows)
+        self.raw_factor = np.array([row.calcular_factor_correccion() for row in rows], dtype=float)
+        self.factor = np.clip(self.raw_factor, 0.45, 2.5)
+        age_days = np.array([max(0, (today - row.fecha).days) for row in rows], dtype=float)
+        self.recency = np.exp(-age_days / 75)
+        self.hour = np.array([row.hora_del_dia for row in rows], dtype=float)
+        self.weekday = np.array([row.dia_semana for row in rows], dtype=int)
+        self.driver_id = np.array([row.conductor_id if row.conductor_id is not None else -1 for row in rows], dtype=int)
+        self.with_mapbox = np.array([row.tiempo_mapbox_min > 0 for row in rows], dtype=bool)
+        self.signatures = [row.ruta_firma for row in rows]
+
+    @classmethod
+    def of(cls, history):
+        return history if isinstance(history, cls) else cls(history)
+
+    def signature_mask(self, signature):
+        if not signature:
+            return np.zeros(self.size, dtype=bool)
+        return np.array([value == signature for value in self.signatures], dtype=bool)
+
+    def departure_weights(self, departures, driver=None):
+        """Pesos [horarios × filas] por antigüedad, cercanía horaria, día de la semana y conductor."""
+        hours = np.array([departure.hour for departure in departures], dtype=float)[:, None]
+        weekdays = np.array([departure.weekday() for departure in departures], dtype=int)[:, None]
+        hour_distance = np.abs(self.hour[None, :] - hours)
+        hour_distance = np.minimum(hour_distance, 24 - hour_distance)
+        weights = self.recency[None, :] * np.exp(-hour_distance / 3.0)
+        weights = weights * np.where(self.weekday[None, :] == weekdays, 1.35, 0.82)
+        return weights, (np.where(self.driver_id == driver.id, 1.65, 1.0) if driver else None)
+
+
 class OperationalLearningEngine:
     """Aprende factores reales por tramo, horario, ruta y conductor."""
 
@@ -26,7 +71,12 @@ class OperationalLearningEngine:
     @classmethod
     def _history(cls, origin, destination):
         cutoff = timezone.now().date() - timedelta(days=cls.HISTORY_DAYS)
-        rows = TiempoViaje.objects.filter(anomalia=False, fecha__gte=cutoff).select_related('conductor')
+        # La grilla acota la consulta a las celdas vecinas; _near aplica el radio exacto.
+        rows = TiempoViaje.objects.filter(
+            anomalia=False, fecha__gte=cutoff,
+            origen_celda__in=TiempoViaje.celdas_vecinas(*origin),
+            destino_celda__in=TiempoViaje.celdas_vecinas(*destination),
+        ).select_related('conductor')
         return [
             row for row in rows
             if cls._near(row.origen_lat, float(origin[0]))
@@ -38,36 +88,33 @@ class OperationalLearningEngine:
         ]
 
     @staticmethod
-    def _circular_hour_distance(left, right):
-        delta = abs(left - right)
-        return min(delta, 24 - delta)
-
-    @classmethod
-    def _weighted_factor(cls, rows, departure, driver=None, route_signature=None):
-        weighted = []
-        for row in rows:
-            factor = max(0.45, min(2.5, row.calcular_factor_correccion()))
-            age_days = max(0, (timezone.now().date() - row.fecha).days)
-            weight = exp(-age_days / 75)
-            hour_distance = cls._circular_hour_distance(row.hora_del_dia, departure.hour)
-            weight *= exp(-hour_distance / 3.0)
-            weight *= 1.35 if row.dia_semana == departure.weekday() else 0.82
-            if route_signature and row.ruta_firma == route_signature:
-                weight *= 1.8
-            if driver and row.conductor_id == driver.id:
-                weight *= 1.65
-            weighted.append((factor, weight))
-        if not weighted:
-            return 1.0
-        total_weight = sum(weight for _, weight in weighted)
-        return sum(factor * weight for factor, weight in weighted) / total_weight
+    def _learned_factors(arrays, departures, signatures, relevant, driver=None):
+        """
+        Factor aprendido [rutas × horarios]: promedio ponderado del factor de
+        las filas relevantes de cada ruta (1.0 si no hay filas).
+        """
+        weights, driver_weight = arrays.departure_weights(departures, driver)
+        learned = np.ones((len(signatures), len(departures)))
+        for index, (signature, mask) in enumerate(zip(signatures, relevant)):
+            if not mask.any():
+                continue
+            route_weights = weights[:, mask]
+            if signature:
+                route_weights = route_weights * np.where(arrays.signature_mask(signature)[mask], 1.8, 1.0)
+            if driver_weight is not None:
+                route_weights = route_weights * driver_weight[mask]
+            learned[index] = (route_weights * arrays.factor[mask]).sum(axis=1) / route_weights.sum(axis=1)
+        return learned
 
     @classmethod
     def driver_profile(cls, driver, rows=None):
         rows = rows if rows is not None else list(
             TiempoViaje.objects.filter(conductor=driver, anomalia=False).order_by('-fecha')[:40]
         )
-        factors = [r.calcular_factor_correccion() for r in rows if r.tiempo_mapbox_min > 0]
+        return cls._profile_from_factors([r.calcular_factor_correccion() for r in rows if r.tiempo_mapbox_min > 0])
+
+    @classmethod
+    def _profile_from_factors(cls, factors):
         samples = len(factors)
         if samples < cls.MIN_DRIVER_SAMPLES:
             return {
@@ -88,31 +135,70 @@ class OperationalLearningEngine:
             'confidence': round(min(0.95, 0.35 + samples / 30), 2),
         }
 
+    @classmethod
+    def driver_profiles(cls, drivers, rows_per_driver=40):
+        """Perfiles de varios conductores con una sola consulta (ventana por conductor)."""
+        drivers = list(drivers)
+        ranked = TiempoViaje.objects.filter(
+            conductor__in=drivers, anomalia=False,
+        ).annotate(
+            rn=Window(
+                expression=RowNumber(),
+                partition_by=[F('conductor_id')],
+                order_by=[F('fecha').desc(), F('id').desc()],
+            )
+        ).filter(rn__lte=rows_per_driver)
+        rows_by_driver = defaultdict(list)
+        for row in ranked:
+            rows_by_driver[row.conductor_id].append(row)
+        return {driver.id: cls.driver_profile(driver, rows_by_driver[driver.id]) for driver in drivers}
+
+    @classmethod
+    def _relevant_mask(cls, arrays, signature):
+        """Filas de la ruta si hay suficientes; si no, todo el histórico del tramo."""
+        route_rows = arrays.signature_mask(signature)
+        if route_rows.sum() >= cls.MIN_ROUTE_SAMPLES:
+            return route_rows
+        return np.ones(arrays.size, dtype=bool)
+
+    @classmethod
+    def _predict_candidates(cls, arrays, departures, routes, driver=None):
+        """Predicciones para cada ruta × horario; `result[r][d]` es la de routes[r] a departures[d]."""
+        signatures = [route.get('route_signature') for route in routes]
+        relevant = [cls._relevant_mask(arrays, signature) for signature in signatures]
+        learned = cls._learned_factors(arrays, departures, signatures, relevant, driver)
+        result = []
+        for index, route in enumerate(routes):
+            samples = int(relevant[index].sum())
+            # Mezcla progresiva: Mapbox domina al inicio; el histórico gana peso al madurar.
+            learned_weight = min(0.78, samples / 18)
+            confidence = min(0.96, 0.25 + samples / 24)
+            profile = None
+            if driver:
+                profile = cls._profile_from_factors(
+                    arrays.raw_factor[relevant[index] & arrays.with_mapbox].tolist()
+                )
+            predictions = []
+            for learned_factor in learned[index].tolist():
+                blended_factor = (1 - learned_weight) + learned_weight * learned_factor
+                predictions.append({
+                    **route,
+                    'predicted_minutes': max(1, round(float(route['duration_minutes']) * blended_factor)),
+                    'mapbox_minutes': float(route['duration_minutes']),
+                    'learned_factor': round(learned_factor, 3),
+                    'blended_factor': round(blended_factor, 3),
+                    'samples': samples,
+                    'confidence': round(confidence, 2),
+                    'source': 'hybrid_ml_mapbox' if samples else 'mapbox_cold_start',
+                    'driver_profile': dict(profile) if profile else None,
+                })
+            result.append(predictions)
+        return result
+
     @classmethod
     def predict_route(cls, origin, destination, departure, base_route, driver=None, history=None):
         history = history if history is not None else cls._history(origin, destination)
-        signature = base_route.get('route_signature')
-        route_rows = [r for r in history if signature and r.ruta_firma == signature]
-        relevant = route_rows if len(route_rows) >= cls.MIN_ROUTE_SAMPLES else history
-        learned_factor = cls._weighted_factor(
-            relevant, departure, driver=driver, route_signature=signature
-        )
-        samples = len(relevant)
-        # Mezcla progresiva: Mapbox domina al inicio; el histórico gana peso al madurar.
-        learned_weight = min(0.78, samples / 18)
-        blended_factor = (1 - learned_weight) + learned_weight * learned_factor
-        predicted = max(1, round(float(base_route['duration_minutes']) * blended_factor))
-        confidence = min(0.96, 0.25 + samples / 24)
-        return {
-            **base_route,
-            'predicted_minutes': predicted,
-            'mapbox_minutes': float(base_route['duration_minutes']),
-            'learned_factor': round(learned_factor, 3),
-            'samples': samples,
-            'confidence': round(confidence, 2),
-            'source': 'hybrid_ml_mapbox' if samples else 'mapbox_cold_start',
-            'driver_profile': cls.driver_profile(driver, relevant) if driver else None,
-        }
+        return cls._predict_candidates(HistoryArrays.of(history), [departure], [base_route], driver)[0][0]
 
     @classmethod
     def recommend(cls, origin, destination, departure, driver=None, window_hours=3):
@@ -130,14 +216,12 @@ class OperationalLearningEngine:
             routes = mapbox['routes']
 
         history = cls._history(origin, destination)
+        departures = [departure + timedelta(hours=offset) for offset in range(max(0, int(window_hours)) + 1)]
+        predictions = cls._predict_candidates(HistoryArrays(history), departures, routes, driver)
         candidates = []
-        for hour_offset in range(max(0, int(window_hours)) + 1):
-            candidate_departure = departure + timedelta(hours=hour_offset)
-            for route in routes:
-                candidate = cls.predict_route(
-                    origin, destination, candidate_departure, route,
-                    driver=driver, history=history,
-                )
+        for departure_index, candidate_departure in enumerate(departures):
+            for route_predictions in predictions:
+                candidate = route_predictions[departure_index]
                 candidate['departure'] = candidate_departure
                 candidates.append(candidate)
         candidates.sort(key=lambda item: (item['predicted_minutes'], item['distance_km']))
@@ -157,7 +241,7 @@ class OperationalLearningEngine:
 
     @classmethod
     def rank_drivers(cls, drivers, origin, destination, departure, base_route):
-        history = cls._history(origin, destination)
+        history = HistoryArrays(cls._history(origin, destination))
         ranked = []
         for driver in drivers:
             prediction = cls.predict_route(
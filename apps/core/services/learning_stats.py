@@ -0,0 +1,180 @@
+"""
+Acumulados de aprendizaje (EstadisticaAprendizaje).
+
+Cada TiempoOperacion/TiempoViaje nuevo suma su conteo, validez y error
+absoluto a la fila de su grupo (fuente, CD, tipo de operación), además de un
+cubo por día para las ventanas recientes. Ediciones y borrados recalculan el
+grupo completo desde el historial; `manage.py rebuild_learning_stats`
+reconstruye todo.
+"""
+import logging
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Func, Q, Sum
+from django.utils import timezone
+
+from apps.programaciones.models import EstadisticaAprendizaje, TiempoOperacion, TiempoViaje
+
+logger = logging.getLogger(__name__)
+
+TIPO_VIAJE = 'viaje'
+# Días de cubos que se conservan (la ventana reportada es DIAS_VENTANA)
+DIAS_RETENCION = EstadisticaAprendizaje.DIAS_VENTANA + 5
+
+
+def _clave(registro):
+    if isinstance(registro, TiempoViaje):
+        return 'viaje', None, TIPO_VIAJE
+    return 'operacion', registro.cd_id, registro.tipo_operacion
+
+
+def _error_abs(registro):
+    if isinstance(registro, TiempoViaje):
+        return abs(registro.tiempo_real_min - registro.tiempo_mapbox_min)
+    return abs(registro.tiempo_real_min - registro.tiempo_estimado_min)
+
+
+def _podar(por_dia, hoy):
+    limite = (hoy - timedelta(days=DIAS_RETENCION)).isoformat()
+    return {fecha: valores for fecha, valores in por_dia.items() if fecha >= limite}
+
+
+class LearningStatsService:
+    @staticmethod
+    def _fila_bloqueada(fuente, cd_id, tipo_operacion):
+        lookup = dict(fuente=fuente, cd_id=cd_id, tipo_operacion=tipo_operacion)
+        fila = EstadisticaAprendizaje.objects.select_for_update().filter(**lookup).first()
+        if fila:
+            return fila
+        try:
+            with transaction.atomic():
+                return EstadisticaAprendizaje.objects.create(**lookup)
+        except IntegrityError:
+            # Otro proceso creó el grupo al mismo tiempo
+            return EstadisticaAprendizaje.objects.select_for_update().get(**lookup)
+
+    @classmethod
+    @transaction.atomic
+    def registrar(cls, registro):
+        """Suma un registro nuevo a su grupo."""
+        fila = cls._fila_bloqueada(*_clave(registro))
+        valido = not registro.anomalia
+        error = _error_abs(registro) if valido else 0
+
+        fila.total += 1
+        fila.validos += int(valido)
+        fila.suma_error_abs += error
+        fecha = (registro.fecha or timezone.localdate()).isoformat()
+        dia_total, dia_validos, dia_error = fila.por_dia.get(fecha, [0, 0, 0])
+        fila.por_dia[fecha] = [dia_total + 1, dia_validos + int(valido), dia_error + error]
+        fila.por_dia = _podar(fila.por_dia, timezone.localdate())
+        fila.save()
+        return fila
+
+    @staticmethod
+    def _historial(fuente, cd_id, tipo_operacion):
+        if fuente == 'viaje':
+            return TiempoViaje.objects.all(), F('tiempo_mapbox_min')
+        return (
+            TiempoOperacion.objects.filter(cd_id=cd_id, tipo_operacion=tipo_operacion),
+            F('tiempo_estimado_min'),
+        )
+
+    @classmethod
+    @transaction.atomic
+    def recalcular(cls, fuente, cd_id, tipo_operacion):
+        """Recalcula un grupo desde el historial (ediciones, borrados, reconstrucción)."""
+        qs, estimado = cls._historial(fuente, cd_id, tipo_operacion)
+        error = Func(F('tiempo_real_min') - estimado, function='ABS')
+        validos = Q(anomalia=False)
+        totales = qs.aggregate(
+            total=Count('id'),
+            validos=Count('id', filter=validos),
+            suma_error_abs=Sum(error, filter=validos),
+        )
+        lookup = dict(fuente=fuente, cd_id=cd_id, tipo_operacion=tipo_operacion)
+        if not totales['total']:
+            EstadisticaAprendizaje.objects.filter(**lookup).delete()
+            return None
+
+        hoy = timezone.localdate()
+        dias = (
+            qs.filter(fecha__gte=hoy - timedelta(days=DIAS_RETENCION))
+            .order_by().values('fecha')
+            .annotate(
+                total=Count('id'),
+                validos=Count('id', filter=validos),
+                error=Sum(error, filter=validos),
+            )
+        )
+        fila = cls._fila_bloqueada(fuente, cd_id, tipo_operacion)
+        fila.total = totales['total']
+        fila.validos = totales['validos']
+        fila.suma_error_abs = float(totales['suma_error_abs'] or 0)
+        fila.por_dia = {
+            dia['fecha'].isoformat(): [dia['total'], dia['validos'], float(dia['error'] or 0)]
+            for dia in dias
+        }
+        fila.save()
+        return fila
+
+    @classmethod
+    def recalcular_para(cls, registro):
+        try:
+            return cls.recalcular(*_clave(registro))
+        except Exception as e:
+            logger.error(f"No se pudieron recalcular las estadísticas de aprendizaje: {e}")
+            return None
+
+    @classmethod
+    def registrar_seguro(cls, registro):
+        try:
+            return cls.registrar(registro)
+        except Exception as e:
+            # Las estadísticas son derivadas: no deben impedir registrar el tiempo
+            logger.error(f"No se pudo actualizar las estadísticas de aprendizaje: {e}")
+            return None
+
+    @classmethod
+    @transaction.atomic
+    def rebuild(cls):
+        """Reconstruye todos los grupos; retorna cuántos quedaron."""
+        grupos = {
+            ('operacion', cd_id, tipo)
+            for cd_id, tipo in TiempoOperacion.objects.order_by().values_list('cd_id', 'tipo_operacion').distinct()
+        }
+        if TiempoViaje.objects.exists():
+            grupos.add(('viaje', None, TIPO_VIAJE))
+        EstadisticaAprendizaje.objects.all().delete()
+        for grupo in grupos:
+            cls.recalcular(*grupo)
+        return len(grupos)
+
+    @staticmethod
+    def resumen():
+        """
+        Métricas de ml_learning_stats desde los acumulados: totales por fuente y
+        una entrada por CD con datos (orden de CD.Meta).
+        """
+        desde = timezone.localdate() - timedelta(days=EstadisticaAprendizaje.DIAS_VENTANA)
+        fuentes = {
+            'operacion': {'total': 0, 'validos': 0, 'recientes_30d': 0},
+            'viaje': {'total': 0, 'validos': 0, 'recientes_30d': 0},
+        }
+        por_cd = {}
+        filas = EstadisticaAprendizaje.objects.select_related('cd').order_by('cd__nombre', 'tipo_operacion')
+        for fila in filas:
+            recientes, validos_recientes, error_reciente = fila.ventana(desde)
+            acumulado = fuentes[fila.fuente]
+            acumulado['total'] += fila.total
+            acumulado['validos'] += fila.validos
+            acumulado['recientes_30d'] += recientes
+            if fila.fuente == 'operacion' and fila.cd_id:
+                cd = por_cd.setdefault(fila.cd_id, {
+                    'cd': fila.cd, 'validos': 0, 'validos_recientes': 0, 'error_reciente': 0.0,
+                })
+                cd['validos'] += fila.validos
+                cd['validos_recientes'] += validos_recientes
+                cd['error_reciente'] += error_reciente
+        return fuentes, list(por_cd.values())
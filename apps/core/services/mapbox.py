@@ -9,6 +9,8 @@ import logging
 import hashlib
 import json
 
+from apps.core.services.route_cache import RouteCache
+
 logger = logging.getLogger(__name__)
 
 
@@ -20,6 +22,10 @@ class MapboxService:
     
     API_KEY = settings.MAPBOX_API_KEY
     BASE_URL = "https://api.mapbox.com/directions/v5/mapbox"
+    MATRIX_URL = "https://api.mapbox.com/directions-matrix/v1/mapbox"
+    MATRIX_CACHE_PREFIX = 'mapbox:matriz'
+    # Límite de coordenadas por solicitud de Matrix API (origen + destinos)
+    MATRIX_MAX_COORDS = {'driving-traffic': 10, 'default': 25}
 
     @staticmethod
     def firma_ruta(geometry):
@@ -30,16 +36,25 @@ class MapboxService:
         return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
     
     @classmethod
-    def calcular_ruta(cls, origen_lng, origen_lat, destino_lng, destino_lat, profile='driving-traffic'):
+    def calcular_ruta(cls, origen_lng, origen_lat, destino_lng, destino_lat, profile='driving-traffic', usar_cache=True):
         """
         Calcula la ruta óptima entre dos puntos
         
+        Las rutas exitosas se guardan en RouteCache (LRU en memoria + caché
+        persistente), por lo que pares origen/destino repetidos en la misma
+        franja horaria no vuelven a consultar la API.
+
+        La ruta la resuelve el primer backend de ROUTING_BACKENDS que pueda
+        (ver apps.core.services.routing): sin API key o con Mapbox caído, el
+        motor offline responde con el mismo formato.
+        
         Args:
             origen_lng: Longitud del origen
             origen_lat: Latitud del origen
             destino_lng: Longitud del destino
             destino_lat: Latitud del destino
             profile: Tipo de ruta (driving, driving-traffic, walking, cycling)
+            usar_cache: False fuerza una consulta a Mapbox
         
         Returns:
             dict: {
@@ -47,9 +62,30 @@ class MapboxService:
                 'distance_km': float,       # Distancia en kilómetros
                 'geometry': dict,           # GeoJSON de la ruta
                 'success': bool,
+                'cached': bool,             # True si viene de la caché
+                'backend': str,             # 'mapbox', 'offline', ...
                 'error': str (opcional)
             }
         """
+        from apps.core.services.routing import solicitar_ruta
+
+        usar_cache = usar_cache and RouteCache.enabled()
+        if usar_cache:
+            key = RouteCache.build_key(origen_lng, origen_lat, destino_lng, destino_lat, profile)
+            cached = RouteCache.get(key)
+            if cached is not None:
+                return {**cached, 'cached': True}
+
+        resultado = solicitar_ruta(origen_lng, origen_lat, destino_lng, destino_lat, profile)
+        # Sólo se cachean rutas de Mapbox: el motor offline tiene su propia caché
+        if usar_cache and resultado.get('backend') == 'mapbox':
+            # raw_response no se persiste: sólo aporta peso a la caché.
+            RouteCache.set(key, {k: v for k, v in resultado.items() if k != 'raw_response'})
+        return {**resultado, 'cached': False}
+
+    @classmethod
+    def _solicitar_ruta(cls, origen_lng, origen_lat, destino_lng, destino_lat, profile):
+        """Consulta Directions API sin pasar por la caché."""
         try:
             # Construir URL
             coordinates = f"{origen_lng},{origen_lat};{destino_lng},{destino_lat}"
@@ -193,7 +229,121 @@ class MapboxService:
             })
         
         return resultados
-    
+
+    @classmethod
+    def matriz_max_coordenadas(cls, profile):
+        """Coordenadas por solicitud que admite Matrix API para el perfil."""
+        return cls.MATRIX_MAX_COORDS.get(profile, cls.MATRIX_MAX_COORDS['default'])
+
+    @classmethod
+    def calcular_matriz_hacia(cls, origenes, destino_lng, destino_lat, profile='driving-traffic', usar_cache=True):
+        """
+        Duración y distancia desde varios orígenes hacia un mismo destino
+        (muchos-a-uno) con Mapbox Matrix API.
+
+        Con Mapbox, los orígenes se agrupan en solicitudes de hasta
+        matriz_max_coordenadas - 1 orígenes más el destino; los que Mapbox no
+        resuelve pasan al siguiente backend de ROUTING_BACKENDS. Pares ya
+        presentes en RouteCache (de una matriz o de una ruta completa) no se
+        vuelven a pedir, y orígenes que caen en la misma llave de caché
+        comparten una sola celda.
+
+        Args:
+            origenes: lista de tuplas (lng, lat)
+            destino_lng, destino_lat: coordenadas del destino
+            profile: perfil de Mapbox
+            usar_cache: False fuerza la consulta a Mapbox
+
+        Returns:
+            list: un dict por origen, en el mismo orden: {
+                'success': bool,
+                'duration_minutes': float,
+                'distance_km': float,
+                'cached': bool,
+                'backend': str (si no viene de la caché),
+                'error': str (si no hay resultado)
+            }
+        """
+        from apps.core.services.routing import solicitar_matriz
+
+        usar_cache = usar_cache and RouteCache.enabled()
+        resultados = [None] * len(origenes)
+        pendientes = {}  # llave de matriz -> (lng, lat, [índices])
+        for index, (lng, lat) in enumerate(origenes):
+            llave = RouteCache.build_key(lng, lat, destino_lng, destino_lat, profile, prefix=cls.MATRIX_CACHE_PREFIX)
+            pendientes.setdefault(llave, (lng, lat, []))[2].append(index)
+
+        if usar_cache:
+            llaves_ruta = {
+                llave: RouteCache.build_key(lng, lat, destino_lng, destino_lat, profile)
+                for llave, (lng, lat, _) in pendientes.items()
+            }
+            cached = RouteCache.get_many([*pendientes, *llaves_ruta.values()])
+            for llave in list(pendientes):
+                valor = cached.get(llave) or cached.get(llaves_ruta[llave])
+                if valor is None:
+                    continue
+                for index in pendientes.pop(llave)[2]:
+                    resultados[index] = {
+                        'success': True,
+                        'duration_minutes': valor['duration_minutes'],
+                        'distance_km': valor['distance_km'],
+                        'cached': True,
+                    }
+
+        llaves = list(pendientes)
+        celdas = solicitar_matriz([pendientes[llave][:2] for llave in llaves], destino_lng, destino_lat, profile)
+        nuevas = {}
+        for llave, celda in zip(llaves, celdas):
+            if celda.get('backend') == 'mapbox':
+                nuevas[llave] = {k: celda[k] for k in ('duration_minutes', 'distance_km')}
+            for index in pendientes[llave][2]:
+                resultados[index] = {**celda, 'cached': False}
+        if usar_cache:
+            RouteCache.set_many(nuevas)
+        return resultados
+
+    @classmethod
+    def _solicitar_matriz(cls, origenes, destino_lng, destino_lat, profile):
+        """Una solicitud a Matrix API; retorna una celda por origen."""
+        if not cls.API_KEY:
+            return [{'success': False, 'error': 'MAPBOX_API_KEY no configurada'}] * len(origenes)
+        try:
+            coordinates = ';'.join(f"{lng},{lat}" for lng, lat in [*origenes, (destino_lng, destino_lat)])
+            response = requests.get(
+                f"{cls.MATRIX_URL}/{profile}/{coordinates}",
+                params={
+                    'access_token': cls.API_KEY,
+                    'sources': ';'.join(str(i) for i in range(len(origenes))),
+                    'destinations': str(len(origenes)),
+                    'annotations': 'duration,distance',
+                },
+                timeout=10,
+            )
+            response.raise_for_status()
+            data = response.json()
+            if data.get('code') != 'Ok':
+                error = data.get('message', 'Error desconocido en Mapbox')
+                return [{'success': False, 'error': error}] * len(origenes)
+        except Exception as e:
+            logger.error(f"Error en Mapbox Matrix API: {str(e)}")
+            return [{'success': False, 'error': str(e)}] * len(origenes)
+
+        celdas = []
+        for fila_duracion, fila_distancia in zip(data.get('durations', []), data.get('distances', [])):
+            duracion, distancia = fila_duracion[0], fila_distancia[0]
+            if duracion is None or distancia is None:
+                celdas.append({'success': False, 'error': 'Sin ruta entre origen y destino'})
+                continue
+            celdas.append({
+                'success': True,
+                'duration_minutes': round(duracion / 60, 2),
+                'distance_km': round(distancia / 1000, 2),
+            })
+        # Respuesta incompleta: los orígenes sin fila quedan sin resultado
+        celdas.extend({'success': False, 'error': 'Respuesta incompleta'} for _ in range(len(origenes) - len(celdas)))
+        return celdas
+
     @classmethod
     def calcular_score_proximidad(cls, driver_lat, driver_lng, cd_lat, cd_lng, max_km=100):
         """
@@ -0,0 +1,104 @@
+"""
+Tiempos de viaje de muchos conductores hacia un mismo destino.
+
+Para puntuar candidatos contra una programación, todos los orígenes (GPS del
+conductor o puerto del contenedor) se resuelven con una sola matriz
+muchos-a-uno de Mapbox (MapboxService.calcular_matriz_hacia, dividida según
+el límite de coordenadas del perfil) en vez de una ruta Directions por par;
+lo que Mapbox no resuelve pasa a los demás backends de ROUTING_BACKENDS.
+
+Si ningún backend resuelve un origen, el tiempo base sale de la distancia
+haversine × MATRIX_ETA_DETOUR_FACTOR a la velocidad aprendida de los viajes
+reales hacia ese destino (MATRIX_ETA_DEFAULT_SPEED_KMH si hay menos de
+MATRIX_ETA_MIN_SAMPLES viajes).
+
+El resultado es el tiempo base que MLTimePredictor corrige con el historial;
+ScoringContext lo calcula una vez por programación y lo comparten el score,
+la detección de anomalías y la validación de factibilidad.
+"""
+import logging
+
+from django.conf import settings
+
+from apps.core.services.incremental_eta import _haversine_m
+from apps.core.services.mapbox import MapboxService
+
+logger = logging.getLogger(__name__)
+
+
+class MatrixETAService:
+    PROFILE = 'driving-traffic'
+
+    @staticmethod
+    def enabled() -> bool:
+        return bool(getattr(settings, 'MATRIX_ETA_ENABLED', True))
+
+    @staticmethod
+    def detour_factor() -> float:
+        return float(getattr(settings, 'MATRIX_ETA_DETOUR_FACTOR', 1.3))
+
+    @staticmethod
+    def default_speed_kmh() -> float:
+        return float(getattr(settings, 'MATRIX_ETA_DEFAULT_SPEED_KMH', 35))
+
+    @staticmethod
+    def min_samples() -> int:
+        return int(getattr(settings, 'MATRIX_ETA_MIN_SAMPLES', 3))
+
+    @classmethod
+    def velocidad_aprendida(cls, historial) -> float:
+        """km/h medios de los viajes reales del historial (sin anomalías)."""
+        viajes = [
+            row for row in historial or []
+            if not row.anomalia and row.tiempo_real_min > 0 and row.distancia_km
+        ]
+        if len(viajes) < cls.min_samples():
+            return cls.default_speed_kmh()
+        horas = sum(row.tiempo_real_min for row in viajes) / 60
+        return float(sum(row.distancia_km for row in viajes)) / horas
+
+    @classmethod
+    def estimacion_offline(cls, origen, destino, velocidad_kmh) -> dict:
+        """Tiempo base por distancia haversine corregida por desvío."""
+        distancia_km = _haversine_m(
+            float(origen[0]), float(origen[1]), float(destino[0]), float(destino[1]),
+        ) / 1000 * cls.detour_factor()
+        return {
+            'success': True,
+            'duration_minutes': round(distancia_km / velocidad_kmh * 60, 2),
+            'distance_km': round(distancia_km, 2),
+            'fuente': 'haversine',
+        }
+
+    @classmethod
+    def tiempos_base(cls, origenes: dict, destino, historial=None) -> dict:
+        """
+        {clave: ruta base} para `origenes` {clave: (lat, lng)} hacia `destino`
+        (lat, lng). Cada ruta base trae 'duration_minutes', 'distance_km' y
+        'fuente' (el backend de ruteo, o 'haversine').
+        """
+        if not origenes or destino is None:
+            return {}
+        claves = list(origenes)
+        destino_lat, destino_lng = float(destino[0]), float(destino[1])
+        celdas = MapboxService.calcular_matriz_hacia(
+            [(float(origenes[c][1]), float(origenes[c][0])) for c in claves],
+            destino_lng, destino_lat, profile=cls.PROFILE,
+        )
+
+        velocidad = None
+        resultado = {}
+        for clave, celda in zip(claves, celdas):
+            if celda.get('success'):
+                resultado[clave] = {
+                    'success': True,
+                    'duration_minutes': celda['duration_minutes'],
+                    'distance_km': celda['distance_km'],
+                    'fuente': celda.get('backend', 'mapbox'),
+                }
+                continue
+            if velocidad is None:
+                velocidad = cls.velocidad_aprendida(historial)
+                logger.debug(f"Matriz ETA sin ruta ({celda.get('error')}); velocidad {velocidad:.1f} km/h")
+            resultado[clave] = cls.estimacion_offline(origenes[clave], (destino_lat, destino_lng), velocidad)
+        return resultado
@@ -24,7 +24,7 @@ class MLTimePredictor:
     """
     
     @classmethod
-    def predecir_tiempo_operacion(cls, cd, tipo_operacion='descarga_cd', conductor=None):
+    def predecir_tiempo_operacion(cls, cd, tipo_operacion='descarga_cd', conductor=None, historial=None):
         """
         Predice tiempo de operación en CD usando ML
         
@@ -32,6 +32,7 @@ class MLTimePredictor:
             cd: CD object
             tipo_operacion: str ('carga_ccti', 'descarga_cd', 'retiro_puerto', 'devolucion_vacio')
             conductor: Driver object (opcional)
+            historial: TiempoOperacion precargados (opcional, evita consultas)
         
         Returns:
             int: Tiempo estimado en minutos
@@ -41,7 +42,8 @@ class MLTimePredictor:
             tiempo_ml = TiempoOperacion.obtener_tiempo_aprendido(
                 cd=cd,
                 tipo_operacion=tipo_operacion,
-                conductor=conductor
+                conductor=conductor,
+                historial=historial,
             )
             
             logger.debug(f"Tiempo ML para {cd.nombre} ({tipo_operacion}): {tiempo_ml} min")
@@ -58,7 +60,8 @@ class MLTimePredictor:
             return 60
     
     @classmethod
-    def predecir_tiempo_viaje(cls, origen_coords, destino_coords, hora_salida=None, conductor=None):
+    def predecir_tiempo_viaje(cls, origen_coords, destino_coords, hora_salida=None, conductor=None, historial=None,
+                              ruta_base=None):
         """
         Predice tiempo de viaje usando ML + Mapbox
         
@@ -72,6 +75,9 @@ class MLTimePredictor:
             destino_coords: tuple (lat, lon)
             hora_salida: datetime opcional
             conductor: Driver opcional
+            historial: TiempoViaje precargados (opcional, evita consultas)
+            ruta_base: dict con 'duration_minutes' y 'distance_km' ya resuelto
+                (p. ej. por MatrixETAService); reemplaza la consulta a Mapbox
         
         Returns:
             dict: {
@@ -87,7 +93,7 @@ class MLTimePredictor:
             origen_lat, origen_lng = float(origen_coords[0]), float(origen_coords[1])
             destino_lat, destino_lng = float(destino_coords[0]), float(destino_coords[1])
 
-            mapbox_resultado = MapboxService.calcular_ruta(
+            mapbox_resultado = ruta_base or MapboxService.calcular_ruta(
                 origen_lng, origen_lat,
                 destino_lng, destino_lat
             )
@@ -111,7 +117,8 @@ class MLTimePredictor:
                     destino_coords=destino_coords,
                     tiempo_mapbox=tiempo_mapbox,
                     hora_salida=hora_salida or datetime.now(),
-                    conductor=conductor
+                    conductor=conductor,
+                    historial=historial,
                 )
                 
                 # Si ML devolvió algo diferente, usarlo
@@ -134,7 +141,7 @@ class MLTimePredictor:
             return {
                 'tiempo_estimado_min': tiempo_mapbox,
                 'distancia_km': distancia_km,
-                'fuente': 'mapbox',
+                'fuente': mapbox_resultado.get('fuente', 'mapbox'),
                 'tiempo_mapbox_min': tiempo_mapbox
             }
         
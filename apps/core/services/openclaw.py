@@ -1,44 +1,111 @@
-import requests
+"""
+Integración con OpenClaw mediante un outbox transaccional.
+
+notify_anomaly y request_review no llaman a OpenClaw: guardan el payload en
+MensajeOpenClaw dentro de la transacción en curso (si se revierte, el mensaje
+desaparece con ella). `manage.py run_openclaw_sender` reclama lotes de
+mensajes pendientes con un UPDATE condicional y los entrega por una sesión
+HTTP con conexiones reutilizables:
+
+- deduplicación: la misma alerta de anomalía para una programación (mismos
+  códigos y severidades) se encola una sola vez por OPENCLAW_DEDUPE_SECONDS;
+- reintentos: un error de red, 5xx o 429 reprograma el mensaje con backoff
+  exponencial; tras OPENCLAW_MAX_ATTEMPTS intentos (o un 4xx) queda fallido.
+
+Así el puntaje de asignación no depende de la latencia del canal.
+"""
+import hashlib
+import json
 import logging
-from django.conf import settings
+import os
+import socket
+import threading
+from datetime import timedelta
 from typing import Any, Dict, List
 
+import requests
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
 logger = logging.getLogger(__name__)
 
+
 class OpenClawService:
     """
     Servicio de integración con OpenClaw para notificaciones proactivas y
     toma de decisiones en canales de mensajería (Telegram, Slack, etc.)
     """
-    
+
     BASE_URL = getattr(settings, 'OPENCLAW_API_URL', 'http://localhost:3000/api/v1')
     API_KEY = getattr(settings, 'OPENCLAW_API_KEY', None)
     ENABLED = getattr(settings, 'OPENCLAW_ENABLED', False)
-    
+
+    _session = None
+    _session_lock = threading.Lock()
+
+    @staticmethod
+    def batch_size() -> int:
+        return int(getattr(settings, 'OPENCLAW_BATCH_SIZE', 50))
+
+    @staticmethod
+    def max_attempts() -> int:
+        return int(getattr(settings, 'OPENCLAW_MAX_ATTEMPTS', 8))
+
+    @staticmethod
+    def backoff_seconds(intentos) -> int:
+        base = int(getattr(settings, 'OPENCLAW_BACKOFF_SECONDS', 30))
+        maximo = int(getattr(settings, 'OPENCLAW_BACKOFF_MAX_SECONDS', 3600))
+        return min(maximo, base * 2 ** max(0, intentos - 1))
+
+    @staticmethod
+    def dedupe_seconds() -> int:
+        return int(getattr(settings, 'OPENCLAW_DEDUPE_SECONDS', 3600))
+
+    @staticmethod
+    def timeout() -> float:
+        return float(getattr(settings, 'OPENCLAW_TIMEOUT', 5))
+
+    # --- Encolado ---
+
     @classmethod
-    def _send_payload(cls, endpoint: str, payload: Dict[str, Any]) -> bool:
+    def _send_payload(cls, endpoint: str, payload: Dict[str, Any], clave_dedupe: str = '', programacion_id=None) -> bool:
+        """Encola el payload en el outbox; retorna False si no se encoló."""
+        from apps.core.models import MensajeOpenClaw
+
         if not cls.ENABLED or not cls.API_KEY:
             logger.debug("OpenClaw disabled or API Key missing.")
             return False
-            
-        try:
-            headers = {'Authorization': f'Bearer {cls.API_KEY}', 'Content-Type': 'application/json'}
-            response = requests.post(f"{cls.BASE_URL}/{endpoint}", json=payload, headers=headers, timeout=5)
-            response.raise_for_status()
-            return True
-        except Exception as e:
-            logger.error(f"Error connecting to OpenClaw: {str(e)}")
-            return False
+
+        if clave_dedupe:
+            desde = timezone.now() - timedelta(seconds=cls.dedupe_seconds())
+            duplicado = MensajeOpenClaw.objects.filter(
+                clave_dedupe=clave_dedupe, created_at__gte=desde,
+            ).exclude(estado='fallido').exists()
+            if duplicado:
+                return False
+        MensajeOpenClaw.objects.create(
+            endpoint=endpoint, payload=payload, clave_dedupe=clave_dedupe, programacion_id=programacion_id,
+        )
+        return True
+
+    @staticmethod
+    def _clave_anomalias(programacion, anomalies):
+        firma = sorted((a.get('code') or a.get('message') or '', a.get('severity') or '') for a in anomalies)
+        contenido = json.dumps([programacion.id, firma], ensure_ascii=False)
+        return hashlib.sha1(contenido.encode('utf-8')).hexdigest()
 
     @classmethod
     def notify_anomaly(cls, programacion: Any, anomalies: List[Dict[str, Any]]):
         """Notifica anomalías críticas P0/P1 al operador"""
         if not anomalies:
             return
-            
+
         top_anomaly = anomalies[0]
         severity = top_anomaly.get('severity', 'P2')
-        
+
         if severity not in ['P0', 'P1']:
             return
 
@@ -62,8 +129,11 @@ class OpenClawService:
                 {"label": "Confirmar", "command": f"confirm_programacion {programacion.id}"}
             ]
         }
-        
-        cls._send_payload("notifications", payload)
+
+        cls._send_payload(
+            "notifications", payload,
+            clave_dedupe=cls._clave_anomalias(programacion, anomalies), programacion_id=programacion.id,
+        )
 
     @classmethod
     def request_review(cls, programacion: Any, candidate_data: Dict[str, Any]):
@@ -84,4 +154,124 @@ class OpenClawService:
                 {"label": "Ver Alternativas", "command": f"list_alternatives {programacion.id}"}
             ]
         }
-        cls._send_payload("notifications", payload)
+        cls._send_payload("notifications", payload, programacion_id=programacion.id)
+
+    # --- Entrega ---
+
+    @classmethod
+    def session(cls):
+        """Sesión HTTP del proceso con pool de conexiones keep-alive."""
+        with cls._session_lock:
+            if cls._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                cls._session = session
+            return cls._session
+
+    @staticmethod
+    def worker_id():
+        return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+    @classmethod
+    def reclamar(cls, worker=None, limite=None):
+        """
+        Reclama hasta `limite` mensajes vencidos con un solo UPDATE condicional;
+        si otro sender ganó alguno, simplemente no se devuelve.
+        """
+        from apps.core.models import MensajeOpenClaw
+
+        worker = worker or cls.worker_id()
+        ahora = timezone.now()
+        ids = list(
+            MensajeOpenClaw.objects.filter(estado='pendiente', proximo_intento__lte=ahora)
+            .order_by('proximo_intento', 'id').values_list('pk', flat=True)[:limite or cls.batch_size()]
+        )
+        if not ids:
+            return []
+        MensajeOpenClaw.objects.filter(pk__in=ids, estado='pendiente').update(
+            estado='enviando', worker=worker, reclamado_en=ahora,
+        )
+        return list(MensajeOpenClaw.objects.filter(pk__in=ids, estado='enviando', worker=worker).order_by('id'))
+
+    @classmethod
+    def _entregar(cls, mensaje):
+        """POST de un mensaje. Retorna None si se entregó, o (error, reintentable)."""
+        headers = {'Authorization': f'Bearer {cls.API_KEY}', 'Content-Type': 'application/json'}
+        try:
+            response = cls.session().post(
+                f"{cls.BASE_URL}/{mensaje.endpoint}", json=mensaje.payload, headers=headers, timeout=cls.timeout(),
+            )
+        except requests.RequestException as e:
+            return str(e), True
+        if response.status_code < 400:
+            return None
+        reintentable = response.status_code >= 500 or response.status_code == 429
+        return f"HTTP {response.status_code}: {response.text[:200]}", reintentable
+
+    @classmethod
+    def enviar_pendientes(cls, worker=None):
+        """Entrega un lote de mensajes vencidos; retorna {'enviados', 'reintentos', 'fallidos'}."""
+        from apps.core.models import MensajeOpenClaw
+
+        lote = cls.reclamar(worker)
+        if not lote:
+            return {'enviados': 0, 'reintentos': 0, 'fallidos': 0}
+        enviados, reintentos, fallidos = [], [], []
+        claves = set()
+        for mensaje in lote:
+            # Dos procesos pueden encolar la misma alerta a la vez: se entrega una
+            if mensaje.clave_dedupe:
+                if mensaje.clave_dedupe in claves:
+                    enviados.append(mensaje.pk)
+                    continue
+                claves.add(mensaje.clave_dedupe)
+            resultado = cls._entregar(mensaje)
+            if resultado is None:
+                enviados.append(mensaje.pk)
+                continue
+            error, reintentable = resultado
+            mensaje.intentos += 1
+            mensaje.error = error
+            if reintentable and mensaje.intentos < cls.max_attempts():
+                mensaje.estado = 'pendiente'
+                mensaje.proximo_intento = timezone.now() + timedelta(seconds=cls.backoff_seconds(mensaje.intentos))
+                reintentos.append(mensaje)
+            else:
+                mensaje.estado = 'fallido'
+                fallidos.append(mensaje)
+                logger.error(f"Mensaje OpenClaw #{mensaje.pk} descartado: {error}")
+
+        if enviados:
+            MensajeOpenClaw.objects.filter(pk__in=enviados).update(
+                estado='enviado', enviado_en=timezone.now(), intentos=F('intentos') + 1, error='',
+            )
+        if reintentos or fallidos:
+            MensajeOpenClaw.objects.bulk_update(
+                reintentos + fallidos, ['estado', 'intentos', 'error', 'proximo_intento'],
+            )
+        if reintentos:
+            logger.warning(f"OpenClaw: {len(reintentos)} mensajes reprogramados ({reintentos[0].error})")
+        return {'enviados': len(enviados), 'reintentos': len(reintentos), 'fallidos': len(fallidos)}
+
+    @classmethod
+    def recuperar_huerfanos(cls, stale_seconds=300):
+        """Devuelve a la cola los mensajes de un sender que murió a mitad de un lote."""
+        from apps.core.models import MensajeOpenClaw
+
+        limite = timezone.now() - timedelta(seconds=stale_seconds)
+        return MensajeOpenClaw.objects.filter(estado='enviando', reclamado_en__lt=limite).update(
+            estado='pendiente', worker='',
+        )
+
+    @classmethod
+    def run_pending(cls, worker=None):
+        """Envía lotes hasta que no queden mensajes vencidos; retorna cuántos se enviaron."""
+        total = 0
+        while True:
+            close_old_connections()
+            resumen = cls.enviar_pendientes(worker)
+            if not any(resumen.values()):
+                return total
+            total += resumen['enviados']
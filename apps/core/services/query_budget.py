@@ -0,0 +1,185 @@
+"""
+Presupuesto de consultas por solicitud y detección de N+1.
+
+QueryBudgetMiddleware instala un execute_wrapper en cada conexión mientras
+dura la solicitud y anota, por consulta, su huella (SQL sin parámetros, con
+listas IN y literales numéricos colapsados) y su duración. Al terminar:
+
+- consultas totales, ms en BD y ms en Python (total menos BD);
+- N+1: una misma huella repetida QUERY_BUDGET_N1_THRESHOLD veces o más;
+- sobre presupuesto: más de QUERY_BUDGET_MAX_QUERIES consultas.
+
+Las solicitudes se acumulan en memoria por nombre de URL y se vuelcan a
+PerfilEndpoint cada QUERY_BUDGET_FLUSH_SECONDS (fuera de la medición). El
+reporte sale del admin o de `manage.py query_budget_report`.
+
+Con QUERY_BUDGET_ENABLED=False el middleware se desactiva al cargar
+(MiddlewareNotUsed): no queda ningún costo por solicitud.
+"""
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_LISTA_PARAMETROS = re.compile(r'%s(?:\s*,\s*%s)+')
+_NUMEROS = re.compile(r'\b\d+\b')
+
+
+def huella(sql):
+    """Huella estable de una consulta: misma forma, distintos parámetros."""
+    normalizada = _NUMEROS.sub('?', _LISTA_PARAMETROS.sub('%s...', sql))
+    return hashlib.sha1(normalizada.encode('utf-8')).hexdigest()[:12], normalizada
+
+
+class RegistroConsultas:
+    """execute_wrapper que anota huella y duración de cada consulta de la solicitud."""
+
+    def __init__(self):
+        self.total = 0
+        self.segundos_bd = 0.0
+        self.por_huella = Counter()
+        self.sql = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.segundos_bd += time.perf_counter() - inicio
+            self.total += 1
+            clave, normalizada = huella(sql)
+            self.por_huella[clave] += 1
+            self.sql.setdefault(clave, normalizada)
+
+    def medir(self):
+        """Context manager que instala el wrapper en todas las conexiones configuradas."""
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(self))
+        return stack
+
+
+class QueryBudgetService:
+    _lock = threading.Lock()
+    _pendientes = defaultdict(list)
+    _ultimo_volcado = time.monotonic()
+
+    @staticmethod
+    def enabled() -> bool:
+        return bool(getattr(settings, 'QUERY_BUDGET_ENABLED', False))
+
+    @staticmethod
+    def max_queries() -> int:
+        return int(getattr(settings, 'QUERY_BUDGET_MAX_QUERIES', 50))
+
+    @staticmethod
+    def n1_threshold() -> int:
+        return int(getattr(settings, 'QUERY_BUDGET_N1_THRESHOLD', 5))
+
+    @staticmethod
+    def max_samples() -> int:
+        return int(getattr(settings, 'QUERY_BUDGET_SAMPLES', 500))
+
+    @staticmethod
+    def flush_seconds() -> int:
+        return int(getattr(settings, 'QUERY_BUDGET_FLUSH_SECONDS', 30))
+
+    @classmethod
+    def analizar(cls, url_name, registro, segundos_total):
+        """Resumen de una solicitud; registra advertencias de N+1 y presupuesto."""
+        repetidas = {
+            clave: veces for clave, veces in registro.por_huella.items() if veces >= cls.n1_threshold()
+        }
+        resumen = {
+            'url_name': url_name,
+            'consultas': registro.total,
+            'ms_bd': round(registro.segundos_bd * 1000, 1),
+            'ms_python': round(max(0.0, segundos_total - registro.segundos_bd) * 1000, 1),
+            'n_mas_1': bool(repetidas),
+            'sobre_presupuesto': registro.total > cls.max_queries(),
+            'repetidas': {clave: {'sql': registro.sql[clave][:500], 'veces': veces} for clave, veces in repetidas.items()},
+        }
+        if repetidas:
+            peor = max(repetidas, key=repetidas.get)
+            logger.warning(
+                f"Posible N+1 en {url_name}: consulta repetida {repetidas[peor]} veces "
+                f"({registro.sql[peor][:200]})"
+            )
+        if resumen['sobre_presupuesto']:
+            logger.warning(f"{url_name} ejecutó {registro.total} consultas (presupuesto {cls.max_queries()})")
+        return resumen
+
+    @classmethod
+    def registrar(cls, resumen):
+        with cls._lock:
+            cls._pendientes[resumen['url_name']].append(resumen)
+            vencido = time.monotonic() - cls._ultimo_volcado >= cls.flush_seconds()
+        if vencido:
+            cls.volcar()
+
+    @classmethod
+    def volcar(cls):
+        """Agrega las solicitudes pendientes de este proceso en PerfilEndpoint."""
+        from apps.core.models import PerfilEndpoint
+
+        with cls._lock:
+            pendientes, cls._pendientes = cls._pendientes, defaultdict(list)
+            cls._ultimo_volcado = time.monotonic()
+        if not pendientes:
+            return 0
+        limite = cls.max_samples()
+        try:
+            with transaction.atomic():
+                existentes = {
+                    perfil.url_name: perfil
+                    for perfil in PerfilEndpoint.objects.select_for_update().filter(url_name__in=list(pendientes))
+                }
+                for url_name, resumenes in pendientes.items():
+                    perfil = existentes.get(url_name) or PerfilEndpoint(url_name=url_name)
+                    perfil.solicitudes += len(resumenes)
+                    perfil.con_n_mas_1 += sum(r['n_mas_1'] for r in resumenes)
+                    perfil.sobre_presupuesto += sum(r['sobre_presupuesto'] for r in resumenes)
+                    perfil.max_consultas = max([perfil.max_consultas] + [r['consultas'] for r in resumenes])
+                    perfil.muestras = (
+                        perfil.muestras + [[r['consultas'], r['ms_bd'], r['ms_python']] for r in resumenes]
+                    )[-limite:]
+                    for resumen in resumenes:
+                        for clave, repetida in resumen['repetidas'].items():
+                            actual = perfil.duplicadas.get(clave, {'sql': repetida['sql'], 'max_repeticiones': 0})
+                            actual['max_repeticiones'] = max(actual['max_repeticiones'], repetida['veces'])
+                            perfil.duplicadas[clave] = actual
+                    perfil.save()
+        except Exception as e:
+            # El perfilado nunca debe romper una solicitud
+            logger.error(f"No se pudo guardar el perfil de consultas: {e}")
+            return 0
+        return len(pendientes)
+
+    @staticmethod
+    def reporte(orden='p95'):
+        """Filas del reporte por endpoint, ordenadas por percentil de consultas descendente."""
+        from apps.core.models import PerfilEndpoint
+
+        filas = []
+        for perfil in PerfilEndpoint.objects.all():
+            consultas = perfil.percentiles(0)
+            filas.append({
+                'url_name': perfil.url_name,
+                'solicitudes': perfil.solicitudes,
+                'consultas': consultas,
+                'ms_bd': perfil.percentiles(1),
+                'ms_python': perfil.percentiles(2),
+                'max_consultas': perfil.max_consultas,
+                'con_n_mas_1': perfil.con_n_mas_1,
+                'sobre_presupuesto': perfil.sobre_presupuesto,
+                'duplicadas': perfil.duplicadas,
+            })
+        return sorted(filas, key=lambda fila: -fila['consultas'].get(orden, 0))
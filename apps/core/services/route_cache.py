@@ -0,0 +1,179 @@
+"""
+Caché de rutas Mapbox en dos niveles.
+
+1. LRU en memoria del proceso (microsegundos, acotada por tamaño y TTL).
+2. Caché persistente de Django (alias MAPBOX_ROUTE_CACHE_ALIAS, por defecto
+   una tabla DatabaseCache compartida entre workers y cron).
+
+La llave cuantiza origen/destino (MAPBOX_ROUTE_CACHE_PRECISION decimales,
+3 ≈ 110 m), incluye el perfil y, para perfiles con tráfico, la franja horaria.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, caches
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class RouteCache:
+    KEY_PREFIX = 'mapbox:ruta'
+    TRAFFIC_PROFILES = {'driving-traffic'}
+
+    _lock = threading.Lock()
+    _lru: OrderedDict = OrderedDict()
+    _stats = {'lru_hits': 0, 'store_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    @staticmethod
+    def enabled() -> bool:
+        return bool(getattr(settings, 'MAPBOX_ROUTE_CACHE_ENABLED', True))
+
+    @staticmethod
+    def ttl_seconds() -> int:
+        return int(getattr(settings, 'MAPBOX_ROUTE_CACHE_TTL', 6 * 3600))
+
+    @staticmethod
+    def lru_size() -> int:
+        return int(getattr(settings, 'MAPBOX_ROUTE_CACHE_LRU_SIZE', 512))
+
+    @classmethod
+    def build_key(cls, origen_lng, origen_lat, destino_lng, destino_lat, profile, when=None, prefix=None) -> str:
+        precision = int(getattr(settings, 'MAPBOX_ROUTE_CACHE_PRECISION', 3))
+        coords = ','.join(
+            f"{round(float(value), precision):.{precision}f}"
+            for value in (origen_lng, origen_lat, destino_lng, destino_lat)
+        )
+        bucket = 'all'
+        if profile in cls.TRAFFIC_PROFILES:
+            bucket_hours = max(1, int(getattr(settings, 'MAPBOX_ROUTE_CACHE_HOUR_BUCKET', 2)))
+            hour = timezone.localtime(when or timezone.now()).hour
+            bucket = f"h{hour // bucket_hours}"
+        return f"{prefix or cls.KEY_PREFIX}:{profile}:{bucket}:{coords}"
+
+    @classmethod
+    def _store(cls):
+        alias = getattr(settings, 'MAPBOX_ROUTE_CACHE_ALIAS', 'mapbox_routes')
+        try:
+            return caches[alias]
+        except InvalidCacheBackendError:
+            return None
+
+    @classmethod
+    def get(cls, key):
+        now = time.monotonic()
+        with cls._lock:
+            entry = cls._lru.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    cls._lru.move_to_end(key)
+                    cls._stats['lru_hits'] += 1
+                    return dict(value)
+                del cls._lru[key]
+
+        store = cls._store()
+        value = None
+        if store is not None:
+            try:
+                value = store.get(key)
+            except Exception as exc:
+                # La caché persistente nunca debe bloquear el cálculo de rutas.
+                logger.warning(f"Caché de rutas no disponible: {exc}")
+        with cls._lock:
+            if value is None:
+                cls._stats['misses'] += 1
+                return None
+            cls._stats['store_hits'] += 1
+        cls._remember(key, value)
+        return dict(value)
+
+    @classmethod
+    def set(cls, key, value):
+        cls._remember(key, value)
+        store = cls._store()
+        if store is not None:
+            try:
+                store.set(key, value, timeout=cls.ttl_seconds())
+            except Exception as exc:
+                logger.warning(f"No se pudo persistir ruta en caché: {exc}")
+        with cls._lock:
+            cls._stats['stores'] += 1
+
+    @classmethod
+    def get_many(cls, keys) -> dict:
+        """Como get para varias llaves, con una sola lectura de la caché persistente."""
+        now = time.monotonic()
+        found, missing = {}, []
+        with cls._lock:
+            for key in dict.fromkeys(keys):
+                entry = cls._lru.get(key)
+                if entry is not None and entry[0] > now:
+                    cls._lru.move_to_end(key)
+                    cls._stats['lru_hits'] += 1
+                    found[key] = dict(entry[1])
+                else:
+                    cls._lru.pop(key, None)
+                    missing.append(key)
+
+        store = cls._store()
+        stored = {}
+        if store is not None and missing:
+            try:
+                stored = store.get_many(missing)
+            except Exception as exc:
+                logger.warning(f"Caché de rutas no disponible: {exc}")
+        with cls._lock:
+            cls._stats['store_hits'] += len(stored)
+            cls._stats['misses'] += len(missing) - len(stored)
+        for key, value in stored.items():
+            cls._remember(key, value)
+            found[key] = dict(value)
+        return found
+
+    @classmethod
+    def set_many(cls, values: dict):
+        if not values:
+            return
+        for key, value in values.items():
+            cls._remember(key, value)
+        store = cls._store()
+        if store is not None:
+            try:
+                store.set_many(values, timeout=cls.ttl_seconds())
+            except Exception as exc:
+                logger.warning(f"No se pudo persistir ruta en caché: {exc}")
+        with cls._lock:
+            cls._stats['stores'] += len(values)
+
+    @classmethod
+    def _remember(cls, key, value):
+        with cls._lock:
+            cls._lru[key] = (time.monotonic() + cls.ttl_seconds(), value)
+            cls._lru.move_to_end(key)
+            while len(cls._lru) > cls.lru_size():
+                cls._lru.popitem(last=False)
+                cls._stats['evictions'] += 1
+
+    @classmethod
+    def stats(cls) -> dict:
+        with cls._lock:
+            stats = dict(cls._stats)
+            stats['lru_entries'] = len(cls._lru)
+        lookups = stats['lru_hits'] + stats['store_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['lru_hits'] + stats['store_hits']) / lookups, 3) if lookups else 0.0
+        return stats
+
+    @classmethod
+    def clear(cls, persistent=False):
+        with cls._lock:
+            cls._lru.clear()
+            for name in cls._stats:
+                cls._stats[name] = 0
+        if persistent:
+            store = cls._store()
+            if store is not None:
+                store.clear()
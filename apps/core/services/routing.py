@@ -0,0 +1,457 @@
+"""
+Backends de ruteo detrás de MapboxService.
+
+MapboxService.calcular_ruta y calcular_matriz_hacia recorren los backends de
+ROUTING_BACKENDS en orden y usan el primero que resuelve cada par:
+
+- 'mapbox': Directions / Matrix API (requiere MAPBOX_API_KEY);
+- 'offline': OfflineBackend, A* sobre un grafo vial local cargado desde
+  ROUTING_GRAPH_PATH;
+- o la ruta con puntos de una clase propia que herede de RoutingBackend.
+
+El grafo es un GeoJSON FeatureCollection de LineStrings, como el que producen
+`osmium export` u Overpass para un extracto OSM (p. ej. el corredor
+Valparaíso–Santiago). De cada feature se usan las propiedades `highway`,
+`maxspeed` y `oneway`. Los vértices con las mismas coordenadas se unen en un
+solo nodo; el costo de cada arco es su tiempo de recorrido a la velocidad de la
+vía, acotada por ROUTING_TRUCK_MAX_KMH.
+
+Las rutas offline usan el mismo formato de respuesta que Mapbox: duración,
+distancia, geometría GeoJSON y route_signature. Los tramos de acceso desde el
+punto pedido hasta el nodo más cercano (a lo más ROUTING_MAX_SNAP_M) se
+recorren a ROUTING_ACCESS_SPEED_KMH. Los caminos entre pares de nodos se
+guardan en una LRU de ROUTING_CACHE_SIZE entradas. Una matriz muchos-a-uno se
+resuelve con un solo Dijkstra inverso desde el destino.
+"""
+import heapq
+import json
+import logging
+import math
+import re
+import threading
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from apps.core.services.incremental_eta import _haversine_m
+
+logger = logging.getLogger(__name__)
+
+# km/h por clase de vía OSM cuando el tramo no declara maxspeed
+VELOCIDADES_KMH = {
+    'motorway': 100, 'motorway_link': 50,
+    'trunk': 80, 'trunk_link': 40,
+    'primary': 60, 'primary_link': 40,
+    'secondary': 50, 'secondary_link': 35,
+    'tertiary': 40, 'tertiary_link': 30,
+    'unclassified': 35, 'residential': 30, 'living_street': 10, 'service': 20,
+}
+VELOCIDAD_DEFAULT_KMH = 30
+CELDA_GRADOS = 0.01
+METROS_POR_GRADO = 111320.0
+_NUMERO = re.compile(r'\d+(?:\.\d+)?')
+
+
+def _error(mensaje):
+    return {'success': False, 'error': mensaje}
+
+
+class GrafoVial:
+    """Grafo dirigido de nodos (lat, lng) con arcos (destino, segundos, metros)."""
+
+    def __init__(self, truck_max_kmh=None):
+        self.truck_max_kmh = truck_max_kmh
+        self.coords = []
+        self.salida = []
+        self.entrada = []
+        self._nodos = {}
+        self._celdas = defaultdict(list)
+        self.vmax_ms = 0.0
+        self.arcos = 0
+
+    @classmethod
+    def desde_geojson(cls, data, truck_max_kmh=None) -> 'GrafoVial':
+        grafo = cls(truck_max_kmh=truck_max_kmh)
+        for feature in data.get('features', []):
+            geometry = feature.get('geometry') or {}
+            props = feature.get('properties') or {}
+            if geometry.get('type') == 'LineString':
+                lineas = [geometry.get('coordinates') or []]
+            elif geometry.get('type') == 'MultiLineString':
+                lineas = geometry.get('coordinates') or []
+            else:
+                continue
+            kmh = cls.velocidad_tramo(props)
+            sentido = cls.sentido_tramo(props)
+            for linea in lineas:
+                grafo.agregar_tramo([(lat, lng) for lng, lat, *_ in linea], kmh, sentido)
+        return grafo
+
+    @classmethod
+    def cargar(cls, path, truck_max_kmh=None) -> 'GrafoVial':
+        with open(path, encoding='utf-8') as handle:
+            return cls.desde_geojson(json.load(handle), truck_max_kmh=truck_max_kmh)
+
+    @staticmethod
+    def velocidad_tramo(props) -> float:
+        maxspeed = _NUMERO.match(str(props.get('maxspeed') or ''))
+        if maxspeed:
+            return float(maxspeed.group())
+        return VELOCIDADES_KMH.get(props.get('highway'), VELOCIDAD_DEFAULT_KMH)
+
+    @staticmethod
+    def sentido_tramo(props) -> int:
+        """1 sólo en el sentido de la geometría, -1 sólo en contra, 0 ambos."""
+        oneway = str(props.get('oneway') or '').lower()
+        if oneway in ('yes', 'true', '1'):
+            return 1
+        if oneway == '-1':
+            return -1
+        return 0
+
+    def nodo(self, lat, lng) -> int:
+        clave = (round(float(lat), 6), round(float(lng), 6))
+        indice = self._nodos.get(clave)
+        if indice is None:
+            indice = len(self.coords)
+            self._nodos[clave] = indice
+            self.coords.append(clave)
+            self.salida.append([])
+            self.entrada.append([])
+            self._celdas[self._celda(*clave)].append(indice)
+        return indice
+
+    @staticmethod
+    def _celda(lat, lng):
+        return math.floor(lat / CELDA_GRADOS), math.floor(lng / CELDA_GRADOS)
+
+    def agregar_tramo(self, puntos, kmh, sentido=0):
+        if self.truck_max_kmh:
+            kmh = min(kmh, self.truck_max_kmh)
+        velocidad_ms = max(kmh, 1) / 3.6
+        self.vmax_ms = max(self.vmax_ms, velocidad_ms)
+        nodos = [self.nodo(lat, lng) for lat, lng in puntos]
+        for a, b in zip(nodos, nodos[1:]):
+            if a == b:
+                continue
+            metros = _haversine_m(*self.coords[a], *self.coords[b])
+            segundos = metros / velocidad_ms
+            if sentido >= 0:
+                self._arco(a, b, segundos, metros)
+            if sentido <= 0:
+                self._arco(b, a, segundos, metros)
+
+    def _arco(self, a, b, segundos, metros):
+        self.salida[a].append((b, segundos, metros))
+        self.entrada[b].append((a, segundos, metros))
+        self.arcos += 1
+
+    def mas_cercano(self, lat, lng, max_m):
+        """(nodo, metros) más cercano a (lat, lng) dentro de max_m, o None."""
+        lat, lng = float(lat), float(lng)
+        fila, columna = self._celda(lat, lng)
+        # Lado mínimo de una celda en metros (el ancho se achica con la latitud)
+        lado_m = CELDA_GRADOS * METROS_POR_GRADO * max(math.cos(math.radians(abs(lat) + CELDA_GRADOS)), 0.01)
+        mejor = None
+        for anillo in range(int(max_m // lado_m) + 2):
+            # Los nodos de este anillo en adelante están a más de (anillo - 1) celdas completas
+            if mejor is not None and mejor[1] <= (anillo - 1) * lado_m:
+                break
+            for df in range(-anillo, anillo + 1):
+                for dc in range(-anillo, anillo + 1):
+                    if max(abs(df), abs(dc)) != anillo:
+                        continue
+                    for indice in self._celdas.get((fila + df, columna + dc), ()):
+                        metros = _haversine_m(lat, lng, *self.coords[indice])
+                        if mejor is None or metros < mejor[1]:
+                            mejor = (indice, metros)
+        if mejor is None or mejor[1] > max_m:
+            return None
+        return mejor
+
+    def a_estrella(self, origen, destino):
+        """(segundos, metros, [nodos]) del camino más rápido, o None si no hay."""
+        if origen == destino:
+            return 0.0, 0.0, [origen]
+        destino_coords = self.coords[destino]
+        vmax = self.vmax_ms or 1.0
+
+        def h(nodo):
+            return _haversine_m(*self.coords[nodo], *destino_coords) / vmax
+
+        costo = {origen: 0.0}
+        metros = {origen: 0.0}
+        previo = {}
+        cerrados = set()
+        abiertos = [(h(origen), origen)]
+        while abiertos:
+            _, nodo = heapq.heappop(abiertos)
+            if nodo in cerrados:
+                continue
+            if nodo == destino:
+                camino = [nodo]
+                while camino[-1] in previo:
+                    camino.append(previo[camino[-1]])
+                return costo[nodo], metros[nodo], camino[::-1]
+            cerrados.add(nodo)
+            for vecino, segundos, largo in self.salida[nodo]:
+                nuevo = costo[nodo] + segundos
+                if vecino not in cerrados and nuevo < costo.get(vecino, math.inf):
+                    costo[vecino] = nuevo
+                    metros[vecino] = metros[nodo] + largo
+                    previo[vecino] = nodo
+                    heapq.heappush(abiertos, (nuevo + h(vecino), vecino))
+        return None
+
+    def dijkstra_hacia(self, destino, objetivos):
+        """{nodo: (segundos, metros)} hacia `destino` para cada nodo de `objetivos` alcanzable."""
+        pendientes = set(objetivos)
+        costo = {destino: 0.0}
+        metros = {destino: 0.0}
+        resultado = {}
+        cerrados = set()
+        abiertos = [(0.0, destino)]
+        while abiertos and pendientes:
+            actual, nodo = heapq.heappop(abiertos)
+            if nodo in cerrados:
+                continue
+            cerrados.add(nodo)
+            if nodo in pendientes:
+                pendientes.discard(nodo)
+                resultado[nodo] = (actual, metros[nodo])
+            for previo, segundos, largo in self.entrada[nodo]:
+                nuevo = actual + segundos
+                if previo not in cerrados and nuevo < costo.get(previo, math.inf):
+                    costo[previo] = nuevo
+                    metros[previo] = metros[nodo] + largo
+                    heapq.heappush(abiertos, (nuevo, previo))
+        return resultado
+
+
+class RoutingBackend:
+    """Interfaz de un backend: `ruta` y `matriz_hacia` con el formato de MapboxService."""
+    nombre = ''
+
+    @classmethod
+    def clave_configuracion(cls):
+        """Cambia cuando la configuración del backend cambia (instancia nueva)."""
+        return ''
+
+    def ruta(self, origen_lng, origen_lat, destino_lng, destino_lat, profile):
+        raise NotImplementedError
+
+    def matriz_hacia(self, origenes, destino_lng, destino_lat, profile):
+        """Una celda por origen (lng, lat); por defecto, una ruta por par."""
+        celdas = []
+        for lng, lat in origenes:
+            resultado = self.ruta(lng, lat, destino_lng, destino_lat, profile)
+            if resultado.get('success'):
+                resultado = {k: resultado[k] for k in ('success', 'duration_minutes', 'distance_km')}
+            celdas.append(resultado)
+        return celdas
+
+
+class MapboxBackend(RoutingBackend):
+    nombre = 'mapbox'
+
+    def ruta(self, origen_lng, origen_lat, destino_lng, destino_lat, profile):
+        from apps.core.services.mapbox import MapboxService
+
+        if not MapboxService.API_KEY:
+            return _error('MAPBOX_API_KEY no configurada')
+        return MapboxService._solicitar_ruta(origen_lng, origen_lat, destino_lng, destino_lat, profile)
+
+    def matriz_hacia(self, origenes, destino_lng, destino_lat, profile):
+        from apps.core.services.mapbox import MapboxService
+
+        por_solicitud = MapboxService.matriz_max_coordenadas(profile) - 1
+        celdas = []
+        for inicio in range(0, len(origenes), por_solicitud):
+            celdas.extend(MapboxService._solicitar_matriz(
+                origenes[inicio:inicio + por_solicitud], destino_lng, destino_lat, profile,
+            ))
+        return celdas
+
+
+class OfflineBackend(RoutingBackend):
+    nombre = 'offline'
+
+    _grafos = {}
+    _grafos_lock = threading.Lock()
+
+    def __init__(self, grafo=None):
+        self._grafo = grafo
+        self._lock = threading.Lock()
+        self._caminos = OrderedDict()
+
+    @staticmethod
+    def graph_path() -> str:
+        return str(getattr(settings, 'ROUTING_GRAPH_PATH', '') or '')
+
+    @staticmethod
+    def max_snap_m() -> float:
+        return float(getattr(settings, 'ROUTING_MAX_SNAP_M', 3000))
+
+    @staticmethod
+    def access_speed_kmh() -> float:
+        return float(getattr(settings, 'ROUTING_ACCESS_SPEED_KMH', 30))
+
+    @staticmethod
+    def cache_size() -> int:
+        return int(getattr(settings, 'ROUTING_CACHE_SIZE', 2048))
+
+    @staticmethod
+    def truck_max_kmh() -> float:
+        return float(getattr(settings, 'ROUTING_TRUCK_MAX_KMH', 90))
+
+    @classmethod
+    def clave_configuracion(cls):
+        return (cls.graph_path(), cls.truck_max_kmh())
+
+    @classmethod
+    def grafo_configurado(cls):
+        """Grafo de ROUTING_GRAPH_PATH, cargado una vez por proceso; None si no hay."""
+        path = cls.graph_path()
+        if not path:
+            return None
+        clave = cls.clave_configuracion()
+        with cls._grafos_lock:
+            if clave not in cls._grafos:
+                try:
+                    grafo = GrafoVial.cargar(path, truck_max_kmh=cls.truck_max_kmh())
+                    logger.info(f"Grafo vial {path}: {len(grafo.coords)} nodos, {grafo.arcos} arcos")
+                except (OSError, ValueError) as exc:
+                    logger.error(f"No se pudo cargar el grafo vial {path}: {exc}")
+                    grafo = None
+                cls._grafos[clave] = grafo
+            return cls._grafos[clave]
+
+    @property
+    def grafo(self):
+        return self._grafo if self._grafo is not None else self.grafo_configurado()
+
+    def _camino(self, grafo, origen, destino):
+        clave = (origen, destino)
+        with self._lock:
+            if clave in self._caminos:
+                self._caminos.move_to_end(clave)
+                return self._caminos[clave]
+        camino = grafo.a_estrella(origen, destino)
+        with self._lock:
+            self._caminos[clave] = camino
+            while len(self._caminos) > self.cache_size():
+                self._caminos.popitem(last=False)
+        return camino
+
+    def _acceso_segundos(self, metros):
+        return metros / (self.access_speed_kmh() / 3.6)
+
+    def ruta(self, origen_lng, origen_lat, destino_lng, destino_lat, profile):
+        from apps.core.services.mapbox import MapboxService
+
+        grafo = self.grafo
+        if grafo is None:
+            return _error('Grafo vial no configurado')
+        inicio = grafo.mas_cercano(origen_lat, origen_lng, self.max_snap_m())
+        fin = grafo.mas_cercano(destino_lat, destino_lng, self.max_snap_m())
+        if inicio is None or fin is None:
+            return _error('Punto fuera de la cobertura del grafo vial')
+        camino = self._camino(grafo, inicio[0], fin[0])
+        if camino is None:
+            return _error('Sin ruta en el grafo vial')
+        segundos, metros, nodos = camino
+        acceso = inicio[1] + fin[1]
+        coordinates = [[float(origen_lng), float(origen_lat)]]
+        coordinates += [[grafo.coords[n][1], grafo.coords[n][0]] for n in nodos]
+        coordinates.append([float(destino_lng), float(destino_lat)])
+        geometry = {'type': 'LineString', 'coordinates': coordinates}
+        return {
+            'success': True,
+            'duration_minutes': round((segundos + self._acceso_segundos(acceso)) / 60, 2),
+            'distance_km': round((metros + acceso) / 1000, 2),
+            'geometry': geometry,
+            'route_signature': MapboxService.firma_ruta(geometry),
+        }
+
+    def matriz_hacia(self, origenes, destino_lng, destino_lat, profile):
+        grafo = self.grafo
+        if grafo is None:
+            return [_error('Grafo vial no configurado')] * len(origenes)
+        fin = grafo.mas_cercano(destino_lat, destino_lng, self.max_snap_m())
+        if fin is None:
+            return [_error('Punto fuera de la cobertura del grafo vial')] * len(origenes)
+        inicios = [grafo.mas_cercano(lat, lng, self.max_snap_m()) for lng, lat in origenes]
+        alcanzados = grafo.dijkstra_hacia(fin[0], {inicio[0] for inicio in inicios if inicio})
+        celdas = []
+        for inicio in inicios:
+            if inicio is None or inicio[0] not in alcanzados:
+                celdas.append(_error('Sin ruta en el grafo vial'))
+                continue
+            segundos, metros = alcanzados[inicio[0]]
+            acceso = inicio[1] + fin[1]
+            celdas.append({
+                'success': True,
+                'duration_minutes': round((segundos + self._acceso_segundos(acceso)) / 60, 2),
+                'distance_km': round((metros + acceso) / 1000, 2),
+            })
+        return celdas
+
+
+BACKENDS = {
+    'mapbox': MapboxBackend,
+    'offline': OfflineBackend,
+}
+
+_instancias = {}
+_instancias_lock = threading.Lock()
+
+
+def backends():
+    """Instancias de ROUTING_BACKENDS, en orden de preferencia."""
+    nombres = getattr(settings, 'ROUTING_BACKENDS', ('mapbox', 'offline'))
+    if isinstance(nombres, str):
+        nombres = [nombre.strip() for nombre in nombres.split(',') if nombre.strip()]
+    resultado = []
+    with _instancias_lock:
+        for nombre in nombres:
+            try:
+                clase = BACKENDS.get(nombre) or import_string(nombre)
+            except ImportError as exc:
+                raise ImproperlyConfigured(f"Backend de ruteo desconocido: {nombre}") from exc
+            clave = (nombre, clase.clave_configuracion())
+            if clave not in _instancias:
+                _instancias[clave] = clase()
+            resultado.append(_instancias[clave])
+    return resultado
+
+
+def solicitar_ruta(origen_lng, origen_lat, destino_lng, destino_lat, profile):
+    """Ruta del primer backend que la resuelve; 'backend' indica cuál."""
+    errores = []
+    for backend in backends():
+        resultado = backend.ruta(origen_lng, origen_lat, destino_lng, destino_lat, profile)
+        if resultado.get('success'):
+            return {**resultado, 'backend': backend.nombre}
+        errores.append(f"{backend.nombre}: {resultado.get('error')}")
+    return _error('; '.join(errores) or 'Sin backends de ruteo configurados')
+
+
+def solicitar_matriz(origenes, destino_lng, destino_lat, profile):
+    """Una celda por origen; cada backend resuelve los orígenes que los anteriores no pudieron."""
+    celdas = [_error('Sin backends de ruteo configurados')] * len(origenes)
+    pendientes = list(range(len(origenes)))
+    for backend in backends():
+        if not pendientes:
+            break
+        resueltas = backend.matriz_hacia([origenes[i] for i in pendientes], destino_lng, destino_lat, profile)
+        siguientes = []
+        for indice, celda in zip(pendientes, resueltas):
+            if celda.get('success'):
+                celdas[indice] = {**celda, 'backend': backend.nombre}
+            else:
+                celdas[indice] = celda
+                siguientes.append(indice)
+        pendientes = siguientes
+    return celdas
@@ -0,0 +1,139 @@
+"""
+Contexto compartido para puntuar varios conductores contra una misma programación.
+
+Todo lo que depende sólo de la programación (pesos dinámicos, casos similares,
+historial del carrier, estado de flota, históricos de tiempos) se carga una vez;
+lo que depende del conductor se obtiene en bloque (perfiles, conflictos activos,
+tiempos de viaje al CD con una sola matriz de MatrixETAService).
+"""
+from dataclasses import dataclass, field
+from datetime import timedelta
+from decimal import Decimal
+
+from django.utils import timezone
+
+from apps.core.services.anomaly_detector import AnomalyDetector, ETAEstimator
+from apps.core.services.contextual_reasoning import ContextualReasoningService
+from apps.core.services.fleet import FleetStatusService
+from apps.core.services.learning_engine import OperationalLearningEngine
+from apps.core.services.matrix_eta import MatrixETAService
+from apps.programaciones.models import Programacion, TiempoOperacion, TiempoViaje
+
+
+@dataclass
+class ScoringContext:
+    programacion: Programacion
+    weights: dict
+    similar_cases: list
+    confidence: float
+    similar_boost: float
+    carrier_history_count: int
+    carrier_incidents: int
+    fleet_at_limit: bool
+    travel_history: list
+    operation_history: list
+    profiles: dict = field(default_factory=dict)
+    conflict_driver_ids: set = field(default_factory=set)
+    travel_base: dict = field(default_factory=dict)
+    _eta_cache: dict = field(default_factory=dict, repr=False)
+
+    # Mismas ventanas que TiempoViaje/TiempoOperacion.obtener_tiempo_aprendido
+    TRAVEL_HISTORY_DAYS = 60
+    OPERATION_HISTORY_DAYS = 30
+    DESTINATION_RADIUS = Decimal('0.009')
+
+    @classmethod
+    def load(cls, programacion: Programacion, drivers, base_weights: dict) -> 'ScoringContext':
+        drivers = list(drivers)
+        now = timezone.now()
+        similar_cases = ContextualReasoningService.similar_cases(programacion, top_n=5)
+        similar_boost = (
+            sum(c.similarity for c in similar_cases) / len(similar_cases) if similar_cases else 0.0
+        )
+        travel_history = cls._load_travel_history(programacion, now)
+        return cls(
+            programacion=programacion,
+            weights=ContextualReasoningService.dynamic_weights(base_weights, programacion),
+            similar_cases=similar_cases,
+            confidence=ContextualReasoningService.confidence(similar_cases),
+            similar_boost=similar_boost,
+            carrier_history_count=AnomalyDetector.carrier_history_count(programacion),
+            carrier_incidents=AnomalyDetector.carrier_incident_count(programacion, now),
+            fleet_at_limit=FleetStatusService.is_fleet_at_limit(),
+            travel_history=travel_history,
+            operation_history=cls._load_operation_history(programacion, now),
+            profiles=OperationalLearningEngine.driver_profiles(drivers) if drivers else {},
+            conflict_driver_ids=AnomalyDetector.active_conflict_driver_ids(
+                programacion, [d.pk for d in drivers]
+            ) if drivers else set(),
+            travel_base=cls._load_travel_base(programacion, drivers, travel_history),
+        )
+
+    @classmethod
+    def _load_travel_base(cls, programacion, drivers, travel_history) -> dict:
+        """{driver_id: ruta base} de todos los candidatos hacia el CD en una matriz."""
+        if not drivers or not programacion.cd or not MatrixETAService.enabled():
+            return {}
+        origenes = {}
+        for driver in drivers:
+            origen = ETAEstimator.origin_coords(programacion, driver)
+            if origen:
+                origenes[driver.id] = origen
+        return MatrixETAService.tiempos_base(
+            origenes, (programacion.cd.lat, programacion.cd.lng), historial=travel_history,
+        )
+
+    @classmethod
+    def _load_travel_history(cls, programacion, now) -> list:
+        cd = programacion.cd
+        if not cd:
+            return []
+        lat, lng = Decimal(str(cd.lat)), Decimal(str(cd.lng))
+        return list(TiempoViaje.objects.filter(
+            destino_lat__gte=lat - cls.DESTINATION_RADIUS,
+            destino_lat__lte=lat + cls.DESTINATION_RADIUS,
+            destino_lon__gte=lng - cls.DESTINATION_RADIUS,
+            destino_lon__lte=lng + cls.DESTINATION_RADIUS,
+            anomalia=False,
+            fecha__gte=(now - timedelta(days=cls.TRAVEL_HISTORY_DAYS)).date(),
+        ))
+
+    @classmethod
+    def _load_operation_history(cls, programacion, now) -> list:
+        if not programacion.cd_id:
+            return []
+        return list(TiempoOperacion.objects.filter(
+            cd_id=programacion.cd_id,
+            anomalia=False,
+            fecha__gte=(now - timedelta(days=cls.OPERATION_HISTORY_DAYS)).date(),
+        ))
+
+    def driver_profile(self, driver):
+        profile = self.profiles.get(driver.id)
+        if profile is None:
+            profile = OperationalLearningEngine.driver_profile(driver)
+            self.profiles[driver.id] = profile
+        return profile
+
+    def has_conflict(self, driver) -> bool:
+        return driver.id in self.conflict_driver_ids
+
+    def eta_minutes(self, driver) -> int:
+        if driver.id not in self._eta_cache:
+            self._eta_cache[driver.id] = ETAEstimator.estimate_minutes(
+                self.programacion, driver,
+                historial_viaje=self.travel_history,
+                historial_operacion=self.operation_history,
+                ruta_base=self.travel_base.get(driver.id),
+            )
+        return self._eta_cache[driver.id]
+
+    def anomalies(self, driver) -> list[dict]:
+        return AnomalyDetector.detect(
+            self.programacion, driver,
+            has_conflict=self.has_conflict(driver),
+            eta_min=self.eta_minutes(driver),
+            carrier_history_count=self.carrier_history_count,
+            carrier_incidents=self.carrier_incidents,
+            fleet_at_limit=self.fleet_at_limit,
+        )
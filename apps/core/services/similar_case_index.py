@@ -0,0 +1,175 @@
+"""
+Índice precalculado de casos similares.
+
+La similitud de ContextualReasoningService sólo depende de CD, tipo de
+contenedor, vendor, urgencia y cliente, así que los casos cerrados se agrupan
+por esa combinación en CasoSimilarIndice (conteo de resultados + casos más
+recientes). Responder similar_cases lee los grupos del mismo CD y tipo (por el
+prefijo de la restricción única); sólo si no reúnen top_n casos amplía a los
+grupos del mismo tipo en otros CD. No recorre el historial ni hace joins.
+
+El grupo de una programación se recalcula cuando su contenedor entra o sale
+de un estado final, o cuando se edita un campo del índice de una programación
+cerrada; `manage.py rebuild_similar_case_index` lo reconstruye completo (p. ej.
+si se editó el tipo o el vendor de un contenedor ya cerrado).
+"""
+import logging
+
+from django.db.models import Count, Q
+
+from apps.programaciones.models import CasoSimilarIndice, Programacion
+
+logger = logging.getLogger(__name__)
+
+# Estados finales que indican que una operación ha concluido
+FINAL_STATES = ('entregado', 'descargado', 'devuelto', 'incidente', 'cancelado')
+# Estados posteriores a la entrega: un caso puede entrar o salir del índice al pasar por ellos
+POST_DELIVERY_STATES = FINAL_STATES + ('soltado', 'vacio', 'vacio_en_ruta', 'en_ccti')
+
+RESULTADOS = ('ENTREGADO', 'PARCIAL', 'FALLIDO')
+CONTAINER_OUTCOMES = {
+    'entregado': 'ENTREGADO',
+    'descargado': 'ENTREGADO',
+    'devuelto': 'ENTREGADO',
+    'incidente': 'FALLIDO',
+    'cancelado': 'FALLIDO',
+}
+
+# Ponderaciones de similitud (ContextualReasoningService.similar_cases)
+PESO_CD = 0.35
+PESO_TIPO = 0.25
+PESO_VENDOR = 0.15
+PESO_URGENCIA = 0.15
+PESO_CLIENTE = 0.10
+
+
+def _outcome(estado_final, container_estado):
+    if estado_final in RESULTADOS:
+        return estado_final
+    return CONTAINER_OUTCOMES.get(container_estado, 'DESCONOCIDO')
+
+
+class SimilarCaseIndex:
+    @staticmethod
+    def group_key(programacion):
+        container = programacion.container
+        return (
+            programacion.cd_id,
+            container.tipo or '',
+            container.vendor or '',
+            programacion.urgencia_servicio or '',
+            programacion.cliente or '',
+        )
+
+    @staticmethod
+    def _group_queryset(key):
+        cd_id, tipo, vendor, urgencia, cliente = key
+        vendor_q = Q(container__vendor=vendor) if vendor else Q(container__vendor__isnull=True) | Q(container__vendor='')
+        return Programacion.objects.filter(
+            vendor_q,
+            cd_id=cd_id,
+            container__tipo=tipo,
+            urgencia_servicio=urgencia,
+            cliente=cliente,
+            container__estado__in=FINAL_STATES,
+        )
+
+    @classmethod
+    def refresh_group(cls, key):
+        """Recalcula conteos y casos recientes de un grupo (o lo elimina si quedó vacío)."""
+        cd_id, tipo, vendor, urgencia, cliente = key
+        if not cd_id:
+            return None
+        qs = cls._group_queryset(key)
+        sin_resultado = ~Q(estado_final__in=RESULTADOS)
+        entregado = Q(estado_final='ENTREGADO') | (sin_resultado & Q(container__estado__in=['entregado', 'descargado', 'devuelto']))
+        fallido = Q(estado_final='FALLIDO') | (sin_resultado & Q(container__estado__in=['incidente', 'cancelado']))
+        tallies = qs.aggregate(
+            total=Count('id'),
+            entregados=Count('id', filter=entregado),
+            parciales=Count('id', filter=Q(estado_final='PARCIAL')),
+            fallidos=Count('id', filter=fallido),
+        )
+        lookup = dict(cd_id=cd_id, tipo=tipo, vendor=vendor, urgencia=urgencia, cliente=cliente)
+        if not tallies['total']:
+            CasoSimilarIndice.objects.filter(**lookup).delete()
+            return None
+
+        recientes = [
+            [pk, fecha.isoformat(), _outcome(estado_final, container_estado)]
+            for pk, fecha, estado_final, container_estado in qs.order_by('-fecha_programada', '-pk').values_list(
+                'pk', 'fecha_programada', 'estado_final', 'container__estado'
+            )[:CasoSimilarIndice.CASOS_RECIENTES]
+        ]
+        grupo, _ = CasoSimilarIndice.objects.update_or_create(
+            **lookup,
+            defaults={
+                **tallies,
+                'casos_recientes': recientes,
+                'ultima_fecha': qs.order_by('-fecha_programada').values_list('fecha_programada', flat=True).first(),
+            },
+        )
+        return grupo
+
+    @classmethod
+    def refresh_for(cls, programacion):
+        try:
+            return cls.refresh_group(cls.group_key(programacion))
+        except Exception as e:
+            # El índice es derivado: un fallo no debe interrumpir el cambio de estado.
+            logger.error(f"No se pudo actualizar el índice de casos similares ({programacion.pk}): {e}")
+            return None
+
+    @classmethod
+    def rebuild(cls):
+        """Reconstruye el índice completo desde el historial; retorna la cantidad de grupos."""
+        CasoSimilarIndice.objects.all().delete()
+        keys = set(
+            Programacion.objects.filter(container__estado__in=FINAL_STATES).values_list(
+                'cd_id', 'container__tipo', 'container__vendor', 'urgencia_servicio', 'cliente'
+            )
+        )
+        normalized = {
+            (cd_id, tipo or '', vendor or '', urgencia or '', cliente or '')
+            for cd_id, tipo, vendor, urgencia, cliente in keys
+        }
+        for key in normalized:
+            cls.refresh_group(key)
+        return len(normalized)
+
+    @staticmethod
+    def similarity(grupo, cd_id, tipo, vendor, urgencia, cliente):
+        sim = 0.0
+        if grupo.cd_id == cd_id:
+            sim += PESO_CD
+        if grupo.tipo == tipo:
+            sim += PESO_TIPO
+        if grupo.vendor and grupo.vendor == vendor:
+            sim += PESO_VENDOR
+        if grupo.urgencia == urgencia:
+            sim += PESO_URGENCIA
+        if grupo.cliente == cliente:
+            sim += PESO_CLIENTE
+        return round(sim, 3)
+
+    @classmethod
+    def top_cases(cls, programacion, top_n=5):
+        """[(programacion_id, similitud, resultado)] más similares; empates por fecha más reciente."""
+        cd_id, tipo, vendor, urgencia, cliente = cls.group_key(programacion)
+        grupos = CasoSimilarIndice.objects.filter(tipo=tipo).only(
+            'cd_id', 'tipo', 'vendor', 'urgencia', 'cliente', 'casos_recientes'
+        )
+
+        def puntuar(candidatos):
+            return [
+                (cls.similarity(grupo, cd_id, tipo, vendor, urgencia, cliente), fecha, pk, outcome)
+                for grupo in candidatos
+                for pk, fecha, outcome in grupo.casos_recientes
+                if pk != programacion.pk and outcome != 'DESCONOCIDO'
+            ]
+
+        scored = puntuar(grupos.filter(cd_id=cd_id))
+        if len(scored) < top_n:
+            scored += puntuar(grupos.exclude(cd_id=cd_id))
+        scored.sort(key=lambda case: (case[0], case[1], case[2]), reverse=True)
+        return [(pk, sim, outcome) for sim, _, pk, outcome in scored[:top_n]]
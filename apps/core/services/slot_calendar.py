@@ -0,0 +1,201 @@
+"""
+Calendario de cupos e histograma de duraciones por CD.
+
+CargaSlotCD cuenta las programaciones activas (contenedor no cancelado ni
+devuelto) por bloques de GRANULARIDAD_MIN minutos alineados en UTC; la carga
+de un slot es la suma de sus bloques. HistogramaDuracionCD guarda las
+duraciones reales de operación por día de la semana y hora local de inicio.
+
+Ambos se recalculan por bloque/celda al crear, mover o cancelar una
+programación (también al reactivar un contenedor cancelado o devuelto) y al
+registrar tiempos de operación, así que las recomendaciones
+de cualquier rango de fechas salen de dos lecturas indexadas.
+`manage.py rebuild_slot_calendar` los reconstruye completos.
+"""
+import bisect
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.utils import timezone
+
+from apps.programaciones.models import CargaSlotCD, HistogramaDuracionCD, Programacion, TiempoOperacion
+
+logger = logging.getLogger(__name__)
+
+GRANULARIDAD_MIN = 5
+ESTADOS_SIN_CARGA = ('cancelado', 'devuelto')
+HISTORY_DAYS = 120
+
+
+def bloque(fecha):
+    """Inicio (UTC) del bloque que contiene `fecha`."""
+    segundos = GRANULARIDAD_MIN * 60
+    ts = int(fecha.timestamp())
+    return datetime.fromtimestamp(ts - ts % segundos, tz=dt_timezone.utc)
+
+
+def alineado(fecha):
+    return fecha.timestamp() % (GRANULARIDAD_MIN * 60) == 0
+
+
+def _celda(hora_inicio):
+    local = timezone.localtime(hora_inicio)
+    return local.weekday(), local.hour
+
+
+class CargaCalendario:
+    """Cargas de un rango ordenadas por inicio, con sumas acumuladas para consultar slots."""
+
+    def __init__(self, entradas):
+        entradas = sorted(entradas)
+        self.inicios = [inicio for inicio, _ in entradas]
+        self.acumulado = [0]
+        for _, carga in entradas:
+            self.acumulado.append(self.acumulado[-1] + carga)
+
+    def carga(self, inicio, fin):
+        desde = bisect.bisect_left(self.inicios, inicio)
+        hasta = bisect.bisect_left(self.inicios, fin)
+        return self.acumulado[hasta] - self.acumulado[desde]
+
+
+class SlotCalendarService:
+    # --- Calendario de carga ---
+
+    @staticmethod
+    def _programaciones_activas(cd_id, desde, hasta):
+        return (
+            Programacion.objects.filter(cd_id=cd_id, fecha_programada__gte=desde, fecha_programada__lt=hasta)
+            .exclude(container__estado__in=ESTADOS_SIN_CARGA)
+            .values_list('fecha_programada', flat=True)
+        )
+
+    @classmethod
+    def recalcular_bloques(cls, cd_id, bloques):
+        """Recalcula la carga de los bloques dados de un CD desde las programaciones."""
+        bloques = set(bloques)
+        if not cd_id or not bloques:
+            return
+        conteo = defaultdict(int)
+        desde, hasta = min(bloques), max(bloques) + timedelta(minutes=GRANULARIDAD_MIN)
+        for fecha in cls._programaciones_activas(cd_id, desde, hasta):
+            conteo[bloque(fecha)] += 1
+        con_carga = [CargaSlotCD(cd_id=cd_id, inicio=b, carga=conteo[b]) for b in bloques if conteo.get(b)]
+        with transaction.atomic():
+            CargaSlotCD.objects.filter(cd_id=cd_id, inicio__in=[b for b in bloques if not conteo.get(b)]).delete()
+            if con_carga:
+                CargaSlotCD.objects.bulk_create(
+                    con_carga, update_conflicts=True, unique_fields=['cd', 'inicio'], update_fields=['carga'],
+                )
+
+    @classmethod
+    def actualizar_programaciones(cls, programaciones):
+        """Recalcula los bloques actuales y anteriores (si se movieron) de las programaciones."""
+        por_cd = defaultdict(set)
+        for programacion in programaciones:
+            if programacion.cd_id and programacion.fecha_programada:
+                por_cd[programacion.cd_id].add(bloque(programacion.fecha_programada))
+            cd_original, fecha_original = getattr(programacion, '_slot_original', (None, None))
+            if cd_original and fecha_original:
+                por_cd[cd_original].add(bloque(fecha_original))
+        try:
+            for cd_id, bloques in por_cd.items():
+                cls.recalcular_bloques(cd_id, bloques)
+        except Exception as e:
+            # El calendario es derivado: no debe impedir guardar la programación
+            logger.error(f"No se pudo actualizar el calendario de cupos: {e}")
+            return
+        for programacion in programaciones:
+            programacion._slot_original = (programacion.cd_id, programacion.fecha_programada)
+
+    @staticmethod
+    def calendario(cd, desde, hasta, duracion_slot_min=GRANULARIDAD_MIN):
+        """
+        CargaCalendario del CD entre `desde` y `hasta` (una consulta). Los
+        bloques sólo sirven si cada slot empieza en un borde de bloque: `desde`
+        alineado y una duración múltiplo de GRANULARIDAD_MIN.
+        """
+        if alineado(desde) and duracion_slot_min % GRANULARIDAD_MIN == 0:
+            filas = CargaSlotCD.objects.filter(cd=cd, inicio__gte=desde, inicio__lt=hasta).values_list('inicio', 'carga')
+            return CargaCalendario(filas)
+        # Slots no alineados a los bloques: se cuentan las programaciones directamente
+        fechas = SlotCalendarService._programaciones_activas(cd.pk, desde, hasta)
+        return CargaCalendario((fecha, 1) for fecha in fechas)
+
+    # --- Histograma de duraciones ---
+
+    @staticmethod
+    def recalcular_celda(cd_id, dia_semana, hora):
+        corte = timezone.now() - timedelta(days=HISTORY_DAYS)
+        muestras = [
+            [inicio.isoformat(), minutos]
+            for inicio, minutos in TiempoOperacion.objects.filter(
+                cd_id=cd_id, anomalia=False, tiempo_real_min__gt=0, hora_inicio__gte=corte,
+                hora_inicio__iso_week_day=dia_semana + 1, hora_inicio__hour=hora,
+            ).order_by('hora_inicio').values_list('hora_inicio', 'tiempo_real_min')
+        ]
+        lookup = dict(cd_id=cd_id, dia_semana=dia_semana, hora=hora)
+        if muestras:
+            HistogramaDuracionCD.objects.update_or_create(**lookup, defaults={'muestras': muestras})
+        else:
+            HistogramaDuracionCD.objects.filter(**lookup).delete()
+
+    @classmethod
+    def actualizar_tiempo(cls, tiempo):
+        try:
+            cls.recalcular_celda(tiempo.cd_id, *_celda(tiempo.hora_inicio))
+        except Exception as e:
+            logger.error(f"No se pudo actualizar el histograma de duraciones: {e}")
+
+    @staticmethod
+    def duraciones(cd):
+        """{(día semana, hora): [(hora_inicio, minutos)]} de la ventana vigente (una consulta)."""
+        corte = timezone.now() - timedelta(days=HISTORY_DAYS)
+        celdas = {}
+        for fila in HistogramaDuracionCD.objects.filter(cd=cd):
+            muestras = [
+                (inicio, minutos) for inicio, minutos in (
+                    (datetime.fromisoformat(iso), minutos) for iso, minutos in fila.muestras
+                ) if inicio >= corte
+            ]
+            if muestras:
+                celdas[(fila.dia_semana, fila.hora)] = muestras
+        return celdas
+
+    # --- Reconstrucción ---
+
+    @classmethod
+    @transaction.atomic
+    def rebuild(cls):
+        """Reconstruye calendario e histograma; retorna (bloques, celdas)."""
+        CargaSlotCD.objects.all().delete()
+        conteo = defaultdict(int)
+        activas = Programacion.objects.exclude(container__estado__in=ESTADOS_SIN_CARGA).values_list(
+            'cd_id', 'fecha_programada'
+        )
+        for cd_id, fecha in activas.iterator(chunk_size=5000):
+            if cd_id:
+                conteo[(cd_id, bloque(fecha))] += 1
+        CargaSlotCD.objects.bulk_create(
+            [CargaSlotCD(cd_id=cd_id, inicio=inicio, carga=n) for (cd_id, inicio), n in conteo.items()],
+            batch_size=1000,
+        )
+
+        HistogramaDuracionCD.objects.all().delete()
+        celdas = defaultdict(list)
+        corte = timezone.now() - timedelta(days=HISTORY_DAYS)
+        tiempos = TiempoOperacion.objects.filter(
+            anomalia=False, tiempo_real_min__gt=0, hora_inicio__gte=corte,
+        ).order_by('hora_inicio').values_list('cd_id', 'hora_inicio', 'tiempo_real_min')
+        for cd_id, inicio, minutos in tiempos.iterator(chunk_size=5000):
+            celdas[(cd_id, *_celda(inicio))].append([inicio.isoformat(), minutos])
+        HistogramaDuracionCD.objects.bulk_create(
+            [
+                HistogramaDuracionCD(cd_id=cd_id, dia_semana=dia, hora=hora, muestras=muestras)
+                for (cd_id, dia, hora), muestras in celdas.items()
+            ],
+            batch_size=500,
+        )
+        return len(conteo), len(celdas)
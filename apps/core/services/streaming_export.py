@@ -0,0 +1,218 @@
+"""
+Exportaciones tabulares en streaming (Excel, CSV y Parquet).
+
+Cada exportación se declara una vez como ExportSpec: queryset base, columnas
+(encabezado, valor, ancho, estilo) y los campos que necesita, que se cargan
+con `.only()` e `.iterator()` para no materializar la tabla completa.
+
+- CSV: StreamingHttpResponse; el primer byte sale con la primera fila.
+- XLSX: hoja write-only de openpyxl con estilos con nombre (uno por tipo de
+  celda, no uno por celda). El zip se arma sobre un archivo temporal que se
+  entrega por bloques, así que la memoria no crece con el número de filas.
+- Parquet: sólo si pyarrow está instalado; se escribe por grupos de filas.
+
+Las especificaciones se registran con `register_export` (ver
+apps.containers.exports) y se obtienen con `get_export`.
+"""
+import codecs
+import csv
+import tempfile
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+FORMATOS = ('xlsx', 'csv', 'parquet')
+CHUNK_SIZE = 2000
+
+
+@dataclass(frozen=True)
+class Column:
+    """
+    Columna exportada.
+
+    `value(obj, fila)` recibe el objeto y el contexto de la fila (`now` más lo
+    que calcule ExportSpec.preparar). `style` es el nombre de un estilo de
+    ExportSpec.styles, o una función `(valor, obj, fila) -> nombre`.
+    """
+    header: str
+    value: Callable[[Any, dict], Any]
+    width: int = 15
+    style: Any = 'celda'
+    tipo: str = 'texto'  # texto | entero | decimal | booleano (esquema Parquet)
+
+
+@dataclass
+class ExportSpec:
+    name: str
+    sheet_title: str
+    filename: str
+    queryset: Callable[[], Any]
+    columns: Sequence[Column]
+    only: Tuple[str, ...] = ()
+    preparar: Optional[Callable[[Any, datetime], dict]] = None
+    styles: Dict[str, dict] = field(default_factory=dict)
+
+    def rows(self, queryset=None):
+        """Genera (obj, fila, valores) con un único `now` para toda la exportación."""
+        qs = self.queryset() if queryset is None else queryset
+        if self.only:
+            qs = qs.only(*self.only)
+        now = timezone.now()
+        for obj in qs.iterator(chunk_size=CHUNK_SIZE):
+            fila = {'now': now}
+            if self.preparar:
+                fila.update(self.preparar(obj, now))
+            yield obj, fila, [column.value(obj, fila) for column in self.columns]
+
+    def nombre_archivo(self, extension):
+        return f'{self.filename}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extension}'
+
+
+_EXPORTS: Dict[str, ExportSpec] = {}
+
+
+def register_export(spec):
+    _EXPORTS[spec.name] = spec
+    return spec
+
+
+def get_export(name):
+    return _EXPORTS[name]
+
+
+# Estilos con nombre compartidos por todas las exportaciones
+BASE_STYLES = {
+    'encabezado': {'bold': True, 'color': 'FFFFFF', 'size': 12, 'fill': 'E95420', 'center': True},
+    'celda': {},
+}
+
+
+def _named_styles(spec):
+    from openpyxl.styles import Alignment, Border, Font, NamedStyle, PatternFill, Side
+
+    lado = Side(style='thin')
+    borde = Border(left=lado, right=lado, top=lado, bottom=lado)
+    estilos = []
+    for nombre, opciones in {**BASE_STYLES, **spec.styles}.items():
+        estilo = NamedStyle(name=nombre, border=borde)
+        if opciones.get('bold') or opciones.get('color') or opciones.get('size'):
+            estilo.font = Font(
+                bold=opciones.get('bold', False), color=opciones.get('color'), size=opciones.get('size', 11)
+            )
+        if opciones.get('fill'):
+            estilo.fill = PatternFill(start_color=opciones['fill'], end_color=opciones['fill'], fill_type='solid')
+        if opciones.get('center'):
+            estilo.alignment = Alignment(horizontal='center', vertical='center')
+        estilos.append(estilo)
+    return estilos
+
+
+class StreamingExport:
+    @staticmethod
+    def response(spec, formato='xlsx', queryset=None):
+        """Respuesta HTTP de la exportación en el formato pedido (ValueError si no es válido)."""
+        if formato == 'csv':
+            return StreamingExport.csv_response(spec, queryset)
+        if formato == 'parquet':
+            return StreamingExport.parquet_response(spec, queryset)
+        if formato == 'xlsx':
+            return StreamingExport.xlsx_response(spec, queryset)
+        raise ValueError(f"Formato no soportado: {formato}. Use {', '.join(FORMATOS)}")
+
+    @staticmethod
+    def _attachment(response, filename):
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @staticmethod
+    def iter_csv(spec, queryset=None):
+        class _Linea:
+            def write(self, value):
+                return value
+
+        writer = csv.writer(_Linea())
+        # BOM para que Excel detecte UTF-8 al abrir el CSV directamente.
+        yield codecs.BOM_UTF8.decode('utf-8') + writer.writerow([c.header for c in spec.columns])
+        for _, _, valores in spec.rows(queryset):
+            yield writer.writerow(['' if v is None else v for v in valores])
+
+    @classmethod
+    def csv_response(cls, spec, queryset=None):
+        response = StreamingHttpResponse(cls.iter_csv(spec, queryset), content_type='text/csv; charset=utf-8')
+        return cls._attachment(response, spec.nombre_archivo('csv'))
+
+    @staticmethod
+    def write_xlsx(spec, destino, queryset=None):
+        """Escribe la exportación en `destino` (ruta o archivo binario) con una hoja write-only."""
+        import openpyxl
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.utils import get_column_letter
+
+        wb = openpyxl.Workbook(write_only=True)
+        for estilo in _named_styles(spec):
+            wb.add_named_style(estilo)
+        ws = wb.create_sheet(spec.sheet_title)
+        # En modo write-only los anchos deben fijarse antes de la primera fila.
+        for idx, column in enumerate(spec.columns, 1):
+            ws.column_dimensions[get_column_letter(idx)].width = column.width
+
+        def celda(valor, estilo):
+            cell = WriteOnlyCell(ws, value=valor)
+            cell.style = estilo
+            return cell
+
+        ws.append([celda(column.header, 'encabezado') for column in spec.columns])
+        for obj, fila, valores in spec.rows(queryset):
+            ws.append([
+                celda(valor, column.style(valor, obj, fila) if callable(column.style) else column.style)
+                for column, valor in zip(spec.columns, valores)
+            ])
+        wb.save(destino)
+
+    @classmethod
+    def xlsx_response(cls, spec, queryset=None):
+        archivo = tempfile.TemporaryFile()
+        try:
+            cls.write_xlsx(spec, archivo, queryset)
+        except Exception:
+            archivo.close()
+            raise
+        archivo.seek(0)
+        response = FileResponse(archivo, content_type=XLSX_CONTENT_TYPE)
+        return cls._attachment(response, spec.nombre_archivo('xlsx'))
+
+    @staticmethod
+    def write_parquet(spec, destino, queryset=None, batch_size=CHUNK_SIZE):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError('La exportación Parquet requiere pyarrow instalado')
+
+        tipos = {'texto': pa.string(), 'entero': pa.int64(), 'decimal': pa.float64(), 'booleano': pa.bool_()}
+        schema = pa.schema([(column.header, tipos[column.tipo]) for column in spec.columns])
+        with pq.ParquetWriter(destino, schema) as writer:
+            lote = []
+            for _, _, valores in spec.rows(queryset):
+                lote.append(valores)
+                if len(lote) >= batch_size:
+                    writer.write_table(pa.Table.from_arrays([list(c) for c in zip(*lote)], schema=schema))
+                    lote = []
+            if lote:
+                writer.write_table(pa.Table.from_arrays([list(c) for c in zip(*lote)], schema=schema))
+
+    @classmethod
+    def parquet_response(cls, spec, queryset=None):
+        archivo = tempfile.TemporaryFile()
+        try:
+            cls.write_parquet(spec, archivo, queryset)
+        except Exception:
+            archivo.close()
+            raise
+        archivo.seek(0)
+        response = FileResponse(archivo, content_type='application/vnd.apache.parquet')
+        return cls._attachment(response, spec.nombre_archivo('parquet'))
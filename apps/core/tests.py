@@ -1,14 +1,42 @@
+import json
+import os
+import tempfile
+import threading
 from datetime import timedelta
-from unittest.mock import patch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import permutations
+from math import exp
+from unittest.mock import Mock, patch
 
-from django.test import TestCase
+import pandas as pd
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
 from django.utils import timezone
 
 from apps.cds.models import CD
+from apps.clientes.models import ClienteEmpresa
 from apps.containers.models import Container
+from apps.core.services.assignment import AssignmentService
+from apps.core.services.batch_dispatch import BatchDispatchService
+from apps.core.models import ImportJob, MensajeOpenClaw
+from apps.core.services.import_jobs import ImportJobService
+from apps.core.services.incremental_eta import IncrementalETAService
 from apps.core.services.learning_engine import OperationalLearningEngine
+from apps.core.services.mapbox import MapboxService
+from apps.core.services.matrix_eta import MatrixETAService
+from apps.core.services.openclaw import OpenClawService
+from apps.core.services import routing
+from apps.core.services.route_cache import RouteCache
+from apps.core.services.routing import GrafoVial, OfflineBackend
 from apps.drivers.models import Driver
-from apps.programaciones.models import Programacion, TiempoViaje
+from apps.programaciones.models import Programacion, TiempoOperacion, TiempoViaje
 
 
 class OperationalLearningEngineTests(TestCase):
@@ -92,9 +120,1063 @@ class OperationalLearningEngineTests(TestCase):
         self.assertEqual(len(result['alternatives']), 5)
         self.assertTrue(result['cold_start'])
 
+    def _reference_prediction(self, history, departure, route, driver):
+        """Evaluación fila a fila previa a la vectorización, como referencia de paridad."""
+        signature = route.get('route_signature')
+        route_rows = [r for r in history if signature and r.ruta_firma == signature]
+        relevant = route_rows if len(route_rows) >= OperationalLearningEngine.MIN_ROUTE_SAMPLES else history
+        weighted = []
+        for row in relevant:
+            factor = max(0.45, min(2.5, row.calcular_factor_correccion()))
+            weight = exp(-max(0, (timezone.now().date() - row.fecha).days) / 75)
+            delta = abs(row.hora_del_dia - departure.hour)
+            weight *= exp(-min(delta, 24 - delta) / 3.0)
+            weight *= 1.35 if row.dia_semana == departure.weekday() else 0.82
+            if signature and row.ruta_firma == signature:
+                weight *= 1.8
+            if driver and row.conductor_id == driver.id:
+                weight *= 1.65
+            weighted.append((factor, weight))
+        learned = (
+            sum(f * w for f, w in weighted) / sum(w for _, w in weighted) if weighted else 1.0
+        )
+        learned_weight = min(0.78, len(relevant) / 18)
+        return {
+            'predicted_minutes': max(1, round(float(route['duration_minutes']) * ((1 - learned_weight) + learned_weight * learned))),
+            'learned_factor': round(learned, 3),
+            'samples': len(relevant),
+            'confidence': round(min(0.96, 0.25 + len(relevant) / 24), 2),
+            'driver_profile': OperationalLearningEngine.driver_profile(driver, relevant),
+        }
+
+    @patch('apps.core.services.learning_engine.MapboxService.calcular_rutas_alternativas')
+    def test_vectorized_recommendation_matches_row_by_row_scoring(self, alternatives):
+        other = Driver.objects.create(nombre='ML Other')
+        for index in range(40):
+            self._trip(
+                real=30 + (index * 7) % 35, mapbox=35 + index % 9, driver=other if index % 3 else self.driver,
+                hour=(5 + index * 5) % 24, signature=('route-a', 'route-b', None)[index % 3], days_ago=1 + index * 2,
+            )
+        routes = [
+            {'route_index': 0, 'duration_minutes': 45, 'distance_km': 20, 'route_signature': 'route-a'},
+            {'route_index': 1, 'duration_minutes': 38, 'distance_km': 24, 'route_signature': 'route-c'},
+            {'route_index': 2, 'duration_minutes': 41, 'distance_km': 22, 'route_signature': None},
+        ]
+        alternatives.return_value = {'success': True, 'routes': routes}
+        history = OperationalLearningEngine._history(self.origin, self.destination)
+
+        result = OperationalLearningEngine.recommend(
+            self.origin, self.destination, self.departure, driver=self.driver, window_hours=8
+        )
+
+        candidates = [result['recommended'], *result['alternatives']]
+        expected = sorted(
+            (
+                {**route, **self._reference_prediction(history, self.departure + timedelta(hours=h), route, self.driver),
+                 'departure': self.departure + timedelta(hours=h)}
+                for h in range(9) for route in routes
+            ),
+            key=lambda item: (item['predicted_minutes'], item['distance_km']),
+        )[:len(candidates)]
+        campos = ('route_index', 'departure', 'predicted_minutes', 'learned_factor', 'samples', 'confidence', 'driver_profile')
+        self.assertEqual(
+            [{campo: c[campo] for campo in campos} for c in candidates],
+            [{campo: e[campo] for campo in campos} for e in expected],
+        )
+
+    def test_history_only_reads_neighbouring_cells(self):
+        near = self._trip(real=50)
+        far = self._trip(real=50)
+        far.origen_lat, far.origen_lon = -32.90, -71.50
+        far.save()
+        self.assertEqual(near.origen_celda, TiempoViaje.celda_para(*self.origin))
+        self.assertNotIn(far.origen_celda, TiempoViaje.celdas_vecinas(*self.origin))
+        history = OperationalLearningEngine._history(self.origin, self.destination)
+        self.assertEqual([row.id for row in history], [near.id])
+
     def test_anomalous_trip_is_excluded(self):
         trip = self._trip(real=200)
         trip.anomalia = True
         trip.save(update_fields=['anomalia'])
         history = OperationalLearningEngine._history(self.origin, self.destination)
         self.assertEqual(history, [])
+
+
+@patch('apps.core.services.ml_predictor.MapboxService.calcular_ruta',
+       return_value={'success': True, 'duration_minutes': 30, 'distance_km': 18})
+class AssignmentBatchScoringTests(TestCase):
+    def setUp(self):
+        self.cd = CD.objects.create(
+            nombre='Batch CD', codigo='BATCH-CD', direccion='Destino', comuna='Santiago',
+            lat=-33.45, lng=-70.65,
+        )
+        container = Container.objects.create(
+            container_id='BTCH1234567', estado='programado', cliente='Cliente', vendor='Carrier'
+        )
+        self.programacion = Programacion.objects.create(
+            container=container, cd=self.cd, cliente='Cliente',
+            fecha_programada=timezone.now() + timedelta(hours=3),
+        )
+
+    def _drivers(self, count):
+        for index in range(Driver.objects.count(), count):
+            driver = Driver.objects.create(
+                nombre=f'Batch Driver {index}', presente=True,
+                ultima_posicion_lat=-33.50, ultima_posicion_lng=-70.70,
+            )
+            TiempoViaje.objects.create(
+                conductor=driver, origen_lat=-33.50, origen_lon=-70.70,
+                destino_lat=-33.45, destino_lon=-70.65,
+                tiempo_mapbox_min=30, tiempo_real_min=36,
+                hora_salida=timezone.now(), hora_llegada=timezone.now(),
+                hora_del_dia=8, dia_semana=0, distancia_km=18,
+            )
+
+    def _count_queries(self, drivers):
+        self._drivers(drivers)
+        with CaptureQueriesContext(connection) as ctx:
+            resultados = AssignmentService.obtener_conductores_disponibles_con_score(self.programacion)
+        self.assertEqual(len(resultados), drivers)
+        return len(ctx.captured_queries), resultados
+
+    def test_query_count_does_not_grow_with_candidates(self, _route):
+        few, _ = self._count_queries(2)
+        many, resultados = self._count_queries(6)
+        self.assertEqual(few, many)
+        self.assertEqual(set(resultados[0]), {
+            'driver', 'score', 'desglose', 'weights', 'anomalies', 'classification',
+            'confidence', 'similar_cases', 'reason', 'eta_estimado_min',
+        })
+
+    def test_single_driver_score_matches_batch(self, _route):
+        self._drivers(3)
+        batch = {r['driver'].id: r for r in AssignmentService.obtener_conductores_disponibles_con_score(self.programacion)}
+        for driver in Driver.objects.all():
+            single = AssignmentService.calcular_score_total(driver, self.programacion)
+            self.assertEqual(single['score_total'], batch[driver.id]['score'])
+            self.assertEqual(single['eta_estimado_min'], batch[driver.id]['eta_estimado_min'])
+            self.assertEqual(single['anomalies'], batch[driver.id]['anomalies'])
+
+    def test_anomalies_are_notified_only_for_the_chosen_driver(self, _route):
+        self._drivers(3)
+        anomalia = [{'code': 'RIESGO', 'severity': 'P1', 'message': 'Riesgo de atraso'}]
+
+        with patch('apps.core.services.scoring_context.ScoringContext.anomalies', return_value=anomalia), \
+                patch.object(OpenClawService, 'notify_anomaly') as notify, \
+                patch.object(OpenClawService, 'request_review'):
+            AssignmentService.obtener_conductores_disponibles_con_score(self.programacion)
+            notify.assert_not_called()
+            AssignmentService.asignar_mejor_conductor(self.programacion)
+
+        notify.assert_called_once_with(self.programacion, anomalia)
+
+
+class RouteCacheTests(TestCase):
+    def setUp(self):
+        RouteCache.clear()
+        self.addCleanup(RouteCache.clear)
+        response = Mock()
+        response.json.return_value = {
+            'code': 'Ok',
+            'routes': [{'duration': 1800, 'distance': 18000,
+                        'geometry': {'type': 'LineString', 'coordinates': [[0, 0], [1, 1]]}}],
+        }
+        patcher = patch('apps.core.services.mapbox.requests.get', return_value=response)
+        self.http_get = patcher.start()
+        self.addCleanup(patcher.stop)
+        api_key = patch.object(MapboxService, 'API_KEY', 'pk.test')
+        api_key.start()
+        self.addCleanup(api_key.stop)
+
+    def test_nearby_coordinates_reuse_cached_route(self):
+        first = MapboxService.calcular_ruta(-70.70001, -33.50001, -70.65, -33.45)
+        second = MapboxService.calcular_ruta(-70.70004, -33.50003, -70.65, -33.45)
+        self.assertEqual(self.http_get.call_count, 1)
+        self.assertFalse(first['cached'])
+        self.assertTrue(second['cached'])
+        self.assertEqual(second['duration_minutes'], 30)
+        self.assertNotIn('raw_response', second)
+        self.assertEqual(RouteCache.stats()['lru_hits'], 1)
+
+    def test_persistent_layer_survives_process_cache_reset(self):
+        MapboxService.calcular_ruta(-70.70, -33.50, -70.65, -33.45)
+        RouteCache.clear()
+        again = MapboxService.calcular_ruta(-70.70, -33.50, -70.65, -33.45)
+        self.assertTrue(again['cached'])
+        self.assertEqual(self.http_get.call_count, 1)
+        self.assertEqual(RouteCache.stats()['store_hits'], 1)
+
+    def test_failures_and_bypass_are_not_cached(self):
+        self.http_get.return_value.json.return_value = {'code': 'NoRoute', 'message': 'sin ruta'}
+        MapboxService.calcular_ruta(-70.70, -33.50, -70.65, -33.45)
+        MapboxService.calcular_ruta(-70.70, -33.50, -70.65, -33.45, usar_cache=False)
+        MapboxService.calcular_ruta(-70.70, -33.50, -70.65, -33.45)
+        self.assertEqual(self.http_get.call_count, 3)
+        self.assertEqual(RouteCache.stats()['stores'], 0)
+
+
+class OfflineRoutingTests(TestCase):
+    # Calle directa lenta A–B y autopista A–C–B; tramo D→E de un solo sentido
+    GRAFO = {
+        'type': 'FeatureCollection',
+        'features': [
+            {'type': 'Feature', 'properties': {'highway': 'residential'},
+             'geometry': {'type': 'LineString', 'coordinates': [[-70.70, -33.45], [-70.65, -33.45]]}},
+            {'type': 'Feature', 'properties': {'highway': 'motorway', 'maxspeed': '100'},
+             'geometry': {'type': 'LineString', 'coordinates': [[-70.70, -33.45], [-70.675, -33.44], [-70.65, -33.45]]}},
+            {'type': 'Feature', 'properties': {'highway': 'primary', 'oneway': 'yes'},
+             'geometry': {'type': 'LineString', 'coordinates': [[-70.65, -33.45], [-70.65, -33.40]]}},
+        ],
+    }
+
+    def setUp(self):
+        RouteCache.clear()
+        handle = tempfile.NamedTemporaryFile('w', suffix='.geojson', delete=False)
+        json.dump(self.GRAFO, handle)
+        handle.close()
+        self.addCleanup(os.unlink, handle.name)
+        self.addCleanup(OfflineBackend._grafos.clear)
+        self.addCleanup(routing._instancias.clear)
+        self.addCleanup(RouteCache.clear)
+        self.graph_path = handle.name
+
+    def test_astar_prefers_faster_road_and_respects_oneway(self):
+        backend = OfflineBackend(GrafoVial.desde_geojson(self.GRAFO, truck_max_kmh=90))
+        ruta = backend.ruta(-70.70, -33.45, -70.65, -33.45, 'driving')
+
+        self.assertTrue(ruta['success'])
+        self.assertIn([-70.675, -33.44], ruta['geometry']['coordinates'])
+        # ~5,1 km de autopista a 90 km/h (tope de camión)
+        self.assertAlmostEqual(ruta['duration_minutes'], 3.4, places=1)
+        self.assertEqual(ruta['route_signature'], MapboxService.firma_ruta(ruta['geometry']))
+
+        self.assertTrue(backend.ruta(-70.65, -33.45, -70.65, -33.40, 'driving')['success'])
+        self.assertFalse(backend.ruta(-70.65, -33.40, -70.65, -33.45, 'driving')['success'])
+        self.assertFalse(backend.ruta(-71.60, -33.05, -70.65, -33.45, 'driving')['success'])
+
+    @patch.object(MapboxService, 'API_KEY', None)
+    @patch('apps.core.services.mapbox.requests.get')
+    def test_mapbox_without_key_falls_back_to_offline_graph(self, http_get):
+        with override_settings(ROUTING_BACKENDS='mapbox,offline', ROUTING_GRAPH_PATH=self.graph_path):
+            ruta = MapboxService.calcular_ruta(-70.70, -33.45, -70.65, -33.45)
+            celdas = MapboxService.calcular_matriz_hacia([(-70.70, -33.45), (-70.65, -33.40)], -70.65, -33.45)
+
+        http_get.assert_not_called()
+        self.assertEqual(ruta['backend'], 'offline')
+        self.assertEqual(set(ruta) - {'cached', 'backend'}, {
+            'success', 'duration_minutes', 'distance_km', 'geometry', 'route_signature',
+        })
+        self.assertEqual(RouteCache.stats()['stores'], 0)
+        # La matriz (Dijkstra inverso) coincide con la ruta punto a punto
+        self.assertEqual(celdas[0]['duration_minutes'], ruta['duration_minutes'])
+        self.assertEqual(celdas[0]['backend'], 'offline')
+        self.assertFalse(celdas[1]['success'])
+
+    def test_unknown_backend_is_a_configuration_error(self):
+        with override_settings(ROUTING_BACKENDS='osrm'):
+            with self.assertRaises(ImproperlyConfigured):
+                routing.backends()
+
+
+@patch('apps.core.services.ml_predictor.MapboxService.calcular_ruta')
+class MatrixETATests(TestCase):
+    def setUp(self):
+        RouteCache.clear()
+        self.addCleanup(RouteCache.clear)
+        self.cd = CD.objects.create(
+            nombre='Matriz CD', codigo='MATRIZ-CD', direccion='Destino', comuna='Santiago',
+            lat=-33.45, lng=-70.65,
+        )
+        container = Container.objects.create(
+            container_id='MTRX1234567', estado='programado', cliente='Cliente', vendor='Carrier'
+        )
+        self.programacion = Programacion.objects.create(
+            container=container, cd=self.cd, cliente='Cliente',
+            fecha_programada=timezone.now() + timedelta(hours=3),
+        )
+        patcher = patch('apps.core.services.mapbox.requests.get', side_effect=self._matrix_response)
+        self.http_get = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def _matrix_response(url, params, timeout):
+        sources = params['sources'].split(';')
+        response = Mock()
+        response.json.return_value = {
+            'code': 'Ok',
+            'durations': [[600.0 * (index + 1)] for index in range(len(sources))],
+            'distances': [[5000.0 * (index + 1)] for index in range(len(sources))],
+        }
+        return response
+
+    def _drivers(self, count):
+        return [
+            Driver.objects.create(
+                nombre=f'Matriz {index}', presente=True,
+                ultima_posicion_lat=-33.50 - index * 0.01, ultima_posicion_lng=-70.70,
+            )
+            for index in range(count)
+        ]
+
+    @patch.object(MapboxService, 'API_KEY', 'pk.test')
+    def test_candidates_resolved_with_chunked_matrix(self, calcular_ruta):
+        self._drivers(12)
+        resultados = AssignmentService.obtener_conductores_disponibles_con_score(self.programacion)
+
+        calcular_ruta.assert_not_called()
+        # driving-traffic admite 10 coordenadas: 9 orígenes + el destino por solicitud
+        self.assertEqual(self.http_get.call_count, 2)
+        self.assertEqual(
+            [len(call.kwargs['params']['sources'].split(';')) for call in self.http_get.call_args_list], [9, 3],
+        )
+        self.assertTrue(all(r['eta_estimado_min'] > 0 for r in resultados))
+
+        # Los mismos pares se sirven desde RouteCache
+        AssignmentService.obtener_conductores_disponibles_con_score(self.programacion)
+        self.assertEqual(self.http_get.call_count, 2)
+
+    @patch.object(MapboxService, 'API_KEY', None)
+    def test_offline_fallback_uses_learned_speed(self, calcular_ruta):
+        for _ in range(3):
+            TiempoViaje.objects.create(
+                origen_lat=-33.50, origen_lon=-70.70, destino_lat=-33.45, destino_lon=-70.65,
+                tiempo_mapbox_min=25, tiempo_real_min=30,
+                hora_salida=timezone.now(), hora_llegada=timezone.now(),
+                hora_del_dia=8, dia_semana=0, distancia_km=20,
+            )
+        historial = list(TiempoViaje.objects.all())
+        origen = (-33.55, -70.65)
+
+        base = MatrixETAService.tiempos_base({'a': origen}, (-33.45, -70.65), historial=historial)['a']
+
+        self.http_get.assert_not_called()
+        self.assertEqual(base['fuente'], 'haversine')
+        # ~11,1 km en línea recta × 1,3 de desvío a 40 km/h aprendidos
+        self.assertAlmostEqual(base['distance_km'], 14.46, places=1)
+        self.assertAlmostEqual(base['duration_minutes'], base['distance_km'] / 40 * 60, places=1)
+        self.assertEqual(MatrixETAService.velocidad_aprendida([]), 35)
+
+    @patch.object(MapboxService, 'API_KEY', 'pk.test')
+    def test_unroutable_cell_falls_back_per_origin(self, calcular_ruta):
+        response = Mock()
+        response.json.return_value = {
+            'code': 'Ok', 'durations': [[900.0], [None]], 'distances': [[9000.0], [None]],
+        }
+        self.http_get.side_effect = None
+        self.http_get.return_value = response
+
+        bases = MatrixETAService.tiempos_base(
+            {1: (-33.50, -70.70), 2: (-33.60, -70.70)}, (-33.45, -70.65),
+        )
+
+        self.assertEqual(bases[1]['fuente'], 'mapbox')
+        self.assertEqual(bases[1]['duration_minutes'], 15)
+        self.assertEqual(bases[2]['fuente'], 'haversine')
+
+
+@patch('apps.core.services.ml_predictor.MapboxService.calcular_ruta',
+       return_value={'success': True, 'duration_minutes': 30, 'distance_km': 18})
+class BatchDispatchTests(TestCase):
+    def setUp(self):
+        self.cd = CD.objects.create(
+            nombre='Lote CD', codigo='LOTE-CD', direccion='Destino', comuna='Santiago',
+            lat=-33.45, lng=-70.65,
+        )
+
+    def _programacion(self, suffix, urgencia='NORMAL'):
+        container = Container.objects.create(
+            container_id=f'LOTE{suffix:07d}', estado='programado', cliente='Cliente', vendor='Carrier'
+        )
+        return Programacion.objects.create(
+            container=container, cd=self.cd, cliente='Cliente', urgencia_servicio=urgencia,
+            fecha_programada=timezone.now() + timedelta(hours=3),
+        )
+
+    def test_hungarian_matches_brute_force(self, _route):
+        cost = [[4, 1, 3, 7], [2, 0, 5, 1], [3, 2, 2, 6]]
+        assignment = BatchDispatchService.hungarian(cost)
+        best = min(
+            sum(cost[row][col] for row, col in enumerate(cols))
+            for cols in permutations(range(4), 3)
+        )
+        self.assertEqual(len(set(assignment)), 3)
+        self.assertEqual(sum(cost[row][col] for row, col in enumerate(assignment)), best)
+
+    def test_solve_beats_greedy_and_skips_p0(self, _route):
+        normal = Programacion(urgencia_servicio='NORMAL')
+        critical = Programacion(urgencia_servicio='CRITICO')
+        fast, slow, blocked = (Driver(nombre=n, presente=True) for n in ('Fast', 'Slow', 'Blocked'))
+
+        def cand(driver, score, p0=False):
+            return {'driver': driver, 'score': score,
+                    'anomalies': [{'severity': 'P0'}] if p0 else []}
+
+        matrix = [
+            [cand(fast, 0.90), cand(slow, 0.80), cand(blocked, 0.99, p0=True)],
+            [cand(fast, 0.85), cand(slow, 0.30), cand(blocked, 0.99, p0=True)],
+        ]
+        # El recorrido codicioso entregaría Fast a la primera programación.
+        selected = BatchDispatchService.solve([normal, critical], matrix, [fast, slow, blocked])
+        self.assertIs(selected[0]['driver'], slow)
+        self.assertIs(selected[1]['driver'], fast)
+
+    def test_dispatch_uses_each_driver_once_and_respects_daily_limit(self, _route):
+        programaciones = [self._programacion(i) for i in range(3)]
+        Driver.objects.create(nombre='Disponible A', presente=True)
+        Driver.objects.create(nombre='Disponible B', presente=True)
+        Driver.objects.create(nombre='Sin cupo', presente=True, num_entregas_dia=3, max_entregas_dia=3)
+
+        resultados = AssignmentService.asignar_multiples(programaciones)
+
+        self.assertEqual(resultados['modo'], 'global')
+        propuestos = [d['driver'] for d in resultados['detalles'] if d['driver']]
+        self.assertEqual(sorted(propuestos), ['Disponible A', 'Disponible B'])
+        self.assertEqual(len(resultados['detalles']), 3)
+
+    def test_anomalies_are_notified_only_for_selected_pairs(self, _route):
+        programacion = self._programacion(9)
+        for nombre in ('A', 'B', 'C'):
+            Driver.objects.create(nombre=f'Conductor {nombre}', presente=True)
+        anomalia = [{'code': 'RIESGO', 'severity': 'P1', 'message': 'Riesgo de atraso'}]
+
+        with patch('apps.core.services.scoring_context.ScoringContext.anomalies', return_value=anomalia), \
+                patch.object(OpenClawService, 'notify_anomaly') as notify:
+            resultados = AssignmentService.asignar_multiples([programacion])
+
+        self.assertTrue(resultados['detalles'][0]['driver'])
+        notify.assert_called_once_with(programacion, anomalia)
+
+
+@patch('apps.core.services.incremental_eta.MapboxService.calcular_ruta')
+class IncrementalETATests(TestCase):
+    def setUp(self):
+        cd = CD.objects.create(
+            nombre='ETA CD', codigo='ETA-CD', direccion='Destino', comuna='Santiago',
+            lat=-33.40, lng=-70.60,
+        )
+        container = Container.objects.create(container_id='ETAA1234567', estado='en_ruta', cliente='Cliente')
+        # Ruta recta sur→norte de ~11 km, 40 minutos aprendidos.
+        self.programacion = Programacion.objects.create(
+            container=container, cd=cd, cliente='Cliente',
+            fecha_programada=timezone.now(), fecha_inicio_ruta=timezone.now(),
+            ruta_geojson={'type': 'LineString', 'coordinates': [[-70.60, -33.50], [-70.60, -33.45], [-70.60, -33.40]]},
+            ruta_firma='eta-test', prediccion_ml={'predicted_minutes': 40, 'learned_factor': 1.5, 'blended_factor': 1.2},
+        )
+
+    def test_on_route_ping_is_projected_without_mapbox(self, calcular_ruta):
+        resultado = IncrementalETAService.estimate(self.programacion, -33.45, -70.6005)
+        calcular_ruta.assert_not_called()
+        self.assertEqual(resultado['fuente'], 'incremental')
+        self.assertEqual(resultado['eta_minutos'], 20)
+        self.assertAlmostEqual(resultado['distancia_km'], 5.56, places=1)
+        self.assertEqual(resultado['update_fields'], [])
+
+    def test_deviation_reroutes_with_blended_factor(self, calcular_ruta):
+        calcular_ruta.return_value = {
+            'success': True, 'duration_minutes': 25, 'distance_km': 9,
+            'geometry': {'type': 'LineString', 'coordinates': [[-70.65, -33.45], [-70.60, -33.40]]},
+            'route_signature': 'desvio',
+        }
+        resultado = IncrementalETAService.estimate(self.programacion, -33.45, -70.65)
+        self.assertEqual(resultado['fuente'], 'mapbox')
+        self.assertEqual(resultado['eta_minutos'], 30)
+        self.assertIn('ruta_geojson', resultado['update_fields'])
+        self.assertEqual(self.programacion.prediccion_ml['eta_incremental']['reruteos'], 1)
+
+    def test_failed_budget_reroute_is_not_retried_on_next_ping(self, calcular_ruta):
+        calcular_ruta.return_value = {'success': False, 'error': 'timeout'}
+        self.programacion.fecha_inicio_ruta = timezone.now() - timedelta(hours=1)
+        primero = IncrementalETAService.estimate(self.programacion, -33.45, -70.6005)
+        segundo = IncrementalETAService.estimate(self.programacion, -33.44, -70.6005)
+        self.assertEqual(calcular_ruta.call_count, 1)
+        self.assertEqual((primero['fuente'], segundo['fuente']), ('incremental', 'incremental'))
+        self.assertEqual(primero['update_fields'], ['prediccion_ml'])
+        self.assertEqual(self.programacion.prediccion_ml['eta_incremental']['reruteos'], 1)
+
+    def test_trip_without_route_does_not_call_mapbox_on_every_ping(self, calcular_ruta):
+        calcular_ruta.return_value = {'success': False, 'error': 'sin API key'}
+        self.programacion.ruta_geojson = None
+        self.programacion.prediccion_ml = {}
+        resultados = [
+            IncrementalETAService.estimate(self.programacion, -33.45 + i * 0.001, -70.60) for i in range(5)
+        ]
+        self.assertEqual(calcular_ruta.call_count, 1)
+        self.assertEqual({r['fuente'] for r in resultados}, {'haversine'})
+        self.assertTrue(all(r['success'] and r['eta_minutos'] > 0 for r in resultados))
+        self.assertEqual(resultados[0]['update_fields'], ['prediccion_ml'])
+
+        # Con el cupo agotado tampoco se reintenta al vencer el presupuesto
+        self.programacion.prediccion_ml['eta_incremental'] = {
+            'reruteos': 99, 'ultimo_reruteo': (timezone.now() - timedelta(hours=1)).isoformat(),
+        }
+        resultado = IncrementalETAService.estimate(self.programacion, -33.45, -70.60)
+        self.assertEqual(calcular_ruta.call_count, 1)
+        self.assertEqual(resultado['fuente'], 'haversine')
+
+    def test_reroutes_are_bounded_per_trip(self, calcular_ruta):
+        self.programacion.prediccion_ml['eta_incremental'] = {'reruteos': 12}
+        resultado = IncrementalETAService.estimate(self.programacion, -33.45, -70.65)
+        calcular_ruta.assert_not_called()
+        self.assertEqual(resultado['fuente'], 'incremental')
+        self.assertGreater(resultado['distancia_km'], 5.56)
+
+
+class DashboardStatsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.container = Container.objects.create(
+            container_id='DASH1234567', estado='liberado', cliente='Cliente'
+        )
+        Container.objects.create(container_id='DASH7654321', estado='vacio', cliente='Cliente')
+        Driver.objects.create(nombre='Dash Driver')
+
+    def test_snapshot_is_constant_queries_and_cached(self):
+        with CaptureQueriesContext(connection) as cold:
+            response = self.client.get(reverse('dashboard_stats'))
+        stats = response.data['stats']
+        self.assertEqual(stats['contenedores_total'], 2)
+        self.assertEqual(stats['liberados'], 1)
+        self.assertEqual(stats['vacios'], 1)
+        self.assertEqual(stats['conductores_disponibles'], 1)
+        self.assertLessEqual(len(cold.captured_queries), 4)
+
+        with CaptureQueriesContext(connection) as warm:
+            self.client.get(reverse('dashboard_stats'))
+        self.assertEqual(len(warm.captured_queries), 0)
+
+    def test_state_change_invalidates_snapshot(self):
+        self.client.get(reverse('dashboard_stats'))
+        self.container.cambiar_estado('programado', 'tester')
+        stats = self.client.get(reverse('dashboard_stats')).data['stats']
+        self.assertEqual(stats['liberados'], 0)
+        self.assertEqual(stats['programados'], 1)
+
+
+class ImportJobQueueTests(APITestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('importstaff', password='***', is_staff=True)
+        self.client.force_authenticate(self.staff)
+        ClienteEmpresa.objects.create(nombre='Cliente Cola', rut='76.111.222-3')
+
+    def _upload(self, url_name='container-import-embarque', **extra):
+        archivo = SimpleUploadedFile('embarque.xlsx', b'contenido', content_type='application/octet-stream')
+        return self.client.post(reverse(url_name), {'file': archivo, **extra}, format='multipart')
+
+    def _frame(self):
+        return pd.DataFrame([{
+            'Container Numbers': 'QUEU 123456-7', 'Container Size': '40',
+            'Nave Confirmado': 'Nave Cola', 'Cliente': 'Cliente Cola',
+        }])
+
+    def test_upload_is_enqueued_and_worker_stores_same_payload(self):
+        response = self._upload()
+
+        self.assertEqual(response.status_code, 202)
+        job = ImportJob.objects.get(pk=response.data['job_id'])
+        self.assertEqual((job.estado, job.tipo, bytes(job.contenido)), ('pendiente', 'embarque', b'contenido'))
+        self.assertFalse(Container.objects.exists())
+
+        with patch(
+            'apps.containers.importers.embarque.read_excel_with_header_detection',
+            return_value=self._frame(),
+        ):
+            self.assertEqual(ImportJobService.run_pending(), 1)
+
+        status = self.client.get(response.data['status_url']).data
+        self.assertEqual((status['estado'], status['progreso']), ('completado', 100))
+        self.assertEqual(status['resultado']['creados'], 1)
+        self.assertEqual(set(status['resultado']), {'success', 'mensaje', 'creados', 'actualizados', 'errores', 'detalles'})
+        self.assertIsNone(ImportJob.objects.get(pk=job.pk).contenido)
+        self.assertTrue(Container.objects.filter(container_id='QUEU1234567').exists())
+
+    def test_sincrono_keeps_inline_processing(self):
+        with patch(
+            'apps.containers.importers.embarque.read_excel_with_header_detection',
+            return_value=self._frame(),
+        ):
+            response = self._upload(sincrono='1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['creados'], 1)
+        self.assertFalse(ImportJob.objects.exists())
+
+    def test_anonymous_upload_is_processed_inline(self):
+        self.client.force_authenticate(None)
+        resultados = {
+            'programados': 2, 'no_encontrados': 0, 'cd_no_encontrado': 0, 'errores': 0,
+            'alertas_generadas': 0, 'detalles': [],
+        }
+        with patch(
+            'apps.containers.importers.programacion.ProgramacionImporter.procesar', return_value=resultados,
+        ):
+            response = self._upload('programacion-import-excel')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['programados'], 2)
+        self.assertFalse(ImportJob.objects.exists())
+
+    def test_failed_import_is_reported_and_job_claimed_once(self):
+        job_id = self._upload().data['job_id']
+        self.assertIsNotNone(ImportJobService.reclamar('worker-a'))
+        self.assertIsNone(ImportJobService.reclamar('worker-b'))
+
+        job = ImportJob.objects.get(pk=job_id)
+        with patch(
+            'apps.containers.importers.embarque.read_excel_with_header_detection',
+            side_effect=ValueError('archivo ilegible'),
+        ):
+            ImportJobService.ejecutar(job)
+        job.refresh_from_db()
+        self.assertEqual(job.estado, 'fallido')
+        self.assertIn('archivo ilegible', job.error)
+
+    def test_stale_jobs_are_requeued_until_max_attempts(self):
+        job_id = self._upload().data['job_id']
+        ImportJobService.reclamar()
+        ImportJob.objects.filter(pk=job_id).update(heartbeat=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(ImportJobService.recuperar_huerfanos(), 1)
+        self.assertEqual(ImportJob.objects.get(pk=job_id).estado, 'pendiente')
+
+        ImportJob.objects.filter(pk=job_id).update(
+            estado='procesando', intentos=3, heartbeat=timezone.now() - timedelta(hours=1)
+        )
+        ImportJobService.recuperar_huerfanos()
+        self.assertEqual(ImportJob.objects.get(pk=job_id).estado, 'fallido')
+
+    def test_status_is_private_to_owner_or_staff(self):
+        job_id = self._upload().data['job_id']
+        otro = User.objects.create_user('otro', password='***')
+        self.client.force_authenticate(otro)
+        self.assertEqual(self.client.get(reverse('import_job_status', args=[job_id])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('import_jobs')).data['results'], [])
+
+
+class SimilarCaseIndexTests(TestCase):
+    def setUp(self):
+        self.cd = CD.objects.create(
+            nombre='Caso CD', codigo='CASO-CD', direccion='Destino', comuna='Santiago', lat=-33.45, lng=-70.65,
+        )
+        self.otro_cd = CD.objects.create(
+            nombre='Otro CD', codigo='OTRO-CD', direccion='Otro', comuna='Maipú', lat=-33.51, lng=-70.76,
+        )
+        self.base = timezone.now() - timedelta(days=30)
+
+    def _programacion(self, n, estado, cd=None, tipo='40HC', vendor='Carrier', urgencia='NORMAL',
+                      cliente='Cliente', estado_final=None):
+        container = Container.objects.create(
+            container_id=f'CASO{n:07d}', estado=estado, tipo=tipo, vendor=vendor, cliente=cliente
+        )
+        return Programacion.objects.create(
+            container=container, cd=cd or self.cd, cliente=cliente, urgencia_servicio=urgencia,
+            fecha_programada=self.base + timedelta(hours=n), estado_final=estado_final,
+        )
+
+    def _historial(self):
+        estados = ['entregado', 'descargado', 'devuelto', 'incidente', 'cancelado', 'vacio']
+        for n in range(24):
+            self._programacion(
+                n, estados[n % len(estados)],
+                cd=self.cd if n % 3 else self.otro_cd,
+                tipo='40HC' if n % 2 else '20',
+                vendor='Carrier' if n % 4 else None,
+                urgencia='URGENTE' if n % 5 == 0 else 'NORMAL',
+                cliente='Cliente' if n % 2 else 'Otro',
+                estado_final='PARCIAL' if n % 7 == 0 else None,
+            )
+
+    def test_index_matches_history_scan(self):
+        from apps.core.services.contextual_reasoning import ContextualReasoningService
+        from apps.core.services.similar_case_index import SimilarCaseIndex
+
+        self._historial()
+        SimilarCaseIndex.rebuild()
+        actual = self._programacion(100, 'programado')
+
+        with self.settings(SIMILAR_CASE_INDEX_ENABLED=False):
+            escaneo = ContextualReasoningService.similar_cases(actual, top_n=50)
+        mismo_tipo = Programacion.objects.filter(container__tipo='40HC')
+        misma_cd = set(mismo_tipo.filter(cd=self.cd).values_list('pk', flat=True))
+        mismo_tipo = set(mismo_tipo.values_list('pk', flat=True))
+
+        # Hay 4 casos cerrados del mismo CD y tipo: top 3 se responde sólo con ese grupo
+        with CaptureQueriesContext(connection) as queries:
+            indice = ContextualReasoningService.similar_cases(actual, top_n=3)
+        self.assertEqual(indice, [c for c in escaneo if c.id in misma_cd][:3])
+        self.assertEqual(len(queries), 1)
+
+        # Para top 8 no alcanzan y se amplía al mismo tipo en otros CD
+        with CaptureQueriesContext(connection) as queries:
+            indice = ContextualReasoningService.similar_cases(actual, top_n=8)
+        self.assertEqual(indice, [c for c in escaneo if c.id in mismo_tipo][:8])
+        self.assertEqual(len(queries), 2)
+
+    def test_index_follows_container_closing(self):
+        from apps.programaciones.models import CasoSimilarIndice
+
+        programacion = self._programacion(1, 'en_ruta')
+        self.assertFalse(CasoSimilarIndice.objects.exists())
+
+        programacion.container.estado = 'entregado'
+        programacion.container.save()
+        grupo = CasoSimilarIndice.objects.get(cd=self.cd, tipo='40HC', cliente='Cliente')
+        self.assertEqual((grupo.total, grupo.entregados), (1, 1))
+        self.assertEqual(grupo.casos_recientes[0][0], programacion.pk)
+
+        programacion.estado_final = 'FALLIDO'
+        programacion.save()
+        grupo.refresh_from_db()
+        self.assertEqual((grupo.entregados, grupo.fallidos), (0, 1))
+
+        programacion = Programacion.objects.get(pk=programacion.pk)
+        with patch('apps.core.services.similar_case_index.SimilarCaseIndex.refresh_group') as refresh:
+            programacion.observaciones = 'Sin cambios para el índice'
+            programacion.save()
+        refresh.assert_not_called()
+
+        programacion.cliente = 'Otro Cliente'
+        programacion.save()
+        self.assertFalse(CasoSimilarIndice.objects.filter(cliente='Cliente').exists())
+        self.assertTrue(CasoSimilarIndice.objects.filter(cliente='Otro Cliente').exists())
+
+
+class AnalyticsAggregationTests(APITestCase):
+    def setUp(self):
+        ahora = timezone.now()
+        self.dias = [ahora - timedelta(days=n) for n in (0, 1, 1, 3, 9)]
+        for i, fecha in enumerate(self.dias):
+            Container.objects.create(
+                container_id=f'ANLT{i:07d}', tipo='40', nave='Nave', estado='descargado', fecha_descarga=fecha
+            )
+        Container.objects.create(
+            container_id='ANLT0000099', tipo='40', nave='Nave', estado='en_ruta', fecha_descarga=ahora
+        )
+
+    def _serie(self, dias):
+        response = self.client.get(reverse('analytics_tendencias'), {'dias': dias})
+        return {p['fecha']: p['entregas'] for p in response.data['entregas_por_dia']}, response.data
+
+    def test_daily_series_matches_per_day_count(self):
+        serie, data = self._serie(14)
+        for fecha, entregas in serie.items():
+            esperado = Container.objects.filter(
+                estado__in=['descargado', 'devuelto'], fecha_descarga__date=fecha
+            ).count()
+            self.assertEqual(entregas, esperado, fecha)
+        self.assertEqual(sum(serie.values()), 5)
+        self.assertEqual(sum(d['entregas'] for d in data['entregas_por_dia_semana']), 5)
+
+    def test_query_count_does_not_depend_on_range(self):
+        self._serie(30)
+        with CaptureQueriesContext(connection) as corto:
+            self._serie(30)
+        with CaptureQueriesContext(connection) as largo:
+            self._serie(365)
+        self.assertLessEqual(len(corto), 5)
+        self.assertLessEqual(len(largo), len(corto) + 3)
+
+    def test_rollup_recomputes_days_with_changed_containers(self):
+        from apps.core.models import ResumenDiario
+
+        ayer = (timezone.localdate() - timedelta(days=1)).isoformat()
+        serie, _ = self._serie(7)
+        self.assertTrue(ResumenDiario.objects.filter(fecha=ayer).exists())
+        antes = serie[ayer]
+
+        container = Container.objects.get(container_id='ANLT0000001')
+        container.estado = 'vacio'
+        container.save()
+        serie, _ = self._serie(7)
+        self.assertEqual(serie[ayer], antes - 1)
+
+    def test_rollup_follows_moved_and_deleted_containers(self):
+        hoy = timezone.localdate()
+        ayer, hace_3 = (hoy - timedelta(days=1)).isoformat(), (hoy - timedelta(days=3)).isoformat()
+        serie, _ = self._serie(7)
+        self.assertEqual((serie[ayer], serie[hace_3]), (2, 1))
+
+        movido = Container.objects.get(container_id='ANLT0000001')
+        movido.fecha_descarga = timezone.now() - timedelta(days=3)
+        movido.save()
+        serie, _ = self._serie(7)
+        self.assertEqual((serie[ayer], serie[hace_3]), (1, 2))
+
+        Container.objects.get(container_id='ANLT0000002').delete()
+        serie, _ = self._serie(7)
+        self.assertEqual(serie[ayer], 0)
+
+    def test_conductores_completed_counts_in_one_query(self):
+        cd = CD.objects.create(
+            nombre='Analytics CD', codigo='ANLT-CD', direccion='Destino', comuna='Santiago', lat=-33.45, lng=-70.65,
+        )
+        drivers = [Driver.objects.create(nombre=f'Analitico {i}') for i in range(3)]
+        for i, container in enumerate(Container.objects.filter(estado='descargado')[:3]):
+            Programacion.objects.create(
+                container=container, cd=cd, cliente='Cliente', driver=drivers[0 if i < 2 else 1],
+                fecha_programada=timezone.now(),
+            )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('analytics_conductores'))
+        completadas = {c['nombre']: c['programaciones_completadas'] for c in response.data['conductores']}
+        self.assertEqual(completadas, {'Analitico 0': 2, 'Analitico 1': 1, 'Analitico 2': 0})
+        self.assertLessEqual(len(queries), 4)
+
+
+class LearningStatsTests(APITestCase):
+    def setUp(self):
+        self.cds = [
+            CD.objects.create(
+                nombre=f'Aprendizaje {i}', codigo=f'APR-{i}', direccion='Destino', comuna='Santiago',
+                lat=-33.45, lng=-70.65,
+            )
+            for i in range(3)
+        ]
+
+    def _operacion(self, cd, estimado, real, anomalia=False, tipo='descarga_cd'):
+        inicio = timezone.now() - timedelta(minutes=real)
+        return TiempoOperacion.objects.create(
+            cd=cd, tipo_operacion=tipo, tiempo_estimado_min=estimado, tiempo_real_min=real,
+            hora_inicio=inicio, hora_fin=timezone.now(), anomalia=anomalia,
+        )
+
+    def _viaje(self, mapbox, real, anomalia=False):
+        return TiempoViaje.objects.create(
+            origen_lat=-33.50, origen_lon=-70.70, destino_lat=-33.45, destino_lon=-70.65,
+            tiempo_mapbox_min=mapbox, tiempo_real_min=real, anomalia=anomalia,
+            hora_salida=timezone.now(), hora_llegada=timezone.now(),
+            hora_del_dia=8, dia_semana=0, distancia_km=18,
+        )
+
+    def test_endpoint_reads_accumulated_rows(self):
+        self._operacion(self.cds[0], 60, 75)
+        self._operacion(self.cds[0], 60, 50)
+        self._operacion(self.cds[0], 60, 300, anomalia=True)
+        self._operacion(self.cds[0], 30, 40, tipo='carga_ccti')
+        self._operacion(self.cds[1], 45, 45, anomalia=True)
+        self._viaje(30, 36)
+        self._viaje(30, 90, anomalia=True)
+
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(reverse('ml_learning_stats')).data
+        self.assertLessEqual(len(queries), 4)
+
+        self.assertEqual(data['tiempos_operacion']['total'], 5)
+        self.assertEqual(data['tiempos_operacion']['validos'], 3)
+        self.assertEqual(data['tiempos_operacion']['recientes_30d'], 5)
+        self.assertEqual(data['tiempos_viaje']['anomalos'], 1)
+        # Sólo el CD con datos válidos; error medio (15 + 10 + 10) / 3 min
+        self.assertEqual(len(data['aprendizaje_por_cd']), 1)
+        self.assertEqual(data['aprendizaje_por_cd'][0]['datos_recolectados'], 3)
+        self.assertEqual(data['aprendizaje_por_cd'][0]['precision_porcentaje'], round(100 - (35 / 3) / 60 * 100, 1))
+
+    def test_edits_and_rebuild_match_incremental_rows(self):
+        from apps.core.services.learning_stats import LearningStatsService
+        from apps.programaciones.models import EstadisticaAprendizaje
+
+        tiempo = self._operacion(self.cds[2], 60, 90)
+        self._operacion(self.cds[2], 60, 70)
+        tiempo.anomalia = True
+        tiempo.save()
+        fila = EstadisticaAprendizaje.objects.get(cd=self.cds[2])
+        self.assertEqual((fila.total, fila.validos, fila.suma_error_abs), (2, 1, 10))
+
+        incremental = list(EstadisticaAprendizaje.objects.values_list('total', 'validos', 'suma_error_abs', 'por_dia'))
+        LearningStatsService.rebuild()
+        self.assertEqual(
+            list(EstadisticaAprendizaje.objects.values_list('total', 'validos', 'suma_error_abs', 'por_dia')),
+            incremental,
+        )
+
+        tiempo.delete()
+        self.assertEqual(EstadisticaAprendizaje.objects.get(cd=self.cds[2]).total, 1)
+
+
+class LearnedTimesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.cd = CD.objects.create(
+            nombre='Tiempos CD', codigo='TIEMPOS', direccion='Destino', comuna='Santiago',
+            lat=-33.45, lng=-70.65, tiempo_promedio_descarga_min=45,
+        )
+        self.drivers = [Driver.objects.create(nombre=f'Tiempos {i}') for i in range(2)]
+
+    def _operaciones(self):
+        for i, real in enumerate([50, 55, 60, 65, 70, 75, 80]):
+            inicio = timezone.now() - timedelta(hours=i + 1)
+            TiempoOperacion.objects.create(
+                cd=self.cd, conductor=self.drivers[i % 2], tipo_operacion='descarga_cd',
+                tiempo_estimado_min=45, tiempo_real_min=real, hora_inicio=inicio, hora_fin=inicio,
+            )
+
+    def _viajes(self):
+        for i, real in enumerate([36, 40, 44, 48]):
+            salida = timezone.now() - timedelta(minutes=i)
+            TiempoViaje.objects.create(
+                conductor=self.drivers[i % 2], origen_lat=-33.50, origen_lon=-70.70,
+                destino_lat=-33.45, destino_lon=-70.65, tiempo_mapbox_min=30, tiempo_real_min=real,
+                hora_salida=salida, hora_llegada=salida, hora_del_dia=9, dia_semana=0, distancia_km=18,
+            )
+
+    def test_database_lookup_matches_in_memory_selection(self):
+        self._operaciones()
+        self._viajes()
+        historial_op = list(TiempoOperacion.objects.all())
+        historial_viaje = list(TiempoViaje.objects.all())
+        salida = timezone.now().replace(hour=9)
+        for conductor in [None, *self.drivers]:
+            self.assertEqual(
+                TiempoOperacion.obtener_tiempo_aprendido(self.cd, 'descarga_cd', conductor),
+                TiempoOperacion.obtener_tiempo_aprendido(self.cd, 'descarga_cd', conductor, historial=historial_op),
+            )
+            args = ((-33.50, -70.70), (-33.45, -70.65), 30, salida, conductor)
+            self.assertEqual(
+                TiempoViaje.obtener_tiempo_aprendido(*args),
+                TiempoViaje.obtener_tiempo_aprendido(*args, historial=historial_viaje),
+            )
+        self.assertEqual(TiempoOperacion.obtener_tiempo_aprendido(self.cd, 'carga_ccti'), 60)
+
+    def test_lookups_are_memoized_until_new_observation(self):
+        self._operaciones()
+        with CaptureQueriesContext(connection) as first:
+            antes = TiempoOperacion.obtener_tiempo_aprendido(self.cd, 'descarga_cd', self.drivers[0])
+        with CaptureQueriesContext(connection) as repeated:
+            TiempoOperacion.obtener_tiempo_aprendido(self.cd, 'descarga_cd', self.drivers[0])
+        self.assertEqual((len(first), len(repeated)), (1, 0))
+
+        # Sin datos suficientes también queda cacheado
+        TiempoOperacion.obtener_tiempo_aprendido(self.cd, 'carga_ccti')
+        with CaptureQueriesContext(connection) as sin_datos:
+            TiempoOperacion.obtener_tiempo_aprendido(self.cd, 'carga_ccti')
+        self.assertEqual(len(sin_datos), 0)
+
+        inicio = timezone.now()
+        TiempoOperacion.objects.create(
+            cd=self.cd, conductor=self.drivers[0], tipo_operacion='descarga_cd',
+            tiempo_estimado_min=45, tiempo_real_min=200, hora_inicio=inicio, hora_fin=inicio,
+        )
+        self.assertGreater(TiempoOperacion.obtener_tiempo_aprendido(self.cd, 'descarga_cd', self.drivers[0]), antes)
+
+
+class QueryBudgetMiddlewareTests(APITestCase):
+    def setUp(self):
+        from apps.clientes.models import ClienteUsuario
+
+        company = ClienteEmpresa.objects.create(nombre='Cliente Perfil')
+        self.user = User.objects.create_user('perfil-cliente', password='***')
+        ClienteUsuario.objects.create(user=self.user, empresa=company)
+        for i in range(6):
+            Container.objects.create(container_id=f'PERF{i:07d}', estado='liberado', cliente_empresa=company)
+
+    def test_disabled_by_default(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(reverse('cliente_stock'))
+        self.assertNotIn('X-Query-Count', response)
+
+    @override_settings(QUERY_BUDGET_ENABLED=True, QUERY_BUDGET_FLUSH_SECONDS=0, QUERY_BUDGET_MAX_QUERIES=5)
+    def test_records_percentiles_and_flags_repeated_queries(self):
+        from apps.core.models import PerfilEndpoint
+        from apps.core.services.query_budget import QueryBudgetService
+
+        self.client.force_authenticate(self.user)
+        for _ in range(2):
+            response = self.client.get(reverse('cliente_stock'))
+        self.assertEqual(response.status_code, 200)
+        consultas = int(response['X-Query-Count'])
+
+        perfil = PerfilEndpoint.objects.get(url_name='cliente_stock')
+        self.assertEqual(perfil.solicitudes, 2)
+        self.assertEqual(perfil.percentiles(0)['p95'], consultas)
+        # tiene_programacion consulta una vez por contenedor
+        self.assertEqual(perfil.con_n_mas_1, 2)
+        self.assertEqual(perfil.sobre_presupuesto, 2)
+        self.assertTrue(any(d['max_repeticiones'] >= 6 for d in perfil.duplicadas.values()))
+        self.assertEqual(QueryBudgetService.reporte()[0]['url_name'], 'cliente_stock')
+
+        from io import StringIO
+        from django.core.management import call_command
+        salida = StringIO()
+        call_command('query_budget_report', '--detalle', stdout=salida)
+        self.assertIn('cliente_stock', salida.getvalue())
+
+
+class _StubOpenClaw(BaseHTTPRequestHandler):
+    """Servidor OpenClaw local: registra cada POST y responde con el código configurado."""
+    recibidos = []
+    codigos = []
+
+    def do_POST(self):
+        cuerpo = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        type(self).recibidos.append((self.path, self.headers.get('Authorization'), json.loads(cuerpo)))
+        codigo = type(self).codigos.pop(0) if type(self).codigos else 200
+        self.send_response(codigo)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(OPENCLAW_BACKOFF_SECONDS=30, OPENCLAW_MAX_ATTEMPTS=2)
+class OpenClawOutboxTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), _StubOpenClaw)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        _StubOpenClaw.recibidos, _StubOpenClaw.codigos = [], []
+        base_url = f'http://127.0.0.1:{self.server.server_address[1]}/api/v1'
+        for nombre, valor in (('ENABLED', True), ('API_KEY', 'clave'), ('BASE_URL', base_url)):
+            patcher = patch.object(OpenClawService, nombre, valor)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        container = Container.objects.create(container_id='CLAW1234567', estado='liberado', cliente='Cliente')
+        cd = CD.objects.create(nombre='Claw CD', codigo='CLAW', direccion='D', comuna='Santiago', lat=-33.4, lng=-70.6)
+        self.programacion = Programacion.objects.create(
+            container=container, cd=cd, cliente='Cliente', fecha_programada=timezone.now() + timedelta(days=1),
+        )
+        self.anomalias = [{'code': 'ETA_EXCEDIDA', 'severity': 'P1', 'message': 'ETA', 'recommended_action': 'Revisar'}]
+
+    def test_notify_only_enqueues_and_dedupes_identical_alerts(self):
+        for _ in range(3):
+            OpenClawService.notify_anomaly(self.programacion, self.anomalias)
+        OpenClawService.notify_anomaly(self.programacion, [{**self.anomalias[0], 'code': 'OTRA'}])
+
+        self.assertEqual(_StubOpenClaw.recibidos, [])
+        self.assertEqual(MensajeOpenClaw.objects.filter(estado='pendiente').count(), 2)
+
+        self.assertEqual(OpenClawService.run_pending(), 2)
+        self.assertEqual(len(_StubOpenClaw.recibidos), 2)
+        path, auth, payload = _StubOpenClaw.recibidos[0]
+        self.assertEqual((path, auth), ('/api/v1/notifications', 'Bearer clave'))
+        self.assertEqual(payload['metadata']['programacion_id'], self.programacion.id)
+        self.assertFalse(MensajeOpenClaw.objects.exclude(estado='enviado').exists())
+
+    def test_server_errors_back_off_then_fail(self):
+        OpenClawService.notify_anomaly(self.programacion, self.anomalias)
+        _StubOpenClaw.codigos = [503, 503]
+
+        OpenClawService.run_pending()
+        mensaje = MensajeOpenClaw.objects.get()
+        self.assertEqual((mensaje.estado, mensaje.intentos), ('pendiente', 1))
+        self.assertGreater(mensaje.proximo_intento, timezone.now() + timedelta(seconds=20))
+
+        MensajeOpenClaw.objects.update(proximo_intento=timezone.now())
+        OpenClawService.run_pending()
+        mensaje.refresh_from_db()
+        self.assertEqual((mensaje.estado, mensaje.intentos), ('fallido', 2))
+        self.assertIn('503', mensaje.error)
+
+    def test_rolled_back_transaction_discards_message(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            OpenClawService.notify_anomaly(self.programacion, self.anomalias)
+            raise RuntimeError
+        self.assertFalse(MensajeOpenClaw.objects.exists())
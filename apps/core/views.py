@@ -1,47 +1,28 @@
 # Core views for frontend pages
 from django.shortcuts import render, get_object_or_404, redirect
-from django.utils import timezone
-from datetime import timedelta
 from apps.containers.models import Container
-from apps.drivers.models import Driver
 from apps.cds.models import CD
 from django.contrib.admin.views.decorators import staff_member_required
+from apps.core.services.dashboard_stats import DashboardStatsService
 
 
 @staff_member_required(login_url='/cuenta/login/')
 def home(request):
     """Dashboard operacional interno con estadísticas"""
-    today = timezone.now().date()
-    tomorrow = today + timedelta(days=1)
-    two_days_from_now = today + timedelta(days=2)
-    ahora = timezone.now()
+    snapshot = DashboardStatsService.snapshot()
+    containers = snapshot['contenedores']
     
-    # Calculate stats for dashboard
-    from apps.programaciones.models import Programacion
-    
-    # Mejorar cálculo de sin_asignar: programaciones sin conductor donde la fecha programada está en las próximas 72 horas
-    # Esto da más tiempo para preparar pero sigue siendo urgente
     stats = {
-        'programados_hoy': Container.objects.filter(
-            estado='programado',
-            fecha_programacion__date=today
-        ).count(),
-        'con_demurrage': Container.objects.filter(
-            fecha_demurrage__isnull=False,
-            estado__in=['liberado', 'programado', 'asignado']
-        ).exclude(estado='devuelto').count(),
-        'liberados': Container.objects.filter(estado='liberado').count(),
-        'en_ruta': Container.objects.filter(estado='en_ruta').count(),
-        'conductores': Driver.objects.filter(activo=True).count(),
-        'por_arribar': Container.objects.filter(estado='por_arribar').count(),
-        'programados': Container.objects.filter(estado='programado').count(),
-        'vacios': Container.objects.filter(estado__in=['vacio', 'vacio_en_ruta']).count(),
+        'programados_hoy': containers['programados_hoy'],
+        'con_demurrage': containers['con_demurrage'],
+        'liberados': containers['estado_liberado'],
+        'en_ruta': containers['estado_en_ruta'],
+        'conductores': snapshot['conductores']['activos'],
+        'por_arribar': containers['estado_por_arribar'],
+        'programados': containers['estado_programado'],
+        'vacios': containers['estado_vacio'] + containers['estado_vacio_en_ruta'],
         # Programaciones sin conductor asignado que requieren atención urgente (< 72h)
-        'sin_asignar': Programacion.objects.filter(
-            fecha_programada__gt=ahora,  # Solo futuras
-            fecha_programada__lte=ahora + timedelta(hours=72),  # Dentro de 72 horas
-            driver__isnull=True  # Sin conductor asignado
-        ).count(),
+        'sin_asignar': snapshot['programaciones_sin_conductor_72h'],
     }
     
     return render(request, 'home.html', {'stats': stats})
@@ -65,10 +46,8 @@ def estados(request):
         'vacio', 'vacio_en_ruta', 'en_ccti', 'devuelto'
     ]
     
-    # Contar contenedores por estado
-    containers_por_estado = {}
-    for estado in estados:
-        containers_por_estado[estado] = Container.objects.filter(estado=estado).count()
+    # Contar contenedores por estado (snapshot compartido con el dashboard)
+    containers_por_estado = DashboardStatsService.por_estado(estados)
     
     return render(request, 'estados.html', {
         'estados': estados,
@@ -0,0 +1,185 @@
+"""
+Feed de la flota activa para el mapa de monitoreo, por deltas.
+
+La flota activa son los conductores con posición actualizada en los
+últimos ACTIVE_MINUTES. El cliente envía el token de la última respuesta y
+recibe sólo lo que cambió: conductores movidos y conductores que dejaron de
+estar activos.
+
+- El token es un cursor de base de datos (microsegundos de `updated_at`),
+  no estado del proceso: cualquier worker responde cualquier token.
+- Movidos: filas con `updated_at` posterior al cursor. Driver.actualizar_posicion
+  y LocationBuffer.flush actualizan `updated_at` junto con la posición.
+- Bajas: conductores cuya última posición salió de la ventana activa entre
+  el cursor y ahora (se calcula desde ultima_actualizacion_posicion), más
+  los que cambiaron y ya no califican (desactivados, sin posición).
+- El cursor se relee con CURSOR_OVERLAP de margen para no perder filas de
+  transacciones que confirmaron después de la consulta; repetir un conductor
+  es inocuo porque el cliente reemplaza por id.
+- Sin token, con uno ilegible, futuro o anterior a la ventana activa, la
+  respuesta es el snapshot completo (`completo: true`).
+
+Con FLEET_FEED_SSE_ENABLED y un worker asíncrono (GUNICORN_WORKER_CLASS) el
+mismo delta se entrega como Server-Sent Events (`eventos`), con el token como
+id del evento para reanudar con Last-Event-ID.
+"""
+import json
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer
+
+ACTIVE_MINUTES = 30
+CURSOR_OVERLAP = timedelta(seconds=2)
+# Workers de gunicorn que no quedan bloqueados por una conexión SSE abierta
+ASYNC_WORKERS = ('gevent', 'eventlet')
+
+
+def _payload(driver):
+    return {
+        'id': driver.pk,
+        'nombre': driver.nombre,
+        'lat': float(driver.ultima_posicion_lat),
+        'lng': float(driver.ultima_posicion_lng),
+        'ultima_actualizacion': driver.ultima_actualizacion_posicion,
+        'num_entregas_dia': driver.num_entregas_dia,
+        'max_entregas_dia': driver.max_entregas_dia,
+    }
+
+
+class FleetFeed:
+    CAMPOS = ('id', 'nombre', 'activo', 'ultima_posicion_lat', 'ultima_posicion_lng',
+              'ultima_actualizacion_posicion', 'num_entregas_dia', 'max_entregas_dia', 'updated_at')
+
+    @staticmethod
+    def sse_enabled():
+        """SSE sólo con worker asíncrono: con 'sync' cada stream bloquearía el worker."""
+        worker = getattr(settings, 'GUNICORN_WORKER_CLASS', 'sync')
+        return bool(getattr(settings, 'FLEET_FEED_SSE_ENABLED', False)) and worker in ASYNC_WORKERS
+
+    @staticmethod
+    def sse_interval():
+        return float(getattr(settings, 'FLEET_FEED_SSE_INTERVAL', 2))
+
+    @staticmethod
+    def sse_max_seconds():
+        return float(getattr(settings, 'FLEET_FEED_SSE_MAX_SECONDS', 300))
+
+    # --- Tokens ---
+
+    @staticmethod
+    def token(momento):
+        return str(int(momento.timestamp() * 1_000_000))
+
+    @staticmethod
+    def _desde(token, ahora, limite):
+        """Cursor del token, o None si no sirve para un delta."""
+        if not token or not token.isdigit():
+            return None
+        try:
+            desde = datetime.fromtimestamp(int(token) / 1_000_000, tz=dt_timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            return None
+        return desde if limite <= desde <= ahora else None
+
+    # --- Lectura ---
+
+    @classmethod
+    def _consulta(cls):
+        from .models import Driver
+
+        return Driver.objects.only(*cls.CAMPOS)
+
+    @staticmethod
+    def _activo(driver, limite):
+        return (
+            driver.activo
+            and driver.ultima_posicion_lat is not None
+            and driver.ultima_posicion_lng is not None
+            and driver.ultima_actualizacion_posicion is not None
+            and driver.ultima_actualizacion_posicion >= limite
+        )
+
+    @classmethod
+    def cambios(cls, token=None):
+        """
+        {'version', 'completo', 'actualizados', 'eliminados'} desde `token`.
+        Sin token válido, `actualizados` es la flota activa completa.
+        """
+        ahora = timezone.now()
+        limite = ahora - timedelta(minutes=ACTIVE_MINUTES)
+        desde = cls._desde(token, ahora, limite)
+        if desde is None:
+            filas = cls._consulta().filter(
+                activo=True, ultima_posicion_lat__isnull=False, ultima_posicion_lng__isnull=False,
+                ultima_actualizacion_posicion__gte=limite,
+            )
+            actualizados, eliminados = [_payload(driver) for driver in filas], []
+        else:
+            corte = desde - CURSOR_OVERLAP
+            filas = cls._consulta().filter(
+                Q(updated_at__gt=corte)
+                | Q(ultima_actualizacion_posicion__gte=corte - timedelta(minutes=ACTIVE_MINUTES),
+                    ultima_actualizacion_posicion__lt=limite)
+            )
+            actualizados, eliminados = [], []
+            for driver in filas:
+                if cls._activo(driver, limite):
+                    actualizados.append(_payload(driver))
+                else:
+                    eliminados.append(driver.pk)
+        return {
+            'version': cls.token(ahora),
+            'completo': desde is None,
+            'actualizados': sorted(actualizados, key=lambda p: p['id']),
+            'eliminados': sorted(eliminados),
+        }
+
+    @classmethod
+    def eventos(cls, token=None, heartbeat_seconds=15):
+        """
+        Generador SSE: un evento `flota` por cada delta no vacío y un comentario
+        de keep-alive sin cambios. Cierra a los FLEET_FEED_SSE_MAX_SECONDS; el
+        navegador reconecta con Last-Event-ID. Las filas repetidas por
+        CURSOR_OVERLAP no se reenvían.
+        """
+        fin = time.monotonic() + cls.sse_max_seconds()
+        ultimo_envio = 0.0
+        enviados = {}
+        yield f'retry: {int(cls.sse_interval() * 1000)}\n\n'
+        while True:
+            delta = cls.cambios(token)
+            token = delta['version']
+            if delta['completo']:
+                enviados = {}
+            else:
+                delta['actualizados'] = [p for p in delta['actualizados'] if enviados.get(p['id']) != p]
+                delta['eliminados'] = [i for i in delta['eliminados'] if enviados.get(i, False) is not None]
+            for payload in delta['actualizados']:
+                enviados[payload['id']] = payload
+            for driver_id in delta['eliminados']:
+                enviados[driver_id] = None
+            ahora = time.monotonic()
+            if delta['completo'] or delta['actualizados'] or delta['eliminados']:
+                yield f"id: {token}\nevent: flota\ndata: {json.dumps(delta, cls=DjangoJSONEncoder)}\n\n"
+                ultimo_envio = ahora
+            elif ahora - ultimo_envio >= heartbeat_seconds:
+                yield ': ping\n\n'
+                ultimo_envio = ahora
+            if ahora >= fin:
+                return
+            time.sleep(cls.sse_interval())
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Permite negociar `Accept: text/event-stream`; la respuesta la arma la vista."""
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, cls=DjangoJSONEncoder)
@@ -29,6 +29,7 @@ class ConductorImporter:
     def __init__(self, archivo_path, usuario=None):
         self.archivo_path = archivo_path
         self.usuario = usuario
+        self.on_progress = None  # callable(filas_procesadas, filas_totales)
         self.resultados = {
             'creados': 0,
             'actualizados': 0,
@@ -108,6 +109,8 @@ class ConductorImporter:
             
             # Procesar cada fila
             for idx, row in df.iterrows():
+                if self.on_progress:
+                    self.on_progress(idx + 1, len(df))
                 try:
                     nombre = str(row['conductor']).strip()
                     
@@ -0,0 +1,184 @@
+"""
+Ingesta de puntos GPS por lotes.
+
+LocationBuffer acumula puntos y los escribe con un bulk_create de
+DriverLocation más una sola actualización (bulk_update) de la última posición
+por conductor. Un punto más antiguo que la posición ya registrada queda en el
+historial pero no retrocede la posición actual del conductor.
+
+Con timer=True (buffer compartido del proceso) el primer punto de un buffer
+vacío arma un temporizador de max_seconds que lo vacía aunque no lleguen más
+pings; sin él, una flota quieta dejaría puntos sin escribir indefinidamente.
+
+Con shared=True el vaciado lo dispara el request de cualquier conductor: los
+puntos de conductores que ya no existen se descartan antes de escribir, y un
+error de base de datos devuelve los puntos al buffer (hasta max_points) en vez
+de propagarse a ese request.
+"""
+import atexit
+import logging
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Driver, DriverLocation
+
+logger = logging.getLogger(__name__)
+
+
+class LocationBuffer:
+    def __init__(self, max_points=None, max_seconds=None, timer=False, shared=False):
+        self.max_points = max_points or int(getattr(settings, 'GPS_BUFFER_MAX_POINTS', 500))
+        self.max_seconds = max_seconds if max_seconds is not None else float(getattr(settings, 'GPS_BUFFER_MAX_SECONDS', 5))
+        self.timer = timer
+        self.shared = shared
+        self._points = []
+        self._lock = threading.Lock()
+        self._opened_at = time.monotonic()
+        self._timer = None
+
+    @staticmethod
+    def parse_point(raw):
+        """Normaliza un punto recibido; devuelve (lat, lng, accuracy, timestamp) o None si es inválido."""
+        try:
+            lat = Decimal(str(raw['lat']))
+            lng = Decimal(str(raw['lng']))
+            # NaN/Infinity no se pueden comparar ni cuantizar
+            if not (lat.is_finite() and lng.is_finite()):
+                return None
+            if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+                return None
+            lat = lat.quantize(Decimal('0.000001'))
+            lng = lng.quantize(Decimal('0.000001'))
+        except (KeyError, TypeError, InvalidOperation):
+            return None
+        accuracy = raw.get('accuracy')
+        try:
+            accuracy = float(accuracy) if accuracy is not None else None
+        except (TypeError, ValueError):
+            accuracy = None
+        now = timezone.now()
+        timestamp = raw.get('timestamp')
+        if timestamp:
+            timestamp = parse_datetime(str(timestamp))
+            if timestamp is None:
+                return None
+            if timezone.is_naive(timestamp):
+                timestamp = timezone.make_aware(timestamp)
+            # Relojes adelantados del teléfono no deben producir posiciones "futuras".
+            timestamp = min(timestamp, now)
+        else:
+            timestamp = now
+        return lat, lng, accuracy, timestamp
+
+    def add(self, driver_id, lat, lng, accuracy=None, timestamp=None):
+        with self._lock:
+            self._points.append((driver_id, lat, lng, accuracy, timestamp or timezone.now()))
+            due = (
+                len(self._points) >= self.max_points
+                or time.monotonic() - self._opened_at >= self.max_seconds
+            )
+            if not due and self.timer and self._timer is None:
+                self._timer = threading.Timer(self.max_seconds, self._flush_on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if due:
+            self.flush()
+
+    def _flush_on_timer(self):
+        try:
+            self.flush()
+        except Exception as exc:
+            logger.error(f"No se pudo vaciar el buffer GPS por antigüedad: {exc}")
+        finally:
+            # El hilo del temporizador abre su propia conexión
+            connection.close()
+
+    def __len__(self):
+        return len(self._points)
+
+    def flush(self):
+        """Escribe los puntos pendientes; devuelve cuántos se insertaron."""
+        with self._lock:
+            points, self._points = self._points, []
+            self._opened_at = time.monotonic()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not points:
+            return 0
+        if not self.shared:
+            return self._escribir(points)
+        try:
+            return self._escribir(points)
+        except Exception as exc:
+            with self._lock:
+                # Se conservan los más recientes: el buffer no crece sin límite mientras la base falla
+                self._points = (points + self._points)[-self.max_points:]
+            logger.error(f"No se pudieron escribir {len(points)} puntos GPS; se reintentarán: {exc}")
+            return 0
+
+    def _escribir(self, points):
+        latest = {}
+        for point in points:
+            current = latest.get(point[0])
+            if current is None or point[4] >= current[4]:
+                latest[point[0]] = point
+
+        with transaction.atomic():
+            drivers = list(Driver.objects.filter(pk__in=latest).only('id', 'ultima_actualizacion_posicion'))
+            if len(drivers) < len(latest):
+                existentes = {driver.id for driver in drivers}
+                recibidos = len(points)
+                points = [point for point in points if point[0] in existentes]
+                logger.warning(f"GPS: {recibidos - len(points)} puntos descartados de conductores inexistentes")
+            DriverLocation.objects.bulk_create([
+                DriverLocation(driver_id=driver_id, lat=lat, lng=lng, accuracy=accuracy, timestamp=ts)
+                for driver_id, lat, lng, accuracy, ts in points
+            ], batch_size=1000)
+
+            changed = []
+            ahora = timezone.now()
+            for driver in drivers:
+                _, lat, lng, _, ts = latest[driver.id]
+                if driver.ultima_actualizacion_posicion and driver.ultima_actualizacion_posicion > ts:
+                    continue
+                driver.ultima_posicion_lat = lat
+                driver.ultima_posicion_lng = lng
+                driver.ultima_actualizacion_posicion = ts
+                driver.updated_at = ahora
+                changed.append(driver)
+            if changed:
+                Driver.objects.bulk_update(
+                    changed,
+                    ['ultima_posicion_lat', 'ultima_posicion_lng', 'ultima_actualizacion_posicion', 'updated_at'],
+                )
+        logger.debug(f"GPS: {len(points)} puntos escritos, {len(drivers)} conductores actualizados")
+        return len(points)
+
+
+_shared_buffer = None
+_shared_lock = threading.Lock()
+
+
+def shared_buffer():
+    """Buffer del proceso para pings individuales (GPS_BUFFER_SINGLE_POINTS)."""
+    global _shared_buffer
+    with _shared_lock:
+        if _shared_buffer is None:
+            _shared_buffer = LocationBuffer(timer=True, shared=True)
+            atexit.register(_flush_shared_buffer)
+        return _shared_buffer
+
+
+def _flush_shared_buffer():
+    try:
+        if _shared_buffer is not None:
+            _shared_buffer.flush()
+    except Exception as exc:
+        logger.error(f"No se pudo vaciar el buffer GPS al cerrar el proceso: {exc}")
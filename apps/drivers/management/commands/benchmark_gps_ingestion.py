@@ -0,0 +1,63 @@
+"""Mide el throughput de ingesta GPS: escritura punto a punto vs. LocationBuffer."""
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.drivers.ingestion import LocationBuffer
+from apps.drivers.models import Driver, DriverLocation
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark GPS ingestion throughput (points/second). All writes are rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drivers', type=int, default=100)
+        parser.add_argument('--points', type=int, default=20, help='Puntos por conductor')
+        parser.add_argument('--batch', type=int, default=500, help='Tamaño de flush del buffer')
+
+    def handle(self, *args, **options):
+        drivers_n, points_n, batch = options['drivers'], options['points'], options['batch']
+        samples = [
+            (-33.45 + random.uniform(-0.2, 0.2), -70.65 + random.uniform(-0.2, 0.2))
+            for _ in range(drivers_n * points_n)
+        ]
+        resultados = {}
+        for modo in ('punto_a_punto', 'buffer'):
+            try:
+                with transaction.atomic():
+                    drivers = Driver.objects.bulk_create([
+                        Driver(nombre=f'bench-gps-{i}', activo=False, presente=False)
+                        for i in range(drivers_n)
+                    ])
+                    start = time.perf_counter()
+                    if modo == 'punto_a_punto':
+                        for index, (lat, lng) in enumerate(samples):
+                            driver = drivers[index % drivers_n]
+                            driver.actualizar_posicion(round(lat, 6), round(lng, 6), 10.0)
+                    else:
+                        buffer = LocationBuffer(max_points=batch, max_seconds=float('inf'))
+                        for index, (lat, lng) in enumerate(samples):
+                            parsed = LocationBuffer.parse_point({'lat': lat, 'lng': lng, 'accuracy': 10.0})
+                            buffer.add(drivers[index % drivers_n].pk, *parsed)
+                        buffer.flush()
+                    elapsed = time.perf_counter() - start
+                    escritos = DriverLocation.objects.filter(driver__in=drivers).count()
+                    raise _Rollback()
+            except _Rollback:
+                pass
+            resultados[modo] = (escritos, elapsed)
+            self.stdout.write(
+                f'{modo:>14}: {escritos} puntos en {elapsed:.2f}s '
+                f'→ {escritos / elapsed:,.0f} puntos/s'
+            )
+
+        base = resultados['punto_a_punto']
+        buffered = resultados['buffer']
+        speedup = (buffered[0] / buffered[1]) / (base[0] / base[1])
+        self.stdout.write(self.style.SUCCESS(f'Aceleración del buffer: {speedup:.1f}x'))
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:08
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drivers', '0004_driver_patente'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='driverlocation',
+            name='timestamp',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Fecha/Hora'),
+        ),
+    ]
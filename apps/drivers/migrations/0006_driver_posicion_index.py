@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:47
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drivers', '0005_driverlocation_timestamp_default'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='driver',
+            index=models.Index(fields=['ultima_actualizacion_posicion'], name='drivers_dri_ultima__8780f0_idx'),
+        ),
+    ]
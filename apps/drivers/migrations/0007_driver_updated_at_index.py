@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drivers', '0006_driver_posicion_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='driver',
+            index=models.Index(fields=['updated_at'], name='drivers_dri_updated_062282_idx'),
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
@@ -76,6 +77,8 @@ class Driver(models.Model):
         indexes = [
             models.Index(fields=['nombre']),
             models.Index(fields=['presente', 'activo']),
+            models.Index(fields=['ultima_actualizacion_posicion']),
+            models.Index(fields=['updated_at']),
         ]
     
     def __str__(self):
@@ -99,11 +102,21 @@ class Driver(models.Model):
         return porcentaje.quantize(Decimal('0.01'))
     
     def actualizar_posicion(self, lat, lng, accuracy=None):
-        """Actualiza la posición GPS del conductor"""
+        """
+        Actualiza la posición GPS del conductor
+        
+        Con GPS_BUFFER_SINGLE_POINTS activo el punto se encola en el buffer
+        del proceso (apps.drivers.ingestion) y se escribe en lote.
+        """
         self.ultima_posicion_lat = lat
         self.ultima_posicion_lng = lng
         self.ultima_actualizacion_posicion = timezone.now()
-        self.save(update_fields=['ultima_posicion_lat', 'ultima_posicion_lng', 'ultima_actualizacion_posicion'])
+        if getattr(settings, 'GPS_BUFFER_SINGLE_POINTS', False):
+            from .ingestion import shared_buffer
+            shared_buffer().add(self.pk, lat, lng, accuracy, self.ultima_actualizacion_posicion)
+            return
+        # updated_at es el cursor del feed de flota (apps.drivers.fleet_feed)
+        self.save(update_fields=['ultima_posicion_lat', 'ultima_posicion_lng', 'ultima_actualizacion_posicion', 'updated_at'])
         
         # Crear registro de historial
         DriverLocation.objects.create(
@@ -131,7 +144,8 @@ class DriverLocation(models.Model):
     lat = models.DecimalField(max_digits=9, decimal_places=6, verbose_name='Latitud')
     lng = models.DecimalField(max_digits=9, decimal_places=6, verbose_name='Longitud')
     accuracy = models.FloatField(null=True, blank=True, verbose_name='Precisión (metros)')
-    timestamp = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Fecha/Hora')
+    # default (no auto_now_add) para conservar la hora de captura de lotes offline
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True, verbose_name='Fecha/Hora')
     
     class Meta:
         verbose_name = 'Ubicación de Conductor'
@@ -1,3 +1,4 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
 from .models import Driver, DriverLocation
 from .access import asegurar_acceso
@@ -80,63 +81,91 @@ class DriverSerializer(serializers.ModelSerializer):
 
 
 class DriverDetailSerializer(DriverSerializer):
-    """Serializer detallado para conductores con programaciones asignadas"""
+    """
+    Serializer detallado para conductores con programaciones asignadas
+
+    Las programaciones visibles (contenedor en ESTADOS_VISIBLES) se filtran en
+    la base de datos. Para varios conductores o en vistas, precargar con
+    `programaciones_prefetch()`; sin precarga se consultan por conductor.
+    """
+    
+    ESTADOS_VISIBLES = ('programado', 'asignado', 'en_ruta', 'entregado', 'soltado', 'descargado', 'vacio')
+    # Columnas que usa get_programaciones_asignadas
+    CAMPOS_PROGRAMACION = (
+        'id', 'driver_id', 'cliente', 'fecha_asignacion', 'fecha_programada', 'fecha_inicio_ruta',
+        'fecha_arribo_cd', 'gps_arribo_lat', 'gps_arribo_lng', 'origen_arribo', 'eta_minutos', 'distancia_km',
+        'container__container_id', 'container__estado',
+        'cd__nombre', 'cd__direccion', 'cd__permite_soltar_contenedor',
+    )
+    PREFETCH_ATTR = 'programaciones_visibles'
     
     programaciones_asignadas = serializers.SerializerMethodField()
     
     class Meta(DriverSerializer.Meta):
         fields = DriverSerializer.Meta.fields + ['programaciones_asignadas']
+
+    @classmethod
+    def programaciones_queryset(cls):
+        from apps.programaciones.models import Programacion
+
+        return (
+            Programacion.objects.filter(container__estado__in=cls.ESTADOS_VISIBLES)
+            .select_related('container', 'cd')
+            .only(*cls.CAMPOS_PROGRAMACION)
+            .order_by('fecha_programada', 'id')
+        )
+
+    @classmethod
+    def programaciones_prefetch(cls):
+        """Prefetch de las programaciones visibles en `PREFETCH_ATTR`."""
+        return Prefetch('programaciones', queryset=cls.programaciones_queryset(), to_attr=cls.PREFETCH_ATTR)
     
     def get_programaciones_asignadas(self, obj):
         """Retorna programaciones asignadas al conductor con información de ETA"""
-        from apps.programaciones.models import Programacion
         from django.utils import timezone
         from datetime import timedelta
         
-        # Get all programaciones for this driver
-        programaciones = Programacion.objects.filter(
-            driver=obj
-        ).select_related('container', 'cd')
+        programaciones = getattr(obj, self.PREFETCH_ATTR, None)
+        if programaciones is None:
+            programaciones = self.programaciones_queryset().filter(driver=obj)
         
         resultado = []
         for prog in programaciones:
-            # Filter by estado after retrieval since it's a property
-            estado = prog.estado
-            if estado in ['programado', 'asignado', 'en_ruta', 'entregado', 'soltado', 'descargado', 'vacio']:
-                item = {
-                    'id': prog.id,
-                    'contenedor': prog.container.container_id_formatted if prog.container else None,
-                    'cliente': prog.cliente,
-                    'cd': prog.cd.nombre if prog.cd else None,
-                    'cd_direccion': prog.cd.direccion if prog.cd else None,
-                    'cd_permite_soltar': prog.cd.permite_soltar_contenedor if prog.cd else False,
-                    'estado': estado,
-                    'fecha_asignacion': prog.fecha_asignacion,
-                    'fecha_programada': prog.fecha_programada,
-                    'fecha_inicio_ruta': prog.fecha_inicio_ruta,
-                    'fecha_arribo_cd': prog.fecha_arribo_cd,
-                    'gps_arribo_lat': prog.gps_arribo_lat,
-                    'gps_arribo_lng': prog.gps_arribo_lng,
-                    'origen_arribo': prog.origen_arribo,
-                    # Información de ETA
-                    'eta_minutos': prog.eta_minutos,
-                    'distancia_km': float(prog.distancia_km) if prog.distancia_km else None,
-                }
-                
-                # El ETA original se ancla al inicio real de ruta. Usar now() aquí
-                # desplazaría artificialmente la llegada estimada en cada recarga.
-                if estado == 'en_ruta' and prog.fecha_inicio_ruta and prog.eta_minutos is not None:
-                    item['eta_timestamp'] = prog.fecha_inicio_ruta + timedelta(minutes=prog.eta_minutos)
-                    transcurrido = max(
-                        0,
-                        int((timezone.now() - prog.fecha_inicio_ruta).total_seconds() / 60),
-                    )
-                    item['eta_restante_minutos'] = max(0, prog.eta_minutos - transcurrido)
-                else:
-                    item['eta_timestamp'] = None
-                    item['eta_restante_minutos'] = None
-                
-                resultado.append(item)
+            estado = prog.container.estado
+            item = {
+                'id': prog.id,
+                'contenedor': prog.container.container_id_formatted,
+                'cliente': prog.cliente,
+                'cd': prog.cd.nombre if prog.cd else None,
+                'cd_direccion': prog.cd.direccion if prog.cd else None,
+                'cd_permite_soltar': prog.cd.permite_soltar_contenedor if prog.cd else False,
+                'estado': estado,
+                'fecha_asignacion': prog.fecha_asignacion,
+                'fecha_programada': prog.fecha_programada,
+                'fecha_inicio_ruta': prog.fecha_inicio_ruta,
+                'fecha_arribo_cd': prog.fecha_arribo_cd,
+                'gps_arribo_lat': prog.gps_arribo_lat,
+                'gps_arribo_lng': prog.gps_arribo_lng,
+                'origen_arribo': prog.origen_arribo,
+                # Información de ETA
+                'eta_minutos': prog.eta_minutos,
+                'distancia_km': float(prog.distancia_km) if prog.distancia_km else None,
+            }
+            
+            # El ETA original se ancla al inicio real de ruta. Usar now() aquí
+            # desplazaría artificialmente la llegada estimada en cada recarga.
+            if estado == 'en_ruta' and prog.fecha_inicio_ruta and prog.eta_minutos is not None:
+                item['eta_timestamp'] = prog.fecha_inicio_ruta + timedelta(minutes=prog.eta_minutos)
+                transcurrido = max(
+                    0,
+                    int((timezone.now() - prog.fecha_inicio_ruta).total_seconds() / 60),
+                )
+                item['eta_restante_minutos'] = max(0, prog.eta_minutos - transcurrido)
+            else:
+                item['eta_timestamp'] = None
+                item['eta_restante_minutos'] = None
+            
+            resultado.append(item)
         
         return resultado
 
@@ -1,4 +1,6 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import OperationalError, connection
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.utils import timezone
@@ -6,6 +8,8 @@ from datetime import timedelta
 from rest_framework.test import APITestCase
 from rest_framework import status
 
+from .fleet_feed import FleetFeed
+from .ingestion import LocationBuffer
 from .models import Driver, DriverLocation
 from .serializers import DriverDetailSerializer
 from apps.cds.models import CD
@@ -16,6 +20,7 @@ from .importers import ConductorImporter
 from unittest.mock import patch
 import pandas as pd
 import tempfile
+import threading
 
 
 class DriverAuthenticationTests(TestCase):
@@ -202,6 +207,174 @@ class DriverGPSTrackingTests(APITestCase):
         
         self.assertEqual(response.status_code, 403)
 
+class DriverGPSBatchIngestionTests(APITestCase):
+    """Tests for batched GPS ingestion"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='batch_driver', password='test123')
+        self.driver = Driver.objects.create(nombre='Batch Driver', user=self.user)
+        self.url = reverse('driver-track-locations-batch', kwargs={'pk': self.driver.id})
+    
+    def test_batch_inserts_history_and_keeps_latest_position(self):
+        self.client.force_authenticate(user=self.user)
+        base = timezone.now() - timedelta(minutes=10)
+        points = [
+            {'lat': -33.40 - i / 100, 'lng': -70.60, 'accuracy': 5,
+             'timestamp': (base + timedelta(minutes=i)).isoformat()}
+            for i in range(5)
+        ]
+        points.append({'lat': 'x', 'lng': -70.60})
+        points.append({'lat': 'NaN', 'lng': -70.60})
+        # Orden de llegada distinto al de captura (buffer offline)
+        points[0], points[4] = points[4], points[0]
+        
+        response = self.client.post(self.url, {'points': points}, format='json')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['aceptados'], 5)
+        self.assertEqual(response.data['rechazados'], 2)
+        self.assertEqual(DriverLocation.objects.filter(driver=self.driver).count(), 5)
+        self.driver.refresh_from_db()
+        self.assertEqual(float(self.driver.ultima_posicion_lat), -33.44)
+        self.assertEqual(self.driver.ultima_actualizacion_posicion, base + timedelta(minutes=4))
+        oldest = DriverLocation.objects.filter(driver=self.driver).order_by('timestamp').first()
+        self.assertEqual(oldest.timestamp, base)
+    
+    def test_older_batch_does_not_rewind_current_position(self):
+        self.driver.actualizar_posicion(-33.1, -70.1)
+        self.client.force_authenticate(user=self.user)
+        old = (timezone.now() - timedelta(hours=1)).isoformat()
+        response = self.client.post(self.url, {'points': [{'lat': -33.9, 'lng': -70.9, 'timestamp': old}]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.driver.refresh_from_db()
+        self.assertEqual(float(self.driver.ultima_posicion_lat), -33.1)
+        self.assertEqual(DriverLocation.objects.filter(driver=self.driver).count(), 2)
+    
+    def test_batch_rejects_other_drivers_and_empty_payloads(self):
+        other = User.objects.create_user(username='other_batch', password='test123')
+        self.client.force_authenticate(user=other)
+        response = self.client.post(self.url, {'points': [{'lat': -33.4, 'lng': -70.6}]}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(self.url, {'points': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_shared_buffer_skips_deleted_drivers(self):
+        borrado = Driver.objects.create(nombre='Borrado')
+        buffer = LocationBuffer(max_points=100, max_seconds=float('inf'), shared=True)
+        buffer.add(self.driver.pk, -33.4, -70.6)
+        buffer.add(borrado.pk, -33.5, -70.7)
+        borrado.delete()
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(list(DriverLocation.objects.values_list('driver_id', flat=True)), [self.driver.pk])
+        self.driver.refresh_from_db()
+        self.assertEqual(float(self.driver.ultima_posicion_lat), -33.4)
+
+    def test_shared_buffer_keeps_points_when_the_write_fails(self):
+        buffer = LocationBuffer(max_points=2, max_seconds=float('inf'), shared=True)
+        with patch.object(DriverLocation.objects, 'bulk_create', side_effect=OperationalError('locked')):
+            buffer.add(self.driver.pk, -33.4, -70.6)
+            buffer.add(self.driver.pk, -33.41, -70.61)
+            buffer.add(self.driver.pk, -33.42, -70.62)
+        self.assertEqual(len(buffer), 2)
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(DriverLocation.objects.filter(driver=self.driver).count(), 2)
+
+    def test_timer_flushes_quiet_buffer(self):
+        buffer = LocationBuffer(max_points=100, max_seconds=0.05, timer=True)
+        vaciado = threading.Event()
+        with patch.object(LocationBuffer, 'flush', side_effect=lambda: vaciado.set()):
+            buffer.add(self.driver.pk, -33.4, -70.6)
+            self.assertTrue(vaciado.wait(2))
+
+
+class FleetFeedTests(APITestCase):
+    """Tests for the delta-encoded fleet position feed"""
+
+    def setUp(self):
+        ahora = timezone.now()
+        self.a = Driver.objects.create(
+            nombre='Driver A', ultima_posicion_lat=-33.40, ultima_posicion_lng=-70.60, ultima_actualizacion_posicion=ahora,
+        )
+        self.b = Driver.objects.create(
+            nombre='Driver B', ultima_posicion_lat=-33.50, ultima_posicion_lng=-70.70, ultima_actualizacion_posicion=ahora,
+        )
+        # Las altas quedan fuera del margen de relectura del cursor
+        Driver.objects.update(updated_at=ahora - timedelta(minutes=1))
+        self.url = reverse('driver-fleet-feed')
+
+    def test_delta_contains_only_moved_drivers(self):
+        inicial = self.client.get(self.url).data
+        self.assertTrue(inicial['completo'])
+        self.assertEqual([d['id'] for d in inicial['actualizados']], [self.a.id, self.b.id])
+
+        self.a.actualizar_posicion(-33.41, -70.61)
+        delta = self.client.get(self.url, {'version': inicial['version']}).data
+        self.assertFalse(delta['completo'])
+        self.assertEqual([d['id'] for d in delta['actualizados']], [self.a.id])
+        self.assertEqual(delta['actualizados'][0]['lat'], -33.41)
+
+        Driver.objects.update(updated_at=timezone.now() - timedelta(minutes=1))
+        with CaptureQueriesContext(connection) as ctx:
+            vacio = self.client.get(self.url, {'version': delta['version']}).data
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual((vacio['actualizados'], vacio['eliminados']), ([], []))
+
+    def test_token_is_valid_across_processes(self):
+        token = FleetFeed.token(timezone.now() - timedelta(seconds=10))
+        data = self.client.get(self.url, {'version': token}).data
+        self.assertFalse(data['completo'])
+        self.assertEqual(data['actualizados'], [])
+
+    def test_unusable_token_gets_full_snapshot(self):
+        ahora = timezone.now()
+        viejo = FleetFeed.token(ahora - timedelta(minutes=31))
+        futuro = FleetFeed.token(ahora + timedelta(minutes=5))
+        for token in ('otro-3', viejo, futuro, '9' * 40, 'basura'):
+            data = self.client.get(self.url, {'version': token}).data
+            self.assertTrue(data['completo'])
+            self.assertEqual(len(data['actualizados']), 2)
+
+    def test_drivers_leaving_the_active_window_are_removed(self):
+        token = FleetFeed.token(timezone.now() - timedelta(seconds=10))
+        # B dejó de reportar hace más de 30 minutos; C fue desactivado
+        Driver.objects.filter(pk=self.b.pk).update(ultima_actualizacion_posicion=timezone.now() - timedelta(minutes=30, seconds=5))
+        c = Driver.objects.create(
+            nombre='Driver C', activo=False, ultima_posicion_lat=-33.6, ultima_posicion_lng=-70.8,
+            ultima_actualizacion_posicion=timezone.now(),
+        )
+        Driver.objects.filter(pk=self.a.pk).update(ultima_posicion_lat=-33.45, updated_at=timezone.now())
+
+        delta = self.client.get(self.url, {'version': token}).data
+        self.assertEqual([d['id'] for d in delta['actualizados']], [self.a.id])
+        self.assertEqual(delta['actualizados'][0]['lat'], -33.45)
+        self.assertEqual(delta['eliminados'], [self.b.id, c.id])
+
+    def test_batch_flush_advances_cursor(self):
+        inicial = self.client.get(self.url).data
+        self.client.force_authenticate(user=User.objects.create_user(username='flota_b', password='x'))
+        Driver.objects.filter(pk=self.b.pk).update(user=User.objects.get(username='flota_b'))
+        punto = {'lat': -33.52, 'lng': -70.72, 'timestamp': timezone.now().isoformat()}
+        response = self.client.post(
+            reverse('driver-track-locations-batch', kwargs={'pk': self.b.id}), {'points': [punto]}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        delta = self.client.get(self.url, {'version': inicial['version']}).data
+        self.assertEqual([(d['id'], d['lat']) for d in delta['actualizados']], [(self.b.id, -33.52)])
+
+    def test_stream_requires_setting_and_async_worker(self):
+        url = reverse('driver-fleet-feed-stream')
+        self.assertEqual(self.client.get(url).status_code, 404)
+        with override_settings(FLEET_FEED_SSE_ENABLED=True, GUNICORN_WORKER_CLASS='sync'):
+            self.assertEqual(self.client.get(url).status_code, 404)
+        with override_settings(FLEET_FEED_SSE_ENABLED=True, GUNICORN_WORKER_CLASS='gevent', FLEET_FEED_SSE_MAX_SECONDS=0):
+            response = self.client.get(url, HTTP_ACCEPT='text/event-stream')
+            self.assertEqual(response.status_code, 200)
+            cuerpo = b''.join(response.streaming_content).decode()
+        self.assertIn('event: flota', cuerpo)
+        self.assertRegex(cuerpo, r'id: \d+\n')
+
+
 class DriverModelTests(TestCase):
     """Tests for Driver model"""
     
@@ -300,6 +473,50 @@ class DriverRouteTimelineSerializerTests(TestCase):
         self.assertIn(item['eta_restante_minutos'], (29, 30))
 
 
+class DriverMyInfoTests(APITestCase):
+    """my_info filters programaciones in the database and answers unchanged polls with 304."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='info_driver', password='test123')
+        self.driver = Driver.objects.create(nombre='Info Driver', user=self.user)
+        cd = CD.objects.create(nombre='Info CD', codigo='INFO', direccion='Destino', comuna='Santiago', lat=-33.45, lng=-70.65)
+        self.activo = Container.objects.create(container_id='INFO1234567', estado='asignado', cliente='Cliente')
+        cerrado = Container.objects.create(container_id='DONE1234567', estado='devuelto', cliente='Cliente')
+        for container in (self.activo, cerrado):
+            Programacion.objects.create(
+                container=container, cd=cd, cliente='Cliente', fecha_programada=timezone.now() + timedelta(hours=1),
+            )
+        Programacion.objects.update(driver=self.driver)
+        self.url = reverse('driver-my-info', kwargs={'pk': self.driver.id})
+        self.client.force_authenticate(user=self.user)
+
+    def test_only_visible_states_in_two_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(ctx.captured_queries), 2)
+        programaciones = response.data['programaciones_asignadas']
+        self.assertEqual([p['contenedor'] for p in programaciones], [self.activo.container_id_formatted])
+        self.assertEqual(programaciones[0]['estado'], 'asignado')
+
+    def test_unchanged_poll_returns_304_until_state_changes(self):
+        etag = self.client.get(self.url)['ETag']
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        Container.objects.filter(pk=self.activo.pk).update(estado='en_ruta', updated_at=timezone.now())
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['programaciones_asignadas'][0]['estado'], 'en_ruta')
+
+    def test_other_driver_is_rejected(self):
+        self.client.force_authenticate(user=User.objects.create_user(username='otro_info', password='x'))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
 class DriverAccessAndCrudTests(APITestCase):
     def setUp(self):
         self.staff = User.objects.create_user('staff', password='StrongPass123!', is_staff=True)
@@ -2,23 +2,31 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
+from django.conf import settings
+from django.db.models import Count, Max, Q, prefetch_related_objects
 from django.utils import timezone
+from django.utils.http import parse_etags, quote_etag
 from datetime import timedelta
+import hashlib
 
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 
+from .fleet_feed import EventStreamRenderer, FleetFeed
+from .ingestion import LocationBuffer
 from .models import Driver, DriverLocation
 from .serializers import (
     DriverSerializer, DriverDetailSerializer, DriverListSerializer,
     DriverLocationSerializer,
 )
 from .access import asegurar_acceso
+from apps.core.services.import_jobs import ImportJobService
 
 
 # ============================================
@@ -85,7 +93,7 @@ class DriverViewSet(viewsets.ModelViewSet):
 
     def get_permissions(self):
         """Lecturas operativas públicas; datos privados y mutaciones, restringidos."""
-        if self.action in {'list', 'active_locations', 'verify_patente'}:
+        if self.action in {'list', 'active_locations', 'fleet_feed', 'fleet_feed_stream', 'verify_patente'}:
             classes = [AllowAny]
         elif self.action in {
             'create', 'update', 'partial_update', 'destroy', 'import_excel',
@@ -131,9 +139,42 @@ class DriverViewSet(viewsets.ModelViewSet):
         
         if presente is not None:
             queryset = queryset.filter(presente=presente.lower() == 'true')
+
+        if self.action == 'my_info':
+            queryset = self._con_version_detalle(queryset)
         
         return queryset.order_by('nombre')
 
+    @staticmethod
+    def _con_version_detalle(queryset):
+        """
+        Anota lo que cambia el detalle de programaciones: última modificación de
+        programaciones y contenedores visibles, cuántas hay y cuántas en ruta.
+        """
+        visibles = Q(programaciones__container__estado__in=DriverDetailSerializer.ESTADOS_VISIBLES)
+        return queryset.annotate(
+            programaciones_version=Max('programaciones__updated_at', filter=visibles),
+            contenedores_version=Max('programaciones__container__updated_at', filter=visibles),
+            programaciones_total=Count('programaciones', filter=visibles),
+            programaciones_en_ruta=Count('programaciones', filter=Q(programaciones__container__estado='en_ruta')),
+        )
+
+    @staticmethod
+    def _etag_detalle(driver):
+        """ETag de my_info a partir de las columnas del conductor y la versión anotada."""
+        partes = [
+            getattr(driver, campo.attname) for campo in driver._meta.concrete_fields
+            if campo.name in DriverDetailSerializer.Meta.fields
+        ]
+        partes += [
+            driver.programaciones_version, driver.contenedores_version,
+            driver.programaciones_total, driver.programaciones_en_ruta,
+        ]
+        if driver.programaciones_en_ruta:
+            # eta_restante_minutos avanza con el reloj
+            partes.append(timezone.now().replace(second=0, microsecond=0))
+        return quote_etag(hashlib.sha1(repr(partes).encode('utf-8')).hexdigest()[:20])
+
     def retrieve(self, request, *args, **kwargs):
         driver = self.get_object()
         if not (request.user.is_staff or request.user.is_superuser or
@@ -225,6 +266,40 @@ class DriverViewSet(viewsets.ModelViewSet):
             })
         
         return Response(resultado)
+
+    @action(detail=False, methods=['get'])
+    def fleet_feed(self, request):
+        """
+        Posiciones de conductores activos como delta desde `version`
+
+        GET /api/drivers/fleet_feed/?version=<token>
+
+        Devuelve {version, completo, actualizados, eliminados}. Sin token (o con
+        uno ilegible o anterior a la ventana activa) `completo` es true y
+        `actualizados` trae la flota activa entera, con el mismo formato que
+        active_locations.
+        """
+        return Response(FleetFeed.cambios(request.query_params.get('version')))
+
+    @action(
+        detail=False, methods=['get'], url_path='fleet_feed/stream',
+        renderer_classes=[JSONRenderer, EventStreamRenderer],
+    )
+    def fleet_feed_stream(self, request):
+        """
+        Mismo delta que fleet_feed como Server-Sent Events
+
+        GET /api/drivers/fleet_feed/stream/
+
+        Requiere FLEET_FEED_SSE_ENABLED y un worker asíncrono de gunicorn.
+        """
+        if not FleetFeed.sse_enabled():
+            raise Http404
+        token = request.headers.get('Last-Event-ID') or request.query_params.get('version')
+        response = StreamingHttpResponse(FleetFeed.eventos(token), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
     
     @action(detail=True, methods=['get'])
     def my_info(self, request, pk=None):
@@ -235,18 +310,25 @@ class DriverViewSet(viewsets.ModelViewSet):
         """
         driver = self.get_object()
         
-        # Verificar que el usuario autenticado es el conductor
-        is_authorized = False
-        if request.user.is_authenticated:
-            if hasattr(request.user, 'driver') and request.user.driver == driver:
-                is_authorized = True
-            # También permitir si es admin/staff
-            elif request.user.is_staff or request.user.is_superuser:
-                is_authorized = True
+        # Verificar que el usuario autenticado es el conductor (o admin/staff)
+        is_authorized = request.user.is_authenticated and (
+            driver.user_id == request.user.pk or request.user.is_staff or request.user.is_superuser
+        )
         
         if is_authorized:
-            serializer = DriverDetailSerializer(driver)
-            return Response(serializer.data)
+            # Sondeo sin cambios: 304 con la sola consulta de get_object
+            etag = self._etag_detalle(driver)
+            if getattr(settings, 'DRIVER_DETAIL_ETAG_ENABLED', True) and etag in parse_etags(
+                request.headers.get('If-None-Match', '')
+            ):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                prefetch_related_objects([driver], DriverDetailSerializer.programaciones_prefetch())
+                response = Response(DriverDetailSerializer(driver).data)
+            response['ETag'] = etag
+            # El navegador revalida siempre, enviando If-None-Match
+            response['Cache-Control'] = 'private, no-cache'
+            return response
         else:
             return Response(
                 {'error': 'No autorizado para ver esta información'},
@@ -317,6 +399,11 @@ class DriverViewSet(viewsets.ModelViewSet):
         
         archivo = request.FILES['file']
         usuario = request.user.username if request.user.is_authenticated else None
+
+        if ImportJobService.async_enabled(request):
+            # El worker (manage.py run_import_worker) procesa el archivo; el cliente sondea status_url.
+            job = ImportJobService.encolar('conductores', archivo, usuario)
+            return Response(ImportJobService.as_dict(job), status=status.HTTP_202_ACCEPTED)
         
         # Guardar temporalmente
         with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as tmp:
@@ -403,6 +490,52 @@ class DriverViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
     
+    @action(detail=True, methods=['post'], url_path='locations/batch')
+    def track_locations_batch(self, request, pk=None):
+        """
+        Registra un lote de puntos GPS (buffer offline de la app)
+        
+        POST /api/drivers/{id}/locations/batch/
+        Body: {
+            "points": [
+                {"lat": -33.4569, "lng": -70.6483, "accuracy": 10.5,
+                 "timestamp": "2025-01-10T08:15:00-03:00"},
+                ...
+            ]
+        }
+        
+        Response: {"ok": true, "aceptados": int, "rechazados": int}
+        """
+        driver = self.get_object()
+        if not (request.user.is_staff or request.user.is_superuser or
+                getattr(request.user, 'driver', None) == driver):
+            return Response({'error': 'No autorizado'}, status=status.HTTP_403_FORBIDDEN)
+        
+        points = request.data.get('points')
+        if not isinstance(points, list) or not points:
+            return Response(
+                {'error': 'Se requiere una lista "points" con al menos un punto'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        max_points = int(getattr(settings, 'GPS_BATCH_MAX_POINTS', 1000))
+        if len(points) > max_points:
+            return Response(
+                {'error': f'Máximo {max_points} puntos por lote'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        buffer = LocationBuffer(max_points=len(points) + 1, max_seconds=float('inf'))
+        rechazados = 0
+        for raw in points:
+            parsed = LocationBuffer.parse_point(raw) if isinstance(raw, dict) else None
+            if parsed is None:
+                rechazados += 1
+                continue
+            buffer.add(driver.pk, *parsed)
+        aceptados = buffer.flush()
+        
+        return Response({'ok': True, 'aceptados': aceptados, 'rechazados': rechazados})
+    
     @action(detail=True, methods=['post'], url_path='update-location')
     def update_location(self, request, pk=None):
         """
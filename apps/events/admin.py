@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Event
+from .models import Event, ParticionEventos
 
 
 @admin.register(Event)
@@ -28,3 +28,20 @@ class EventAdmin(admin.ModelAdmin):
     def has_change_permission(self, request, obj=None):
         # Los eventos no se pueden modificar
         return False
+
+
+@admin.register(ParticionEventos)
+class ParticionEventosAdmin(admin.ModelAdmin):
+    list_display = ['mes', 'filas', 'archivo', 'archivado_en']
+    readonly_fields = ['mes', 'archivo', 'filas', 'sha256', 'desde_id', 'hasta_id', 'archivado_en']
+
+    def get_queryset(self, request):
+        # El JSONL archivado puede pesar varios MB por mes
+        return super().get_queryset(request).defer('contenido')
+
+    def has_add_permission(self, request):
+        # Las particiones solo las crea `manage.py archive_events`
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,29 @@
+"""Mueve los meses fríos de la bitácora de eventos a archivos JSONL comprimidos."""
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.events.services import EventArchiveService
+
+
+class Command(BaseCommand):
+    help = 'Archive events older than the hot window to monthly gzip JSONL partitions (database or EVENTS_ARCHIVE_DIR) and delete them from the table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hot-months', type=int, default=None,
+                            help='Meses completos que se mantienen en la tabla (default EVENTS_HOT_MONTHS)')
+        parser.add_argument('--dir', default=None, help='Directorio persistente de archivo (default EVENTS_ARCHIVE_DIR; vacío = base de datos)')
+        parser.add_argument('--dry-run', action='store_true', help='Sólo listar los meses que se archivarían')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            corte = EventArchiveService.corte(hot_months=options['hot_months'])
+            meses = EventArchiveService.meses_archivables(corte)
+            self.stdout.write(f"Meses anteriores a {corte:%Y-%m}: {', '.join(f'{m:%Y-%m}' for m in meses) or 'ninguno'}")
+            return
+        try:
+            particiones = EventArchiveService.archivar(hot_months=options['hot_months'], directorio=options['dir'])
+        except (ImproperlyConfigured, ValueError) as exc:
+            raise CommandError(str(exc)) from exc
+        for particion in particiones:
+            self.stdout.write(f"{particion.mes:%Y-%m}: {particion.filas} eventos -> {particion.archivo or 'base de datos'}")
+        self.stdout.write(self.style.SUCCESS(f'Particiones archivadas: {len(particiones)}'))
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('containers', '0013_container_created_at_index'),
+        ('events', '0003_event_business_types'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParticionEventos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(db_index=True, help_text='Primer día del mes archivado', verbose_name='Mes')),
+                ('archivo', models.CharField(help_text='JSONL comprimido con gzip', max_length=500, verbose_name='Archivo')),
+                ('filas', models.PositiveIntegerField(default=0, verbose_name='Filas')),
+                ('sha256', models.CharField(max_length=64)),
+                ('desde_id', models.BigIntegerField(blank=True, null=True)),
+                ('hasta_id', models.BigIntegerField(blank=True, null=True)),
+                ('archivado_en', models.DateTimeField(auto_now_add=True, verbose_name='Archivado en')),
+            ],
+            options={
+                'verbose_name': 'Partición de eventos archivada',
+                'verbose_name_plural': 'Particiones de eventos archivadas',
+                'ordering': ['-mes', '-archivado_en'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='container',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='events', to='containers.container', verbose_name='Contenedor'),
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='event_type',
+            field=models.CharField(choices=[('import_embarque', 'Importación Embarque'), ('import_liberacion', 'Importación Liberación'), ('import_programacion', 'Importación Programación'), ('asignacion_driver', 'Asignación de Conductor'), ('inicio_ruta', 'Inicio de Ruta'), ('arribo_cd', 'Arribo a CD'), ('llegada_destino', 'Llegada a Destino'), ('contenedor_vacio', 'Contenedor Vacío'), ('contenedor_soltado', 'Contenedor Soltado (Drop & Hook)'), ('devolucion_vacio', 'Devolución Vacío'), ('alerta_48h', 'Alerta 48 Horas'), ('cambio_estado', 'Cambio de Estado'), ('actualizacion_posicion', 'Actualización de Posición'), ('exportacion_stock', 'Exportación de Stock'), ('asignacion_conductor', 'Asignación de Conductor'), ('incidente_reportado', 'Incidente Reportado')], max_length=50, verbose_name='Tipo de Evento'),
+        ),
+    ]
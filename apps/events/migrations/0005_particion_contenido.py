@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0004_event_log_particiones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='particioneventos',
+            name='contenido',
+            field=models.BinaryField(help_text='JSONL comprimido con gzip', null=True, verbose_name='Contenido'),
+        ),
+        migrations.AlterField(
+            model_name='particioneventos',
+            name='archivo',
+            field=models.CharField(blank=True, help_text='JSONL comprimido con gzip; vacío si el archivo está en `contenido`', max_length=500, verbose_name='Archivo'),
+        ),
+    ]
@@ -23,16 +23,17 @@ class Event(models.Model):
         ('incidente_reportado', 'Incidente Reportado'),
     ]
     
-    # Relación con contenedor
+    # Relación con contenedor (el índice (container, created_at) cubre las búsquedas por contenedor)
     container = models.ForeignKey(
         'containers.Container',
         on_delete=models.CASCADE,
         related_name='events',
-        verbose_name='Contenedor'
+        verbose_name='Contenedor',
+        db_index=False,
     )
     
-    # Tipo de evento
-    event_type = models.CharField('Tipo de Evento', max_length=50, choices=EVENT_TYPES, db_index=True)
+    # Tipo de evento (cubierto por el índice (event_type, created_at))
+    event_type = models.CharField('Tipo de Evento', max_length=50, choices=EVENT_TYPES)
     
     # Detalles en JSON
     detalles = models.JSONField('Detalles', default=dict, blank=True)
@@ -40,7 +41,7 @@ class Event(models.Model):
     # Usuario que realizó la acción
     usuario = models.CharField('Usuario', max_length=200, null=True, blank=True)
     
-    # Timestamp
+    # Timestamp (con EventLog, la hora del commit de la transacción)
     created_at = models.DateTimeField('Fecha', auto_now_add=True, db_index=True)
     
     class Meta:
@@ -54,3 +55,27 @@ class Event(models.Model):
     
     def __str__(self):
         return f"{self.get_event_type_display()} - {self.container.container_id} - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
+
+
+class ParticionEventos(models.Model):
+    """Mes de eventos archivado fuera de la tabla viva (ver EventArchiveService)."""
+
+    mes = models.DateField('Mes', db_index=True, help_text='Primer día del mes archivado')
+    archivo = models.CharField(
+        'Archivo', max_length=500, blank=True,
+        help_text='JSONL comprimido con gzip; vacío si el archivo está en `contenido`',
+    )
+    contenido = models.BinaryField('Contenido', null=True, editable=False, help_text='JSONL comprimido con gzip')
+    filas = models.PositiveIntegerField('Filas', default=0)
+    sha256 = models.CharField(max_length=64)
+    desde_id = models.BigIntegerField(null=True, blank=True)
+    hasta_id = models.BigIntegerField(null=True, blank=True)
+    archivado_en = models.DateTimeField('Archivado en', auto_now_add=True)
+
+    class Meta:
+        ordering = ['-mes', '-archivado_en']
+        verbose_name = 'Partición de eventos archivada'
+        verbose_name_plural = 'Particiones de eventos archivadas'
+
+    def __str__(self):
+        return f"{self.mes:%Y-%m} ({self.filas} eventos)"
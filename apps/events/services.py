@@ -0,0 +1,247 @@
+"""
+Bitácora de eventos: escritura agrupada por transacción y archivo mensual.
+
+EventLog.registrar reemplaza a Event.objects.create. Dentro de una
+transacción los eventos se acumulan y se insertan con un solo bulk_create al
+hacer commit (transaction.on_commit); si la transacción se revierte, los
+eventos desaparecen con ella. Los eventos registrados dentro de un savepoint se
+agrupan aparte, para que un rollback parcial descarte sólo los suyos: el costo
+es un INSERT por transacción (más uno por savepoint anidado que registre
+eventos). Fuera de una transacción se insertan de inmediato.
+
+La tabla viva guarda sólo los últimos EVENTS_HOT_MONTHS meses completos más el
+mes en curso. `manage.py archive_events` mueve cada mes anterior a un JSONL
+comprimido (una partición por mes, registrada en ParticionEventos con su
+sha256) y lo borra de la tabla. Por defecto el archivo se guarda en la misma
+base de datos (ParticionEventos.contenido); con EVENTS_ARCHIVE_DIR se escribe
+en ese directorio, que debe ser un volumen persistente fuera del despliegue.
+Las filas se borran sólo después de releer el archivo y comprobar su sha256.
+"""
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import weakref
+from datetime import date, datetime, time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from .models import Event, ParticionEventos
+
+logger = logging.getLogger(__name__)
+
+# Volcados pendientes del hilo por (alias, savepoints). Referencias débiles: si
+# la transacción o el savepoint se revierten, Django suelta el callback y la
+# entrada desaparece sola.
+_pendientes = threading.local()
+
+
+class _Volcado:
+    """Callback on_commit con los eventos de un nivel de savepoint."""
+
+    def __init__(self, using):
+        self.using = using
+        self.eventos = []
+        self.ejecutado = False
+
+    def __call__(self):
+        self.ejecutado = True
+        try:
+            Event.objects.using(self.using).bulk_create(self.eventos, batch_size=EventLog.batch_size())
+        except Exception as exc:
+            # La transacción ya se confirmó: la bitácora no puede revertirla
+            logger.error(f"No se pudieron guardar {len(self.eventos)} eventos: {exc}")
+
+
+class EventLog:
+    @staticmethod
+    def enabled() -> bool:
+        return bool(getattr(settings, 'EVENTS_BUFFERED', True))
+
+    @staticmethod
+    def batch_size() -> int:
+        return int(getattr(settings, 'EVENTS_BATCH_SIZE', 500))
+
+    @classmethod
+    def registrar(cls, container, event_type, detalles=None, usuario=None, using=DEFAULT_DB_ALIAS):
+        """Registra un evento; dentro de una transacción se inserta al hacer commit."""
+        evento = Event(container=container, event_type=event_type, detalles=detalles or {}, usuario=usuario)
+        cls.registrar_eventos([evento], using=using)
+        return evento
+
+    @classmethod
+    def registrar_eventos(cls, eventos, using=DEFAULT_DB_ALIAS):
+        eventos = list(eventos)
+        if not eventos:
+            return
+        connection = connections[using]
+        if not cls.enabled() or not connection.in_atomic_block:
+            Event.objects.using(using).bulk_create(eventos, batch_size=cls.batch_size())
+            return
+        clave = (using, tuple(connection.savepoint_ids))
+        volcado = cls._volcados_pendientes().get(clave)
+        if volcado is None or volcado.ejecutado:
+            volcado = _Volcado(using)
+            cls._volcados_pendientes()[clave] = volcado
+            transaction.on_commit(volcado, using=using, robust=True)
+        volcado.eventos.extend(eventos)
+
+    @staticmethod
+    def _volcados_pendientes():
+        """Volcados registrados por nivel de savepoint en el hilo actual."""
+        if not hasattr(_pendientes, 'volcados'):
+            _pendientes.volcados = weakref.WeakValueDictionary()
+        return _pendientes.volcados
+
+
+def _inicio_mes(valor: date) -> datetime:
+    return timezone.make_aware(datetime.combine(valor.replace(day=1), time.min))
+
+
+def _mes_siguiente(valor: date) -> date:
+    return date(valor.year + valor.month // 12, valor.month % 12 + 1, 1)
+
+
+class EventArchiveService:
+    COLUMNAS = ('id', 'container_id', 'container__container_id', 'event_type', 'detalles', 'usuario', 'created_at')
+
+    @staticmethod
+    def hot_months() -> int:
+        return int(getattr(settings, 'EVENTS_HOT_MONTHS', 3))
+
+    @staticmethod
+    def archive_dir():
+        """Directorio de archivo configurado, o None para guardar las particiones en la base de datos."""
+        directorio = getattr(settings, 'EVENTS_ARCHIVE_DIR', '')
+        return Path(directorio) if directorio else None
+
+    @staticmethod
+    def validar_directorio(directorio: Path) -> Path:
+        """
+        Rechaza directorios dentro del despliegue (BASE_DIR): en Render ese
+        disco es efímero y el borrado posterior perdería los eventos.
+        """
+        directorio = Path(directorio).resolve()
+        base = Path(settings.BASE_DIR).resolve()
+        if directorio == base or base in directorio.parents:
+            raise ImproperlyConfigured(
+                f"EVENTS_ARCHIVE_DIR={directorio} está dentro del despliegue ({base}), que no es persistente. "
+                "Usa un volumen persistente o deja EVENTS_ARCHIVE_DIR vacío para archivar en la base de datos."
+            )
+        return directorio
+
+    @classmethod
+    def corte(cls, ahora=None, hot_months=None) -> datetime:
+        """Inicio del mes más antiguo que se mantiene en la tabla viva."""
+        hot_months = cls.hot_months() if hot_months is None else hot_months
+        hoy = timezone.localtime(ahora or timezone.now()).date()
+        indice = hoy.year * 12 + hoy.month - 1 - hot_months
+        return _inicio_mes(date(indice // 12, indice % 12 + 1, 1))
+
+    @classmethod
+    def meses_archivables(cls, corte) -> list[date]:
+        return list(Event.objects.filter(created_at__lt=corte).dates('created_at', 'month', order='ASC'))
+
+    @classmethod
+    def archivar(cls, ahora=None, hot_months=None, directorio=None) -> list:
+        """Archiva todos los meses anteriores al corte; retorna las particiones creadas."""
+        corte = cls.corte(ahora, hot_months)
+        return [
+            particion for particion in (
+                cls.archivar_mes(mes, directorio) for mes in cls.meses_archivables(corte)
+            ) if particion is not None
+        ]
+
+    @classmethod
+    def archivar_mes(cls, mes: date, directorio=None):
+        """
+        Escribe los eventos del mes en un JSONL.gz, registra la partición y los
+        borra de la tabla viva. Un mes ya archivado que recibió eventos tardíos
+        genera una parte adicional.
+
+        El borrado ocurre sólo después de releer lo guardado (de la base de
+        datos o del disco) y comprobar su sha256 y su número de filas; si no
+        coinciden se lanza ValueError y la tabla queda intacta.
+        """
+        inicio, fin = _inicio_mes(mes), _inicio_mes(_mes_siguiente(mes))
+        eventos = Event.objects.filter(created_at__gte=inicio, created_at__lt=fin)
+        directorio = directorio or cls.archive_dir()
+        if directorio is not None:
+            directorio = cls.validar_directorio(directorio)
+
+        buffer = io.BytesIO()
+        filas, desde_id, hasta_id = 0, None, None
+        with gzip.open(buffer, 'wt', encoding='utf-8') as handle:
+            for fila in eventos.order_by('id').values_list(*cls.COLUMNAS).iterator(chunk_size=2000):
+                registro = dict(zip(cls.COLUMNAS, fila))
+                registro['container'] = registro.pop('container__container_id')
+                handle.write(json.dumps(registro, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n')
+                filas += 1
+                desde_id = registro['id'] if desde_id is None else desde_id
+                hasta_id = registro['id']
+        if not filas:
+            return None
+        datos = buffer.getvalue()
+        sha256 = hashlib.sha256(datos).hexdigest()
+
+        parte = ParticionEventos.objects.filter(mes=mes).count() + 1
+        nombre = f"eventos-{mes:%Y-%m}" + (f".{parte}" if parte > 1 else '') + '.jsonl.gz'
+        destino = None
+        if directorio is not None:
+            destino = cls._escribir(directorio, nombre, datos)
+            cls._verificar(destino.read_bytes(), sha256, filas, destino)
+
+        with transaction.atomic():
+            particion = ParticionEventos.objects.create(
+                mes=mes, archivo=str(destino or ''), contenido=None if destino else datos,
+                filas=filas, sha256=sha256, desde_id=desde_id, hasta_id=hasta_id,
+            )
+            if destino is None:
+                guardado = ParticionEventos.objects.values_list('contenido', flat=True).get(pk=particion.pk)
+                cls._verificar(bytes(guardado), sha256, filas, particion)
+            # Sólo lo escrito: eventos del mes insertados durante la exportación quedan para la próxima
+            borrados, _ = eventos.filter(id__lte=hasta_id).delete()
+        logger.info(f"Eventos {mes:%Y-%m} archivados en {destino or 'la base de datos'}: {filas} filas, {borrados} borradas")
+        return particion
+
+    @staticmethod
+    def _escribir(directorio: Path, nombre: str, datos: bytes) -> Path:
+        """Escritura atómica y sincronizada a disco del archivo de la partición."""
+        directorio.mkdir(parents=True, exist_ok=True)
+        destino = directorio / nombre
+        temporal = directorio / f".{nombre}.tmp"
+        with open(temporal, 'wb') as handle:
+            handle.write(datos)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temporal, destino)
+        descriptor = os.open(directorio, os.O_RDONLY)
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+        return destino
+
+    @staticmethod
+    def _verificar(datos: bytes, sha256: str, filas: int, origen):
+        if hashlib.sha256(datos).hexdigest() != sha256 or len(gzip.decompress(datos).splitlines()) != filas:
+            raise ValueError(f"El archivo de eventos {origen} no coincide con lo exportado; no se borró nada")
+
+    @staticmethod
+    def leer(particion):
+        """Itera los eventos archivados de una partición (dicts)."""
+        if particion.contenido is not None:
+            origen = io.BytesIO(bytes(particion.contenido))
+        else:
+            origen = particion.archivo
+        with gzip.open(origen, 'rt', encoding='utf-8') as handle:
+            for linea in handle:
+                yield json.loads(linea)
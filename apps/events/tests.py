@@ -1,3 +1,124 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import tempfile
+from datetime import datetime
+from io import StringIO
+from pathlib import Path
+from unittest.mock import patch
 
-# Create your tests here.
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from apps.containers.models import Container
+from apps.events.models import Event, ParticionEventos
+from apps.events.services import EventArchiveService, EventLog
+
+
+class EventLogWriterTests(TestCase):
+    def setUp(self):
+        self.container = Container.objects.create(container_id='EVNT1234567', estado='por_arribar')
+
+    def test_events_in_a_transaction_are_one_insert_at_commit(self):
+        with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                for index in range(3):
+                    EventLog.registrar(self.container, 'cambio_estado', {'paso': index}, usuario='ops')
+                self.assertFalse(Event.objects.exists())
+
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "events_event"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(
+            sorted(Event.objects.values_list('detalles__paso', flat=True)), [0, 1, 2],
+        )
+
+    def test_savepoint_rollback_discards_only_its_events(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            EventLog.registrar(self.container, 'cambio_estado', {'paso': 'antes'})
+            try:
+                with transaction.atomic():
+                    EventLog.registrar(self.container, 'cambio_estado', {'paso': 'revertido'})
+                    raise ValueError
+            except ValueError:
+                pass
+            EventLog.registrar(self.container, 'cambio_estado', {'paso': 'despues'})
+
+        self.assertEqual(
+            sorted(Event.objects.values_list('detalles__paso', flat=True)), ['antes', 'despues'],
+        )
+
+    def test_events_after_a_flushed_batch_start_a_new_one(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            EventLog.registrar(self.container, 'cambio_estado', {'paso': 1})
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            EventLog.registrar(self.container, 'cambio_estado', {'paso': 2})
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(sorted(Event.objects.values_list('detalles__paso', flat=True)), [1, 2])
+
+    def test_container_state_change_goes_through_the_log(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.container.cambiar_estado('liberado', 'ops')
+        self.assertEqual(len(callbacks), 1)
+        evento = Event.objects.get(container=self.container)
+        self.assertEqual(evento.detalles, {'estado_anterior': 'por_arribar', 'estado_nuevo': 'liberado'})
+
+
+class EventArchiveTests(TestCase):
+    def setUp(self):
+        self.container = Container.objects.create(container_id='ARCH1234567', estado='por_arribar')
+        self.ahora = timezone.make_aware(datetime(2026, 6, 15, 12, 0))
+        for dia in (datetime(2026, 1, 10), datetime(2026, 1, 20), datetime(2026, 2, 20),
+                    datetime(2026, 3, 5), datetime(2026, 6, 14)):
+            evento = Event.objects.create(container=self.container, event_type='cambio_estado', detalles={'dia': dia.day})
+            Event.objects.filter(pk=evento.pk).update(created_at=timezone.make_aware(dia))
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.directorio = directorio.name
+
+    def test_cold_months_move_to_compressed_partitions(self):
+        particiones = EventArchiveService.archivar(ahora=self.ahora, hot_months=3, directorio=self.directorio)
+
+        self.assertEqual([(p.mes.month, p.filas) for p in particiones], [(1, 2), (2, 1)])
+        self.assertEqual(Event.objects.count(), 2)
+        enero = particiones[0]
+        self.assertEqual(Path(enero.archivo).name, 'eventos-2026-01.jsonl.gz')
+        self.assertEqual(hashlib.sha256(Path(enero.archivo).read_bytes()).hexdigest(), enero.sha256)
+        filas = list(EventArchiveService.leer(enero))
+        self.assertEqual([f['detalles'] for f in filas], [{'dia': 10}, {'dia': 20}])
+        self.assertEqual(filas[0]['container'], 'ARCH1234567')
+
+        # Idempotente: nada nuevo que archivar
+        self.assertEqual(EventArchiveService.archivar(ahora=self.ahora, hot_months=3, directorio=self.directorio), [])
+        self.assertEqual(ParticionEventos.objects.count(), 2)
+
+    def test_default_archive_is_stored_in_the_database(self):
+        with override_settings(EVENTS_ARCHIVE_DIR=''):
+            particiones = EventArchiveService.archivar(ahora=self.ahora, hot_months=3)
+
+        enero = ParticionEventos.objects.get(pk=particiones[0].pk)
+        self.assertEqual(enero.archivo, '')
+        self.assertEqual(hashlib.sha256(bytes(enero.contenido)).hexdigest(), enero.sha256)
+        self.assertEqual([f['detalles'] for f in EventArchiveService.leer(enero)], [{'dia': 10}, {'dia': 20}])
+        self.assertEqual(Event.objects.count(), 2)
+
+    def test_refuses_directory_inside_the_deployment(self):
+        with self.assertRaises(CommandError):
+            call_command('archive_events', '--hot-months', '3', '--dir', str(Path(settings.BASE_DIR) / 'archive'))
+        self.assertEqual(Event.objects.count(), 5)
+        self.assertFalse(ParticionEventos.objects.exists())
+
+    def test_nothing_is_deleted_when_the_written_file_does_not_verify(self):
+        with patch.object(Path, 'read_bytes', return_value=gzip.compress(b'{}\n')):
+            with self.assertRaises(ValueError):
+                EventArchiveService.archivar(ahora=self.ahora, hot_months=3, directorio=self.directorio)
+        self.assertEqual(Event.objects.count(), 5)
+        self.assertFalse(ParticionEventos.objects.exists())
+
+    def test_dry_run_lists_months_without_archiving(self):
+        salida = StringIO()
+        call_command('archive_events', '--dry-run', '--hot-months', '0', stdout=salida)
+        self.assertIn('2026-01', salida.getvalue())
+        self.assertEqual(Event.objects.count(), 5)
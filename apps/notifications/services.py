@@ -120,45 +120,54 @@ class NotificationService:
         return notification
     
     @classmethod
-    def actualizar_eta(cls, programacion, driver, nueva_posicion_lat, nueva_posicion_lng):
+    def actualizar_eta(cls, programacion, driver, nueva_posicion_lat, nueva_posicion_lng, guardar=True):
         """
         Actualiza el ETA basado en la posición actual del conductor
         
+        El ETA se proyecta sobre la ruta almacenada (IncrementalETAService);
+        Mapbox sólo se consulta ante desvío real o al vencer el presupuesto.
+        
         Args:
             programacion: Programación activa
             driver: Conductor
             nueva_posicion_lat: Nueva latitud
             nueva_posicion_lng: Nueva longitud
+            guardar: False deja los cambios en memoria; el llamador persiste
+                `update_fields` junto con sus propios campos
         
         Returns:
             dict: {
                 'eta_minutos': int,
                 'distancia_km': Decimal,
+                'fuente': 'incremental' | 'mapbox' | 'haversine',
+                'update_fields': list,
                 'notificacion': Notification (si se creó)
             }
         """
+        from apps.core.services.incremental_eta import IncrementalETAService
+        
         cd = programacion.cd
         
-        # Calcular nuevo ETA con Mapbox
-        resultado = MapboxService.calcular_ruta(
-            float(nueva_posicion_lng),
-            float(nueva_posicion_lat),
-            float(cd.lng),
-            float(cd.lat)
-        )
+        resultado = IncrementalETAService.estimate(programacion, nueva_posicion_lat, nueva_posicion_lng)
         
         if not resultado.get('success'):
             logger.warning(f"Error calculando ETA actualizado: {resultado.get('error')}")
+            # El intento de re-ruteo fallido queda registrado para no repetirlo en cada ping
+            if guardar and resultado.get('update_fields'):
+                programacion.save(update_fields=resultado['update_fields'])
             return None
         
-        eta_minutos = int(resultado['duration_minutes'])
-        distancia_km = Decimal(str(resultado['distance_km']))
+        eta_minutos = int(resultado['eta_minutos'])
+        distancia_km = Decimal(str(resultado['distancia_km']))
         eta_timestamp = timezone.now() + timedelta(minutes=eta_minutos)
         
         # Actualizar ETA en la programación
         programacion.eta_minutos = eta_minutos
         programacion.distancia_km = distancia_km
-        programacion.save(update_fields=['eta_minutos', 'distancia_km'])
+        # updated_at: el ETag de my_info detecta el ETA nuevo
+        update_fields = ['eta_minutos', 'distancia_km', 'updated_at'] + resultado['update_fields']
+        if guardar:
+            programacion.save(update_fields=update_fields)
         
         # Buscar notificación activa de esta programación
         notificacion_activa = Notification.objects.filter(
@@ -212,6 +221,8 @@ class NotificationService:
             'eta_minutos': eta_minutos,
             'distancia_km': distancia_km,
             'eta_timestamp': eta_timestamp,
+            'fuente': resultado['fuente'],
+            'update_fields': update_fields,
             'notificacion': notificacion
         }
     
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Programacion, TiempoOperacion, TiempoViaje
+from .models import CargaSlotCD, CasoSimilarIndice, HistogramaDuracionCD, Programacion, TiempoOperacion, TiempoViaje
 
 
 @admin.register(Programacion)
@@ -125,3 +125,25 @@ class TiempoViajeAdmin(admin.ModelAdmin):
         else:
             return f"⚪ {factor:.2f}x (Normal)"
     factor_correccion_display.short_description = 'Factor Corrección'
+
+
+@admin.register(CasoSimilarIndice)
+class CasoSimilarIndiceAdmin(admin.ModelAdmin):
+    list_display = ['cd', 'tipo', 'cliente', 'urgencia', 'total', 'entregados', 'parciales', 'fallidos', 'ultima_fecha']
+    list_filter = ['cd', 'tipo', 'urgencia']
+    search_fields = ['cliente', 'vendor']
+    readonly_fields = ['casos_recientes', 'actualizado']
+
+
+@admin.register(CargaSlotCD)
+class CargaSlotCDAdmin(admin.ModelAdmin):
+    list_display = ['cd', 'inicio', 'carga']
+    list_filter = ['cd']
+    date_hierarchy = 'inicio'
+
+
+@admin.register(HistogramaDuracionCD)
+class HistogramaDuracionCDAdmin(admin.ModelAdmin):
+    list_display = ['cd', 'dia_semana', 'hora', 'actualizado']
+    list_filter = ['cd', 'dia_semana']
+    readonly_fields = ['muestras', 'actualizado']
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:06
+
+import math
+
+from django.db import migrations, models
+
+TAMANO_CELDA_GRADOS = 0.012
+
+
+def _celda(lat, lon):
+    return f"{math.floor(float(lat) / TAMANO_CELDA_GRADOS)}:{math.floor(float(lon) / TAMANO_CELDA_GRADOS)}"
+
+
+def poblar_celdas(apps, schema_editor):
+    TiempoViaje = apps.get_model('programaciones', 'TiempoViaje')
+    pendientes = []
+    for viaje in TiempoViaje.objects.only('origen_lat', 'origen_lon', 'destino_lat', 'destino_lon').iterator(chunk_size=2000):
+        viaje.origen_celda = _celda(viaje.origen_lat, viaje.origen_lon)
+        viaje.destino_celda = _celda(viaje.destino_lat, viaje.destino_lon)
+        pendientes.append(viaje)
+        if len(pendientes) >= 2000:
+            TiempoViaje.objects.bulk_update(pendientes, ['origen_celda', 'destino_celda'])
+            pendientes = []
+    if pendientes:
+        TiempoViaje.objects.bulk_update(pendientes, ['origen_celda', 'destino_celda'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drivers', '0004_driver_patente'),
+        ('programaciones', '0009_programacion_fecha_liberacion_conductor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tiempoviaje',
+            name='destino_celda',
+            field=models.CharField(blank=True, default='', max_length=24),
+        ),
+        migrations.AddField(
+            model_name='tiempoviaje',
+            name='origen_celda',
+            field=models.CharField(blank=True, default='', max_length=24),
+        ),
+        migrations.AddIndex(
+            model_name='tiempoviaje',
+            index=models.Index(fields=['origen_celda', 'destino_celda', 'fecha'], name='programacio_origen__72f10a_idx'),
+        ),
+        migrations.RunPython(poblar_celdas, migrations.RunPython.noop),
+    ]
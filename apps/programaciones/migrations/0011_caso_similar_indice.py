@@ -0,0 +1,87 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+ESTADOS_FINALES = ('entregado', 'descargado', 'devuelto', 'incidente', 'cancelado')
+RESULTADOS_CONTENEDOR = {
+    'entregado': 'ENTREGADO',
+    'descargado': 'ENTREGADO',
+    'devuelto': 'ENTREGADO',
+    'incidente': 'FALLIDO',
+    'cancelado': 'FALLIDO',
+}
+CASOS_RECIENTES = 10
+
+
+def poblar_indice(apps, schema_editor):
+    Programacion = apps.get_model('programaciones', 'Programacion')
+    CasoSimilarIndice = apps.get_model('programaciones', 'CasoSimilarIndice')
+    grupos = {}
+    filas = (
+        Programacion.objects.filter(container__estado__in=ESTADOS_FINALES)
+        .order_by('-fecha_programada', '-pk')
+        .values_list(
+            'pk', 'fecha_programada', 'estado_final', 'cd_id', 'urgencia_servicio', 'cliente',
+            'container__estado', 'container__tipo', 'container__vendor',
+        )
+    )
+    for pk, fecha, estado_final, cd_id, urgencia, cliente, estado, tipo, vendor in filas.iterator(chunk_size=2000):
+        if not cd_id:
+            continue
+        clave = (cd_id, tipo or '', vendor or '', urgencia or '', cliente or '')
+        grupo = grupos.setdefault(clave, {
+            'total': 0, 'entregados': 0, 'parciales': 0, 'fallidos': 0,
+            'casos_recientes': [], 'ultima_fecha': fecha,
+        })
+        if estado_final in ('ENTREGADO', 'PARCIAL', 'FALLIDO'):
+            resultado = estado_final
+        else:
+            resultado = RESULTADOS_CONTENEDOR[estado]
+        grupo['total'] += 1
+        grupo[{'ENTREGADO': 'entregados', 'PARCIAL': 'parciales', 'FALLIDO': 'fallidos'}[resultado]] += 1
+        if len(grupo['casos_recientes']) < CASOS_RECIENTES:
+            grupo['casos_recientes'].append([pk, fecha.isoformat(), resultado])
+
+    CasoSimilarIndice.objects.bulk_create([
+        CasoSimilarIndice(
+            cd_id=cd_id, tipo=tipo, vendor=vendor, urgencia=urgencia, cliente=cliente, **datos
+        )
+        for (cd_id, tipo, vendor, urgencia, cliente), datos in grupos.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cds', '0004_cd_cliente_empresa'),
+        ('programaciones', '0010_tiempoviaje_celdas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CasoSimilarIndice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(blank=True, default='', max_length=10)),
+                ('vendor', models.CharField(blank=True, default='', max_length=200)),
+                ('urgencia', models.CharField(blank=True, default='', max_length=10)),
+                ('cliente', models.CharField(blank=True, default='', max_length=200)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('entregados', models.PositiveIntegerField(default=0)),
+                ('parciales', models.PositiveIntegerField(default=0)),
+                ('fallidos', models.PositiveIntegerField(default=0)),
+                ('casos_recientes', models.JSONField(blank=True, default=list, help_text='[[programacion_id, fecha_programada ISO, resultado], ...] del más reciente al más antiguo')),
+                ('ultima_fecha', models.DateTimeField(blank=True, null=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('cd', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='casos_similares', to='cds.cd')),
+            ],
+            options={
+                'verbose_name': 'Índice de Casos Similares',
+                'verbose_name_plural': 'Índice de Casos Similares',
+                'indexes': [models.Index(fields=['tipo'], name='programacio_tipo_4b25b1_idx')],
+                'constraints': [models.UniqueConstraint(fields=('cd', 'tipo', 'vendor', 'urgencia', 'cliente'), name='caso_similar_grupo_unico')],
+            },
+        ),
+        migrations.RunPython(poblar_indice, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:32
+
+import django.db.models.deletion
+from datetime import date, timedelta
+
+from django.db import migrations, models
+from django.db.models import Count, F, Func, Q, Sum
+
+DIAS_RETENCION = 35
+
+
+def _acumular(qs, estimado):
+    error = Func(F('tiempo_real_min') - estimado, function='ABS')
+    validos = Q(anomalia=False)
+    agregados = dict(total=Count('id'), validos=Count('id', filter=validos), error=Sum(error, filter=validos))
+    totales = qs.aggregate(**agregados)
+    desde = date.today() - timedelta(days=DIAS_RETENCION)
+    por_dia = {
+        dia['fecha'].isoformat(): [dia['total'], dia['validos'], float(dia['error'] or 0)]
+        for dia in qs.filter(fecha__gte=desde).order_by().values('fecha').annotate(**agregados)
+    }
+    return {
+        'total': totales['total'],
+        'validos': totales['validos'],
+        'suma_error_abs': float(totales['error'] or 0),
+        'por_dia': por_dia,
+    }
+
+
+def poblar_estadisticas(apps, schema_editor):
+    TiempoOperacion = apps.get_model('programaciones', 'TiempoOperacion')
+    TiempoViaje = apps.get_model('programaciones', 'TiempoViaje')
+    EstadisticaAprendizaje = apps.get_model('programaciones', 'EstadisticaAprendizaje')
+    grupos = TiempoOperacion.objects.order_by().values_list('cd_id', 'tipo_operacion').distinct()
+    for cd_id, tipo in grupos:
+        qs = TiempoOperacion.objects.filter(cd_id=cd_id, tipo_operacion=tipo)
+        EstadisticaAprendizaje.objects.create(
+            fuente='operacion', cd_id=cd_id, tipo_operacion=tipo, **_acumular(qs, F('tiempo_estimado_min'))
+        )
+    if TiempoViaje.objects.exists():
+        EstadisticaAprendizaje.objects.create(
+            fuente='viaje', cd_id=None, tipo_operacion='viaje',
+            **_acumular(TiempoViaje.objects.all(), F('tiempo_mapbox_min')),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cds', '0004_cd_cliente_empresa'),
+        ('programaciones', '0011_caso_similar_indice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadisticaAprendizaje',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fuente', models.CharField(choices=[('operacion', 'Tiempo de operación'), ('viaje', 'Tiempo de viaje')], max_length=10)),
+                ('tipo_operacion', models.CharField(max_length=20)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('validos', models.PositiveIntegerField(default=0)),
+                ('suma_error_abs', models.FloatField(default=0, help_text='Suma de |real - estimado| en minutos de los registros válidos')),
+                ('por_dia', models.JSONField(blank=True, default=dict, help_text='{fecha ISO: [total, válidos, suma error abs válidos]} de los últimos días')),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('cd', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='estadisticas_aprendizaje', to='cds.cd')),
+            ],
+            options={
+                'verbose_name': 'Estadística de Aprendizaje',
+                'verbose_name_plural': 'Estadísticas de Aprendizaje',
+                'constraints': [models.UniqueConstraint(condition=models.Q(('cd__isnull', False)), fields=('fuente', 'cd', 'tipo_operacion'), name='estadistica_aprendizaje_cd_unica'), models.UniqueConstraint(condition=models.Q(('cd__isnull', True)), fields=('fuente', 'tipo_operacion'), name='estadistica_aprendizaje_global_unica')],
+            },
+        ),
+        migrations.RunPython(poblar_estadisticas, migrations.RunPython.noop),
+    ]
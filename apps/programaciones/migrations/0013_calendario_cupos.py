@@ -0,0 +1,94 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:35
+
+import django.db.models.deletion
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import migrations, models
+from django.utils import timezone
+
+GRANULARIDAD_MIN = 5
+HISTORY_DAYS = 120
+
+
+def _bloque(fecha):
+    segundos = GRANULARIDAD_MIN * 60
+    ts = int(fecha.timestamp())
+    return datetime.fromtimestamp(ts - ts % segundos, tz=dt_timezone.utc)
+
+
+def poblar_calendario(apps, schema_editor):
+    Programacion = apps.get_model('programaciones', 'Programacion')
+    TiempoOperacion = apps.get_model('programaciones', 'TiempoOperacion')
+    CargaSlotCD = apps.get_model('programaciones', 'CargaSlotCD')
+    HistogramaDuracionCD = apps.get_model('programaciones', 'HistogramaDuracionCD')
+
+    conteo = defaultdict(int)
+    activas = Programacion.objects.exclude(container__estado__in=('cancelado', 'devuelto')).values_list(
+        'cd_id', 'fecha_programada'
+    )
+    for cd_id, fecha in activas.iterator(chunk_size=5000):
+        if cd_id:
+            conteo[(cd_id, _bloque(fecha))] += 1
+    CargaSlotCD.objects.bulk_create(
+        [CargaSlotCD(cd_id=cd_id, inicio=inicio, carga=n) for (cd_id, inicio), n in conteo.items()],
+        batch_size=1000,
+    )
+
+    celdas = defaultdict(list)
+    corte = timezone.now() - timedelta(days=HISTORY_DAYS)
+    tiempos = TiempoOperacion.objects.filter(
+        anomalia=False, tiempo_real_min__gt=0, hora_inicio__gte=corte,
+    ).order_by('hora_inicio').values_list('cd_id', 'hora_inicio', 'tiempo_real_min')
+    for cd_id, inicio, minutos in tiempos.iterator(chunk_size=5000):
+        local = timezone.localtime(inicio)
+        celdas[(cd_id, local.weekday(), local.hour)].append([inicio.isoformat(), minutos])
+    HistogramaDuracionCD.objects.bulk_create(
+        [
+            HistogramaDuracionCD(cd_id=cd_id, dia_semana=dia, hora=hora, muestras=muestras)
+            for (cd_id, dia, hora), muestras in celdas.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cds', '0004_cd_cliente_empresa'),
+        ('programaciones', '0012_estadistica_aprendizaje'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CargaSlotCD',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateTimeField()),
+                ('carga', models.PositiveIntegerField(default=0)),
+                ('cd', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='carga_slots', to='cds.cd')),
+            ],
+            options={
+                'verbose_name': 'Carga de Slot',
+                'verbose_name_plural': 'Carga de Slots',
+                'constraints': [models.UniqueConstraint(fields=('cd', 'inicio'), name='carga_slot_cd_inicio_unica')],
+            },
+        ),
+        migrations.CreateModel(
+            name='HistogramaDuracionCD',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia_semana', models.PositiveSmallIntegerField(help_text='0=Lunes, 6=Domingo')),
+                ('hora', models.PositiveSmallIntegerField()),
+                ('muestras', models.JSONField(blank=True, default=list, help_text='[[hora_inicio ISO, tiempo_real_min], ...]')),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('cd', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='histograma_duraciones', to='cds.cd')),
+            ],
+            options={
+                'verbose_name': 'Histograma de Duración',
+                'verbose_name_plural': 'Histogramas de Duración',
+                'constraints': [models.UniqueConstraint(fields=('cd', 'dia_semana', 'hora'), name='histograma_duracion_cd_unico')],
+            },
+        ),
+        migrations.RunPython(poblar_calendario, migrations.RunPython.noop),
+    ]
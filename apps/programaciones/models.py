@@ -1,4 +1,5 @@
 import logging
+import math
 from django.core.exceptions import ValidationError
 from django.db import models, transaction
 from django.db.models import F
@@ -163,6 +164,32 @@ class Programacion(models.Model):
     
     def __str__(self):
         return f"{self.container.container_id if self.container else 'N/A'} - {self.cliente}"
+
+    # Campos de la programación que usa CasoSimilarIndice (grupo, resultado y orden de casos recientes)
+    CAMPOS_INDICE_SIMILARES = ('cd_id', 'urgencia_servicio', 'cliente', 'estado_final', 'fecha_programada')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # CD y horario tal como se leyeron: el calendario de cupos descuenta el slot anterior si cambian
+        instance._slot_original = (instance.__dict__.get('cd_id'), instance.__dict__.get('fecha_programada'))
+        instance.marcar_indice_sincronizado()
+        return instance
+
+    def marcar_indice_sincronizado(self):
+        self._indice_original = {
+            campo: self.__dict__[campo] for campo in self.CAMPOS_INDICE_SIMILARES if campo in self.__dict__
+        }
+
+    def campos_indice_cambiados(self):
+        """CAMPOS_INDICE_SIMILARES modificados desde la lectura (todos si no hay referencia)."""
+        originales = getattr(self, '_indice_original', None)
+        if originales is None:
+            return set(self.CAMPOS_INDICE_SIMILARES)
+        return {
+            campo for campo in self.CAMPOS_INDICE_SIMILARES
+            if campo in self.__dict__ and (campo not in originales or originales[campo] != self.__dict__[campo])
+        }
     
     @property
     def estado(self):
@@ -173,7 +200,7 @@ class Programacion(models.Model):
     
     def asignar_conductor(self, driver, usuario=None):
         """Asigna un conductor a la programación"""
-        from apps.events.models import Event
+        from apps.events.services import EventLog
 
         with transaction.atomic():
             programacion = Programacion.objects.select_for_update().select_related('container').get(pk=self.pk)
@@ -201,17 +228,17 @@ class Programacion(models.Model):
             self.driver = locked_driver
             self.fecha_asignacion = programacion.fecha_asignacion
 
-        # Crear evento de asignación
-        Event.objects.create(
-            container=self.container,
-            event_type='asignacion_conductor',
-            detalles={
-                'driver_id': self.driver.id,
-                'driver_nombre': self.driver.nombre,
-                'asignado_por': usuario or 'system',
-            },
-            usuario=usuario or 'system'
-        )
+            # Evento de asignación: se inserta junto al cambio de estado al confirmar
+            EventLog.registrar(
+                container=self.container,
+                event_type='asignacion_conductor',
+                detalles={
+                    'driver_id': self.driver.id,
+                    'driver_nombre': self.driver.nombre,
+                    'asignado_por': usuario or 'system',
+                },
+                usuario=usuario or 'system'
+            )
         
         # Crear notificación para el conductor
         try:
@@ -359,7 +386,7 @@ class TiempoOperacion(models.Model):
         return ((self.tiempo_real_min - self.tiempo_estimado_min) / self.tiempo_estimado_min) * 100
     
     @classmethod
-    def obtener_tiempo_aprendido(cls, cd, tipo_operacion, conductor=None):
+    def obtener_tiempo_aprendido(cls, cd, tipo_operacion, conductor=None, historial=None):
         """
         Obtiene tiempo aprendido basado en operaciones históricas
         
@@ -367,53 +394,59 @@ class TiempoOperacion(models.Model):
         - Promedio móvil de las últimas 10 operaciones válidas (no anómalas)
         - Si hay conductor, priorizarlo pero considerar datos generales del CD
         - Fallback al tiempo promedio del CD
+
+        Args:
+            historial: lista opcional de TiempoOperacion ya cargada (p. ej. por
+                la puntuación por lotes). Si se entrega, la selección se hace en
+                memoria con las mismas reglas y no se consulta la base de datos;
+                si no, se usa LearnedTimesService (una consulta, con caché).
         
         Returns:
             int: Tiempo estimado en minutos
         """
         from datetime import timedelta
         from django.utils import timezone
-        from django.db.models import Avg
-        
+        from apps.core.services.learned_times import LearnedTimesService
+
         # Filtro base: CD + tipo_operacion + sin anomalías + últimos 30 días
-        fecha_limite = timezone.now() - timedelta(days=30)
-        
-        filtros = {
-            'cd': cd,
-            'tipo_operacion': tipo_operacion,
-            'anomalia': False,
-            'fecha__gte': fecha_limite
-        }
-        
-        # Intentar con conductor específico primero
-        if conductor:
-            tiempos_conductor = cls.objects.filter(
-                **filtros,
-                conductor=conductor
-            ).order_by('-fecha')[:10]
-            
-            if tiempos_conductor.count() >= 3:
-                # Suficientes datos del conductor
-                promedio = tiempos_conductor.aggregate(Avg('tiempo_real_min'))['tiempo_real_min__avg']
-                if promedio:
-                    return int(promedio)
-        
-        # Fallback a datos generales del CD
-        tiempos_cd = cls.objects.filter(**filtros).order_by('-fecha')[:20]
-        
-        if tiempos_cd.count() >= 5:
-            # Suficientes datos generales
-            promedio = tiempos_cd.aggregate(Avg('tiempo_real_min'))['tiempo_real_min__avg']
-            if promedio:
-                return int(promedio)
-        
+        fecha_limite = (timezone.now() - timedelta(days=30)).date()
+
+        if historial is not None:
+            promedio = cls._promedio_en_memoria(historial, cd, tipo_operacion, fecha_limite, conductor)
+        else:
+            # Últimas 10 del conductor (mínimo 3) o últimas 20 del CD (mínimo 5), en una consulta cacheada
+            promedio = LearnedTimesService.promedio_operacion(cd, tipo_operacion, fecha_limite, conductor)
+        if promedio:
+            return int(promedio)
+
         # Fallback final al tiempo promedio del CD
         if tipo_operacion == 'descarga_cd' and cd.tiempo_promedio_descarga_min:
             return cd.tiempo_promedio_descarga_min
-        
+
         # Default genérico
         return 60
 
+    @staticmethod
+    def _promedio_en_memoria(historial, cd, tipo_operacion, fecha_limite, conductor=None):
+        """Replica en memoria las ventanas de obtener_tiempo_aprendido (10 del conductor, 20 del CD)."""
+        validos = sorted(
+            (
+                row for row in historial
+                if row.cd_id == cd.id and row.tipo_operacion == tipo_operacion
+                and not row.anomalia and row.fecha >= fecha_limite
+            ),
+            key=lambda row: (row.fecha, row.hora_inicio),
+            reverse=True,
+        )
+        if conductor:
+            propios = [row for row in validos if row.conductor_id == conductor.id][:10]
+            if len(propios) >= 3:
+                return sum(row.tiempo_real_min for row in propios) / len(propios)
+        generales = validos[:20]
+        if len(generales) >= 5:
+            return sum(row.tiempo_real_min for row in generales) / len(generales)
+        return None
+
 
 class TiempoViaje(models.Model):
     """Modelo para tracking de tiempos de viaje"""
@@ -460,6 +493,12 @@ class TiempoViaje(models.Model):
         help_text='Marca viajes anómalos (pausas largas, desvíos) para excluir'
     )
     observaciones = models.TextField(blank=True)
+    # Índice espacial por grilla: celda de origen/destino (ver celda_para)
+    origen_celda = models.CharField(max_length=24, blank=True, default='')
+    destino_celda = models.CharField(max_length=24, blank=True, default='')
+    
+    # Lado de la celda en grados (~1,3 km); igual al radio de vecindad del motor de aprendizaje.
+    TAMANO_CELDA_GRADOS = 0.012
     
     class Meta:
         verbose_name = 'Tiempo de Viaje'
@@ -469,11 +508,38 @@ class TiempoViaje(models.Model):
             models.Index(fields=['origen_lat', 'origen_lon', 'destino_lat', 'destino_lon']),
             models.Index(fields=['hora_del_dia', 'dia_semana']),
             models.Index(fields=['conductor', '-fecha']),
+            models.Index(fields=['origen_celda', 'destino_celda', 'fecha']),
         ]
     
     def __str__(self):
         return f"{self.origen_nombre} → {self.destino_nombre} ({self.fecha})"
     
+    @classmethod
+    def celda_para(cls, lat, lon):
+        """Celda de grilla que contiene el punto (lat, lon)."""
+        size = cls.TAMANO_CELDA_GRADOS
+        return f"{math.floor(float(lat) / size)}:{math.floor(float(lon) / size)}"
+    
+    @classmethod
+    def celdas_vecinas(cls, lat, lon):
+        """
+        Celdas que cubren un radio de TAMANO_CELDA_GRADOS alrededor del punto.
+        
+        Con celdas del mismo lado que el radio, basta el bloque 3×3 centrado.
+        """
+        size = cls.TAMANO_CELDA_GRADOS
+        row = math.floor(float(lat) / size)
+        col = math.floor(float(lon) / size)
+        return [f"{row + dr}:{col + dc}" for dr in (-1, 0, 1) for dc in (-1, 0, 1)]
+    
+    def save(self, *args, **kwargs):
+        self.origen_celda = self.celda_para(self.origen_lat, self.origen_lon)
+        self.destino_celda = self.celda_para(self.destino_lat, self.destino_lon)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'origen_celda', 'destino_celda'}
+        super().save(*args, **kwargs)
+    
     def calcular_factor_correccion(self):
         """
         Calcula el factor de corrección entre el tiempo de Mapbox y el tiempo real
@@ -486,7 +552,7 @@ class TiempoViaje(models.Model):
         return self.tiempo_real_min / self.tiempo_mapbox_min
     
     @classmethod
-    def obtener_tiempo_aprendido(cls, origen_coords, destino_coords, tiempo_mapbox, hora_salida, conductor=None):
+    def obtener_tiempo_aprendido(cls, origen_coords, destino_coords, tiempo_mapbox, hora_salida, conductor=None, historial=None):
         """
         Obtiene tiempo aprendido basado en viajes históricos similares
         
@@ -502,76 +568,67 @@ class TiempoViaje(models.Model):
             tiempo_mapbox: int (tiempo base de Mapbox)
             hora_salida: datetime
             conductor: Driver opcional
+            historial: lista opcional de TiempoViaje ya cargada; si se entrega,
+                se aplican los mismos filtros en memoria sin consultar la BD
+                (si no, LearnedTimesService: una consulta, con caché).
         
         Returns:
             int: Tiempo estimado en minutos
         """
         from datetime import timedelta
         from django.utils import timezone
-        from django.db.models import Avg, Q
         from decimal import Decimal
-        
+        from apps.core.services.learned_times import LearnedTimesService
+
         # Radio de búsqueda: ~1km = 0.009 grados
         radio = Decimal('0.009')
-        
-        # Extraer hora y día de semana
+
+        # Origen/destino similares + sin anomalías + últimos 60 días
+        fecha_limite = (timezone.now() - timedelta(days=60)).date()
+
+        # Priorizar misma franja horaria (±2 horas)
         hora_del_dia = hora_salida.hour
-        dia_semana = hora_salida.weekday()
-        
-        # Filtros base: origen/destino similares + sin anomalías + últimos 60 días
-        fecha_limite = timezone.now() - timedelta(days=60)
-        
-        filtros_base = Q(
-            origen_lat__gte=Decimal(str(origen_coords[0])) - radio,
-            origen_lat__lte=Decimal(str(origen_coords[0])) + radio,
-            origen_lon__gte=Decimal(str(origen_coords[1])) - radio,
-            origen_lon__lte=Decimal(str(origen_coords[1])) + radio,
-            destino_lat__gte=Decimal(str(destino_coords[0])) - radio,
-            destino_lat__lte=Decimal(str(destino_coords[0])) + radio,
-            destino_lon__gte=Decimal(str(destino_coords[1])) - radio,
-            destino_lon__lte=Decimal(str(destino_coords[1])) + radio,
-            anomalia=False,
-            fecha__gte=fecha_limite
+        franja = (max(0, hora_del_dia - 2), min(23, hora_del_dia + 2))
+
+        if historial is not None:
+            return cls._tiempo_en_memoria(
+                historial, origen_coords, destino_coords, tiempo_mapbox,
+                franja, fecha_limite, radio, conductor,
+            )
+        # Últimos 5 del conductor (mínimo 2) o factor de los últimos 10 (mínimo 3); si no, Mapbox directo
+        return LearnedTimesService.tiempo_viaje(
+            origen_coords, destino_coords, tiempo_mapbox, franja, fecha_limite, radio, conductor,
+        )
+
+    @staticmethod
+    def _tiempo_en_memoria(historial, origen_coords, destino_coords, tiempo_mapbox, franja, fecha_limite, radio, conductor=None):
+        """Misma selección que obtener_tiempo_aprendido, aplicada a filas ya cargadas."""
+        from decimal import Decimal
+
+        o_lat, o_lon = Decimal(str(origen_coords[0])), Decimal(str(origen_coords[1]))
+        d_lat, d_lon = Decimal(str(destino_coords[0])), Decimal(str(destino_coords[1]))
+        hora_min, hora_max = franja
+        similares = sorted(
+            (
+                row for row in historial
+                if abs(row.origen_lat - o_lat) <= radio and abs(row.origen_lon - o_lon) <= radio
+                and abs(row.destino_lat - d_lat) <= radio and abs(row.destino_lon - d_lon) <= radio
+                and not row.anomalia and row.fecha >= fecha_limite
+                and hora_min <= row.hora_del_dia <= hora_max
+            ),
+            key=lambda row: (row.fecha, row.hora_salida),
+            reverse=True,
         )
-        
-        # Priorizar misma franja horaria (±2 horas)
-        hora_min = max(0, hora_del_dia - 2)
-        hora_max = min(23, hora_del_dia + 2)
-        
-        # Intentar con conductor específico primero
         if conductor:
-            viajes_conductor = cls.objects.filter(
-                filtros_base,
-                conductor=conductor,
-                hora_del_dia__gte=hora_min,
-                hora_del_dia__lte=hora_max
-            ).order_by('-fecha')[:5]
-            
-            if viajes_conductor.count() >= 2:
-                # Suficientes datos del conductor
-                promedio_real = viajes_conductor.aggregate(Avg('tiempo_real_min'))['tiempo_real_min__avg']
-                if promedio_real:
-                    return int(promedio_real)
-        
-        # Fallback a datos generales (misma franja horaria)
-        viajes_similares = cls.objects.filter(
-            filtros_base,
-            hora_del_dia__gte=hora_min,
-            hora_del_dia__lte=hora_max
-        ).order_by('-fecha')[:10]
-        
-        if viajes_similares.count() >= 3:
-            # Calcular factor de corrección
-            promedio_real = viajes_similares.aggregate(Avg('tiempo_real_min'))['tiempo_real_min__avg']
-            promedio_mapbox = viajes_similares.aggregate(Avg('tiempo_mapbox_min'))['tiempo_mapbox_min__avg']
-            
-            if promedio_real and promedio_mapbox and promedio_mapbox > 0:
-                factor = promedio_real / promedio_mapbox
-                # Aplicar factor al tiempo actual de Mapbox
-                tiempo_ajustado = int(tiempo_mapbox * factor)
-                return tiempo_ajustado
-        
-        # Fallback final: usar Mapbox directo
+            propios = [row for row in similares if row.conductor_id == conductor.id][:5]
+            if len(propios) >= 2:
+                return int(sum(row.tiempo_real_min for row in propios) / len(propios))
+        recientes = similares[:10]
+        if len(recientes) >= 3:
+            promedio_real = sum(row.tiempo_real_min for row in recientes) / len(recientes)
+            promedio_mapbox = sum(row.tiempo_mapbox_min for row in recientes) / len(recientes)
+            if promedio_real and promedio_mapbox > 0:
+                return int(tiempo_mapbox * (promedio_real / promedio_mapbox))
         return tiempo_mapbox
 
 
@@ -601,3 +658,148 @@ class RegistroOperacion(models.Model):
 
     def __str__(self):
         return f"{self.service_id} - {self.clasificacion_sistema}"
+
+
+class CasoSimilarIndice(models.Model):
+    """
+    Índice de casos históricos para ContextualReasoningService.similar_cases.
+
+    Una fila por combinación de atributos de similitud (CD, tipo de contenedor,
+    vendor, urgencia y cliente) con los resultados acumulados y los casos más
+    recientes del grupo. Lo mantiene SimilarCaseIndex cuando una programación
+    llega a un estado final.
+    """
+    CASOS_RECIENTES = 10
+
+    cd = models.ForeignKey(CD, on_delete=models.CASCADE, related_name='casos_similares')
+    tipo = models.CharField(max_length=10, blank=True, default='')
+    vendor = models.CharField(max_length=200, blank=True, default='')
+    urgencia = models.CharField(max_length=10, blank=True, default='')
+    cliente = models.CharField(max_length=200, blank=True, default='')
+    total = models.PositiveIntegerField(default=0)
+    entregados = models.PositiveIntegerField(default=0)
+    parciales = models.PositiveIntegerField(default=0)
+    fallidos = models.PositiveIntegerField(default=0)
+    casos_recientes = models.JSONField(
+        default=list, blank=True,
+        help_text='[[programacion_id, fecha_programada ISO, resultado], ...] del más reciente al más antiguo'
+    )
+    ultima_fecha = models.DateTimeField(null=True, blank=True)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Índice de Casos Similares'
+        verbose_name_plural = 'Índice de Casos Similares'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['cd', 'tipo', 'vendor', 'urgencia', 'cliente'], name='caso_similar_grupo_unico'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['tipo']),
+        ]
+
+    def __str__(self):
+        return f"{self.cd_id}/{self.tipo}/{self.cliente}: {self.total} casos"
+
+
+class EstadisticaAprendizaje(models.Model):
+    """
+    Acumulados de aprendizaje por fuente, CD y tipo de operación.
+
+    Los mantiene LearningStatsService al registrar cada TiempoOperacion o
+    TiempoViaje, de modo que ml_learning_stats lee una fila por CD en vez de
+    recorrer el historial. Los viajes no tienen CD: se acumulan en una sola
+    fila con `cd` nulo y tipo 'viaje'.
+    """
+    FUENTES = [
+        ('operacion', 'Tiempo de operación'),
+        ('viaje', 'Tiempo de viaje'),
+    ]
+    DIAS_VENTANA = 30
+
+    fuente = models.CharField(max_length=10, choices=FUENTES)
+    cd = models.ForeignKey(CD, on_delete=models.CASCADE, null=True, blank=True, related_name='estadisticas_aprendizaje')
+    tipo_operacion = models.CharField(max_length=20)
+    total = models.PositiveIntegerField(default=0)
+    validos = models.PositiveIntegerField(default=0)
+    suma_error_abs = models.FloatField(
+        default=0, help_text='Suma de |real - estimado| en minutos de los registros válidos'
+    )
+    por_dia = models.JSONField(
+        default=dict, blank=True,
+        help_text='{fecha ISO: [total, válidos, suma error abs válidos]} de los últimos días'
+    )
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Estadística de Aprendizaje'
+        verbose_name_plural = 'Estadísticas de Aprendizaje'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['fuente', 'cd', 'tipo_operacion'], condition=models.Q(cd__isnull=False),
+                name='estadistica_aprendizaje_cd_unica',
+            ),
+            models.UniqueConstraint(
+                fields=['fuente', 'tipo_operacion'], condition=models.Q(cd__isnull=True),
+                name='estadistica_aprendizaje_global_unica',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.fuente}/{self.cd_id or '-'}/{self.tipo_operacion}: {self.validos}/{self.total}"
+
+    def ventana(self, desde):
+        """(total, válidos, suma error abs válidos) de los días >= `desde`."""
+        total = validos = error = 0
+        for fecha, (dia_total, dia_validos, dia_error) in self.por_dia.items():
+            if fecha >= desde.isoformat():
+                total += dia_total
+                validos += dia_validos
+                error += dia_error
+        return total, validos, error
+
+
+class CargaSlotCD(models.Model):
+    """
+    Calendario de carga por CD: programaciones activas (contenedor no cancelado
+    ni devuelto) por bloque de SlotCalendarService.GRANULARIDAD_MIN minutos.
+    Lo mantiene SlotCalendarService al crear, mover o cancelar programaciones.
+    """
+    cd = models.ForeignKey(CD, on_delete=models.CASCADE, related_name='carga_slots')
+    inicio = models.DateTimeField()
+    carga = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Carga de Slot'
+        verbose_name_plural = 'Carga de Slots'
+        constraints = [
+            models.UniqueConstraint(fields=['cd', 'inicio'], name='carga_slot_cd_inicio_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.cd_id} {self.inicio:%Y-%m-%d %H:%M}: {self.carga}"
+
+
+class HistogramaDuracionCD(models.Model):
+    """
+    Duraciones reales de operación por CD, día de la semana y hora local de
+    inicio (ventana de ClientSlotRecommendationService.HISTORY_DAYS días).
+    """
+    cd = models.ForeignKey(CD, on_delete=models.CASCADE, related_name='histograma_duraciones')
+    dia_semana = models.PositiveSmallIntegerField(help_text='0=Lunes, 6=Domingo')
+    hora = models.PositiveSmallIntegerField()
+    muestras = models.JSONField(
+        default=list, blank=True, help_text='[[hora_inicio ISO, tiempo_real_min], ...]'
+    )
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Histograma de Duración'
+        verbose_name_plural = 'Histogramas de Duración'
+        constraints = [
+            models.UniqueConstraint(fields=['cd', 'dia_semana', 'hora'], name='histograma_duracion_cd_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.cd_id} d{self.dia_semana} {self.hora:02d}h: {len(self.muestras)} muestras"
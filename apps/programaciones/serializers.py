@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Programacion
+from apps.core.fieldsets import SparseFieldsetSerializerMixin
 from apps.containers.serializers import ContainerListSerializer
 from apps.drivers.serializers import DriverListSerializer
 from apps.cds.serializers import CDListSerializer
@@ -18,8 +19,8 @@ class ProgramacionSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at', 'alerta_48h_enviada']
 
 
-class ProgramacionListSerializer(serializers.ModelSerializer):
-    """Serializer simplificado para listas"""
+class ProgramacionListSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
+    """Serializer simplificado para listas (admite `?fields=`)"""
     container_id = serializers.CharField(source='container.container_id', read_only=True)
     container_id_formatted = serializers.CharField(source='container.container_id_formatted', read_only=True)
     driver_nombre = serializers.CharField(source='driver.nombre', read_only=True, allow_null=True)
@@ -41,6 +42,11 @@ class ProgramacionListSerializer(serializers.ModelSerializer):
             'urgencia_servicio', 'requiere_seguimiento_especial',
             'clasificacion_sistema', 'nivel_confianza', 'decision_operador'
         ]
+        # Columnas que usan las propiedades (proyección de `?fields=`)
+        dependencias_campos = {
+            'container_id_formatted': ['container__container_id'],
+            'horas_hasta_programacion': ['fecha_programada'],
+        }
 
 
 class ProgramacionCreateSerializer(serializers.ModelSerializer):
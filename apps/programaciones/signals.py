@@ -1,9 +1,9 @@
 import logging
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.db import transaction
 
-from apps.programaciones.models import Programacion
+from apps.programaciones.models import Programacion, TiempoOperacion, TiempoViaje
 from apps.core.services.assignment import AssignmentService
 
 logger = logging.getLogger(__name__)
@@ -43,6 +43,101 @@ def trigger_automatic_assignment(sender, instance: Programacion, created: bool,
             exc_info=True
         )
 
+@receiver(post_save, sender=Programacion)
+def actualizar_indice_casos_similares(sender, instance: Programacion, created: bool, update_fields=None, **kwargs):
+    """
+    Recalcula el grupo de CasoSimilarIndice si se edita un campo del índice de
+    una programación ya cerrada (p. ej. al registrar su estado_final). Si cambió
+    de grupo (CD, urgencia o cliente) también recalcula el grupo anterior.
+    """
+    originales = dict(getattr(instance, '_indice_original', None) or {})
+    cambiados = instance.campos_indice_cambiados()
+    if update_fields is not None:
+        # Lo no incluido en update_fields no se guardó: sigue pendiente para el próximo save
+        cambiados &= {Programacion._meta.get_field(campo).attname for campo in update_fields}
+    if created or getattr(instance, '_indice_original', None) is None:
+        instance.marcar_indice_sincronizado()
+    else:
+        instance._indice_original.update({campo: instance.__dict__[campo] for campo in cambiados})
+    if created or not cambiados:
+        return
+
+    from apps.core.services.similar_case_index import POST_DELIVERY_STATES, SimilarCaseIndex
+
+    if not (instance.container and instance.container.estado in POST_DELIVERY_STATES):
+        return
+    SimilarCaseIndex.refresh_for(instance)
+    if {'cd_id', 'urgencia_servicio', 'cliente'} & cambiados:
+        anterior = Programacion(
+            pk=instance.pk, container=instance.container,
+            cd_id=originales.get('cd_id', instance.cd_id),
+            urgencia_servicio=originales.get('urgencia_servicio', instance.urgencia_servicio),
+            cliente=originales.get('cliente', instance.cliente),
+        )
+        SimilarCaseIndex.refresh_for(anterior)
+
+@receiver(post_save, sender=Programacion)
+def actualizar_calendario_cupos(sender, instance: Programacion, update_fields=None, **kwargs):
+    """
+    Recalcula la carga de los bloques de CargaSlotCD que ocupa la programación
+    (y los que ocupaba, si cambió de CD o de horario).
+    """
+    if update_fields is not None and not {'cd', 'fecha_programada'} & set(update_fields):
+        return
+
+    from apps.core.services.slot_calendar import SlotCalendarService
+
+    SlotCalendarService.actualizar_programaciones([instance])
+
+
+@receiver(post_delete, sender=Programacion)
+def liberar_calendario_cupos(sender, instance: Programacion, **kwargs):
+    from apps.core.services.slot_calendar import SlotCalendarService
+
+    SlotCalendarService.actualizar_programaciones([instance])
+
+
+@receiver(post_save, sender=TiempoOperacion)
+@receiver(post_delete, sender=TiempoOperacion)
+def actualizar_histograma_duraciones(sender, instance: TiempoOperacion, **kwargs):
+    """Recalcula la celda (día de la semana, hora) del histograma de duraciones del CD."""
+    from apps.core.services.slot_calendar import SlotCalendarService
+
+    SlotCalendarService.actualizar_tiempo(instance)
+
+
+@receiver(post_save, sender=TiempoOperacion)
+@receiver(post_save, sender=TiempoViaje)
+def actualizar_estadisticas_aprendizaje(sender, instance, created: bool, **kwargs):
+    """
+    Suma cada tiempo nuevo a EstadisticaAprendizaje; una edición (p. ej. marcar
+    anomalía) recalcula su grupo.
+    """
+    from apps.core.services.learning_stats import LearningStatsService
+
+    if created:
+        LearningStatsService.registrar_seguro(instance)
+    else:
+        LearningStatsService.recalcular_para(instance)
+
+
+@receiver(post_delete, sender=TiempoOperacion)
+@receiver(post_delete, sender=TiempoViaje)
+def descontar_estadisticas_aprendizaje(sender, instance, **kwargs):
+    from apps.core.services.learning_stats import LearningStatsService
+
+    LearningStatsService.recalcular_para(instance)
+
+@receiver(post_save, sender=TiempoOperacion)
+@receiver(post_save, sender=TiempoViaje)
+@receiver(post_delete, sender=TiempoOperacion)
+@receiver(post_delete, sender=TiempoViaje)
+def invalidar_tiempos_aprendidos(sender, instance, **kwargs):
+    """Nueva versión de la caché de tiempos aprendidos del grupo de la observación."""
+    from apps.core.services.learned_times import LearnedTimesService
+
+    LearnedTimesService.invalidar(instance)
+
 def _run_assignment_service(programacion_id: int):
     """
     Función auxiliar que ejecuta el servicio de asignación.
@@ -248,3 +248,36 @@ class OperationalCompletionTests(TestCase):
         self.assertEqual(driver.num_entregas_dia, 0)
         self.assertEqual(cd.vacios_actuales, 1)
         self.assertEqual(TiempoOperacion.objects.filter(container=container).count(), 1)
+
+
+class ProgramacionListFieldsTests(TestCase):
+    def test_sparse_fields_with_related_columns_and_cursor(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        cd = CD.objects.create(
+            nombre='CD Campos', codigo='CAMPOS', direccion='A', comuna='Santiago', lat=-33.45, lng=-70.65,
+        )
+        driver = Driver.objects.create(nombre='Campos Driver')
+        for i in range(3):
+            container = Container.objects.create(container_id=f'CAMP{i:07d}', tipo='40', nave='Nave', estado='liberado')
+            Programacion.objects.create(
+                container=container, cd=cd, cliente='Cliente',
+                fecha_programada=timezone.now() + timedelta(hours=i + 1),
+            )
+        Programacion.objects.update(driver=driver)
+
+        view = ProgramacionViewSet.as_view({'get': 'list'})
+        request = APIRequestFactory().get('/api/programaciones/', {
+            'paginacion': 'cursor', 'fields': 'container_id_formatted,driver_nombre,horas_hasta_programacion',
+        })
+        with CaptureQueriesContext(connection) as queries:
+            response = view(request)
+            response.render()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(
+            set(response.data['results'][0]), {'id', 'container_id_formatted', 'driver_nombre', 'horas_hasta_programacion'}
+        )
+        self.assertEqual(response.data['results'][0]['container_id_formatted'], 'CAMP 000000-0')
+        self.assertEqual(response.data['results'][0]['driver_nombre'], 'Campos Driver')
@@ -18,16 +18,22 @@ from .serializers import (
     ProgramacionListSerializer,
     ProgramacionCreateSerializer
 )
+from apps.core.fieldsets import SparseFieldsetViewMixin
+from apps.core.pagination import CursorOrPagePagination
 from apps.core.services.assignment import AssignmentService
+from apps.core.services.import_jobs import ImportJobService
 from apps.drivers.serializers import DriverDisponibleSerializer
 
 
 logger = logging.getLogger(__name__)
 
 
-class ProgramacionViewSet(viewsets.ModelViewSet):
+class ProgramacionViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     """
     ViewSet para gestión de programaciones
+
+    El listado admite `?paginacion=cursor` (orden fecha_programada, sin COUNT
+    ni OFFSET) y `?fields=` para acotar campos y columnas.
     """
     queryset = Programacion.objects.select_related('container', 'driver', 'cd').all()
     serializer_class = ProgramacionSerializer
@@ -35,6 +41,8 @@ class ProgramacionViewSet(viewsets.ModelViewSet):
     search_fields = ['container__container_id', 'cliente']
     ordering_fields = ['fecha_programada', 'created_at']
     ordering = ['fecha_programada']
+    cursor_ordering = ('fecha_programada', 'id')
+    pagination_class = CursorOrPagePagination
     permission_classes = [IsAuthenticatedOrReadOnly]
 
     def get_queryset(self):
@@ -231,6 +239,8 @@ class ProgramacionViewSet(viewsets.ModelViewSet):
         """
         Asigna conductores automáticamente a múltiples programaciones
         Permite acceso anónimo para operaciones masivas desde el panel.
+        
+        Body: {"programacion_ids": [...], "modo": "global" | "secuencial"}
         """
         programacion_ids = request.data.get('programacion_ids', [])
         
@@ -243,10 +253,18 @@ class ProgramacionViewSet(viewsets.ModelViewSet):
         programaciones = self.queryset.filter(id__in=programacion_ids, driver__isnull=True)
         usuario = request.user.username if request.user.is_authenticated else 'operador_manual'
         
-        resultados = AssignmentService.asignar_multiples(programaciones, usuario)
+        modo = request.data.get('modo', 'global')
+        if modo not in ('global', 'secuencial'):
+            return Response(
+                {'error': "modo debe ser 'global' o 'secuencial'"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        resultados = AssignmentService.asignar_multiples(programaciones, usuario, modo=modo)
         
         return Response({
             'success': True,
+            'modo': resultados['modo'],
             'asignadas': resultados['asignadas'],
             'fallidas': resultados['fallidas'],
             'detalles': resultados['detalles']
@@ -398,8 +416,8 @@ class ProgramacionViewSet(viewsets.ModelViewSet):
         container.cambiar_estado('programado', usuario)
         
         # Crear evento de auditoría
-        from apps.events.models import Event
-        Event.objects.create(
+        from apps.events.services import EventLog
+        EventLog.registrar(
             container=container,
             event_type='import_programacion',
             usuario=request.user.username if request.user.is_authenticated else None,
@@ -455,6 +473,11 @@ class ProgramacionViewSet(viewsets.ModelViewSet):
             )
         
         usuario = request.user.username if request.user.is_authenticated else None
+
+        if ImportJobService.async_enabled(request):
+            # El worker (manage.py run_import_worker) procesa el archivo; el cliente sondea status_url.
+            job = ImportJobService.encolar('programacion', archivo, usuario)
+            return Response(ImportJobService.as_dict(job), status=status.HTTP_202_ACCEPTED)
         
         import tempfile
         import os
@@ -614,8 +637,8 @@ class ProgramacionViewSet(viewsets.ModelViewSet):
         programacion.container.cambiar_estado('en_ruta', usuario)
         
         # Crear evento de inicio de ruta con datos GPS
-        from apps.events.models import Event
-        Event.objects.create(
+        from apps.events.services import EventLog
+        EventLog.registrar(
             container=programacion.container,
             event_type='inicio_ruta',
             detalles={
@@ -649,6 +672,7 @@ class ProgramacionViewSet(viewsets.ModelViewSet):
                     'mapbox_minutes': prediccion['mapbox_minutes'],
                     'predicted_minutes': prediccion['predicted_minutes'],
                     'learned_factor': prediccion['learned_factor'],
+                    'blended_factor': prediccion['blended_factor'],
                     'samples': prediccion['samples'],
                     'confidence': prediccion['confidence'],
                     'driver_profile': prediccion.get('driver_profile'),
@@ -758,7 +782,7 @@ class ProgramacionViewSet(viewsets.ModelViewSet):
 
     def _registrar_arribo(self, programacion, lat, lng, origen, usuario=None):
         """Registra una sola vez el arribo, sea manual o disparado por geocerca."""
-        from apps.events.models import Event
+        from apps.events.services import EventLog
 
         with transaction.atomic():
             locked = Programacion.objects.select_for_update().select_related(
@@ -788,7 +812,7 @@ class ProgramacionViewSet(viewsets.ModelViewSet):
             ])
             locked.container.cambiar_estado('entregado', usuario)
 
-            Event.objects.create(
+            EventLog.registrar(
                 container=locked.container,
                 event_type='arribo_cd',
                 detalles={
@@ -917,8 +941,8 @@ class ProgramacionViewSet(viewsets.ModelViewSet):
         self._update_registro_operacion_on_completion(programacion, 'PARCIAL') # Ojo: PARCIAL porque aún no se devuelve el vacío
         
         # Crear evento de vacío
-        from apps.events.models import Event
-        Event.objects.create(
+        from apps.events.services import EventLog
+        EventLog.registrar(
             container=programacion.container,
             event_type='contenedor_vacio',
             detalles={
@@ -993,9 +1017,9 @@ class ProgramacionViewSet(viewsets.ModelViewSet):
         self._update_registro_operacion_on_completion(programacion, 'PARCIAL')
         
         # Crear evento de contenedor soltado
-        from apps.events.models import Event
+        from apps.events.services import EventLog
         if created:
-            Event.objects.create(
+            EventLog.registrar(
                 container=programacion.container,
                 event_type='contenedor_soltado',
                 detalles={
@@ -1077,7 +1101,7 @@ class ProgramacionViewSet(viewsets.ModelViewSet):
         
         # Actualizar ETA y crear notificación si cambió significativamente
         resultado = NotificationService.actualizar_eta(
-            programacion, programacion.driver, lat, lng
+            programacion, programacion.driver, lat, lng, guardar=False
         )
         
         if not resultado:
@@ -1102,15 +1126,19 @@ class ProgramacionViewSet(viewsets.ModelViewSet):
                 'timestamp': timezone.now().isoformat(),
             }
             programacion.desviaciones_detectadas = (programacion.desviaciones_detectadas or []) + [desvio]
+        programacion.posicion_actual_lat = lat
+        programacion.posicion_actual_lng = lng
+        programacion.ultima_actualizacion_tracking = timezone.now()
         programacion.save(update_fields=[
             'posicion_actual_lat', 'posicion_actual_lng', 'ultima_actualizacion_tracking',
-            'eta_recalculado_min', 'desviaciones_detectadas'
+            'eta_recalculado_min', 'desviaciones_detectadas', *resultado['update_fields']
         ])
         
         response_data = {
             'success': True,
             'mensaje': 'Posición actualizada y ETA recalculado',
             'eta_minutos': resultado['eta_minutos'],
+            'fuente_eta': resultado['fuente'],
             'distancia_km': str(resultado['distancia_km']),
             'eta_timestamp': resultado['eta_timestamp']
         }
@@ -1277,8 +1305,8 @@ class ProgramacionViewSet(viewsets.ModelViewSet):
         programacion.save(update_fields=['incidentes_registrados'])
 
         # Crear evento de auditoría
-        from apps.events.models import Event
-        Event.objects.create(
+        from apps.events.services import EventLog
+        EventLog.registrar(
             container=programacion.container,
             event_type='incidente_reportado',
             detalles=incidente_data,
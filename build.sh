@@ -35,6 +35,9 @@ while ! python manage.py migrate --no-input; do
   sleep "$retry_seconds"
 done
 
+echo "🗺️  Creando tabla de caché de rutas..."
+python manage.py createcachetable
+
 echo "=========================================="
 echo "✅ Build completado exitosamente"
 echo "=========================================="
@@ -64,6 +64,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'apps.core.middleware.QueryBudgetMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -156,6 +157,102 @@ CORS_ALLOW_CREDENTIALS = True
 # Mapbox
 MAPBOX_API_KEY = config('MAPBOX_API_KEY', default=None)
 
+# Caché de rutas Mapbox (LRU en proceso + tabla compartida; ver RouteCache)
+MAPBOX_ROUTE_CACHE_ENABLED = config('MAPBOX_ROUTE_CACHE_ENABLED', default=True, cast=bool)
+MAPBOX_ROUTE_CACHE_TTL = config('MAPBOX_ROUTE_CACHE_TTL', default=6 * 3600, cast=int)
+MAPBOX_ROUTE_CACHE_LRU_SIZE = config('MAPBOX_ROUTE_CACHE_LRU_SIZE', default=512, cast=int)
+MAPBOX_ROUTE_CACHE_PRECISION = config('MAPBOX_ROUTE_CACHE_PRECISION', default=3, cast=int)
+MAPBOX_ROUTE_CACHE_HOUR_BUCKET = config('MAPBOX_ROUTE_CACHE_HOUR_BUCKET', default=2, cast=int)
+MAPBOX_ROUTE_CACHE_ALIAS = 'mapbox_routes'
+
+# ETA de candidatos con una matriz muchos-a-uno (ver MatrixETAService)
+MATRIX_ETA_ENABLED = config('MATRIX_ETA_ENABLED', default=True, cast=bool)
+MATRIX_ETA_DETOUR_FACTOR = config('MATRIX_ETA_DETOUR_FACTOR', default=1.3, cast=float)
+MATRIX_ETA_DEFAULT_SPEED_KMH = config('MATRIX_ETA_DEFAULT_SPEED_KMH', default=35, cast=float)
+MATRIX_ETA_MIN_SAMPLES = config('MATRIX_ETA_MIN_SAMPLES', default=3, cast=int)
+
+# Backends de ruteo en orden de preferencia: mapbox, offline o ruta a una clase
+# RoutingBackend. El motor offline usa un grafo vial GeoJSON (extracto OSM).
+ROUTING_BACKENDS = config('ROUTING_BACKENDS', default='mapbox,offline')
+ROUTING_GRAPH_PATH = config('ROUTING_GRAPH_PATH', default='')
+ROUTING_MAX_SNAP_M = config('ROUTING_MAX_SNAP_M', default=3000, cast=float)
+ROUTING_ACCESS_SPEED_KMH = config('ROUTING_ACCESS_SPEED_KMH', default=30, cast=float)
+ROUTING_TRUCK_MAX_KMH = config('ROUTING_TRUCK_MAX_KMH', default=90, cast=float)
+ROUTING_CACHE_SIZE = config('ROUTING_CACHE_SIZE', default=2048, cast=int)
+
+# Bitácora de eventos: inserción agrupada al commit y archivo mensual (ver EventLog)
+EVENTS_BUFFERED = config('EVENTS_BUFFERED', default=True, cast=bool)
+EVENTS_BATCH_SIZE = config('EVENTS_BATCH_SIZE', default=500, cast=int)
+EVENTS_HOT_MONTHS = config('EVENTS_HOT_MONTHS', default=3, cast=int)
+# Vacío: las particiones archivadas se guardan en la base de datos (ParticionEventos.contenido).
+# Un directorio debe ser un volumen persistente fuera de BASE_DIR (el disco del despliegue es
+# efímero en Render); `archive_events` se niega a borrar eventos si apunta dentro del despliegue.
+EVENTS_ARCHIVE_DIR = config('EVENTS_ARCHIVE_DIR', default='')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'mapbox_routes': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'mapbox_route_cache',
+        'TIMEOUT': MAPBOX_ROUTE_CACHE_TTL,
+        'OPTIONS': {
+            'MAX_ENTRIES': config('MAPBOX_ROUTE_CACHE_MAX_ENTRIES', default=20000, cast=int),
+            'CULL_FREQUENCY': 4,
+        },
+    },
+}
+
+# Conteos del dashboard: segundos de vida del snapshot cacheado
+DASHBOARD_STATS_TTL = config('DASHBOARD_STATS_TTL', default=30, cast=int)
+
+# Tiempos aprendidos (apps.core.services.learned_times): caché versionada por grupo
+LEARNED_TIMES_CACHE_ENABLED = config('LEARNED_TIMES_CACHE_ENABLED', default=True, cast=bool)
+LEARNED_TIMES_CACHE_TTL = config('LEARNED_TIMES_CACHE_TTL', default=300, cast=int)
+
+# Presupuesto de consultas / detector N+1 (apps.core.middleware.QueryBudgetMiddleware)
+QUERY_BUDGET_ENABLED = config('QUERY_BUDGET_ENABLED', default=False, cast=bool)
+QUERY_BUDGET_MAX_QUERIES = config('QUERY_BUDGET_MAX_QUERIES', default=50, cast=int)
+QUERY_BUDGET_N1_THRESHOLD = config('QUERY_BUDGET_N1_THRESHOLD', default=5, cast=int)
+QUERY_BUDGET_SAMPLES = config('QUERY_BUDGET_SAMPLES', default=500, cast=int)
+QUERY_BUDGET_FLUSH_SECONDS = config('QUERY_BUDGET_FLUSH_SECONDS', default=30, cast=int)
+
+# ETA incremental en actualizar_posicion (apps.core.services.incremental_eta)
+ETA_REROUTE_DEVIATION_M = config('ETA_REROUTE_DEVIATION_M', default=300, cast=int)
+ETA_REROUTE_BUDGET_MIN = config('ETA_REROUTE_BUDGET_MIN', default=20, cast=int)
+ETA_MAX_REROUTES = config('ETA_MAX_REROUTES', default=12, cast=int)
+
+# Ingesta GPS por lotes (apps.drivers.ingestion)
+GPS_BATCH_MAX_POINTS = config('GPS_BATCH_MAX_POINTS', default=1000, cast=int)
+GPS_BUFFER_SINGLE_POINTS = config('GPS_BUFFER_SINGLE_POINTS', default=False, cast=bool)
+GPS_BUFFER_MAX_POINTS = config('GPS_BUFFER_MAX_POINTS', default=500, cast=int)
+GPS_BUFFER_MAX_SECONDS = config('GPS_BUFFER_MAX_SECONDS', default=5, cast=float)
+
+# Clase de worker de gunicorn (start.sh); 'gevent'/'eventlet' requieren instalar el paquete
+GUNICORN_WORKER_CLASS = config('GUNICORN_WORKER_CLASS', default='sync')
+
+# Feed de posiciones de flota por deltas (apps.drivers.fleet_feed)
+# El stream SSE mantiene la conexión abierta hasta FLEET_FEED_SSE_MAX_SECONDS: sólo se
+# sirve con un worker asíncrono (GUNICORN_WORKER_CLASS gevent/eventlet). Con el worker
+# sync queda desactivado aunque FLEET_FEED_SSE_ENABLED sea true; usar el polling.
+FLEET_FEED_SSE_ENABLED = config('FLEET_FEED_SSE_ENABLED', default=False, cast=bool)
+FLEET_FEED_SSE_INTERVAL = config('FLEET_FEED_SSE_INTERVAL', default=2, cast=float)
+FLEET_FEED_SSE_MAX_SECONDS = config('FLEET_FEED_SSE_MAX_SECONDS', default=300, cast=float)
+# my_info responde 304 si el ETag del conductor y sus programaciones no cambió
+DRIVER_DETAIL_ETAG_ENABLED = config('DRIVER_DETAIL_ETAG_ENABLED', default=True, cast=bool)
+
+# Cola de importaciones (apps.core.services.import_jobs); la procesa run_import_worker
+IMPORT_JOBS_ASYNC = config('IMPORT_JOBS_ASYNC', default=True, cast=bool)
+IMPORT_JOB_STALE_SECONDS = config('IMPORT_JOB_STALE_SECONDS', default=300, cast=int)
+IMPORT_JOB_MAX_ATTEMPTS = config('IMPORT_JOB_MAX_ATTEMPTS', default=3, cast=int)
+
+# Analíticas de tendencias: días cerrados desde el rollup ResumenDiario (apps.core.services.analytics)
+ANALYTICS_ROLLUP_ENABLED = config('ANALYTICS_ROLLUP_ENABLED', default=True, cast=bool)
+
+# Casos similares desde el índice precalculado (apps.core.services.similar_case_index)
+SIMILAR_CASE_INDEX_ENABLED = config('SIMILAR_CASE_INDEX_ENABLED', default=True, cast=bool)
+
 # Alertas
 ALERTA_PROGRAMACION_DIAS = config('ALERTA_PROGRAMACION_DIAS', default=2, cast=int)
 ALERTA_DEMURRAGE_DIAS = config('ALERTA_DEMURRAGE_DIAS', default=2, cast=int)
@@ -172,3 +269,14 @@ LOGIN_REDIRECT_URL = '/driver/dashboard/'
 LOGOUT_REDIRECT_URL = '/driver/login/'
 
 SITE_URL = config('SITE_URL', default='http://localhost:8000')
+
+# OpenClaw: notificaciones vía outbox (MensajeOpenClaw); las entrega run_openclaw_sender
+OPENCLAW_ENABLED = config('OPENCLAW_ENABLED', default=False, cast=bool)
+OPENCLAW_API_URL = config('OPENCLAW_API_URL', default='http://localhost:3000/api/v1')
+OPENCLAW_API_KEY = config('OPENCLAW_API_KEY', default=None)
+OPENCLAW_TIMEOUT = config('OPENCLAW_TIMEOUT', default=5, cast=float)
+OPENCLAW_BATCH_SIZE = config('OPENCLAW_BATCH_SIZE', default=50, cast=int)
+OPENCLAW_MAX_ATTEMPTS = config('OPENCLAW_MAX_ATTEMPTS', default=8, cast=int)
+OPENCLAW_BACKOFF_SECONDS = config('OPENCLAW_BACKOFF_SECONDS', default=30, cast=int)
+OPENCLAW_BACKOFF_MAX_SECONDS = config('OPENCLAW_BACKOFF_MAX_SECONDS', default=3600, cast=int)
+OPENCLAW_DEDUPE_SECONDS = config('OPENCLAW_DEDUPE_SECONDS', default=3600, cast=int)
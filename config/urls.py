@@ -16,7 +16,7 @@ from apps.programaciones.views import ProgramacionViewSet
 from apps.cds.views import CDViewSet
 from apps.clientes.views import (
     cliente_login, cliente_logout, cliente_dashboard, solicitudes_operaciones,
-    api_stock, api_centros, api_recomendaciones, api_solicitudes, api_situaciones,
+    api_stock, api_centros, api_recomendaciones, api_recomendaciones_rango, api_solicitudes, api_situaciones,
     api_solicitudes_operaciones, api_revisar_solicitud,
     api_situaciones_operaciones, api_revisar_situacion,
 )
@@ -34,7 +34,7 @@ from apps.core.views import (
 from apps.core.api_views import (
     dashboard_stats, dashboard_alertas, analytics_conductores,
     analytics_eficiencia, analytics_tendencias, ml_learning_stats,
-    operaciones_diarias
+    operaciones_diarias, import_jobs, import_job_status
 )
 
 # Setup API router
@@ -73,6 +73,7 @@ urlpatterns = [
     path('api/cliente/stock/', api_stock, name='cliente_stock'),
     path('api/cliente/centros/', api_centros, name='cliente_centros'),
     path('api/cliente/recomendaciones/', api_recomendaciones, name='cliente_recomendaciones'),
+    path('api/cliente/recomendaciones/rango/', api_recomendaciones_rango, name='cliente_recomendaciones_rango'),
     path('api/cliente/solicitudes/', api_solicitudes, name='cliente_solicitudes'),
     path('api/cliente/situaciones/', api_situaciones, name='cliente_situaciones'),
     path('api/operaciones/solicitudes-clientes/', api_solicitudes_operaciones, name='operaciones_solicitudes_clientes'),
@@ -99,6 +100,8 @@ urlpatterns = [
     path('api/analytics/tendencias/', analytics_tendencias, name='analytics_tendencias'),
     path('api/ml/learning-stats/', ml_learning_stats, name='ml_learning_stats'),
     path('api/operaciones/diarias/', operaciones_diarias, name='operaciones_diarias'),
+    path('api/import-jobs/', import_jobs, name='import_jobs'),
+    path('api/import-jobs/<int:pk>/', import_job_status, name='import_job_status'),
     
     # API Authentication
     path('api-auth/', include('rest_framework.urls')),
@@ -19,6 +19,19 @@ while ! python manage.py migrate --no-input; do
   sleep "$retry_seconds"
 done
 
+# Tabla de la caché persistente de rutas Mapbox (idempotente).
+python manage.py createcachetable
+
 python manage.py ensure_admin
 
-exec gunicorn config.wsgi:application --bind "0.0.0.0:${PORT:-10000}"
+# Worker de importaciones Excel: procesa la cola ImportJob fuera de gunicorn.
+if [ "${IMPORT_WORKER_EMBEDDED:-true}" = "true" ]; then
+  python manage.py run_import_worker --concurrency "${IMPORT_WORKER_CONCURRENCY:-2}" &
+fi
+
+# Sender del outbox de OpenClaw: entrega las notificaciones fuera del request.
+if [ "${OPENCLAW_ENABLED:-false}" = "true" ] && [ "${OPENCLAW_SENDER_EMBEDDED:-true}" = "true" ]; then
+  python manage.py run_openclaw_sender &
+fi
+
+exec gunicorn config.wsgi:application --bind "0.0.0.0:${PORT:-10000}" --worker-class "${GUNICORN_WORKER_CLASS:-sync}"